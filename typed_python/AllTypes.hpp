@@ -33,6 +33,7 @@
 #include "NoneType.hpp"
 #include "Instance.hpp"
 #include "StringType.hpp"
+#include "ColumnarSerialization.hpp"
 #include "BytesType.hpp"
 #include "ValueType.hpp"
 #include "AlternativeType.hpp"
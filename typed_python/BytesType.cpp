@@ -37,6 +37,18 @@ typed_python_hash_type BytesType::hash(instance_ptr left) {
     return (*(layout**)left)->hash_cache;
 }
 
+typed_python_wide_hash_type BytesType::wideHash(instance_ptr left) {
+    if (!(*(layout**)left)) {
+        return 0x1234;
+    }
+
+    WideHashAccumulator acc((int)getTypeCategory());
+
+    acc.addBytes(eltPtr(left, 0), count(left));
+
+    return acc.get();
+}
+
 bool BytesType::cmp(instance_ptr left, instance_ptr right, int pyComparisonOp, bool suppressExceptions) {
     if ( !(*(layout**)left) && !(*(layout**)right) ) {
         return cmpResultToBoolForPyOrdering(pyComparisonOp, 0);
@@ -145,6 +145,8 @@ public:
 
     typed_python_hash_type hash(instance_ptr left);
 
+    typed_python_wide_hash_type wideHash(instance_ptr left);
+
     bool cmp(instance_ptr left, instance_ptr right, int pyComparisonOp, bool suppressExceptions);
 
     static char cmpStatic(layout* left, layout* right);
@@ -0,0 +1,450 @@
+/******************************************************************************
+   Copyright 2017-2021 typed_python Authors
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+******************************************************************************/
+
+#pragma once
+
+#include "Type.hpp"
+#include "CompositeType.hpp"
+#include "RegisterTypes.hpp"
+#include "StringType.hpp"
+#include "WireType.hpp"
+#include <unordered_map>
+#include <type_traits>
+
+bool typeSerializesIndependently(Type* t);
+
+/****************
+
+ColumnarSerialization:
+
+Writes the elements of a ListOf or TupleOf of NamedTuples one field at a time
+instead of one row at a time, which is both faster to encode and decode and
+compresses much better for long tables.
+
+A list written this way writes its count with field number 1 instead of 0,
+followed by the number of columns and then one compound message per column:
+
+    0: the name of the field
+    1: the encoding of the column
+    and then, depending on the encoding:
+        VALUES: each value, in row order, as field 3
+        RAW: 2: the type category of the values, and 3: a bytes message holding
+            the values' raw in-memory representation
+        DELTAS: like RAW, but each integer is replaced by its difference from
+            the previous one (wrapping around), which compresses much better
+            when neighbouring rows hold similar values
+        DICTIONARY: 2: the number of distinct strings, then each distinct
+            string as field 3, then as many (index, run length) pairs as field 4
+            as it takes to cover all the rows
+
+Columns are identified by name, so the data can be read as a list of any
+NamedTuple whose fields are a subset of the ones that were written, which reads
+only those columns and skips the rest. As with NamedTuples written a row at a
+time, fields that have no column get their default value.
+
+We only write lists this way if their elements serialize independently (see
+typeSerializesIndependently), so that skipping a column can't leave a hole in
+the pointer memo.
+
+*****************/
+
+class ColumnarSerialization {
+public:
+    enum class ColumnEncoding {
+        VALUES = 0,
+        RAW = 1,
+        DICTIONARY = 2,
+        DELTAS = 3
+    };
+
+    // write raw columns in pieces this big, so that they compress in the usual blocks
+    static const size_t RAW_CHUNK_BYTES = 1024 * 1024;
+
+    static bool canSerialize(Type* eltType) {
+        return eltType->getTypeCategory() == Type::TypeCategory::catNamedTuple
+            && typeSerializesIndependently(eltType);
+    }
+
+    // write the columns of the 'ct' NamedTuples of type 'eltType' stored contiguously at 'data'
+    template<class buf_t>
+    static void serialize(NamedTuple* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+        buffer.writeUnsignedVarintObject(2, eltType->getTypes().size());
+
+        for (long col = 0; col < eltType->getTypes().size(); col++) {
+            Column column(eltType, data, ct, col);
+
+            buffer.writeBeginCompound(0);
+            buffer.writeStringObject(0, eltType->getNames()[col]);
+
+            column.type->check([&](auto& concreteType) {
+                serializeColumn(&concreteType, column, buffer);
+            });
+
+            buffer.writeEndCompound();
+        }
+    }
+
+    // read the columns of 'ct' NamedTuples of type 'eltType' into the uninitialized
+    // memory at 'data'. If this throws, nothing at 'data' is left initialized.
+    template<class buf_t>
+    static void deserialize(NamedTuple* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+        size_t columnCount = buffer.readUnsignedVarintObject();
+
+        std::vector<bool> columnIsRead(eltType->getTypes().size(), false);
+
+        auto destroyColumnsRead = [&]() {
+            for (long col = 0; col < columnIsRead.size(); col++) {
+                if (columnIsRead[col]) {
+                    Column column(eltType, data, ct, col);
+                    column.destroyRows(0, ct);
+                }
+            }
+        };
+
+        try {
+            for (size_t k = 0; k < columnCount; k++) {
+                auto fieldAndWire = buffer.readFieldNumberAndWireType();
+                assertWireTypesEqual(fieldAndWire.second, WireType::BEGIN_COMPOUND);
+
+                auto nameHeader = buffer.readFieldNumberAndWireType();
+                assertWireTypesEqual(nameHeader.second, WireType::BYTES);
+                std::string name = buffer.readStringObject();
+
+                auto it = eltType->getNameToIndex().find(name);
+
+                if (it == eltType->getNameToIndex().end()) {
+                    // this is a column the caller didn't ask for
+                    buffer.finishCompoundMessage(WireType::BEGIN_COMPOUND, false);
+                    continue;
+                }
+
+                if (columnIsRead[it->second]) {
+                    throw std::runtime_error("Corrupt data: column " + name + " appears twice");
+                }
+
+                Column column(eltType, data, ct, it->second);
+
+                ColumnEncoding encoding = (ColumnEncoding)buffer.readUnsignedVarintObject();
+
+                column.type->check([&](auto& concreteType) {
+                    deserializeColumn(&concreteType, encoding, column, buffer);
+                });
+
+                columnIsRead[it->second] = true;
+
+                buffer.finishCompoundMessage(WireType::BEGIN_COMPOUND);
+            }
+
+            // like a NamedTuple written a row at a time, fields that weren't written
+            // get their default values.
+            for (long col = 0; col < columnIsRead.size(); col++) {
+                if (!columnIsRead[col]) {
+                    Column column(eltType, data, ct, col);
+                    column.constructRows();
+                    columnIsRead[col] = true;
+                }
+            }
+        } catch(...) {
+            destroyColumnsRead();
+            throw;
+        }
+    }
+
+private:
+    // one field of each of 'ct' NamedTuples laid out one after the other.
+    class Column {
+    public:
+        Column(NamedTuple* eltType, instance_ptr data, size_t ct, size_t col) :
+                type(eltType->getTypes()[col]),
+                first(data + eltType->getOffsets()[col]),
+                stride(eltType->bytecount()),
+                count(ct)
+        {
+        }
+
+        instance_ptr row(size_t k) const {
+            return first + stride * k;
+        }
+
+        // default-construct every row. If this throws, no row is left constructed.
+        void constructRows() const {
+            size_t k = 0;
+
+            try {
+                for (; k < count; k++) {
+                    type->constructor(row(k));
+                }
+            } catch(...) {
+                destroyRows(0, k);
+                throw;
+            }
+        }
+
+        void destroyRows(size_t lo, size_t hi) const {
+            for (size_t k = lo; k < hi; k++) {
+                type->destroy(row(k));
+            }
+        }
+
+        Type* type;
+        instance_ptr first;
+        size_t stride;
+        size_t count;
+    };
+
+    template<class T>
+    static bool isDeltaEncoded() {
+        return std::is_integral<T>::value && !std::is_same<T, bool>::value;
+    }
+
+    template<class buf_t, class T>
+    static void serializeColumn(RegisterType<T>* type, const Column& column, buf_t& buffer) {
+        bool deltas = isDeltaEncoded<T>();
+
+        buffer.writeUnsignedVarintObject(1, (size_t)(deltas ? ColumnEncoding::DELTAS : ColumnEncoding::RAW));
+        buffer.writeUnsignedVarintObject(2, (size_t)type->getTypeCategory());
+        buffer.writeBeginBytes(3, column.count * sizeof(T));
+
+        std::vector<uint8_t> chunk;
+        uint64_t prior = 0;
+
+        for (size_t lo = 0; lo < column.count; lo += RAW_CHUNK_BYTES / sizeof(T)) {
+            size_t hi = std::min(column.count, lo + RAW_CHUNK_BYTES / sizeof(T));
+
+            chunk.resize((hi - lo) * sizeof(T));
+
+            for (size_t k = lo; k < hi; k++) {
+                T value = *(T*)column.row(k);
+
+                if (deltas) {
+                    uint64_t cur = (uint64_t)value;
+                    value = (T)(cur - prior);
+                    prior = cur;
+                }
+
+                memcpy(&chunk[(k - lo) * sizeof(T)], &value, sizeof(T));
+            }
+
+            buffer.write_bytes(chunk.data(), chunk.size());
+        }
+    }
+
+    template<class buf_t>
+    static void serializeColumn(StringType* type, const Column& column, buf_t& buffer) {
+        struct Hash {
+            size_t operator()(StringType::layout* s) const {
+                return StringType::hash_static((instance_ptr)&s);
+            }
+        };
+
+        struct Equal {
+            bool operator()(StringType::layout* l, StringType::layout* r) const {
+                return l == r || StringType::cmpStaticEq(l, r);
+            }
+        };
+
+        std::unordered_map<StringType::layout*, size_t, Hash, Equal> indices;
+        std::vector<StringType::layout*> distinct;
+        std::vector<size_t> rowIndices(column.count);
+
+        for (size_t k = 0; k < column.count; k++) {
+            StringType::layout* s = *(StringType::layout**)column.row(k);
+
+            auto it = indices.find(s);
+
+            if (it == indices.end()) {
+                it = indices.insert(std::make_pair(s, distinct.size())).first;
+                distinct.push_back(s);
+            }
+
+            rowIndices[k] = it->second;
+        }
+
+        // mostly-distinct strings are cheaper to just write out
+        if (distinct.size() > column.count / 2) {
+            serializeColumn((Type*)type, column, buffer);
+            return;
+        }
+
+        buffer.writeUnsignedVarintObject(1, (size_t)ColumnEncoding::DICTIONARY);
+        buffer.writeUnsignedVarintObject(2, distinct.size());
+
+        for (auto& s: distinct) {
+            type->serialize((instance_ptr)&s, buffer, 3);
+        }
+
+        size_t k = 0;
+        while (k < column.count) {
+            size_t runLength = 1;
+
+            while (k + runLength < column.count && rowIndices[k + runLength] == rowIndices[k]) {
+                runLength++;
+            }
+
+            buffer.writeUnsignedVarintObject(4, rowIndices[k]);
+            buffer.writeUnsignedVarintObject(4, runLength);
+
+            k += runLength;
+        }
+    }
+
+    template<class buf_t>
+    static void serializeColumn(Type* type, const Column& column, buf_t& buffer) {
+        buffer.writeUnsignedVarintObject(1, (size_t)ColumnEncoding::VALUES);
+
+        type->check([&](auto& concreteType) {
+            for (size_t k = 0; k < column.count; k++) {
+                concreteType.serialize(column.row(k), buffer, 3);
+            }
+        });
+    }
+
+    template<class buf_t, class T>
+    static void deserializeColumn(RegisterType<T>* type, ColumnEncoding encoding, const Column& column, buf_t& buffer) {
+        if (encoding != ColumnEncoding::RAW && encoding != ColumnEncoding::DELTAS) {
+            deserializeColumn((Type*)type, encoding, column, buffer);
+            return;
+        }
+
+        if (encoding == ColumnEncoding::DELTAS && !isDeltaEncoded<T>()) {
+            throw std::runtime_error("Corrupt data: can't read deltas into a column of " + type->name());
+        }
+
+        if (buffer.readUnsignedVarintObject() != (size_t)type->getTypeCategory()) {
+            throw std::runtime_error("Can't read a column of " + type->name() + " from a column holding another type.");
+        }
+
+        auto fieldAndWire = buffer.readFieldNumberAndWireType();
+        assertWireTypesEqual(fieldAndWire.second, WireType::BYTES);
+
+        size_t bytecount = buffer.readUnsignedVarint();
+
+        if (bytecount != column.count * sizeof(T)) {
+            throw std::runtime_error("Corrupt data: column has the wrong size");
+        }
+
+        buffer.read_bytes_fun(bytecount, [&](uint8_t* bytes) {
+            uint64_t prior = 0;
+
+            for (size_t k = 0; k < column.count; k++) {
+                T value;
+                memcpy(&value, bytes + k * sizeof(T), sizeof(T));
+
+                if (encoding == ColumnEncoding::DELTAS) {
+                    prior += (uint64_t)value;
+                    value = (T)prior;
+                }
+
+                *(T*)column.row(k) = value;
+            }
+        });
+    }
+
+    template<class buf_t>
+    static void deserializeColumn(StringType* type, ColumnEncoding encoding, const Column& column, buf_t& buffer) {
+        if (encoding != ColumnEncoding::DICTIONARY) {
+            deserializeColumn((Type*)type, encoding, column, buffer);
+            return;
+        }
+
+        size_t distinctCount = buffer.readUnsignedVarintObject();
+
+        if (distinctCount > column.count) {
+            throw std::runtime_error("Corrupt data: column has more distinct values than rows");
+        }
+
+        std::vector<StringType::layout*> distinct;
+        size_t rowsRead = 0;
+
+        auto cleanup = [&]() {
+            column.destroyRows(0, rowsRead);
+
+            for (auto& s: distinct) {
+                type->destroy((instance_ptr)&s);
+            }
+        };
+
+        try {
+            for (size_t k = 0; k < distinctCount; k++) {
+                auto fieldAndWire = buffer.readFieldNumberAndWireType();
+
+                distinct.push_back(nullptr);
+                type->deserialize((instance_ptr)&distinct.back(), buffer, fieldAndWire.second);
+            }
+
+            while (rowsRead < column.count) {
+                size_t index = buffer.readUnsignedVarintObject();
+                size_t runLength = buffer.readUnsignedVarintObject();
+
+                if (index >= distinct.size() || runLength > column.count - rowsRead || !runLength) {
+                    throw std::runtime_error("Corrupt data: invalid run in a dictionary-encoded column");
+                }
+
+                for (size_t k = 0; k < runLength; k++) {
+                    type->copy_constructor(column.row(rowsRead), (instance_ptr)&distinct[index]);
+                    rowsRead++;
+                }
+            }
+        } catch(...) {
+            cleanup();
+            throw;
+        }
+
+        for (auto& s: distinct) {
+            type->destroy((instance_ptr)&s);
+        }
+    }
+
+    template<class buf_t>
+    static void deserializeColumn(Type* type, ColumnEncoding encoding, const Column& column, buf_t& buffer) {
+        if (encoding != ColumnEncoding::VALUES) {
+            throw std::runtime_error("Can't read a column of " + type->name() + " from a column holding another type.");
+        }
+
+        size_t k = 0;
+
+        try {
+            type->check([&](auto& concreteType) {
+                for (; k < column.count; k++) {
+                    auto fieldAndWire = buffer.readFieldNumberAndWireType();
+
+                    if (fieldAndWire.first != 3) {
+                        throw std::runtime_error("Corrupt data: column is too short");
+                    }
+
+                    concreteType.deserialize(column.row(k), buffer, fieldAndWire.second);
+                }
+            });
+        } catch(...) {
+            column.destroyRows(0, k);
+            throw;
+        }
+    }
+};
+
+inline bool canSerializeColumnar(Type* eltType) {
+    return ColumnarSerialization::canSerialize(eltType);
+}
+
+template<class buf_t>
+void serializeColumnar(NamedTuple* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+    ColumnarSerialization::serialize(eltType, data, ct, buffer);
+}
+
+template<class buf_t>
+void deserializeColumnar(NamedTuple* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+    ColumnarSerialization::deserialize(eltType, data, ct, buffer);
+}
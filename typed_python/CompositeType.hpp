@@ -125,6 +125,14 @@ public:
         }
 
         buffer.consumeCompoundMessage(wireType, [&](size_t fieldNumber, size_t subWireType) {
+            // fields normally show up under their own index, so check that before
+            // looking the code up.
+            if (fieldNumber < m_serialize_typecodes.size() && m_serialize_typecodes[fieldNumber] == fieldNumber) {
+                initialized[fieldNumber] = true;
+                getTypes()[fieldNumber]->deserialize(eltPtr(self, fieldNumber), buffer, subWireType);
+                return;
+            }
+
             auto it = m_serialize_typecodes_to_position.find(fieldNumber);
             if (it != m_serialize_typecodes_to_position.end()) {
                 initialized[it->second] = true;
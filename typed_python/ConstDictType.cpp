@@ -84,17 +84,18 @@ void ConstDictType::repr(instance_ptr self, ReprAccumulator& stream, bool isStr)
 
     stream << "{";
 
-    int32_t ct = count(self);
-
-    for (long k = 0; k < ct;k++) {
-        if (k > 0) {
+    bool first = true;
+    visitKeyValuePairsSeparately(self, [&](instance_ptr key, instance_ptr value) {
+        if (!first) {
             stream << ", ";
         }
+        first = false;
 
-        m_key->repr(kvPairPtrKey(self,k),stream, false);
+        m_key->repr(key, stream, false);
         stream << ": ";
-        m_value->repr(kvPairPtrValue(self,k),stream, false);
-    }
+        m_value->repr(value, stream, false);
+        return true;
+    });
 
     stream << "}";
 }
@@ -109,15 +110,16 @@ void ConstDictType::repr_keys(instance_ptr self, ReprAccumulator& stream) {
 
     stream << "const_dict_keys([";
 
-    int32_t ct = count(self);
-
-    for (long k = 0; k < ct;k++) {
-        if (k > 0) {
+    bool first = true;
+    visitKeyValuePairs(self, [&](instance_ptr key) {
+        if (!first) {
             stream << ", ";
         }
+        first = false;
 
-        m_key->repr(kvPairPtrKey(self,k),stream, false);
-    }
+        m_key->repr(key, stream, false);
+        return true;
+    });
 
     stream << "])";
 }
@@ -132,19 +134,20 @@ void ConstDictType::repr_items(instance_ptr self, ReprAccumulator& stream) {
 
     stream << "const_dict_items([";
 
-    int32_t ct = count(self);
-
-    for (long k = 0; k < ct;k++) {
-        if (k > 0) {
+    bool first = true;
+    visitKeyValuePairsSeparately(self, [&](instance_ptr key, instance_ptr value) {
+        if (!first) {
             stream << ", ";
         }
+        first = false;
 
         stream << "(";
-        m_key->repr(kvPairPtrKey(self,k), stream, false);
+        m_key->repr(key, stream, false);
         stream << ", ";
-        m_value->repr(kvPairPtrValue(self,k), stream, false);
+        m_value->repr(value, stream, false);
         stream << ")";
-    }
+        return true;
+    });
 
     stream << "])";
 }
@@ -159,15 +162,16 @@ void ConstDictType::repr_values(instance_ptr self, ReprAccumulator& stream) {
 
     stream << "const_dict_values([";
 
-    int32_t ct = count(self);
-
-    for (long k = 0; k < ct;k++) {
-        if (k > 0) {
+    bool first = true;
+    visitValues(self, [&](instance_ptr value) {
+        if (!first) {
             stream << ", ";
         }
+        first = false;
 
-        m_value->repr(kvPairPtrValue(self,k), stream, false);
-    }
+        m_value->repr(value, stream, false);
+        return true;
+    });
 
     stream << "])";
 }
@@ -182,10 +186,11 @@ typed_python_hash_type ConstDictType::hash(instance_ptr left) {
 
         int32_t count = size(left);
         acc.add(count);
-        for (long k = 0; k < count;k++) {
-            acc.add(m_key->hash(kvPairPtrKey(left,k)));
-            acc.add(m_value->hash(kvPairPtrValue(left,k)));
-        }
+        visitKeyValuePairsSeparately(left, [&](instance_ptr key, instance_ptr value) {
+            acc.add(m_key->hash(key));
+            acc.add(m_value->hash(value));
+            return true;
+        });
 
         (*(layout**)left)->hash_cache = acc.get();
         if ((*(layout**)left)->hash_cache == -1) {
@@ -250,25 +255,44 @@ bool ConstDictType::cmp(instance_ptr left, instance_ptr right, int pyComparisonO
 }
 
 void ConstDictType::addDicts(instance_ptr lhs, instance_ptr rhs, instance_ptr output) {
-    std::vector<instance_ptr> keep;
+    int64_t lhsCount = size(lhs);
+    int64_t rhsCount = size(rhs);
+
+    if (!rhsCount) {
+        copy_constructor(output, lhs);
+        return;
+    }
+
+    if (lhsCount >= TREE_MIN_PAIRS && rhsCount * TREE_UPDATE_RATIO <= lhsCount) {
+        layout* root = buildTree(lhs);
+
+        visitKeyValuePairsSeparately(rhs, [&](instance_ptr key, instance_ptr value) {
+            insertIntoTree(root, key, value);
+            return true;
+        });
 
-    int64_t lhsCount = count(lhs);
-    int64_t rhsCount = count(rhs);
+        *(layout**)output = root;
+        return;
+    }
 
-    for (long k = 0; k < lhsCount; k++) {
-        instance_ptr lhsVal = kvPairPtrKey(lhs, k);
+    std::vector<instance_ptr> keep;
 
+    visitKeyValuePairs(lhs, [&](instance_ptr lhsVal) {
         if (!lookupValueByKey(rhs, lhsVal)) {
             keep.push_back(lhsVal);
         }
-    }
+        return true;
+    });
 
     constructor(output, rhsCount + keep.size(), false);
 
-    for (long k = 0; k < rhsCount; k++) {
-        m_key->copy_constructor(kvPairPtrKey(output,k), kvPairPtrKey(rhs, k));
-        m_value->copy_constructor(kvPairPtrValue(output,k), kvPairPtrValue(rhs, k));
-    }
+    long written = 0;
+    visitKeyValuePairsSeparately(rhs, [&](instance_ptr key, instance_ptr value) {
+        m_key->copy_constructor(kvPairPtrKey(output, written), key);
+        m_value->copy_constructor(kvPairPtrValue(output, written), value);
+        written++;
+        return true;
+    });
     for (long k = 0; k < keep.size(); k++) {
         m_key->copy_constructor(kvPairPtrKey(output,k + rhsCount), keep[k]);
         m_value->copy_constructor(kvPairPtrValue(output,k + rhsCount), keep[k] + m_bytes_per_key);
@@ -281,10 +305,27 @@ void ConstDictType::addDicts(instance_ptr lhs, instance_ptr rhs, instance_ptr ou
 void ConstDictType::subtractTupleOfKeysFromDict(instance_ptr lhs, instance_ptr rhs, instance_ptr output) {
     TupleOfType* tupleType = tupleOfKeysType();
 
-    int64_t lhsCount = count(lhs);
+    int64_t lhsCount = size(lhs);
     int64_t rhsCount = tupleType->count(rhs);
 
-    std::set<int> remove;
+    if (lhsCount >= TREE_MIN_PAIRS && rhsCount * TREE_UPDATE_RATIO <= lhsCount) {
+        layout* root = buildTree(lhs);
+
+        for (long k = 0; k < rhsCount && root; k++) {
+            removeFromTree(root, tupleType->eltPtr(rhs, k));
+        }
+
+        if (root && root->subpointers && root->count <= TREE_LEAF_PAIRS) {
+            layout* flat = flattenTree((instance_ptr)&root);
+            destroy((instance_ptr)&root);
+            root = flat;
+        }
+
+        *(layout**)output = root;
+        return;
+    }
+
+    std::set<int64_t> remove;
 
     for (long k = 0; k < rhsCount; k++) {
         int64_t index = lookupIndexByKey(lhs, tupleType->eltPtr(rhs, k));
@@ -296,18 +337,304 @@ void ConstDictType::subtractTupleOfKeysFromDict(instance_ptr lhs, instance_ptr r
     constructor(output, lhsCount - remove.size(), false);
 
     long written = 0;
-    for (long k = 0; k < lhsCount; k++) {
+    long k = 0;
+    visitKeyValuePairsSeparately(lhs, [&](instance_ptr key, instance_ptr value) {
         if (remove.find(k) == remove.end()) {
-            m_key->copy_constructor(kvPairPtrKey(output,written), kvPairPtrKey(lhs, k));
-            m_value->copy_constructor(kvPairPtrValue(output,written), kvPairPtrValue(lhs, k));
+            m_key->copy_constructor(kvPairPtrKey(output,written), key);
+            m_value->copy_constructor(kvPairPtrValue(output,written), value);
 
             written++;
         }
-    }
+        k++;
+        return true;
+    });
 
     incKvPairCount(output, written);
 }
 
+ConstDictType::layout* ConstDictType::allocateRecord(int64_t pairs, int64_t subtrees) {
+    layout* record = (layout*)tp_malloc(
+        sizeof(layout) + (
+            subtrees
+            ? subtrees * (m_bytes_per_key_subtree_pair + sizeof(int32_t))
+            : pairs * m_bytes_per_key_value_pair
+        )
+    );
+
+    record->refcount = 1;
+    record->hash_cache = -1;
+    record->count = pairs;
+    record->subpointers = subtrees;
+
+    return record;
+}
+
+// build an interior record over 'count' subtrees, taking ownership of their references
+ConstDictType::layout* ConstDictType::makeTreeRecord(layout** subtrees, int64_t count) {
+    layout* record = allocateRecord(0, count);
+    int32_t* counts = treeCounts(record);
+
+    for (long k = 0; k < count; k++) {
+        // leaves and interior records both start with their smallest key
+        m_key->copy_constructor(treeKey(record, k), subtrees[k]->data);
+        treeChild(record, k) = subtrees[k];
+        record->count += subtrees[k]->count;
+        counts[k] = record->count;
+    }
+
+    return record;
+}
+
+ConstDictType::layout* ConstDictType::copyLeafPairs(layout* leaf, int64_t start, int64_t count) {
+    layout* record = allocateRecord(count, 0);
+
+    for (long k = 0; k < count; k++) {
+        instance_ptr src = leaf->data + m_bytes_per_key_value_pair * (start + k);
+        instance_ptr tgt = record->data + m_bytes_per_key_value_pair * k;
+
+        m_key->copy_constructor(tgt, src);
+        m_value->copy_constructor(tgt + m_bytes_per_key, src + m_bytes_per_key);
+    }
+
+    return record;
+}
+
+// the index of the subtree of 'record' that holds 'key', if anything does
+int64_t ConstDictType::treeChildFor(layout* record, instance_ptr key) {
+    long low = 1;
+    long high = record->subpointers;
+
+    while (low < high) {
+        long mid = (low + high) / 2;
+
+        if (m_key->cmp(key, treeKey(record, mid), Py_LT, true)) {
+            high = mid;
+        } else {
+            low = mid + 1;
+        }
+    }
+
+    return low - 1;
+}
+
+// the index of the first pair in 'leaf' whose key is not less than 'key'
+int64_t ConstDictType::leafLowerBound(layout* leaf, instance_ptr key) {
+    long low = 0;
+    long high = leaf->count;
+
+    while (low < high) {
+        long mid = (low + high) / 2;
+
+        if (m_key->cmp(leaf->data + m_bytes_per_key_value_pair * mid, key, Py_LT, true)) {
+            low = mid + 1;
+        } else {
+            high = mid;
+        }
+    }
+
+    return low;
+}
+
+// return a tree holding the same items as 'self', which may be flat.
+ConstDictType::layout* ConstDictType::buildTree(instance_ptr self) {
+    layout* record = *(layout**)self;
+
+    if (record->subpointers) {
+        record->refcount++;
+        return record;
+    }
+
+    // leave the new records half empty so that updates don't immediately split them
+    std::vector<layout*> level;
+
+    for (long start = 0; start < record->count; start += TREE_LEAF_PAIRS / 2) {
+        level.push_back(
+            copyLeafPairs(record, start, std::min<int64_t>(TREE_LEAF_PAIRS / 2, record->count - start))
+        );
+    }
+
+    while (level.size() > 1) {
+        std::vector<layout*> nextLevel;
+
+        for (long start = 0; start < level.size(); start += TREE_FANOUT / 2) {
+            nextLevel.push_back(
+                makeTreeRecord(&level[start], std::min<int64_t>(TREE_FANOUT / 2, level.size() - start))
+            );
+        }
+
+        level.swap(nextLevel);
+    }
+
+    return level[0];
+}
+
+// return a single flat record holding the items of the tree 'self'.
+ConstDictType::layout* ConstDictType::flattenTree(instance_ptr self) {
+    layout* record = allocateRecord(size(self), 0);
+
+    long written = 0;
+    visitKeyValuePairsSeparately(self, [&](instance_ptr key, instance_ptr value) {
+        instance_ptr tgt = record->data + m_bytes_per_key_value_pair * written++;
+
+        m_key->copy_constructor(tgt, key);
+        m_value->copy_constructor(tgt + m_bytes_per_key, value);
+        return true;
+    });
+
+    return record;
+}
+
+// return a new subtree holding the items of 'record' plus (key, value), sharing any
+// subtrees it didn't need to change with 'record'. If the new subtree is too big, it's
+// split in two, and the upper half is returned in 'outSplit'.
+ConstDictType::layout* ConstDictType::treeInsert(layout* record, instance_ptr key, instance_ptr value, layout*& outSplit) {
+    outSplit = nullptr;
+
+    if (!record->subpointers) {
+        int64_t pos = leafLowerBound(record, key);
+        bool replacing = pos < record->count &&
+            m_key->cmp(record->data + m_bytes_per_key_value_pair * pos, key, Py_EQ, true);
+
+        int64_t newCount = replacing ? record->count : record->count + 1;
+        int64_t lowCount = newCount <= TREE_LEAF_PAIRS ? newCount : newCount / 2;
+
+        layout* low = allocateRecord(lowCount, 0);
+        layout* high = lowCount < newCount ? allocateRecord(newCount - lowCount, 0) : nullptr;
+
+        for (long k = 0; k < newCount; k++) {
+            instance_ptr tgt = k < lowCount
+                ? low->data + m_bytes_per_key_value_pair * k
+                : high->data + m_bytes_per_key_value_pair * (k - lowCount);
+
+            if (k == pos) {
+                m_key->copy_constructor(tgt, key);
+                m_value->copy_constructor(tgt + m_bytes_per_key, value);
+            } else {
+                instance_ptr src = record->data + m_bytes_per_key_value_pair * (
+                    k < pos || replacing ? k : k - 1
+                );
+
+                m_key->copy_constructor(tgt, src);
+                m_value->copy_constructor(tgt + m_bytes_per_key, src + m_bytes_per_key);
+            }
+        }
+
+        outSplit = high;
+        return low;
+    }
+
+    int64_t which = treeChildFor(record, key);
+
+    layout* split;
+    layout* newChild = treeInsert(treeChild(record, which), key, value, split);
+
+    std::vector<layout*> subtrees;
+    for (long k = 0; k < record->subpointers; k++) {
+        if (k == which) {
+            subtrees.push_back(newChild);
+            if (split) {
+                subtrees.push_back(split);
+            }
+        } else {
+            treeChild(record, k)->refcount++;
+            subtrees.push_back(treeChild(record, k));
+        }
+    }
+
+    if (subtrees.size() <= TREE_FANOUT) {
+        return makeTreeRecord(&subtrees[0], subtrees.size());
+    }
+
+    int64_t lowCount = subtrees.size() / 2;
+
+    outSplit = makeTreeRecord(&subtrees[lowCount], subtrees.size() - lowCount);
+    return makeTreeRecord(&subtrees[0], lowCount);
+}
+
+// if 'key' is in 'record', set 'outRecord' to a new subtree without it (or nullptr if
+// that would be empty) and return true. Otherwise, return false.
+bool ConstDictType::treeRemove(layout* record, instance_ptr key, layout*& outRecord) {
+    if (!record->subpointers) {
+        int64_t pos = leafLowerBound(record, key);
+
+        if (pos == record->count ||
+                !m_key->cmp(record->data + m_bytes_per_key_value_pair * pos, key, Py_EQ, true)) {
+            return false;
+        }
+
+        if (record->count == 1) {
+            outRecord = nullptr;
+            return true;
+        }
+
+        outRecord = allocateRecord(record->count - 1, 0);
+
+        for (long k = 0; k + 1 < record->count; k++) {
+            instance_ptr src = record->data + m_bytes_per_key_value_pair * (k < pos ? k : k + 1);
+            instance_ptr tgt = outRecord->data + m_bytes_per_key_value_pair * k;
+
+            m_key->copy_constructor(tgt, src);
+            m_value->copy_constructor(tgt + m_bytes_per_key, src + m_bytes_per_key);
+        }
+
+        return true;
+    }
+
+    int64_t which = treeChildFor(record, key);
+
+    layout* newChild;
+    if (!treeRemove(treeChild(record, which), key, newChild)) {
+        return false;
+    }
+
+    std::vector<layout*> subtrees;
+    for (long k = 0; k < record->subpointers; k++) {
+        if (k == which) {
+            if (newChild) {
+                subtrees.push_back(newChild);
+            }
+        } else {
+            treeChild(record, k)->refcount++;
+            subtrees.push_back(treeChild(record, k));
+        }
+    }
+
+    outRecord = subtrees.size() ? makeTreeRecord(&subtrees[0], subtrees.size()) : nullptr;
+    return true;
+}
+
+void ConstDictType::insertIntoTree(layout*& root, instance_ptr key, instance_ptr value) {
+    layout* split;
+    layout* newRoot = treeInsert(root, key, value, split);
+
+    if (split) {
+        layout* subtrees[2] = {newRoot, split};
+        newRoot = makeTreeRecord(subtrees, 2);
+    }
+
+    destroy((instance_ptr)&root);
+    root = newRoot;
+}
+
+void ConstDictType::removeFromTree(layout*& root, instance_ptr key) {
+    layout* newRoot;
+
+    if (!treeRemove(root, key, newRoot)) {
+        return;
+    }
+
+    destroy((instance_ptr)&root);
+    root = newRoot;
+
+    // drop any interior records that only have a single subtree
+    while (root && root->subpointers == 1) {
+        layout* child = treeChild(root, 0);
+        child->refcount++;
+        destroy((instance_ptr)&root);
+        root = child;
+    }
+}
+
 instance_ptr ConstDictType::kdPairPtrKey(instance_ptr self, int64_t i) {
     if (!(*(layout**)self)) {
         return self;
@@ -333,9 +660,22 @@ instance_ptr ConstDictType::kvPairPtrKey(instance_ptr self, int64_t i) {
         return self;
     }
 
-    layout& record = **(layout**)self;
+    layout* record = *(layout**)self;
 
-    return record.data + m_bytes_per_key_value_pair * i;
+    while (record->subpointers) {
+        int32_t* counts = treeCounts(record);
+
+        // the first subtree whose running total is past 'i'
+        int64_t which = std::upper_bound(counts, counts + record->subpointers, (int32_t)i) - counts;
+
+        if (which) {
+            i -= counts[which - 1];
+        }
+
+        record = treeChild(record, which);
+    }
+
+    return record->data + m_bytes_per_key_value_pair * i;
 }
 
 instance_ptr ConstDictType::kvPairPtrValue(instance_ptr self, int64_t i) {
@@ -343,9 +683,7 @@ instance_ptr ConstDictType::kvPairPtrValue(instance_ptr self, int64_t i) {
         return self;
     }
 
-    layout& record = **(layout**)self;
-
-    return record.data + m_bytes_per_key_value_pair * i + m_bytes_per_key;
+    return kvPairPtrKey(self, i) + m_bytes_per_key;
 }
 
 void ConstDictType::incKvPairCount(instance_ptr self, int by) {
@@ -438,13 +776,7 @@ int64_t ConstDictType::count(instance_ptr self) {
         return 0;
     }
 
-    layout& record = **(layout**)self;
-
-    if (record.subpointers) {
-        return record.subpointers;
-    }
-
-    return record.count;
+    return (*(layout**)self)->count;
 }
 
 int64_t ConstDictType::size(instance_ptr self) {
@@ -455,39 +787,55 @@ int64_t ConstDictType::size(instance_ptr self) {
     return (*(layout**)self)->count;
 }
 
-int64_t ConstDictType::lookupIndexByKey(instance_ptr self, instance_ptr key) {
-    if (!(*(layout**)self)) {
-        return -1;
+instance_ptr ConstDictType::lookupKvPairByKey(instance_ptr self, instance_ptr key, int64_t* outIndex) {
+    layout* record = *(layout**)self;
+
+    if (!record) {
+        return 0;
     }
 
-    layout& record = **(layout**)self;
+    int64_t offset = 0;
 
-    assert(record.subpointers == 0); //this is not implemented yet
+    while (record->subpointers) {
+        int64_t which = treeChildFor(record, key);
 
-    long low = 0;
-    long high = record.count;
+        if (which) {
+            offset += treeCounts(record)[which - 1];
+        }
 
-    while (low < high) {
-        long mid = (low+high)/2;
+        record = treeChild(record, which);
+    }
 
-        if (m_key->cmp(kvPairPtrKey(self, mid), key, Py_EQ, true)) {
-            return mid;
-        } else if (m_key->cmp(kvPairPtrKey(self, mid), key, Py_LT, true)) {
-            low = mid+1;
-        } else {
-            high = mid;
-        }
+    int64_t pos = leafLowerBound(record, key);
+    instance_ptr pair = record->data + m_bytes_per_key_value_pair * pos;
+
+    if (pos == record->count || !m_key->cmp(pair, key, Py_EQ, true)) {
+        return 0;
+    }
+
+    if (outIndex) {
+        *outIndex = offset + pos;
+    }
+
+    return pair;
+}
+
+int64_t ConstDictType::lookupIndexByKey(instance_ptr self, instance_ptr key) {
+    int64_t index;
+
+    if (!lookupKvPairByKey(self, key, &index)) {
+        return -1;
     }
 
-    return -1;
+    return index;
 }
 
 instance_ptr ConstDictType::lookupValueByKey(instance_ptr self, instance_ptr key) {
-    int64_t offset = lookupIndexByKey(self, key);
-    if (offset == -1) {
+    instance_ptr pair = lookupKvPairByKey(self, key, nullptr);
+    if (!pair) {
         return 0;
     }
-    return kvPairPtrValue(self, offset);
+    return pair + m_bytes_per_key;
 }
 
 void ConstDictType::constructor(instance_ptr self, int64_t space, bool isPointerTree) {
@@ -519,27 +867,31 @@ void ConstDictType::destroy(instance_ptr self) {
         return;
     }
 
-    layout& record = **(layout**)self;
+    if ((*(layout**)self)->refcount.fetch_sub(1) == 1) {
+        destroyRecord(self);
+    }
+}
 
-    if (record.refcount.fetch_sub(1) == 1) {
-        if (record.subpointers == 0) {
-            m_key->destroy(record.count, [&](long ix) {
-                return record.data + m_bytes_per_key_value_pair * ix;
-            });
-            m_value->destroy(record.count, [&](long ix) {
-                return record.data + m_bytes_per_key_value_pair * ix + m_bytes_per_key;
-            });
-        } else {
-            m_key->destroy(record.subpointers, [&](long ix) {
-                return record.data + m_bytes_per_key_subtree_pair * ix;
-            });
-            ((Type*)this)->destroy(record.subpointers, [&](long ix) {
-                return record.data + m_bytes_per_key_subtree_pair * ix + m_bytes_per_key;
-            });
-        }
+void ConstDictType::destroyRecord(instance_ptr self) {
+    layout& record = **(layout**)self;
 
-        tp_free((*(layout**)self));
+    if (record.subpointers == 0) {
+        m_key->destroy(record.count, [&](long ix) {
+            return record.data + m_bytes_per_key_value_pair * ix;
+        });
+        m_value->destroy(record.count, [&](long ix) {
+            return record.data + m_bytes_per_key_value_pair * ix + m_bytes_per_key;
+        });
+    } else {
+        m_key->destroy(record.subpointers, [&](long ix) {
+            return record.data + m_bytes_per_key_subtree_pair * ix;
+        });
+        ((Type*)this)->destroy(record.subpointers, [&](long ix) {
+            return record.data + m_bytes_per_key_subtree_pair * ix + m_bytes_per_key;
+        });
     }
+
+    tp_free((*(layout**)self));
 }
 
 void ConstDictType::copy_constructor(instance_ptr self, instance_ptr other) {
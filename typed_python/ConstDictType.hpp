@@ -34,12 +34,28 @@ class ConstDictType : public Type {
         int32_t count; //the actual number of items in the tree (in total)
         int32_t subpointers; //if 0, then all values are inline as pairs of (key,value)
                              //otherwise, its an array of '(key, ConstDict(key,value))'
+                             //holding the smallest key of each subtree, followed by an
+                             //array of int32 giving the running total of items in the
+                             //subtrees up to and including each one.
         uint8_t data[];
     };
 
     typedef layout* layout_ptr;
 
 public:
+    // ConstDicts are normally a single sorted array of (key, value) pairs. Adding or
+    // removing a few keys from a big one instead produces a persistent B-tree whose
+    // leaves are ordinary sorted arrays of at most TREE_LEAF_PAIRS items, and whose
+    // interior records have at most TREE_FANOUT subtrees. Each update copies only
+    // the path from the root to the leaf it touches and shares everything else.
+    enum {
+        TREE_LEAF_PAIRS = 64,
+        TREE_FANOUT = 32,
+        // don't bother building trees for dicts smaller than this
+        TREE_MIN_PAIRS = 256,
+        // and only update a tree if the change is this many times smaller than it
+        TREE_UPDATE_RATIO = 8
+    };
 
     ConstDictType(Type* key, Type* value) :
             Type(TypeCategory::catConstDict),
@@ -79,39 +95,66 @@ public:
     // each value. if it returns 'false', exit early.
     template<class visitor_type>
     void visitValues(instance_ptr self, visitor_type visitor) {
-        size_t ct = count(self);
-
-        for (long k = 0; k < ct; k++) {
-            if (!visitor(kvPairPtrValue(self, k))) {
-                return;
+        visitLeaves(self, [&](layout* leaf) {
+            for (long k = 0; k < leaf->count; k++) {
+                if (!visitor(leaf->data + m_bytes_per_key_value_pair * k + m_bytes_per_key)) {
+                    return false;
+                }
             }
-        }
+            return true;
+        });
     }
 
     // hand 'visitor' each key and value instance_ptr as a single tuple.
     // if it returns 'false', exit early.
     template<class visitor_type>
     void visitKeyValuePairs(instance_ptr self, visitor_type visitor) {
-        size_t ct = count(self);
-
-        for (long k = 0; k < ct; k++) {
-            if (!visitor(kvPairPtrKey(self, k))) {
-                return;
+        visitLeaves(self, [&](layout* leaf) {
+            for (long k = 0; k < leaf->count; k++) {
+                if (!visitor(leaf->data + m_bytes_per_key_value_pair * k)) {
+                    return false;
+                }
             }
-        }
+            return true;
+        });
     }
 
     // hand 'visitor' each key and value instance_ptr as two separate arguments.
     // if it returns 'false', exit early.
     template<class visitor_type>
     void visitKeyValuePairsSeparately(instance_ptr self, visitor_type visitor) {
-        size_t ct = count(self);
+        visitLeaves(self, [&](layout* leaf) {
+            for (long k = 0; k < leaf->count; k++) {
+                instance_ptr pair = leaf->data + m_bytes_per_key_value_pair * k;
+
+                if (!visitor(pair, pair + m_bytes_per_key)) {
+                    return false;
+                }
+            }
+            return true;
+        });
+    }
+
+    // hand 'visitor' each leaf record of 'self' in order. if it returns 'false', exit early.
+    template<class visitor_type>
+    bool visitLeaves(instance_ptr self, const visitor_type& visitor) {
+        layout* record = *(layout**)self;
+
+        if (!record) {
+            return true;
+        }
+
+        if (!record->subpointers) {
+            return visitor(record);
+        }
 
-        for (long k = 0; k < ct; k++) {
-            if (!visitor(kvPairPtrKey(self, k), kvPairPtrValue(self, k))) {
-                return;
+        for (long k = 0; k < record->subpointers; k++) {
+            if (!visitLeaves((instance_ptr)&treeChild(record, k), visitor)) {
+                return false;
             }
         }
+
+        return true;
     }
 
     template<class buf_t>
@@ -120,10 +163,11 @@ public:
 
         buffer.writeBeginCompound(fieldNumber);
         buffer.writeUnsignedVarintObject(0, ct);
-        for (long k = 0; k < ct;k++) {
-            m_key->serialize(kvPairPtrKey(self,k),buffer, 0);
-            m_value->serialize(kvPairPtrValue(self,k),buffer, 0);
-        }
+        visitKeyValuePairsSeparately(self, [&](instance_ptr key, instance_ptr value) {
+            m_key->serialize(key, buffer, 0);
+            m_value->serialize(value, buffer, 0);
+            return true;
+        });
 
         buffer.writeEndCompound();
     }
@@ -144,7 +188,7 @@ public:
         auto doDeepcopy = [&]() {
             int bytecount;
             if (srcRecordPtr->subpointers) {
-                bytecount = sizeof(layout) + srcRecordPtr->subpointers * m_bytes_per_key_subtree_pair;
+                bytecount = sizeof(layout) + srcRecordPtr->subpointers * (m_bytes_per_key_subtree_pair + sizeof(int32_t));
             } else {
                 bytecount = sizeof(layout) + srcRecordPtr->count * m_bytes_per_key_value_pair;
             }
@@ -169,6 +213,12 @@ public:
                         context
                     );
                 }
+
+                memcpy(
+                    treeCounts(destRecordPtr),
+                    treeCounts(srcRecordPtr),
+                    sizeof(int32_t) * srcRecordPtr->subpointers
+                );
             } else {
                 for (long k = 0; k < srcRecordPtr->count; k++) {
                     m_key->deepcopy(
@@ -221,10 +271,12 @@ public:
         }
 
         size_t res = bytesRequiredForAllocation(
-            sizeof(layout)
-            + l->subpointers * m_bytes_per_key_subtree_pair
-            + l->count * m_bytes_per_key_value_pair
-            );
+            sizeof(layout) + (
+                l->subpointers
+                ? l->subpointers * (m_bytes_per_key_subtree_pair + sizeof(int32_t))
+                : l->count * m_bytes_per_key_value_pair
+            )
+        );
 
         if (l->subpointers) {
             for (long k = 0; k < l->subpointers; k++) {
@@ -341,6 +393,9 @@ public:
 
     void destroy(instance_ptr self);
 
+    // destroy and free the record held in 'self', whose refcount has already reached zero.
+    void destroyRecord(instance_ptr self);
+
     void copy_constructor(instance_ptr self, instance_ptr other);
 
     void assign(instance_ptr self, instance_ptr other);
@@ -350,6 +405,42 @@ public:
     Type* valueType() const { return m_value; }
 
 private:
+    layout_ptr& treeChild(layout* record, int64_t i) {
+        return *(layout_ptr*)(record->data + m_bytes_per_key_subtree_pair * i + m_bytes_per_key);
+    }
+
+    instance_ptr treeKey(layout* record, int64_t i) {
+        return record->data + m_bytes_per_key_subtree_pair * i;
+    }
+
+    int32_t* treeCounts(layout* record) {
+        return (int32_t*)(record->data + m_bytes_per_key_subtree_pair * record->subpointers);
+    }
+
+    layout* allocateRecord(int64_t pairs, int64_t subtrees);
+
+    layout* makeTreeRecord(layout** subtrees, int64_t count);
+
+    layout* copyLeafPairs(layout* leaf, int64_t start, int64_t count);
+
+    int64_t treeChildFor(layout* record, instance_ptr key);
+
+    int64_t leafLowerBound(layout* leaf, instance_ptr key);
+
+    instance_ptr lookupKvPairByKey(instance_ptr self, instance_ptr key, int64_t* outIndex);
+
+    layout* buildTree(instance_ptr self);
+
+    layout* flattenTree(instance_ptr self);
+
+    layout* treeInsert(layout* record, instance_ptr key, instance_ptr value, layout*& outSplit);
+
+    bool treeRemove(layout* record, instance_ptr key, layout*& outRecord);
+
+    void insertIntoTree(layout*& root, instance_ptr key, instance_ptr value);
+
+    void removeFromTree(layout*& root, instance_ptr key);
+
     Type* m_key;
     Type* m_value;
     size_t m_bytes_per_key;
@@ -2,6 +2,52 @@
 
 #include "lz4frame.h"
 
+namespace {
+
+// decompress the lz4 frame of 'bytecount' bytes at 'data' onto the end of 'out'
+void decompressFrame(uint8_t* data, size_t bytecount, std::vector<uint8_t>& out) {
+    LZ4F_decompressionContext_t compressionContext;
+
+    if (LZ4F_createDecompressionContext(&compressionContext, LZ4F_VERSION)) {
+        throw std::runtime_error("Failed to allocate an lz4 compression context.");
+    }
+
+    size_t bytesDecompressed = 0;
+
+    while (bytesDecompressed < bytecount) {
+        unsigned char compressionBuffer[1024*1024];
+
+        size_t bytesWritten = 1024 * 1024;
+        size_t bytesRead = bytecount - bytesDecompressed;
+
+        size_t result = LZ4F_decompress(
+            compressionContext,
+            compressionBuffer,
+            &bytesWritten,
+            data + bytesDecompressed,
+            &bytesRead,
+            nullptr
+        );
+
+        if (LZ4F_isError(result)) {
+            LZ4F_freeDecompressionContext(compressionContext);
+            throw std::runtime_error("Corrupt data: couldn't decompress a block");
+        }
+
+        out.insert(
+            out.end(),
+            compressionBuffer,
+            compressionBuffer + bytesWritten
+        );
+
+        bytesDecompressed += bytesRead;
+    }
+
+    LZ4F_freeDecompressionContext(compressionContext);
+}
+
+}
+
 bool DeserializationBuffer::decompress() {
     if (!m_context.isCompressionEnabled()) {
         if (m_compressed_block_data_remaining == 0) {
@@ -20,67 +66,59 @@ bool DeserializationBuffer::decompress() {
         m_read_head_offset = 0;
 
         return true;
-    } else {
-        PyEnsureGilReleased releaseTheGil;
+    }
 
-        if (m_compressed_block_data_remaining < sizeof(uint32_t)) {
-            return false;
-        }
+    if (m_compressed_block_data_remaining < sizeof(uint32_t)) {
+        return false;
+    }
+
+    // the blocks to decompress: the next one, and if we can use more than one
+    // thread, the ones after it as well.
+    std::vector<std::pair<uint8_t*, size_t> > frames;
 
+    while (frames.size() < m_parallelism && m_compressed_block_data_remaining >= sizeof(uint32_t)) {
         uint32_t bytesToDecompress = *((uint32_t*)m_compressed_blocks);
 
         if (bytesToDecompress + sizeof(uint32_t) > m_compressed_block_data_remaining) {
             throw std::runtime_error("Corrupt data: can't decompress this large of a block");
         }
 
+        frames.push_back(std::make_pair(m_compressed_blocks + sizeof(uint32_t), bytesToDecompress));
+
         m_compressed_blocks += sizeof(uint32_t) + bytesToDecompress;
         m_compressed_block_data_remaining -= sizeof(uint32_t) + bytesToDecompress;
+    }
 
-        LZ4F_decompressionContext_t compressionContext;
+    PyEnsureGilReleased releaseTheGil;
 
-        if (LZ4F_createDecompressionContext(&compressionContext, LZ4F_VERSION)) {
-            throw std::runtime_error("Failed to allocate an lz4 compression context.");
-        }
+    // drop the data we've already read
+    if (m_read_head_offset) {
+        m_decompressed_buffer.erase(
+            m_decompressed_buffer.begin(),
+            m_decompressed_buffer.begin() + m_read_head_offset
+        );
 
-        size_t bytesDecompressed = 0;
-
-        while (bytesDecompressed < bytesToDecompress) {
-            unsigned char compressionBuffer[1024*1024];
-
-            size_t bytesWritten = 1024 * 1024;
-            size_t bytesRead = bytesToDecompress - bytesDecompressed;
-
-            LZ4F_decompress(
-                compressionContext,
-                compressionBuffer,
-                &bytesWritten,
-                m_compressed_blocks - bytesToDecompress + bytesDecompressed,
-                &bytesRead,
-                nullptr
-            );
-
-            if (m_read_head_offset) {
-                m_decompressed_buffer.erase(
-                    m_decompressed_buffer.begin(),
-                    m_decompressed_buffer.begin() + m_read_head_offset
-                );
-
-                m_read_head_offset = 0;
-            }
-
-            m_decompressed_buffer.insert(
-                m_decompressed_buffer.end(),
-                compressionBuffer,
-                compressionBuffer + bytesWritten
-            );
-            m_size += bytesWritten;
-            m_read_head = &m_decompressed_buffer[0];
-
-            bytesDecompressed += bytesRead;
-        }
+        m_read_head_offset = 0;
+    }
 
-        LZ4F_freeDecompressionContext(compressionContext);
+    size_t priorBytecount = m_decompressed_buffer.size();
 
-        return true;
+    if (frames.size() == 1) {
+        decompressFrame(frames[0].first, frames[0].second, m_decompressed_buffer);
+    } else {
+        std::vector<std::vector<uint8_t> > decompressed(frames.size());
+
+        parallelFor(frames.size(), m_parallelism, [&](size_t frame) {
+            decompressFrame(frames[frame].first, frames[frame].second, decompressed[frame]);
+        });
+
+        for (auto& frameData: decompressed) {
+            m_decompressed_buffer.insert(m_decompressed_buffer.end(), frameData.begin(), frameData.end());
+        }
     }
+
+    m_size += m_decompressed_buffer.size() - priorBytecount;
+    m_read_head = &m_decompressed_buffer[0];
+
+    return true;
 }
@@ -18,6 +18,8 @@
 
 #include "Type.hpp"
 #include "WireType.hpp"
+#include "SerializationBuffer.hpp"
+#include "ParallelFor.hpp"
 #include <stdexcept>
 #include <stdlib.h>
 #include <vector>
@@ -34,11 +36,16 @@ public:
             m_size(0),
             m_compressed_blocks(ptr),
             m_compressed_block_data_remaining(sz),
-            m_pos(0)
+            m_pos(0),
+            m_parallelism(context.parallelism())
     {
     }
 
     ~DeserializationBuffer() {
+        if (m_needs_decref.empty() && m_pyobj_needs_decref.empty()) {
+            return;
+        }
+
         PyEnsureGilAcquired acquireTheGil;
 
         for (auto& typeAndList: m_needs_decref) {
@@ -69,6 +76,25 @@ public:
 
         uint64_t shift = 0;
 
+        // if the longest possible varint is already decompressed, decode it
+        // straight out of the buffer.
+        if (m_size >= 10) {
+            uint8_t* readHead = m_read_head;
+
+            if (!decodeUnsignedVarint(readHead, accumulator)) {
+                throw std::runtime_error("Corrupt data: varint is too long");
+            }
+
+            size_t bytecount = readHead - m_read_head;
+
+            m_size -= bytecount;
+            m_read_head = readHead;
+            m_read_head_offset += bytecount;
+            m_pos += bytecount;
+
+            return accumulator;
+        }
+
         while (true) {
             uint64_t value = read<uint8_t>();
             accumulator += (value & 127) << shift;
@@ -404,6 +430,95 @@ public:
         return ptr;
     }
 
+    // should we read 'count' instances of 'itemTypes' with 'readInParallel'? Only if
+    // we're allowed to use more than one thread, there are enough of them to be worth it,
+    // and they all deserialize independently.
+    bool shouldReadInParallel(size_t count, std::initializer_list<Type*> itemTypes) {
+        if (SerializationBuffer::parallelBlockCount(count, m_parallelism) < 2) {
+            return false;
+        }
+
+        for (Type* t: itemTypes) {
+            if (!typeSerializesIndependently(t)) {
+                return false;
+            }
+        }
+
+        return true;
+    }
+
+    // read 'count' items of 'messagesPerItem' messages each. We find where the
+    // messages start, split them into ranges, and call 'readRange(blockBuffer, lo, hi)'
+    // for each range on worker threads, where 'blockBuffer' holds exactly the messages
+    // for items [lo, hi). 'readRange' must leave nothing in its range constructed if
+    // it throws. If any of them throw, we call 'discardRange(lo, hi)' on each range
+    // that was read successfully before rethrowing.
+    template<class read_range_type, class discard_range_type>
+    void readInParallel(
+            size_t count,
+            size_t messagesPerItem,
+            const read_range_type& readRange,
+            const discard_range_type& discardRange
+    ) {
+        size_t blockCount = SerializationBuffer::parallelBlockCount(count, m_parallelism);
+
+        // the offset of each block relative to the read head, and then the end
+        std::vector<size_t> blockOffsets(blockCount + 1);
+
+        size_t offset = 0;
+
+        for (size_t block = 0; block < blockCount; block++) {
+            blockOffsets[block] = offset;
+
+            size_t messageCount = (count * (block + 1) / blockCount - count * block / blockCount) * messagesPerItem;
+
+            for (size_t k = 0; k < messageCount; k++) {
+                offset = skipMessageAt(offset);
+            }
+        }
+
+        blockOffsets[blockCount] = offset;
+
+        if (!canConsume(offset)) {
+            throw std::runtime_error("out of data");
+        }
+
+        // nothing moves the read head until we're done
+        uint8_t* data = m_read_head;
+
+        std::vector<uint8_t> blockWasRead(blockCount, false);
+
+        try {
+            parallelFor(blockCount, m_parallelism, [&](size_t block) {
+                DeserializationBuffer blockBuffer(
+                    m_context,
+                    data + blockOffsets[block],
+                    blockOffsets[block + 1] - blockOffsets[block]
+                );
+
+                readRange(blockBuffer, count * block / blockCount, count * (block + 1) / blockCount);
+
+                blockWasRead[block] = true;
+
+                if (!blockBuffer.isDone()) {
+                    throw std::runtime_error("Corrupt data: messages didn't line up with their blocks");
+                }
+            });
+        } catch(...) {
+            for (size_t block = 0; block < blockCount; block++) {
+                if (blockWasRead[block]) {
+                    discardRange(count * block / blockCount, count * (block + 1) / blockCount);
+                }
+            }
+            throw;
+        }
+
+        m_size -= offset;
+        m_read_head += offset;
+        m_read_head_offset += offset;
+        m_pos += offset;
+    }
+
     void skipNextEncodedValue() {
         throw std::runtime_error("not implemented yet");
     }
@@ -485,6 +600,57 @@ public:
         *out = readSignedVarint();
     }
 
+    // read 'count' register values of type T with field number 'fieldNumber' into
+    // 'out'. We decode runs of them straight out of the bytes we've already
+    // decompressed, updating our position once per run. We hand any value we can't
+    // decode that way (because it may straddle the end of what's decompressed, or
+    // because it's encoded in some other way) to 'readOne', which should read one
+    // value into its argument the usual way (and produce the usual errors if the
+    // value is malformed).
+    template<class T, class read_one_t>
+    void readRegisterTypes(size_t fieldNumber, T* out, size_t count, const read_one_t& readOne) {
+        // a header and a value, each of which is at most a 10 byte varint.
+        const size_t maxObjectBytes = 20;
+
+        while (count) {
+            size_t decodable = fieldNumber < 16 ? m_size / maxObjectBytes : 0;
+
+            if (decodable > count) {
+                decodable = count;
+            }
+
+            uint8_t* readHead = m_read_head;
+            size_t k = 0;
+
+            for (; k < decodable; k++) {
+                uint8_t* next = readHead;
+
+                if (!decodeRegisterType(next, fieldNumber << 3, out + k)) {
+                    break;
+                }
+
+                readHead = next;
+            }
+
+            size_t bytecount = readHead - m_read_head;
+
+            m_size -= bytecount;
+            m_read_head = readHead;
+            m_read_head_offset += bytecount;
+            m_pos += bytecount;
+
+            out += k;
+            count -= k;
+
+            if (count) {
+                readOne(out);
+
+                out++;
+                count--;
+            }
+        }
+    }
+
     template<class T>
     T read() {
         while (m_size < sizeof(T)) {
@@ -504,8 +670,218 @@ public:
     }
 
 private:
+    // a buffer over 'bytecount' bytes of already-decompressed messages at 'data', owned by
+    // somebody else, for reading one block of a container on a worker thread.
+    DeserializationBuffer(const SerializationContext& context, uint8_t* data, size_t bytecount) :
+            m_context(context),
+            m_read_head(data),
+            m_read_head_offset(0),
+            m_size(bytecount),
+            m_compressed_blocks(nullptr),
+            m_compressed_block_data_remaining(0),
+            m_pos(0),
+            m_parallelism(1)
+    {
+    }
+
     bool decompress();
 
+    // peek at the varint 'offset' bytes past the read head, and move 'offset' past it
+    uint64_t peekUnsignedVarintAt(size_t& offset) {
+        uint64_t res;
+
+        if (canConsume(offset + 10)) {
+            uint8_t* readHead = m_read_head + offset;
+
+            if (!decodeUnsignedVarint(readHead, res)) {
+                throw std::runtime_error("Corrupt data: varint is too long");
+            }
+
+            offset = readHead - m_read_head;
+            return res;
+        }
+
+        res = 0;
+
+        for (uint64_t shift = 0; shift < 70; shift += 7) {
+            if (!canConsume(offset + 1)) {
+                throw std::runtime_error("out of data");
+            }
+
+            uint64_t value = m_read_head[offset++];
+            res += (value & 127) << shift;
+
+            if (value < 128) {
+                return res;
+            }
+        }
+
+        throw std::runtime_error("Corrupt data: varint is too long");
+    }
+
+    // the offset just past the message starting 'offset' bytes past the read head. We
+    // don't consume anything, but we may decompress more data to see the whole message.
+    size_t skipMessageAt(size_t offset) {
+        size_t wireType = peekUnsignedVarintAt(offset) & 7;
+
+        return skipMessageBodyAt(offset, wireType);
+    }
+
+    size_t skipMessageBodyAt(size_t offset, size_t wireType) {
+        if (wireType == WireType::EMPTY || wireType == WireType::END_COMPOUND) {
+            return offset;
+        }
+
+        if (wireType == WireType::VARINT) {
+            peekUnsignedVarintAt(offset);
+            return offset;
+        }
+
+        if (wireType == WireType::BITS_32) {
+            return offset + 4;
+        }
+
+        if (wireType == WireType::BITS_64) {
+            return offset + 8;
+        }
+
+        if (wireType == WireType::BYTES) {
+            size_t bytecount = peekUnsignedVarintAt(offset);
+            return offset + bytecount;
+        }
+
+        if (wireType == WireType::SINGLE) {
+            return skipMessageAt(offset);
+        }
+
+        if (wireType == WireType::BEGIN_COMPOUND) {
+            while (true) {
+                size_t subWireType = peekUnsignedVarintAt(offset) & 7;
+
+                if (subWireType == WireType::END_COMPOUND) {
+                    return offset;
+                }
+
+                offset = skipMessageBodyAt(offset, subWireType);
+            }
+        }
+
+        throw std::runtime_error("Corrupt message with invalid wire type found.");
+    }
+
+    static bool decodeUnsignedVarint(uint8_t*& in, uint64_t& out) {
+        uint64_t shift = 0;
+
+        out = 0;
+
+        for (long k = 0; k < 10; k++) {
+            uint64_t value = *in++;
+            out += (value & 127) << shift;
+            shift += 7;
+
+            if (value < 128) {
+                return true;
+            }
+        }
+
+        return false;
+    }
+
+    static bool decodeSignedVarint(uint8_t*& in, int64_t& out) {
+        uint64_t val;
+
+        if (!decodeUnsignedVarint(in, val)) {
+            return false;
+        }
+
+        bool isNegative = val & 1;
+        val >>= 1;
+        out = isNegative ? -val-1 : val;
+
+        return true;
+    }
+
+    // the decoders below expect a header that fits in a single byte
+    template<class T>
+    static bool decodeBitsRegisterType(uint8_t*& in, uint64_t header, T* out) {
+        if (*in != header) {
+            return false;
+        }
+
+        memcpy(out, in + 1, sizeof(T));
+        in += 1 + sizeof(T);
+
+        return true;
+    }
+
+    template<class T>
+    static bool decodeUnsignedRegisterType(uint8_t*& in, uint64_t header, T* out) {
+        uint64_t value;
+
+        if (*in != header || !decodeUnsignedVarint(++in, value)) {
+            return false;
+        }
+
+        *out = value;
+        return true;
+    }
+
+    template<class T>
+    static bool decodeSignedRegisterType(uint8_t*& in, uint64_t header, T* out) {
+        int64_t value;
+
+        if (*in != header || !decodeSignedVarint(++in, value)) {
+            return false;
+        }
+
+        *out = value;
+        return true;
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, double* out) {
+        return decodeBitsRegisterType(in, fieldBits + WireType::BITS_64, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, float* out) {
+        return decodeBitsRegisterType(in, fieldBits + WireType::BITS_32, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, bool* out) {
+        return decodeUnsignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, uint8_t* out) {
+        return decodeUnsignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, uint16_t* out) {
+        return decodeUnsignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, uint32_t* out) {
+        return decodeUnsignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, uint64_t* out) {
+        return decodeUnsignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, int8_t* out) {
+        return decodeSignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, int16_t* out) {
+        return decodeSignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, int32_t* out) {
+        return decodeSignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
+    static bool decodeRegisterType(uint8_t*& in, uint64_t fieldBits, int64_t* out) {
+        return decodeSignedRegisterType(in, fieldBits + WireType::VARINT, out);
+    }
+
     const SerializationContext& m_context;
 
     std::vector<uint8_t> m_decompressed_buffer;
@@ -518,6 +894,8 @@ private:
 
     size_t m_pos;
 
+    size_t m_parallelism;
+
     // maps indices to the pointers we've cached under that index.
     std::vector<void*> m_cachedPointers;
 
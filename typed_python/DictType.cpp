@@ -266,9 +266,9 @@ int64_t DictType::size(instance_ptr self) const {
 instance_ptr DictType::lookupValueByKey(instance_ptr self, instance_ptr key) const {
     hash_table_layout& record = **(hash_table_layout**)self;
 
-    typed_python_hash_type keyHash = m_key->hash(key);
+    typed_python_wide_hash_type keyHash = record.hashKey(m_key, key);
 
-    int32_t index = record.find(m_bytes_per_key_value_pair, keyHash, [&](instance_ptr ptr) {
+    int64_t index = record.find(m_bytes_per_key_value_pair, keyHash, [&](instance_ptr ptr) {
         return m_key->cmp(key, ptr, Py_EQ, false);
     });
 
@@ -282,9 +282,9 @@ instance_ptr DictType::lookupValueByKey(instance_ptr self, instance_ptr key) con
 bool DictType::deleteKey(instance_ptr self, instance_ptr key) const {
     hash_table_layout& record = **(hash_table_layout**)self;
 
-    typed_python_hash_type keyHash = m_key->hash(key);
+    typed_python_wide_hash_type keyHash = record.hashKey(m_key, key);
 
-    int32_t index = record.remove(m_bytes_per_key_value_pair, keyHash, [&](instance_ptr ptr) {
+    int64_t index = record.remove(m_bytes_per_key_value_pair, keyHash, [&](instance_ptr ptr) {
         return m_key->cmp(key, ptr, Py_EQ, false);
     });
 
@@ -315,9 +315,9 @@ void DictType::clear(instance_ptr self) {
 bool DictType::deleteKeyWithUninitializedValue(instance_ptr self, instance_ptr key) const {
     hash_table_layout& record = **(hash_table_layout**)self;
 
-    typed_python_hash_type keyHash = m_key->hash(key);
+    typed_python_wide_hash_type keyHash = record.hashKey(m_key, key);
 
-    int32_t index = record.remove(m_bytes_per_key_value_pair, keyHash, [&](instance_ptr ptr) {
+    int64_t index = record.remove(m_bytes_per_key_value_pair, keyHash, [&](instance_ptr ptr) {
         return m_key->cmp(key, ptr, Py_EQ, false);
     });
 
@@ -331,11 +331,9 @@ bool DictType::deleteKeyWithUninitializedValue(instance_ptr self, instance_ptr k
 instance_ptr DictType::insertKey(instance_ptr self, instance_ptr key) const {
     hash_table_layout& record = **(hash_table_layout**)self;
 
-    typed_python_hash_type keyHash = m_key->hash(key);
+    int64_t slot = record.allocateNewSlot(m_bytes_per_key_value_pair, m_key);
 
-    int32_t slot = record.allocateNewSlot(m_bytes_per_key_value_pair);
-
-    record.add(keyHash, slot);
+    record.add(record.hashKey(m_key, key), slot);
 
     m_key->copy_constructor(record.items + slot * m_bytes_per_key_value_pair, key);
 
@@ -368,7 +366,8 @@ void DictType::destroy(instance_ptr self) {
         tp_free(record.items);
         tp_free(record.items_populated);
         tp_free(record.hash_table_slots);
-        tp_free(record.hash_table_hashes);
+        tp_free(record.item_hashes);
+        tp_free(record.hash_table_control);
         tp_free(&record);
     }
 }
@@ -156,8 +156,17 @@ public:
         res += bytesRequiredForAllocation(l.items_reserved);
         res += bytesRequiredForAllocation(l.items_reserved * m_bytes_per_key_value_pair);
 
-        // count the hashtable
-        res += bytesRequiredForAllocation(sizeof(int32_t) * l.hash_table_size) * 2;
+        // count the hashtable, which small tables don't have, and its control
+        // bytes, which only Swiss tables have
+        res += bytesRequiredForAllocation(l.item_hash_bytes * l.items_reserved);
+
+        if (l.hash_table_slots) {
+            res += bytesRequiredForAllocation(l.hash_table_slot_bytes * l.hash_table_size);
+        }
+
+        if (l.hash_table_control) {
+            res += bytesRequiredForAllocation(l.hash_table_size);
+        }
 
         if (!m_key->isPOD()) {
             for (long k = 0; k < l.items_reserved; k++) {
@@ -196,13 +205,26 @@ public:
         buffer.writeUnsignedVarintObject(0, id);
         buffer.writeUnsignedVarintObject(0, l.hash_table_count);
 
-        size_t slotsWritten = 2;
-        for (long k = 0; k < l.items_reserved; k++) {
-            if (l.items_populated[k]) {
-                m_key->serialize(l.items + m_bytes_per_key_value_pair * k, buffer, 0);
-                m_value->serialize(l.items + m_bytes_per_key_value_pair * k + m_bytes_per_key, buffer, 0);
-                slotsWritten += 2;
+        std::atomic<size_t> slotsWritten(2);
+
+        auto writeRange = [&](auto& rangeBuffer, size_t lo, size_t hi) {
+            size_t slotsWrittenInRange = 0;
+
+            for (size_t k = lo; k < hi; k++) {
+                if (l.items_populated[k]) {
+                    m_key->serialize(l.items + m_bytes_per_key_value_pair * k, rangeBuffer, 0);
+                    m_value->serialize(l.items + m_bytes_per_key_value_pair * k + m_bytes_per_key, rangeBuffer, 0);
+                    slotsWrittenInRange += 2;
+                }
             }
+
+            slotsWritten += slotsWrittenInRange;
+        };
+
+        if (buffer.shouldWriteInParallel(l.items_reserved, {m_key, m_value})) {
+            buffer.writeInParallel(l.items_reserved, writeRange);
+        } else {
+            writeRange(buffer, 0, l.items_reserved);
         }
 
         buffer.writeEndCompound();
@@ -217,6 +239,7 @@ public:
         size_t count = 0;
         size_t id = 0;
         bool wasFromId = false;
+        size_t pairsReadInParallel = 0;
 
         size_t valuesRead = buffer.consumeCompoundMessageWithImpliedFieldNumbers(wireType,
             [&](size_t fieldNumber, size_t subWireType) {
@@ -242,6 +265,11 @@ public:
                     l.refcount++;
 
                     l.prepareForDeserialization(count, m_bytes_per_key_value_pair);
+
+                    if (buffer.shouldReadInParallel(count, {m_key, m_value})) {
+                        deserializePairsInParallel(l, count, buffer);
+                        pairsReadInParallel = count;
+                    }
                 } else {
                     hash_table_layout& l = **((hash_table_layout**)self);
 
@@ -256,15 +284,67 @@ public:
         });
 
         if (!wasFromId) {
-            if ((valuesRead - 2) / 2 != count) {
+            if ((valuesRead - 2) / 2 + pairsReadInParallel != count) {
                 throw std::runtime_error("Invalid Dict found.");
             }
 
             hash_table_layout& l = **((hash_table_layout**)self);
-            l.buildHashTableAfterDeserialization(
-                m_bytes_per_key_value_pair,
-                [&](instance_ptr ptr) { return m_key->hash(ptr); }
-                );
+            l.buildHashTableAfterDeserialization(m_bytes_per_key_value_pair, m_key);
+        }
+    }
+
+    // read the 'count' key-value pairs of a table prepared for deserialization, on
+    // several threads. If this throws, nothing in the table is left populated.
+    template<class buf_t>
+    void deserializePairsInParallel(hash_table_layout& l, size_t count, buf_t& buffer) {
+        auto readMessage = [&](Type* t, instance_ptr tgt, buf_t& rangeBuffer) {
+            auto fieldAndWire = rangeBuffer.readFieldNumberAndWireType();
+
+            if (fieldAndWire.first != 0) {
+                throw std::runtime_error("Expected all zero field numbers");
+            }
+
+            t->deserialize(tgt, rangeBuffer, fieldAndWire.second);
+        };
+
+        auto discardRange = [&](size_t lo, size_t hi) {
+            for (size_t k = lo; k < hi; k++) {
+                m_key->destroy(l.items + m_bytes_per_key_value_pair * k);
+                m_value->destroy(l.items + m_bytes_per_key_value_pair * k + m_bytes_per_key);
+            }
+        };
+
+        try {
+            buffer.readInParallel(
+                count,
+                2,
+                [&](buf_t& rangeBuffer, size_t lo, size_t hi) {
+                    for (size_t k = lo; k < hi; k++) {
+                        instance_ptr key = l.items + m_bytes_per_key_value_pair * k;
+
+                        try {
+                            readMessage(m_key, key, rangeBuffer);
+                        } catch(...) {
+                            discardRange(lo, k);
+                            throw;
+                        }
+
+                        try {
+                            readMessage(m_value, key + m_bytes_per_key, rangeBuffer);
+                        } catch(...) {
+                            m_key->destroy(key);
+                            discardRange(lo, k);
+                            throw;
+                        }
+                    }
+                },
+                discardRange
+            );
+        } catch(...) {
+            for (size_t k = 0; k < count; k++) {
+                l.items_populated[k] = false;
+            }
+            throw;
         }
     }
 
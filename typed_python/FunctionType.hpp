@@ -20,9 +20,23 @@
 #include "TypedCellType.hpp"
 #include "ReprAccumulator.hpp"
 #include "Format.hpp"
+#include <unordered_map>
 
 class Function;
 
+class HashPyTypeObjectVector {
+public:
+    size_t operator()(const std::vector<PyTypeObject*>& types) const {
+        size_t hash = types.size();
+
+        for (auto t: types) {
+            hash = hash * 1000003 ^ std::hash<PyTypeObject*>()(t);
+        }
+
+        return hash;
+    }
+};
+
 class ClosureVariableBindingStep {
     enum class BindingType {
         FUNCTION = 1,
@@ -535,13 +549,34 @@ public:
                     ) :
             mFuncPtr(funcPtr),
             mReturnType(returnType),
-            mArgTypes(argTypes)
+            mArgTypes(argTypes),
+            mCallCount(0)
         {}
 
         compiled_code_entrypoint getFuncPtr() const {
             return mFuncPtr;
         }
 
+        void setFuncPtr(compiled_code_entrypoint funcPtr) {
+            mFuncPtr = funcPtr;
+        }
+
+        // the number of calls from the interpreter after which we tell the runtime
+        // that a specialization is hot, so that it can recompile it with more
+        // optimization. Zero means we don't count calls at all.
+        static int64_t& hotCallCount() {
+            static int64_t count = 0;
+            return count;
+        }
+
+        // count a call from the interpreter. Returns true exactly once, on the call
+        // that makes this specialization hot. Must be called with the GIL held.
+        bool countCall() const {
+            int64_t threshold = hotCallCount();
+
+            return threshold > 0 && ++mCallCount == threshold;
+        }
+
         Type* getReturnType() const {
             return mReturnType;
         }
@@ -557,10 +592,15 @@ public:
                 ;
         }
 
+        bool hasSameSignatureAs(const CompiledSpecialization& other) const {
+            return mReturnType == other.mReturnType && mArgTypes == other.mArgTypes;
+        }
+
     private:
         compiled_code_entrypoint mFuncPtr;
         Type* mReturnType;
         std::vector<Type*> mArgTypes;
+        mutable int64_t mCallCount;
     };
 
     class Overload {
@@ -913,7 +953,10 @@ public:
             CompiledSpecialization newSpec = CompiledSpecialization(e,returnType,argTypes);
 
             for (auto& spec: mCompiledSpecializations) {
-                if (spec == newSpec) {
+                if (spec.hasSameSignatureAs(newSpec)) {
+                    // this is a recompilation (say, with more optimization) of code
+                    // we already have, so just swap the new code in.
+                    spec.setFuncPtr(e);
                     return;
                 }
             }
@@ -927,6 +970,31 @@ public:
             std::swap(mCompiledSpecializations, other);
         }
 
+        // can we look up specializations by the python types of our arguments?
+        // we only do this for overloads taking a fixed set of arguments.
+        bool canCacheSpecializationLookup() const {
+            return !mHasStarArg && !mHasKwarg;
+        }
+
+        // return the index of the specialization that most recently accepted
+        // arguments with these python types, or -1 if we don't know. This is
+        // only a hint: the specialization may still reject the actual values
+        // (e.g. a Value type or a python function matched by code object), so
+        // callers have to verify it.
+        long cachedSpecializationFor(const std::vector<PyTypeObject*>& argTypes) const {
+            auto it = mSpecializationLookupCache.find(argTypes);
+
+            if (it == mSpecializationLookupCache.end() || it->second >= mCompiledSpecializations.size()) {
+                return -1;
+            }
+
+            return it->second;
+        }
+
+        void cacheSpecializationFor(const std::vector<PyTypeObject*>& argTypes, long specializationIx) const {
+            mSpecializationLookupCache[argTypes] = specializationIx;
+        }
+
         bool operator<(const Overload& other) const {
             if (mFunctionCode < other.mFunctionCode) { return true; }
             if (mFunctionCode > other.mFunctionCode) { return false; }
@@ -1191,6 +1259,7 @@ public:
             mReturnType = other.mReturnType;
             mArgs = other.mArgs;
             mCompiledSpecializations = other.mCompiledSpecializations;
+            mSpecializationLookupCache.clear();
 
             mHasStarArg = other.mHasStarArg;
             mHasKwarg = other.mHasKwarg;
@@ -1469,6 +1538,16 @@ public:
         // actual function arguments
         std::vector<CompiledSpecialization> mCompiledSpecializations;
 
+        // map from the python types of a call's arguments to the index of the
+        // compiled specialization that accepted them. Specializations are only
+        // ever appended, so indices stay valid. This is populated while holding
+        // the GIL, and isn't copied along with the overload.
+        mutable std::unordered_map<
+            std::vector<PyTypeObject*>,
+            long,
+            HashPyTypeObjectVector
+        > mSpecializationLookupCache;
+
         bool mHasStarArg;
         bool mHasKwarg;
         size_t mMinPositionalArgs;
@@ -16,9 +16,15 @@
 
 #pragma once
 
+#include <cstring>
 
 typedef int32_t typed_python_hash_type;
 
+// Dict and Set hashtables too big to index with int32 hash their keys to 64
+// bits, so that they don't collide far more often than a table of that size
+// should. See Type::wideHash.
+typedef int64_t typed_python_wide_hash_type;
+
 
 class HashAccumulator {
 public:
@@ -80,3 +86,50 @@ public:
 private:
     typed_python_hash_type m_state;
 };
+
+
+class WideHashAccumulator {
+public:
+    WideHashAccumulator(typed_python_wide_hash_type init = 0) :
+        m_state(init)
+    {
+    }
+
+    void add(int64_t i) {
+        m_state = int64_t(uint64_t(m_state) * 1099511628211ULL) ^ i;
+    }
+
+    void addBytes(const uint8_t* bytes, int64_t count) {
+        while (count >= 8) {
+            int64_t word;
+            memcpy(&word, bytes, sizeof(word));
+            add(word);
+            bytes += 8;
+            count -= 8;
+        }
+        while (count) {
+            add(*bytes);
+            bytes++;
+            count--;
+        }
+    }
+
+    typed_python_wide_hash_type get() const {
+        return m_state;
+    }
+
+    // floats that hold an integer hash like that integer, so that keys that
+    // compare equal across int and float hash the same.
+    static typed_python_wide_hash_type hashDouble(double d) {
+        if (d >= -9223372036854775808.0 && d < 9223372036854775808.0 && d == (double)(int64_t)d) {
+            return (int64_t)d;
+        }
+
+        int64_t bits;
+        memcpy(&bits, &d, sizeof(bits));
+        return bits;
+    }
+
+private:
+    typed_python_wide_hash_type m_state;
+};
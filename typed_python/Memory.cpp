@@ -2,19 +2,199 @@
 #include "Slab.hpp"
 
 #include <cstddef>
+#include <mutex>
+#include <unordered_set>
 
 static_assert(sizeof(Slab*) <= sizeof(std::max_align_t), "Can't fit a Slab* in the max_align_t?");
 
+namespace {
+
+const size_t kAlign = sizeof(std::max_align_t);
+
+// allocations of up to this many bytes come from the per-thread caches, in size
+// classes that are 'kAlign' bytes apart.
+const size_t kPooledMaxBytes = 256;
+const size_t kPoolClassCount = kPooledMaxBytes / kAlign;
+
+// each thread keeps at most this many bytes of free blocks in each size class.
+const size_t kPoolCacheBytesPerClass = 64 * 1024;
+
+inline size_t pooledBlockBytes(size_t sizeClass) {
+    return (sizeClass + 1) * kAlign + kAlign;
+}
+
+class ThreadAllocationCache;
+
+// every live thread's cache, plus the net count of bytes allocated by threads that
+// have exited (or that allocated while their cache was being torn down).
+class AllocationCacheRegistry {
+public:
+    static AllocationCacheRegistry& get() {
+        static AllocationCacheRegistry* registry = new AllocationCacheRegistry();
+        return *registry;
+    }
+
+    std::mutex mMutex;
+    std::unordered_set<ThreadAllocationCache*> mCaches;
+    std::atomic<int64_t> mRetiredBytes;
+};
+
+class ThreadAllocationCache {
+public:
+    ThreadAllocationCache() : mBytesAllocated(0) {
+        for (size_t k = 0; k < kPoolClassCount; k++) {
+            mFreeBlocks[k] = nullptr;
+            mFreeBlockCount[k] = 0;
+        }
+
+        AllocationCacheRegistry& registry = AllocationCacheRegistry::get();
+        std::lock_guard<std::mutex> lock(registry.mMutex);
+        registry.mCaches.insert(this);
+    }
+
+    ~ThreadAllocationCache();
+
+    void countBytes(int64_t bytes) {
+        // only this thread writes the counter, so there's no need for an atomic add
+        mBytesAllocated.store(
+            mBytesAllocated.load(std::memory_order_relaxed) + bytes,
+            std::memory_order_relaxed
+        );
+    }
+
+    void* allocate(size_t sizeClass) {
+        uint8_t* block = mFreeBlocks[sizeClass];
+
+        if (block) {
+            mFreeBlocks[sizeClass] = *(uint8_t**)block;
+            mFreeBlockCount[sizeClass]--;
+        } else {
+            block = (uint8_t*)malloc(pooledBlockBytes(sizeClass));
+        }
+
+        ((int64_t*)block)[0] = ((int64_t)sizeClass << 1) | 1;
+
+        countBytes(pooledBlockBytes(sizeClass));
+
+        return block + kAlign;
+    }
+
+    // take back a block, which may have been allocated by some other thread.
+    void release(uint8_t* block, size_t sizeClass) {
+        countBytes(-(int64_t)pooledBlockBytes(sizeClass));
+
+        if (mFreeBlockCount[sizeClass] * pooledBlockBytes(sizeClass) >= kPoolCacheBytesPerClass) {
+            free(block);
+            return;
+        }
+
+        *(uint8_t**)block = mFreeBlocks[sizeClass];
+        mFreeBlocks[sizeClass] = block;
+        mFreeBlockCount[sizeClass]++;
+    }
+
+    std::atomic<int64_t> mBytesAllocated;
+
+private:
+    uint8_t* mFreeBlocks[kPoolClassCount];
+    size_t mFreeBlockCount[kPoolClassCount];
+};
+
+thread_local ThreadAllocationCache* tlsAllocationCache = nullptr;
+thread_local bool tlsAllocationCacheDestroyed = false;
+
+ThreadAllocationCache::~ThreadAllocationCache() {
+    for (size_t k = 0; k < kPoolClassCount; k++) {
+        while (mFreeBlocks[k]) {
+            uint8_t* next = *(uint8_t**)mFreeBlocks[k];
+            free(mFreeBlocks[k]);
+            mFreeBlocks[k] = next;
+        }
+    }
+
+    tlsAllocationCache = nullptr;
+    tlsAllocationCacheDestroyed = true;
+
+    AllocationCacheRegistry& registry = AllocationCacheRegistry::get();
+    std::lock_guard<std::mutex> lock(registry.mMutex);
+    registry.mCaches.erase(this);
+    registry.mRetiredBytes += mBytesAllocated.load();
+}
+
+// this thread's cache, or nullptr if the thread is exiting and has already torn it down.
+inline ThreadAllocationCache* threadAllocationCache() {
+    if (tlsAllocationCache) {
+        return tlsAllocationCache;
+    }
+
+    if (tlsAllocationCacheDestroyed) {
+        return nullptr;
+    }
+
+    static thread_local ThreadAllocationCache cache;
+    tlsAllocationCache = &cache;
+
+    return tlsAllocationCache;
+}
+
+inline void countFreeStoreBytes(int64_t bytes) {
+    ThreadAllocationCache* cache = threadAllocationCache();
+
+    if (cache) {
+        cache->countBytes(bytes);
+    } else {
+        AllocationCacheRegistry::get().mRetiredBytes += bytes;
+    }
+}
+
+}
+
+size_t tpBytesAllocatedOnFreeStore() {
+    AllocationCacheRegistry& registry = AllocationCacheRegistry::get();
+    std::lock_guard<std::mutex> lock(registry.mMutex);
+
+    int64_t res = registry.mRetiredBytes.load();
+
+    for (auto cache: registry.mCaches) {
+        res += cache->mBytesAllocated.load(std::memory_order_relaxed);
+    }
+
+    return res;
+}
+
+std::atomic<bool>& tpThreadLocalAllocatorEnabled() {
+    static std::atomic<bool> enabled(true);
+    return enabled;
+}
+
+Slab*& tpCurrentArena() {
+    static thread_local Slab* arena = nullptr;
+    return arena;
+}
+
 void* tp_malloc(size_t s) {
     if (s == 0) {
         return nullptr;
     }
 
+    Slab* arena = tpCurrentArena();
+    if (arena) {
+        return arena->allocate(s, nullptr);
+    }
+
+    if (s <= kPooledMaxBytes && tpThreadLocalAllocatorEnabled().load(std::memory_order_relaxed)) {
+        ThreadAllocationCache* cache = threadAllocationCache();
+
+        if (cache) {
+            return cache->allocate((s - 1) / kAlign);
+        }
+    }
+
     uint8_t* m = (uint8_t*)malloc(s + sizeof(std::max_align_t));
 
     ((int64_t*)m)[0] = -(int64_t)s;
 
-    tpBytesAllocatedOnFreeStore() += s + sizeof(std::max_align_t);
+    countFreeStoreBytes(s + sizeof(std::max_align_t));
 
     return m + sizeof(std::max_align_t);
 }
@@ -29,11 +209,24 @@ void tp_free(void* p) {
     int64_t sizeOrSlab = ((int64_t*)m)[0];
 
     if (sizeOrSlab <= 0) {
-        tpBytesAllocatedOnFreeStore() += sizeOrSlab - sizeof(std::max_align_t);
+        countFreeStoreBytes(sizeOrSlab - sizeof(std::max_align_t));
         free(m);
         return;
     }
 
+    if (sizeOrSlab & 1) {
+        size_t sizeClass = sizeOrSlab >> 1;
+        ThreadAllocationCache* cache = threadAllocationCache();
+
+        if (cache) {
+            cache->release(m, sizeClass);
+        } else {
+            AllocationCacheRegistry::get().mRetiredBytes -= pooledBlockBytes(sizeClass);
+            free(m);
+        }
+        return;
+    }
+
     Slab* slab = ((Slab**)m)[0];
     slab->free(p);
 }
@@ -53,7 +246,7 @@ void* tp_realloc(void* p, size_t oldSize, size_t newSize) {
     int64_t sizeOrSlab = ((int64_t*)m)[0];
 
     if (sizeOrSlab <= 0) {
-        tpBytesAllocatedOnFreeStore() += (int64_t)newSize - (int64_t)oldSize;
+        countFreeStoreBytes((int64_t)newSize - (int64_t)oldSize);
 
         uint8_t* res = (uint8_t*)realloc(m, newSize + sizeof(std::max_align_t));
 
@@ -61,11 +254,14 @@ void* tp_realloc(void* p, size_t oldSize, size_t newSize) {
 
         return res + sizeof(std::max_align_t);
     } else {
-        Slab* slab = ((Slab**)m)[0];
+        // pooled blocks that are still big enough can stay where they are
+        if ((sizeOrSlab & 1) && newSize <= pooledBlockBytes(sizeOrSlab >> 1) - kAlign) {
+            return p;
+        }
 
         void* newData = tp_malloc(newSize);
-        memcpy(newData, m + sizeof(std::max_align_t), std::min(newSize, oldSize));
-        slab->free(p);
+        memcpy(newData, p, std::min(newSize, oldSize));
+        tp_free(p);
 
         return newData;
     }
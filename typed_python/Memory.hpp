@@ -30,6 +30,20 @@ The word can either be the bytecount of the allocation with the top bit set,
 indicating that this is a direct allocation from malloc, or it can be a pointer
 to a Slab object which we decref when the allocation is released.
 
+Small allocations are served from per-thread caches of freed blocks, grouped
+into size classes, so that code churning through lots of small objects
+rarely needs to call malloc. Those blocks have an odd header word holding
+their size class, which can't be confused with a Slab pointer. The cache can
+be turned off with setThreadLocalAllocatorEnabled, in which case every
+allocation goes straight to malloc.
+
+While a Slab arena is entered on a thread (see Slab.hpp), tp_malloc on that
+thread allocates from the arena instead.
+
+Each thread also counts the bytes it allocates and frees on its own, and
+tpBytesAllocatedOnFreeStore adds those counts up when it's asked for the
+total.
+
 ***************/
 
 #include <cstddef>
@@ -43,10 +57,17 @@ void tp_free(void* ptr);
 
 }
 
-inline std::atomic<size_t>& tpBytesAllocatedOnFreeStore() {
-   static std::atomic<size_t> allocatedCount;
-   return allocatedCount;
-}
+// the total number of bytes currently allocated by tp_malloc across all threads,
+// including the header word.
+size_t tpBytesAllocatedOnFreeStore();
+
+// is tp_malloc allowed to serve small allocations from the per-thread caches?
+std::atomic<bool>& tpThreadLocalAllocatorEnabled();
+
+class Slab;
+
+// the arena tp_malloc allocates from on this thread, or nullptr if there isn't one.
+Slab*& tpCurrentArena();
 
 // how many bytes are required to back an allocation of size 's'
 // accounts for alignment and extra pointers.
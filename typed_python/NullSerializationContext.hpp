@@ -40,4 +40,12 @@ public:
     virtual bool isCompressionEnabled() const {
         return false;
     }
+
+    virtual size_t parallelism() const {
+        return 1;
+    }
+
+    virtual bool isColumnarEncodingEnabled() const {
+        return false;
+    }
 };
@@ -97,6 +97,10 @@ typed_python_hash_type OneOfType::hash(instance_ptr left) {
     return m_types[*((uint8_t*)left)]->hash(left+1);
 }
 
+typed_python_wide_hash_type OneOfType::wideHash(instance_ptr left) {
+    return m_types[*((uint8_t*)left)]->wideHash(left+1);
+}
+
 bool OneOfType::cmp(instance_ptr left, instance_ptr right, int pyComparisonOp, bool suppressExceptions) {
     if (((uint8_t*)left)[0] < ((uint8_t*)right)[0]) {
         return cmpResultToBoolForPyOrdering(pyComparisonOp, -1);
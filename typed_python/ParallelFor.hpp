@@ -0,0 +1,71 @@
+/******************************************************************************
+   Copyright 2017-2021 typed_python Authors
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+******************************************************************************/
+
+#pragma once
+
+#include <atomic>
+#include <exception>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+// call 'f(k)' for each k in [0, taskCount) on up to 'threadCount' threads (including the
+// calling one), and return once they've all finished. If any of the calls throw, the
+// remaining tasks are still run, and the first exception is rethrown here.
+//
+// 'f' runs on threads that don't hold the GIL and have no python thread state, so it
+// must not touch python objects.
+template<class func_type>
+void parallelFor(size_t taskCount, size_t threadCount, const func_type& f) {
+    std::atomic<size_t> nextTask(0);
+    std::exception_ptr firstException;
+    std::mutex exceptionMutex;
+
+    auto work = [&]() {
+        while (true) {
+            size_t task = nextTask++;
+
+            if (task >= taskCount) {
+                return;
+            }
+
+            try {
+                f(task);
+            } catch(...) {
+                std::lock_guard<std::mutex> lock(exceptionMutex);
+                if (!firstException) {
+                    firstException = std::current_exception();
+                }
+            }
+        }
+    };
+
+    std::vector<std::thread> threads;
+
+    for (size_t k = 1; k < threadCount && k < taskCount; k++) {
+        threads.push_back(std::thread(work));
+    }
+
+    work();
+
+    for (auto& t: threads) {
+        t.join();
+    }
+
+    if (firstException) {
+        std::rethrow_exception(firstException);
+    }
+}
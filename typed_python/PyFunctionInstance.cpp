@@ -18,6 +18,33 @@
 #include "FunctionCallArgMapping.hpp"
 #include "TypedClosureBuilder.hpp"
 
+// return a borrowed reference to typed_python.compiler.runtime.Runtime.singleton()
+static PyObject* runtimeSingleton() {
+    static PyObject* runtimeModule = ::runtimeModule();
+
+    if (!runtimeModule) {
+        throw std::runtime_error("Internal error: couldn't find typed_python.compiler.runtime");
+    }
+
+    static PyObject* runtimeClass = PyObject_GetAttrString(runtimeModule, "Runtime");
+
+    if (!runtimeClass) {
+        throw std::runtime_error("Internal error: couldn't find typed_python.compiler.runtime.Runtime");
+    }
+
+    static PyObject* singleton = PyObject_CallMethod(runtimeClass, "singleton", "");
+
+    if (!singleton) {
+        if (PyErr_Occurred()) {
+            PyErr_Clear();
+        }
+
+        throw std::runtime_error("Internal error: couldn't call typed_python.compiler.runtime.Runtime.singleton");
+    }
+
+    return singleton;
+}
+
 Function* PyFunctionInstance::type() {
     return (Function*)extractTypeFrom(((PyObject*)this)->ob_type);
 }
@@ -378,18 +405,15 @@ std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToNative(
     ) {
     const Function::Overload& overload(f->getOverloads()[overloadIx]);
 
-    for (const auto& spec: overload.getCompiledSpecializations()) {
-        auto res = dispatchFunctionCallToCompiledSpecialization(
-            overload,
-            f->getClosureType(),
-            functionClosure,
-            spec,
-            mapper
-        );
+    auto res = dispatchFunctionCallToCompiledSpecializations(
+        overload,
+        f->getClosureType(),
+        functionClosure,
+        mapper
+    );
 
-        if (res.first) {
-            return res;
-        }
+    if (res.first) {
+        return res;
     }
 
     if (f->isEntrypoint()) {
@@ -422,47 +446,22 @@ std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToNative(
 
         const Function::Overload& overload2(convertedF->getOverloads()[overloadIx]);
 
-        for (const auto& spec: overload2.getCompiledSpecializations()) {
-            auto res = dispatchFunctionCallToCompiledSpecialization(
-                overload2,
-                convertedF->getClosureType(),
-                convertedFData,
-                spec,
-                mapper
-            );
-
-            if (res.first) {
-                return res;
-            }
-        }
-
-        static PyObject* runtimeModule = ::runtimeModule();
-
-        if (!runtimeModule) {
-            throw std::runtime_error("Internal error: couldn't find typed_python.compiler.runtime");
-        }
-
-        PyObject* runtimeClass = PyObject_GetAttrString(runtimeModule, "Runtime");
-
-        if (!runtimeClass) {
-            throw std::runtime_error("Internal error: couldn't find typed_python.compiler.runtime.Runtime");
-        }
-
-        PyObject* singleton = PyObject_CallMethod(runtimeClass, "singleton", "");
-
-        if (!singleton) {
-            if (PyErr_Occurred()) {
-                PyErr_Clear();
-            }
+        res = dispatchFunctionCallToCompiledSpecializations(
+            overload2,
+            convertedF->getClosureType(),
+            convertedFData,
+            mapper
+        );
 
-            throw std::runtime_error("Internal error: couldn't call typed_python.compiler.runtime.Runtime.singleton");
+        if (res.first) {
+            return res;
         }
 
         PyObjectStealer arguments(mapper.extractFunctionArgumentValues());
 
         PyObject* res = PyObject_CallMethod(
-            singleton,
-            "compileFunctionOverload",
+            runtimeSingleton(),
+            "compileFunctionOverloadForEntrypoint",
             "OlO",
             PyInstance::typePtrToPyTypeRepresentation((Type*)convertedF),
             overloadIx,
@@ -473,22 +472,27 @@ std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToNative(
             throw PythonExceptionSet();
         }
 
+        bool compiledNow = PyObject_IsTrue(res);
+
         decref(res);
 
+        if (!compiledNow) {
+            // the runtime is compiling this specialization in the background.
+            // Run this call in the interpreter in the meantime.
+            return std::pair<bool, PyObject*>(false, (PyObject*)nullptr);
+        }
+
         const Function::Overload& convertedOverload(convertedF->getOverloads()[overloadIx]);
 
-        for (const auto& spec: convertedOverload.getCompiledSpecializations()) {
-            auto res = dispatchFunctionCallToCompiledSpecialization(
-                convertedOverload,
-                convertedF->getClosureType(),
-                convertedFData,
-                spec,
-                mapper
-            );
+        auto dispatchRes = dispatchFunctionCallToCompiledSpecializations(
+            convertedOverload,
+            convertedF->getClosureType(),
+            convertedFData,
+            mapper
+        );
 
-            if (res.first) {
-                return res;
-            }
+        if (dispatchRes.first) {
+            return dispatchRes;
         }
 
         throw std::runtime_error(
@@ -501,6 +505,63 @@ std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToNative(
     return std::pair<bool, PyObject*>(false, (PyObject*)nullptr);
 }
 
+std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToCompiledSpecializations(
+                                                        const Function::Overload& overload,
+                                                        Type* closureType,
+                                                        instance_ptr closureData,
+                                                        const FunctionCallArgMapping& mapper
+                                                        ) {
+    const std::vector<Function::CompiledSpecialization>& specializations = overload.getCompiledSpecializations();
+
+    if (!overload.canCacheSpecializationLookup()) {
+        for (const auto& spec: specializations) {
+            auto res = dispatchFunctionCallToCompiledSpecialization(overload, closureType, closureData, spec, mapper);
+
+            if (res.first) {
+                return res;
+            }
+        }
+
+        return std::pair<bool, PyObject*>(false, (PyObject*)nullptr);
+    }
+
+    std::vector<PyTypeObject*> argTypes;
+    argTypes.reserve(mapper.getSingleValueArgs().size());
+
+    for (PyObject* arg: mapper.getSingleValueArgs()) {
+        argTypes.push_back(arg->ob_type);
+    }
+
+    long cachedIx = overload.cachedSpecializationFor(argTypes);
+
+    if (cachedIx >= 0) {
+        auto res = dispatchFunctionCallToCompiledSpecialization(
+            overload, closureType, closureData, specializations[cachedIx], mapper
+        );
+
+        if (res.first) {
+            return res;
+        }
+    }
+
+    for (long ix = 0; ix < specializations.size(); ix++) {
+        if (ix == cachedIx) {
+            continue;
+        }
+
+        auto res = dispatchFunctionCallToCompiledSpecialization(
+            overload, closureType, closureData, specializations[ix], mapper
+        );
+
+        if (res.first) {
+            overload.cacheSpecializationFor(argTypes, ix);
+            return res;
+        }
+    }
+
+    return std::pair<bool, PyObject*>(false, (PyObject*)nullptr);
+}
+
 std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToCompiledSpecialization(
                                                         const Function::Overload& overload,
                                                         Type* closureType,
@@ -541,6 +602,20 @@ std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToCompiledSpe
         }
     }
 
+    // grab the pointer now: telling the runtime that we're hot may let another thread
+    // install specializations, which can move 'specialization' out from under us.
+    auto functionPtr = specialization.getFuncPtr();
+
+    if (specialization.countCall()) {
+        PyObjectStealer res(
+            PyObject_CallMethod(runtimeSingleton(), "specializationIsHot", "n", (Py_ssize_t)functionPtr)
+        );
+
+        if (!res) {
+            throw PythonExceptionSet();
+        }
+    }
+
     Instance result = Instance::createAndInitialize(returnType, [&](instance_ptr returnData) {
         std::vector<Instance> closureCells;
 
@@ -556,8 +631,6 @@ std::pair<bool, PyObject*> PyFunctionInstance::dispatchFunctionCallToCompiledSpe
             args.push_back(i.dataPtr());
         }
 
-        auto functionPtr = specialization.getFuncPtr();
-
         PyEnsureGilReleased releaseTheGIL;
 
         try {
@@ -1011,35 +1084,13 @@ PyObject* PyFunctionInstance::overload(PyObject* funcObj, PyObject* args, PyObje
 
 /* static */
 PyObject* PyFunctionInstance::resultTypeFor(PyObject* funcObj, PyObject* args, PyObject* kwargs) {
-    static PyObject* runtimeModule = ::runtimeModule();
-
-    if (!runtimeModule) {
-        throw std::runtime_error("Internal error: couldn't find typed_python.compiler.runtime");
-    }
-
-    static PyObject* runtimeClass = PyObject_GetAttrString(runtimeModule, "Runtime");
-
-    if (!runtimeClass) {
-        throw std::runtime_error("Internal error: couldn't find typed_python.compiler.runtime.Runtime");
-    }
-
-    static PyObject* singleton = PyObject_CallMethod(runtimeClass, "singleton", "");
-
-    if (!singleton) {
-        if (PyErr_Occurred()) {
-            PyErr_Clear();
-        }
-
-        throw std::runtime_error("Internal error: couldn't call typed_python.compiler.runtime.Runtime.singleton");
-    }
-
     if (!kwargs) {
         static PyObject* emptyDict = PyDict_New();
         kwargs = emptyDict;
     }
 
     return PyObject_CallMethod(
-        singleton,
+        runtimeSingleton(),
         "resultTypeForCall",
         "OOO",
         funcObj,
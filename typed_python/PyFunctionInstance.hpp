@@ -80,6 +80,16 @@ public:
         const FunctionCallArgMapping& mapping
     );
 
+    //attempt to dispatch to any of the specializations already compiled for 'overload'. We first try
+    //the specialization that last accepted arguments with the same python types, and then fall back
+    //to a linear scan, remembering whichever one matched.
+    static std::pair<bool, PyObject*> dispatchFunctionCallToCompiledSpecializations(
+        const Function::Overload& overload,
+        Type* closureType,
+        instance_ptr closureData,
+        const FunctionCallArgMapping& mapping
+    );
+
     //attempt to dispatch to this one exact specialization by converting each arg to the relevant type. if
     //we can't convert, then return <false, nullptr>. If we do dispatch, return <true, result or none> and set
     //the python exception if native code returns an exception.
@@ -211,6 +211,107 @@ PyObject* PyPointerToInstance::pointerCast(PyObject* o, PyObject* args) {
     return extractPythonObject(self_w->dataPtr(), newType);
 }
 
+// the atomic operations are only defined on PointerTo(int). Returns the
+// address to operate on, or nullptr with a python exception set.
+static int64_t* atomicTargetFor(PyObject* o, const char* methodName) {
+    PyInstance* self_w = (PyInstance*)o;
+    PointerTo* pointerT = (PointerTo*)PyInstance::extractTypeFrom(o->ob_type);
+
+    if (pointerT->getEltType()->getTypeCategory() != Type::TypeCategory::catInt64) {
+        PyErr_Format(PyExc_TypeError, "PointerTo.%s is only defined on PointerTo(int)", methodName);
+        return nullptr;
+    }
+
+    return *(int64_t**)self_w->dataPtr();
+}
+
+//static
+PyDoc_STRVAR(pointerAtomicLoad_doc,
+    "p.atomicLoad() -> the int pointed to by p, read atomically\n"
+    "\n"
+    "Only defined for PointerTo(int). The load is sequentially consistent.\n"
+    );
+PyObject* PyPointerToInstance::pointerAtomicLoad(PyObject* o, PyObject* args) {
+    if (PyTuple_Size(args) != 0) {
+        PyErr_SetString(PyExc_TypeError, "PointerTo.atomicLoad takes zero arguments");
+        return NULL;
+    }
+
+    int64_t* target = atomicTargetFor(o, "atomicLoad");
+
+    if (!target) {
+        return NULL;
+    }
+
+    return PyLong_FromLongLong(__atomic_load_n(target, __ATOMIC_SEQ_CST));
+}
+
+//static
+PyDoc_STRVAR(pointerAtomicStore_doc,
+    "p.atomicStore(v) -> None, and atomically sets the int pointed to by p to v\n"
+    "\n"
+    "Only defined for PointerTo(int). The store is sequentially consistent.\n"
+    );
+PyObject* PyPointerToInstance::pointerAtomicStore(PyObject* o, PyObject* args) {
+    if (PyTuple_Size(args) != 1) {
+        PyErr_SetString(PyExc_TypeError, "PointerTo.atomicStore takes one argument");
+        return NULL;
+    }
+
+    int64_t* target = atomicTargetFor(o, "atomicStore");
+
+    if (!target) {
+        return NULL;
+    }
+
+    int64_t value = PyLong_AsLongLong(PyTuple_GetItem(args, 0));
+
+    if (value == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    __atomic_store_n(target, value, __ATOMIC_SEQ_CST);
+
+    return incref(Py_None);
+}
+
+//static
+PyDoc_STRVAR(pointerCompareExchange_doc,
+    "p.compareExchange(expected, v) -> bool\n"
+    "\n"
+    "Atomically set the int pointed to by p to v if it currently holds\n"
+    "'expected', and return whether we did. Only defined for PointerTo(int).\n"
+    );
+PyObject* PyPointerToInstance::pointerCompareExchange(PyObject* o, PyObject* args) {
+    if (PyTuple_Size(args) != 2) {
+        PyErr_SetString(PyExc_TypeError, "PointerTo.compareExchange takes two arguments");
+        return NULL;
+    }
+
+    int64_t* target = atomicTargetFor(o, "compareExchange");
+
+    if (!target) {
+        return NULL;
+    }
+
+    int64_t expected = PyLong_AsLongLong(PyTuple_GetItem(args, 0));
+
+    if (expected == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    int64_t value = PyLong_AsLongLong(PyTuple_GetItem(args, 1));
+
+    if (value == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+
+    return incref(
+        __atomic_compare_exchange_n(target, &expected, value, false, __ATOMIC_SEQ_CST, __ATOMIC_SEQ_CST)
+        ? Py_True : Py_False
+    );
+}
+
 PyObject* PyPointerToInstance::pyOperatorConcrete(PyObject* rhs, const char* op, const char* opErr) {
     if (strcmp(op, "__add__") == 0 || strcmp(op, "__iadd__") == 0) {
         if (!PyIndex_Check(rhs)) {
@@ -250,12 +351,15 @@ PyObject* PyPointerToInstance::pyOperatorConcrete(PyObject* rhs, const char* op,
 }
 
 PyMethodDef* PyPointerToInstance::typeMethodsConcrete(Type* t) {
-    return new PyMethodDef [6] {
+    return new PyMethodDef [9] {
         {"initialize", (PyCFunction)PyPointerToInstance::pointerInitialize, METH_VARARGS, pointerInitialize_doc},
         {"set", (PyCFunction)PyPointerToInstance::pointerSet, METH_VARARGS, pointerSet_doc},
         {"get", (PyCFunction)PyPointerToInstance::pointerGet, METH_VARARGS, pointerGet_doc},
         {"cast", (PyCFunction)PyPointerToInstance::pointerCast, METH_VARARGS, pointerCast_doc},
         {"destroy", (PyCFunction)PyPointerToInstance::pointerDestroy, METH_VARARGS, pointerDestroy_doc},
+        {"atomicLoad", (PyCFunction)PyPointerToInstance::pointerAtomicLoad, METH_VARARGS, pointerAtomicLoad_doc},
+        {"atomicStore", (PyCFunction)PyPointerToInstance::pointerAtomicStore, METH_VARARGS, pointerAtomicStore_doc},
+        {"compareExchange", (PyCFunction)PyPointerToInstance::pointerCompareExchange, METH_VARARGS, pointerCompareExchange_doc},
         {NULL, NULL}
     };
 }
@@ -36,6 +36,12 @@ public:
 
     static PyObject* pointerCast(PyObject* o, PyObject* args);
 
+    static PyObject* pointerAtomicLoad(PyObject* o, PyObject* args);
+
+    static PyObject* pointerAtomicStore(PyObject* o, PyObject* args);
+
+    static PyObject* pointerCompareExchange(PyObject* o, PyObject* args);
+
     PyObject* pyOperatorConcrete(PyObject* rhs, const char* op, const char* opErr);
 
     static void mirrorTypeInformationIntoPyTypeConcrete(PointerTo* pointerT, PyTypeObject* pyType);
@@ -31,7 +31,22 @@ PyDoc_STRVAR(PySlab_doc,
     "consisting of small ones.\n\n"
     "If you construct the slab with trackInternalReferences=True then we will\n"
     "maintain a list of each allocation, whether it's alive, and Type it was.\n"
-    "This can be used to get diagnostics if your Slabs are leaking."
+    "This can be used to get diagnostics if your Slabs are leaking.\n\n"
+    "Slab.arena() creates a Slab that grows as needed and that can be used as\n"
+    "a context manager. Inside a 'with Slab.arena():' block, every typed_python\n"
+    "allocation made on the current thread (from the interpreter or from\n"
+    "compiled code) comes out of the arena, and the arena's memory is released\n"
+    "in one go once all of those objects are gone."
+);
+
+PyDoc_STRVAR(PySlab_arena_doc,
+    "Slab.arena(trackInternalReferences=False, bytecount=65536, tag=None) -> Slab\n\n"
+    "Create an empty arena. 'bytecount' is the size of the first block of memory\n"
+    "it hands out; each time it fills up it gets a new block twice as big.\n\n"
+    "Use it as 'with Slab.arena() as arena:'. Objects that outlive the block keep\n"
+    "the whole arena alive, which 'liveAllocCount' will show. If\n"
+    "'trackInternalReferences' is True, 'allocIsAlive' and 'allocRefcount' can\n"
+    "be used to find them."
 );
 
 PyDoc_STRVAR(PySlab_refcount_doc,
@@ -101,6 +116,9 @@ PyMethodDef PySlabInstance_methods[] = {
     {"slabPtr", (PyCFunction)PySlab::slabPtr, METH_VARARGS | METH_KEYWORDS, PySlab_slabPtr_doc},
     {"getTag", (PyCFunction)PySlab::getTag, METH_VARARGS | METH_KEYWORDS, NULL},
     {"setTag", (PyCFunction)PySlab::setTag, METH_VARARGS | METH_KEYWORDS, NULL},
+    {"arena", (PyCFunction)PySlab::arena, METH_VARARGS | METH_KEYWORDS | METH_STATIC, PySlab_arena_doc},
+    {"__enter__", (PyCFunction)PySlab::enter, METH_VARARGS | METH_KEYWORDS, NULL},
+    {"__exit__", (PyCFunction)PySlab::exit, METH_VARARGS | METH_KEYWORDS, NULL},
     {NULL}  /* Sentinel */
 };
 
@@ -126,6 +144,53 @@ PyObject* PySlab::setTag(PySlab* self, PyObject* args, PyObject* kwargs) {
     return incref(Py_None);
 }
 
+PyObject* PySlab::arena(PyObject* nullValue, PyObject* args, PyObject* kwargs) {
+    static const char *kwlist[] = {"trackInternalReferences", "bytecount", "tag", NULL};
+
+    int trackInternalReferences = 0;
+    long bytecount = 65536;
+    PyObject* tag = nullptr;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|plO", (char**)kwlist, &trackInternalReferences, &bytecount, &tag)) {
+        return NULL;
+    }
+
+    if (bytecount <= 0) {
+        PyErr_Format(PyExc_ValueError, "bytecount must be positive");
+        return NULL;
+    }
+
+    Slab* slab = new Slab(false, bytecount, true);
+
+    if (tag && tag != Py_None) {
+        slab->setTag(tag);
+    }
+
+    if (trackInternalReferences) {
+        slab->enableTrackAllocTypes();
+    }
+
+    PyObject* res = newPySlab(slab);
+
+    slab->decref();
+
+    return res;
+}
+
+PyObject* PySlab::enter(PySlab* self, PyObject* args, PyObject* kwargs) {
+    return translateExceptionToPyObject([&]() {
+        self->mSlab->enterArena();
+        return incref((PyObject*)self);
+    });
+}
+
+PyObject* PySlab::exit(PySlab* self, PyObject* args, PyObject* kwargs) {
+    return translateExceptionToPyObject([&]() {
+        self->mSlab->exitArena();
+        return incref(Py_False);
+    });
+}
+
 PyObject* PySlab::slabPtr(PySlab* self, PyObject* args, PyObject* kwargs)
 {
     static const char *kwlist[] = {NULL};
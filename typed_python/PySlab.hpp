@@ -54,6 +54,12 @@ public:
     static PyObject* getTag(PySlab* self, PyObject* args, PyObject* kwargs);
 
     static PyObject* setTag(PySlab* self, PyObject* args, PyObject* kwargs);
+
+    static PyObject* arena(PyObject* nullValue, PyObject* args, PyObject* kwargs);
+
+    static PyObject* enter(PySlab* self, PyObject* args, PyObject* kwargs);
+
+    static PyObject* exit(PySlab* self, PyObject* args, PyObject* kwargs);
 };
 
 extern PyTypeObject PyType_Slab;
@@ -46,6 +46,33 @@ void PythonSerializationContext::setFlags() {
     }
 
     mSerializeHashSequence = ((PyObject*)serializeHashSequence) == Py_True;
+
+    // contexts that predate these settings don't have them, and get the defaults
+    if (PyObject_HasAttrString(mContextObj, "parallelism")) {
+        PyObjectStealer parallelism(PyObject_GetAttrString(mContextObj, "parallelism"));
+
+        if (!parallelism) {
+            throw PythonExceptionSet();
+        }
+
+        long parallelismValue = PyLong_AsLong(parallelism);
+
+        if (parallelismValue == -1 && PyErr_Occurred()) {
+            throw PythonExceptionSet();
+        }
+
+        mParallelism = parallelismValue < 1 ? 1 : parallelismValue;
+    }
+
+    if (PyObject_HasAttrString(mContextObj, "columnarEncoding")) {
+        PyObjectStealer columnarEncoding(PyObject_GetAttrString(mContextObj, "columnarEncoding"));
+
+        if (!columnarEncoding) {
+            throw PythonExceptionSet();
+        }
+
+        mColumnarEncoding = ((PyObject*)columnarEncoding) == Py_True;
+    }
 }
 
 std::string PythonSerializationContext::getNameForPyObj(PyObject* o) const {
@@ -83,7 +83,9 @@ public:
     PythonSerializationContext(PyObject* typeSetObj) :
             mContextObj(typeSetObj),
             mCompressionEnabled(false),
-            mSerializeHashSequence(false)
+            mSerializeHashSequence(false),
+            mParallelism(1),
+            mColumnarEncoding(false)
     {
         setFlags();
     }
@@ -94,6 +96,14 @@ public:
         return mCompressionEnabled;
     }
 
+    size_t parallelism() const {
+        return mParallelism;
+    }
+
+    bool isColumnarEncodingEnabled() const {
+        return mColumnarEncoding;
+    }
+
     // should we serialize an integer in the order of the
     // hash sequence rather than the hash itself?
     bool shouldSerializeHashSequence() const {
@@ -188,4 +198,8 @@ private:
     bool mInternalizeTypeGroups;
 
     bool mSerializeHashSequence;
+
+    size_t mParallelism;
+
+    bool mColumnarEncoding;
 };
@@ -24,38 +24,115 @@ Bytes SerializationBuffer::serializeSingleBoolToBytes(bool value) {
     return Bytes((const char*)existsValue, 2);
 }
 
+bool typeSerializesIndependently(Type* t) {
+    switch (t->getTypeCategory()) {
+        case Type::TypeCategory::catNone:
+        case Type::TypeCategory::catBool:
+        case Type::TypeCategory::catUInt8:
+        case Type::TypeCategory::catUInt16:
+        case Type::TypeCategory::catUInt32:
+        case Type::TypeCategory::catUInt64:
+        case Type::TypeCategory::catInt8:
+        case Type::TypeCategory::catInt16:
+        case Type::TypeCategory::catInt32:
+        case Type::TypeCategory::catInt64:
+        case Type::TypeCategory::catFloat32:
+        case Type::TypeCategory::catFloat64:
+        case Type::TypeCategory::catString:
+        case Type::TypeCategory::catBytes:
+        case Type::TypeCategory::catValue:
+            return true;
+        case Type::TypeCategory::catOneOf:
+        case Type::TypeCategory::catTuple:
+        case Type::TypeCategory::catNamedTuple: {
+            bool res = true;
+
+            t->visitContainedTypes([&](Type* subtype) {
+                if (!typeSerializesIndependently(subtype)) {
+                    res = false;
+                }
+            });
+
+            return res;
+        }
+        default:
+            return false;
+    }
+}
+
+/* static */
+std::vector<uint8_t> SerializationBuffer::compressBlock(const uint8_t* data, size_t bytecount) {
+    size_t bytesRequired = LZ4F_compressFrameBound(bytecount, nullptr);
+
+    std::vector<uint8_t> block(sizeof(uint32_t) + bytesRequired);
+
+    size_t compressedBytecount = LZ4F_compressFrame(
+        &block[sizeof(uint32_t)],
+        bytesRequired,
+        data,
+        bytecount,
+        nullptr
+    );
+
+    *(uint32_t*)&block[0] = compressedBytecount;
+
+    block.resize(sizeof(uint32_t) + compressedBytecount);
+
+    return block;
+}
+
 void SerializationBuffer::compress() {
     if (m_last_compression_point == m_size) {
         return;
     }
 
-    //replace the data we have here with a block of 4 bytes of size of compressed data and
-    //then the data stream
-    size_t bytesRequired = LZ4F_compressFrameBound(m_size - m_last_compression_point, nullptr);
+    if (m_parallelism > 1) {
+        // compress this block on another thread and keep going.
+        std::shared_ptr<std::vector<uint8_t> > data(
+            new std::vector<uint8_t>(m_buffer + m_last_compression_point, m_buffer + m_size)
+        );
 
-    void* compressedBytes = malloc(bytesRequired);
+        m_size = m_last_compression_point;
 
-    size_t compressedBytecount;
+        m_pending_blocks.push_back(
+            std::async(std::launch::async, [data]() {
+                return compressBlock(data->data(), data->size());
+            })
+        );
+
+        // don't let more blocks pile up than we have threads to work on them
+        while (m_pending_blocks.size() > m_parallelism) {
+            writeOldestPendingBlock();
+        }
 
-    {
+        return;
+    }
+
+    //replace the data we have here with a block of 4 bytes of size of compressed data and
+    //then the data stream
+    std::vector<uint8_t> block;
+
+    if (m_is_worker) {
+        block = compressBlock(m_buffer + m_last_compression_point, m_size - m_last_compression_point);
+    } else {
         PyEnsureGilReleased releaseTheGil;
 
-        compressedBytecount = LZ4F_compressFrame(
-            compressedBytes,
-            bytesRequired,
-            m_buffer + m_last_compression_point,
-            m_size - m_last_compression_point,
-            nullptr
-        );
+        block = compressBlock(m_buffer + m_last_compression_point, m_size - m_last_compression_point);
     }
 
     m_size = m_last_compression_point;
 
-    write<uint32_t>(compressedBytecount);
+    write_bytes(block.data(), block.size(), false);
+
+    m_last_compression_point = m_size;
+}
+
+void SerializationBuffer::writeOldestPendingBlock() {
+    std::vector<uint8_t> block = m_pending_blocks.front().get();
 
-    write_bytes((uint8_t*)compressedBytes, compressedBytecount, false);
+    m_pending_blocks.pop_front();
 
-    free(compressedBytes);
+    write_bytes(block.data(), block.size(), false);
 
     m_last_compression_point = m_size;
 }
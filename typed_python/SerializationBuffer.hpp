@@ -20,18 +20,29 @@
 #include <stdlib.h>
 #include <map>
 #include <set>
+#include <deque>
+#include <future>
+#include <initializer_list>
 #include "Type.hpp"
 #include "WireType.hpp"
+#include "ParallelFor.hpp"
 
 class Type;
 class SerializationContext;
 class Bytes;
 
+// can instances of 't' be serialized and deserialized without the pointer memo or
+// the python interpreter, so that we can encode and decode many of them at once
+// on separate threads?
+bool typeSerializesIndependently(Type* t);
+
 class SerializationBuffer {
 public:
     SerializationBuffer(const SerializationContext& context) :
             m_context(context),
             m_wants_compress(context.isCompressionEnabled()),
+            m_parallelism(context.parallelism()),
+            m_is_worker(false),
             m_buffer(nullptr),
             m_size(0),
             m_reserved(0),
@@ -40,12 +51,19 @@ public:
     }
 
     ~SerializationBuffer() {
-        PyEnsureGilAcquired acquireTheGil;
+        // wait for any blocks still being compressed on other threads
+        m_pending_blocks.clear();
 
         if (m_buffer) {
             ::free(m_buffer);
         }
 
+        if (m_pointersNeedingDecref.empty() && m_pyObjectsNeedingDecref.empty()) {
+            return;
+        }
+
+        PyEnsureGilAcquired acquireTheGil;
+
         for (auto& typeAndList: m_pointersNeedingDecref) {
             if (typeAndList.first) {
                 typeAndList.first->check([&](auto& concreteType) {
@@ -99,11 +117,10 @@ public:
 
     //write a 'varint' (a la google protobuf encoding)
     void writeUnsignedVarint(uint64_t i) {
-        while (i >= 128) {
-            write<uint8_t>(128 + (i & 127));
-            i >>= 7;
-        }
-        write<uint8_t>(i);
+        // a 64 bit varint is never more than 10 bytes
+        ensure(10);
+
+        m_size = encodeUnsignedVarint(m_buffer + m_size, i) - m_buffer;
     }
 
     //write a signed 'varint' using zigzag encoding (a la google protobuf)
@@ -171,6 +188,33 @@ public:
         writeSignedVarint(v);
     }
 
+    // write 'count' register values as consecutive objects, exactly as calling
+    // writeRegisterType on each of them would, but checking our capacity once
+    // per few thousand values instead of once per byte.
+    template<class T>
+    void writeRegisterTypes(size_t fieldNumber, const T* values, size_t count) {
+        // a header and a value, each of which is at most a 10 byte varint.
+        const size_t maxObjectBytes = 20;
+        const size_t valuesPerChunk = 4096;
+
+        while (count) {
+            size_t chunk = count < valuesPerChunk ? count : valuesPerChunk;
+
+            ensure(chunk * maxObjectBytes);
+
+            uint8_t* out = m_buffer + m_size;
+
+            for (size_t k = 0; k < chunk; k++) {
+                out = encodeRegisterType(out, fieldNumber, values[k]);
+            }
+
+            m_size = out - m_buffer;
+
+            values += chunk;
+            count -= chunk;
+        }
+    }
+
     void writeStringObject(size_t fieldNumber, const std::string& s) {
         writeUnsignedVarint(WireType::BYTES + (fieldNumber << 3));
         writeUnsignedVarint(s.size());
@@ -305,11 +349,85 @@ public:
     void finalize() {
         if (m_wants_compress) {
             compress();
+
+            while (m_pending_blocks.size()) {
+                writeOldestPendingBlock();
+            }
         }
     }
 
     void compress();
 
+    // should we write 'count' instances of 'itemTypes' with 'writeInParallel'? Only if
+    // we're allowed to use more than one thread, there are enough of them to be worth it,
+    // and they all serialize independently.
+    bool shouldWriteInParallel(size_t count, std::initializer_list<Type*> itemTypes) {
+        if (parallelBlockCount(count, m_parallelism) < 2) {
+            return false;
+        }
+
+        for (Type* t: itemTypes) {
+            if (!typeSerializesIndependently(t)) {
+                return false;
+            }
+        }
+
+        return true;
+    }
+
+    // split [0, count) into ranges and call 'writeRange(blockBuffer, lo, hi)' for each
+    // of them on worker threads, each writing into (and compressing) a buffer of its
+    // own, and then append those in order.
+    template<class write_range_type>
+    void writeInParallel(size_t count, const write_range_type& writeRange) {
+        size_t blockCount = parallelBlockCount(count, m_parallelism);
+
+        // everything we've written so far has to come ahead of the blocks
+        if (m_wants_compress) {
+            compress();
+        }
+
+        std::vector<std::vector<uint8_t> > blocks(blockCount);
+
+        parallelFor(blockCount, m_parallelism, [&](size_t block) {
+            SerializationBuffer blockBuffer(m_context, m_wants_compress);
+
+            writeRange(blockBuffer, count * block / blockCount, count * (block + 1) / blockCount);
+
+            blockBuffer.finalize();
+
+            blocks[block].assign(blockBuffer.buffer(), blockBuffer.buffer() + blockBuffer.size());
+        });
+
+        while (m_pending_blocks.size()) {
+            writeOldestPendingBlock();
+        }
+
+        for (auto& block: blocks) {
+            write_bytes(block.data(), block.size(), false);
+        }
+
+        if (m_wants_compress) {
+            m_last_compression_point = m_size;
+        }
+    }
+
+    // how many blocks should we split 'count' items into to serialize them on
+    // 'parallelism' threads? Returns 1 if it's not worth splitting them at all.
+    static size_t parallelBlockCount(size_t count, size_t parallelism) {
+        // blocks smaller than this don't pay for the thread handoff
+        const size_t minItemsPerBlock = 16384;
+
+        if (parallelism < 2 || count < minItemsPerBlock * 2) {
+            return 1;
+        }
+
+        // a few blocks per thread, so that uneven blocks even out
+        size_t blockCount = count / minItemsPerBlock;
+
+        return blockCount < parallelism * 4 ? blockCount : parallelism * 4;
+    }
+
     template< class T>
     void write(T i) {
         ensure(sizeof(i));
@@ -344,15 +462,111 @@ public:
     }
 
 private:
+    // a buffer for one block of a container we're writing in parallel, which
+    // never touches the GIL and never splits its own work up any further.
+    SerializationBuffer(const SerializationContext& context, bool wantsCompress) :
+            m_context(context),
+            m_wants_compress(wantsCompress),
+            m_parallelism(1),
+            m_is_worker(true),
+            m_buffer(nullptr),
+            m_size(0),
+            m_reserved(0),
+            m_last_compression_point(0)
+    {
+    }
+
+    // compress 'bytecount' bytes of 'data' into a block: four bytes holding the size
+    // of the compressed frame, followed by the frame.
+    static std::vector<uint8_t> compressBlock(const uint8_t* data, size_t bytecount);
+
+    // append the compressed block that was handed off first, once it's done.
+    // we must not be holding any uncompressed data.
+    void writeOldestPendingBlock();
+
+    static uint8_t* encodeUnsignedVarint(uint8_t* out, uint64_t i) {
+        while (i >= 128) {
+            *out++ = 128 + (i & 127);
+            i >>= 7;
+        }
+        *out++ = i;
+
+        return out;
+    }
+
+    static uint8_t* encodeSignedVarint(uint8_t* out, int64_t i) {
+        uint64_t val = i < 0 ? -i - 1 : i;
+        val *= 2;
+        if (i < 0) {
+            val += 1;
+        }
+        return encodeUnsignedVarint(out, val);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, double v) {
+        out = encodeUnsignedVarint(out, WireType::BITS_64 + (fieldNumber << 3));
+        memcpy(out, &v, sizeof(v));
+        return out + sizeof(v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, float v) {
+        out = encodeUnsignedVarint(out, WireType::BITS_32 + (fieldNumber << 3));
+        memcpy(out, &v, sizeof(v));
+        return out + sizeof(v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, bool v) {
+        return encodeUnsignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, uint8_t v) {
+        return encodeUnsignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, uint16_t v) {
+        return encodeUnsignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, uint32_t v) {
+        return encodeUnsignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, uint64_t v) {
+        return encodeUnsignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, int8_t v) {
+        return encodeSignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, int16_t v) {
+        return encodeSignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, int32_t v) {
+        return encodeSignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
+    static uint8_t* encodeRegisterType(uint8_t* out, size_t fieldNumber, int64_t v) {
+        return encodeSignedVarint(encodeUnsignedVarint(out, WireType::VARINT + (fieldNumber << 3)), v);
+    }
+
     const SerializationContext& m_context;
 
     bool m_wants_compress;
 
+    size_t m_parallelism;
+
+    bool m_is_worker;
+
     uint8_t* m_buffer;
     size_t m_size;
     size_t m_reserved;
     size_t m_last_compression_point;
 
+    // blocks being compressed on other threads, in the order they go into the buffer
+    std::deque<std::future<std::vector<uint8_t> > > m_pending_blocks;
+
     std::map<void*, int32_t> m_idToPointerCache;
 
     std::map<Type*, std::vector<void*>> m_pointersNeedingDecref;
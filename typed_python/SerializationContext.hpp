@@ -35,4 +35,10 @@ public:
     virtual Type* deserializeNativeType(DeserializationBuffer& b, size_t wireType) const = 0;
 
     virtual bool isCompressionEnabled() const = 0;
+
+    // how many threads we may use to encode, compress, and decode large containers
+    virtual size_t parallelism() const = 0;
+
+    // should we write lists of NamedTuples a column at a time?
+    virtual bool isColumnarEncodingEnabled() const = 0;
 };
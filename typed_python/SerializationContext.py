@@ -123,7 +123,9 @@ class SerializationContext:
         objectToNameOverride=None,
         internalizeTypeGroups=True,
         serializeFunctionGlobalsAsIs=False,
-        serializeHashSequence=False
+        serializeHashSequence=False,
+        parallelism=1,
+        columnarEncoding=False
     ):
         super().__init__()
 
@@ -138,6 +140,8 @@ class SerializationContext:
         self.internalizeTypeGroups = internalizeTypeGroups
         self.serializeFunctionGlobalsAsIs = serializeFunctionGlobalsAsIs
         self.serializeHashSequence = serializeHashSequence
+        self.parallelism = parallelism
+        self.columnarEncoding = columnarEncoding
 
     def addNamedObject(self, name, obj):
         self.nameToObjectOverride[name] = obj
@@ -172,7 +176,9 @@ class SerializationContext:
             objectToNameOverride=self.objectToNameOverride,
             internalizeTypeGroups=self.internalizeTypeGroups,
             serializeFunctionGlobalsAsIs=True,
-            serializeHashSequence=self.serializeHashSequence
+            serializeHashSequence=self.serializeHashSequence,
+            parallelism=self.parallelism,
+            columnarEncoding=self.columnarEncoding
         )
 
     def withoutInternalizingTypeGroups(self):
@@ -191,7 +197,9 @@ class SerializationContext:
             objectToNameOverride=self.objectToNameOverride,
             internalizeTypeGroups=False,
             serializeFunctionGlobalsAsIs=self.serializeFunctionGlobalsAsIs,
-            serializeHashSequence=self.serializeHashSequence
+            serializeHashSequence=self.serializeHashSequence,
+            parallelism=self.parallelism,
+            columnarEncoding=self.columnarEncoding
         )
 
     def withoutLineInfoEncoded(self):
@@ -205,7 +213,9 @@ class SerializationContext:
             objectToNameOverride=self.objectToNameOverride,
             internalizeTypeGroups=self.internalizeTypeGroups,
             serializeFunctionGlobalsAsIs=self.serializeFunctionGlobalsAsIs,
-            serializeHashSequence=self.serializeHashSequence
+            serializeHashSequence=self.serializeHashSequence,
+            parallelism=self.parallelism,
+            columnarEncoding=self.columnarEncoding
         )
 
     def withoutCompression(self):
@@ -219,7 +229,9 @@ class SerializationContext:
             objectToNameOverride=self.objectToNameOverride,
             internalizeTypeGroups=self.internalizeTypeGroups,
             serializeFunctionGlobalsAsIs=self.serializeFunctionGlobalsAsIs,
-            serializeHashSequence=self.serializeHashSequence
+            serializeHashSequence=self.serializeHashSequence,
+            parallelism=self.parallelism,
+            columnarEncoding=self.columnarEncoding
         )
 
     def withCompression(self):
@@ -233,7 +245,66 @@ class SerializationContext:
             objectToNameOverride=self.objectToNameOverride,
             internalizeTypeGroups=self.internalizeTypeGroups,
             serializeFunctionGlobalsAsIs=self.serializeFunctionGlobalsAsIs,
-            serializeHashSequence=self.serializeHashSequence
+            serializeHashSequence=self.serializeHashSequence,
+            parallelism=self.parallelism,
+            columnarEncoding=self.columnarEncoding
+        )
+
+    def withParallelism(self, parallelism):
+        """Encode, compress, and decode large containers on up to 'parallelism' threads.
+
+        ListOf, TupleOf, and Dict instances with many elements are split into blocks
+        that are encoded (and compressed, if compression is enabled) independently
+        on worker threads. Deserializing with such a context decompresses upcoming
+        blocks and decodes those containers in parallel as well. The output is
+        readable by any context: only the work is split, not the format.
+
+        Only containers whose elements are plain data (numbers, strings, bytes, and
+        Tuples, NamedTuples, and OneOfs of those) are split up.
+        """
+        if self.parallelism == parallelism:
+            return self
+
+        return SerializationContext(
+            nameToObjectOverride=self.nameToObjectOverride,
+            compressionEnabled=self.compressionEnabled,
+            encodeLineInformationForCode=self.encodeLineInformationForCode,
+            objectToNameOverride=self.objectToNameOverride,
+            internalizeTypeGroups=self.internalizeTypeGroups,
+            serializeFunctionGlobalsAsIs=self.serializeFunctionGlobalsAsIs,
+            serializeHashSequence=self.serializeHashSequence,
+            parallelism=parallelism,
+            columnarEncoding=self.columnarEncoding
+        )
+
+    def withColumnarEncoding(self):
+        """Write ListOf and TupleOf of NamedTuples one field at a time.
+
+        Each field of the NamedTuple becomes a contiguous column: numbers are
+        written as raw arrays, and strings are dictionary and run-length encoded
+        when they repeat. This is much faster to encode and decode, and compresses
+        much better, for long tables than writing them a row at a time.
+
+        Any context can read the result. Columns are matched to fields by name, so
+        deserializing as a ListOf of a NamedTuple with only some of the fields reads
+        just those columns. Fields with no column get their default values.
+
+        Only NamedTuples of plain data (numbers, strings, bytes, and Tuples,
+        NamedTuples, and OneOfs of those) are written this way.
+        """
+        if self.columnarEncoding:
+            return self
+
+        return SerializationContext(
+            nameToObjectOverride=self.nameToObjectOverride,
+            compressionEnabled=self.compressionEnabled,
+            encodeLineInformationForCode=self.encodeLineInformationForCode,
+            objectToNameOverride=self.objectToNameOverride,
+            internalizeTypeGroups=self.internalizeTypeGroups,
+            serializeFunctionGlobalsAsIs=self.serializeFunctionGlobalsAsIs,
+            serializeHashSequence=self.serializeHashSequence,
+            parallelism=self.parallelism,
+            columnarEncoding=True
         )
 
     def withSerializeHashSequence(self):
@@ -247,7 +318,9 @@ class SerializationContext:
             objectToNameOverride=self.objectToNameOverride,
             internalizeTypeGroups=self.internalizeTypeGroups,
             serializeFunctionGlobalsAsIs=self.serializeFunctionGlobalsAsIs,
-            serializeHashSequence=True
+            serializeHashSequence=True,
+            parallelism=self.parallelism,
+            columnarEncoding=self.columnarEncoding
         )
 
     def nameForObject(self, t):
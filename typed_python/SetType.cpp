@@ -19,8 +19,8 @@ SetType* SetType::Make(Type* eltype, SetType* knownType) {
 
 bool SetType::discard(instance_ptr self, instance_ptr key) {
     hash_table_layout& record = **(hash_table_layout**)self;
-    typed_python_hash_type keyHash = m_key_type->hash(key);
-    int32_t index = record.remove(m_bytes_per_el, keyHash, [&](instance_ptr ptr) {
+    typed_python_wide_hash_type keyHash = record.hashKey(m_key_type, key);
+    int64_t index = record.remove(m_bytes_per_el, keyHash, [&](instance_ptr ptr) {
         return m_key_type->cmp(key, ptr, Py_EQ);
     });
     if (index >= 0) {
@@ -42,17 +42,16 @@ void SetType::clear(instance_ptr self) {
 
 instance_ptr SetType::insertKey(instance_ptr self, instance_ptr key) {
     hash_table_layout& record = **(hash_table_layout**)self;
-    typed_python_hash_type keyHash = m_key_type->hash(key);
-    int32_t slot = record.allocateNewSlot(m_bytes_per_el);
-    record.add(keyHash, slot);
+    int64_t slot = record.allocateNewSlot(m_bytes_per_el, m_key_type);
+    record.add(record.hashKey(m_key_type, key), slot);
     m_key_type->copy_constructor(record.items + slot * m_bytes_per_el, key);
     return record.items + slot * m_bytes_per_el;
 }
 
 instance_ptr SetType::lookupKey(instance_ptr self, instance_ptr key) const {
     hash_table_layout& record = **(hash_table_layout**)self;
-    typed_python_hash_type keyHash = m_key_type->hash(key);
-    int32_t index = record.find(m_bytes_per_el, keyHash,
+    typed_python_wide_hash_type keyHash = record.hashKey(m_key_type, key);
+    int64_t index = record.find(m_bytes_per_el, keyHash,
                                 [&](instance_ptr ptr) { return m_key_type->cmp(key, ptr, Py_EQ); });
     if (index >= 0) {
         return record.items + index * m_bytes_per_el;
@@ -106,7 +105,8 @@ void SetType::destroy(instance_ptr self) {
         tp_free(record.items);
         tp_free(record.items_populated);
         tp_free(record.hash_table_slots);
-        tp_free(record.hash_table_hashes);
+        tp_free(record.item_hashes);
+        tp_free(record.hash_table_control);
         tp_free(&record);
     }
 }
@@ -129,8 +129,17 @@ void deepcopyConcrete(
         res += bytesRequiredForAllocation(l.items_reserved * m_bytes_per_el);
         res += bytesRequiredForAllocation(l.items_reserved);
 
-        // count the hashtable
-        res += bytesRequiredForAllocation(sizeof(int32_t) * l.hash_table_size) * 2;
+        // count the hashtable, which small tables don't have, and its control
+        // bytes, which only Swiss tables have
+        res += bytesRequiredForAllocation(l.item_hash_bytes * l.items_reserved);
+
+        if (l.hash_table_slots) {
+            res += bytesRequiredForAllocation(l.hash_table_slot_bytes * l.hash_table_size);
+        }
+
+        if (l.hash_table_control) {
+            res += bytesRequiredForAllocation(l.hash_table_size);
+        }
 
         if (!m_key_type->isPOD()) {
             for (long k = 0; k < l.items_reserved; k++) {
@@ -224,10 +233,7 @@ void deepcopyConcrete(
             }
 
             hash_table_layout& l = **((hash_table_layout**)self);
-            l.buildHashTableAfterDeserialization(
-                m_bytes_per_el,
-                [&](instance_ptr ptr) { return m_key_type->hash(ptr); }
-            );
+            l.buildHashTableAfterDeserialization(m_bytes_per_el, m_key_type);
         }
     }
 
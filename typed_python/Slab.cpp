@@ -28,3 +28,32 @@ void Slab::free(void* data) {
         decref();
     }
 }
+
+void Slab::enterArena() {
+    if (!mIsArena) {
+        throw std::runtime_error("Only Slabs created by Slab.arena() can be entered.");
+    }
+
+    if (mArenaIsEntered.exchange(true)) {
+        throw std::runtime_error("This arena is already entered.");
+    }
+
+    incref();
+
+    mPreviousArena = tpCurrentArena();
+    tpCurrentArena() = this;
+}
+
+void Slab::exitArena() {
+    if (tpCurrentArena() != this) {
+        throw std::runtime_error(
+            "Arenas have to be exited on the thread that entered them, in the reverse order."
+        );
+    }
+
+    tpCurrentArena() = mPreviousArena;
+    mPreviousArena = nullptr;
+    mArenaIsEntered = false;
+
+    decref();
+}
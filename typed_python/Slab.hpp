@@ -52,35 +52,39 @@ slab looking for incremented refcounts, and if you happen to incref something we
 looked at (and then decref something we're going to look at) you could retain
 an undetected reference.
 
+A Slab can also be an 'arena', which grows by adding more blocks of memory as it fills
+up. While an arena is entered on a thread, tp_malloc on that thread allocates from it
+instead of the free store. Each allocation holds a reference to the arena, so its memory
+is released all at once when every object allocated in it has been destroyed.
+
+Finally, a Slab can live inside a region of memory mapped from a file (see SlabFile.hpp).
+In that case the Slab object itself sits at a fixed offset inside the mapping, so the
+allocation headers written into the file stay valid, and the whole region is unmapped
+when the last reference goes away. Mapped memory isn't counted in
+totalBytesAllocatedInSlabs, since it's backed by the file and shared between processes.
+
 *****************/
 
 class Slab {
 public:
-    Slab(bool isFreeStoreSlab, size_t slabSize) :
+    Slab(bool isFreeStoreSlab, size_t slabSize, bool isArena=false) :
         mSlabBytecount(0),
         mSlabData(nullptr),
         mAllocationPoint(nullptr),
         mIsFreeStore(isFreeStoreSlab),
+        mIsArena(isArena),
+        mArenaIsEntered(false),
+        mPreviousArena(nullptr),
+        mMapping(nullptr),
+        mMappingBytecount(0),
         mRefcount(1),
         mTrackAllocTypes(false),
         mTag(nullptr)
     {
         if (!mIsFreeStore) {
-            if (slabSize > 1024 * 128 && HAVE_MMAP) {
-                size_t pageSize = ::getpagesize();
-                // round up to a page.
-                if (slabSize % pageSize) {
-                    slabSize = slabSize + (pageSize - slabSize % pageSize);
-                }
-
-                mSlabData = (instance_ptr)::mmap(NULL, slabSize, PROT_READ | PROT_WRITE, MAP_ANONYMOUS | MAP_PRIVATE, -1, 0);
-            } else {
-                mSlabData = (instance_ptr)::malloc(slabSize);
-            }
-
+            mSlabData = allocateBlock(slabSize);
             mAllocationPoint = mSlabData;
             mSlabBytecount = slabSize;
-            totalBytesAllocatedInSlabs().fetch_add(slabSize);
         } else {
             if (slabSize > 0) {
                 throw std::runtime_error("Allocate the free-store slab with 0 bytecount please.");
@@ -91,6 +95,34 @@ public:
         aliveSlabs().insert(this);
     }
 
+    // construct a Slab (using placement new) inside of the mapped region 'mapping', handing
+    // out memory from 'data'. The first 'allocatedBytecount' bytes of 'data' are already
+    // in use by allocations holding 'refcount - 1' references to the slab.
+    Slab(
+        uint8_t* mapping,
+        size_t mappingBytecount,
+        instance_ptr data,
+        size_t dataBytecount,
+        size_t allocatedBytecount,
+        size_t refcount
+    ) :
+        mSlabBytecount(dataBytecount),
+        mSlabData(data),
+        mAllocationPoint(data + allocatedBytecount),
+        mIsFreeStore(false),
+        mIsArena(false),
+        mArenaIsEntered(false),
+        mPreviousArena(nullptr),
+        mMapping(mapping),
+        mMappingBytecount(mappingBytecount),
+        mRefcount(refcount),
+        mTrackAllocTypes(false),
+        mTag(nullptr)
+    {
+        std::lock_guard<std::mutex> guard(aliveSlabsMutex());
+        aliveSlabs().insert(this);
+    }
+
     void enableTrackAllocTypes() {
         mTrackAllocTypes = true;
     }
@@ -101,7 +133,8 @@ public:
         }
         unsigned char* p = (unsigned char*)ptr - sizeof(std::max_align_t);
 
-        if (*(int64_t*)p < 0) {
+        // negative headers are plain mallocs, and odd ones are pooled blocks
+        if (*(int64_t*)p < 0 || (*(int64_t*)p & 1)) {
             return nullptr;
         }
 
@@ -109,15 +142,12 @@ public:
     }
 
     ~Slab() {
-        if (!mIsFreeStore) {
-            if (mSlabData) {
-                if (mSlabBytecount > 1024 * 128 && HAVE_MMAP) {
-                    ::munmap(mSlabData, mSlabBytecount);
-                } else {
-                    ::free(mSlabData);
-                }
+        if (!mIsFreeStore && !mMapping) {
+            releaseBlock(mSlabData, mSlabBytecount);
+
+            for (auto& block: mFullBlocks) {
+                releaseBlock(block.first, block.second);
             }
-            totalBytesAllocatedInSlabs().fetch_sub(mSlabBytecount);
         }
 
         if (mTag) {
@@ -152,7 +182,18 @@ public:
                 aliveSlabs().erase(this);
             }
 
-            delete this;
+            if (mMapping) {
+                // we live inside the mapping, so we have to tear ourselves down before
+                // we unmap it.
+                uint8_t* mapping = mMapping;
+                size_t mappingBytecount = mMappingBytecount;
+
+                this->~Slab();
+
+                ::munmap(mapping, mappingBytecount);
+            } else {
+                delete this;
+            }
         }
     }
 
@@ -165,7 +206,13 @@ public:
     }
 
     size_t getBytecount() {
-        return mSlabBytecount;
+        size_t res = mSlabBytecount;
+
+        for (auto& block: mFullBlocks) {
+            res += block.second;
+        }
+
+        return res;
     }
 
     size_t getAllocated() {
@@ -189,8 +236,19 @@ public:
                 bytes = bytes + sizeof(std::max_align_t) - (bytes % sizeof(std::max_align_t));
             }
 
-            if (mAllocationPoint + bytes > mSlabData + mSlabBytecount) {
-                throw std::runtime_error("Slab ran out of data.");
+            if (mAllocationPoint + bytes + sizeof(std::max_align_t) > mSlabData + mSlabBytecount) {
+                if (!mIsArena) {
+                    throw std::runtime_error("Slab ran out of data.");
+                }
+
+                // start a new block at least twice as big as the last one
+                size_t newBytecount = std::max(mSlabBytecount * 2, bytes + sizeof(std::max_align_t));
+
+                mFullBlocks.push_back(std::make_pair(mSlabData, mSlabBytecount));
+
+                mSlabData = allocateBlock(newBytecount);
+                mAllocationPoint = mSlabData;
+                mSlabBytecount = newBytecount;
             }
 
             incref();
@@ -265,7 +323,51 @@ public:
         return mTag;
     }
 
+    bool isArena() {
+        return mIsArena;
+    }
+
+    // make this arena the one that tp_malloc allocates from on this thread, until
+    // the matching call to exitArena.
+    void enterArena();
+
+    void exitArena();
+
 private:
+    // allocate a block of memory for the slab, rounding 'bytecount' up to a whole
+    // number of pages if the block is big enough to get from mmap.
+    static instance_ptr allocateBlock(size_t& bytecount) {
+        instance_ptr res;
+
+        if (bytecount > 1024 * 128 && HAVE_MMAP) {
+            size_t pageSize = ::getpagesize();
+            // round up to a page.
+            if (bytecount % pageSize) {
+                bytecount = bytecount + (pageSize - bytecount % pageSize);
+            }
+
+            res = (instance_ptr)::mmap(NULL, bytecount, PROT_READ | PROT_WRITE, MAP_ANONYMOUS | MAP_PRIVATE, -1, 0);
+        } else {
+            res = (instance_ptr)::malloc(bytecount);
+        }
+
+        totalBytesAllocatedInSlabs().fetch_add(bytecount);
+
+        return res;
+    }
+
+    static void releaseBlock(instance_ptr block, size_t bytecount) {
+        if (block) {
+            if (bytecount > 1024 * 128 && HAVE_MMAP) {
+                ::munmap(block, bytecount);
+            } else {
+                ::free(block);
+            }
+        }
+
+        totalBytesAllocatedInSlabs().fetch_sub(bytecount);
+    }
+
     // how many bytes we allocated
     size_t mSlabBytecount;
 
@@ -277,8 +379,23 @@ private:
     // the allocation point within the slab
     instance_ptr mAllocationPoint;
 
+    // for arenas, the blocks we've already filled up, and their sizes
+    std::vector<std::pair<instance_ptr, size_t> > mFullBlocks;
+
     bool mIsFreeStore;
 
+    bool mIsArena;
+
+    std::atomic<bool> mArenaIsEntered;
+
+    // the arena that was current on this thread when we entered this one
+    Slab* mPreviousArena;
+
+    // if we live in a region mapped from a file, the region
+    uint8_t* mMapping;
+
+    size_t mMappingBytecount;
+
     bool mTrackAllocTypes;
 
     std::mutex mAllocMutex;
@@ -0,0 +1,328 @@
+/******************************************************************************
+   Copyright 2017-2021 typed_python Authors
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+******************************************************************************/
+
+#include "SlabFile.hpp"
+#include "AllTypes.hpp"
+#include "DeepcopyContext.hpp"
+
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/stat.h>
+#include <chrono>
+
+namespace {
+
+const char kSlabFileMagic[8] = {'T', 'P', 'S', 'L', 'A', 'B', 0, 0};
+
+// bump this whenever the memory layout of any of the mappable types changes.
+const uint64_t kSlabFileFormatVersion = 1;
+
+// random base addresses come out of this range, which linux leaves empty in 64-bit
+// processes: the executable and the heap live below it, and shared libraries and
+// other mappings live above it.
+const uint64_t kMinRandomBaseAddress = 0x200000000000;
+const uint64_t kMaxRandomBaseAddress = 0x600000000000;
+
+const uint64_t kBaseAddressAlignment = 2 * 1024 * 1024;
+
+// a number that's different every time we're called, in any process.
+uint64_t randomSeed() {
+    static std::atomic<uint64_t> counter;
+
+    uint64_t x = std::chrono::high_resolution_clock::now().time_since_epoch().count()
+        ^ ((uint64_t)::getpid() << 32)
+        ^ (counter++ * 0x9e3779b97f4a7c15ULL);
+
+    // splitmix64's finalizer, to spread the bits around
+    x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9ULL;
+    x = (x ^ (x >> 27)) * 0x94d049bb133111ebULL;
+    return x ^ (x >> 31);
+}
+
+size_t roundUp(size_t value, size_t alignment) {
+    return (value + alignment - 1) / alignment * alignment;
+}
+
+// map 'bytecount' bytes of 'fd' (or anonymous memory if 'fd' is -1) at exactly 'address'.
+// returns false if any of that range is already in use.
+bool mapAtAddress(uint64_t address, size_t bytecount, int fd) {
+    int flags = MAP_PRIVATE | (fd == -1 ? MAP_ANONYMOUS : 0);
+
+#ifdef MAP_FIXED_NOREPLACE
+    flags |= MAP_FIXED_NOREPLACE;
+#endif
+
+    void* res = ::mmap((void*)address, bytecount, PROT_READ | PROT_WRITE, flags, fd, 0);
+
+    if (res == MAP_FAILED) {
+        return false;
+    }
+
+    // older kernels treat the address as a hint and put the mapping somewhere else
+    if (res != (void*)address) {
+        ::munmap(res, bytecount);
+        return false;
+    }
+
+    return true;
+}
+
+bool typeIsMappable(Type* t, std::unordered_set<Type*>& visited) {
+    if (!visited.insert(t).second) {
+        return true;
+    }
+
+    bool res = true;
+
+    auto check = [&](Type* subtype) {
+        if (!typeIsMappable(subtype, visited)) {
+            res = false;
+        }
+    };
+
+    switch (t->getTypeCategory()) {
+        case Type::TypeCategory::catNone:
+        case Type::TypeCategory::catBool:
+        case Type::TypeCategory::catUInt8:
+        case Type::TypeCategory::catUInt16:
+        case Type::TypeCategory::catUInt32:
+        case Type::TypeCategory::catUInt64:
+        case Type::TypeCategory::catInt8:
+        case Type::TypeCategory::catInt16:
+        case Type::TypeCategory::catInt32:
+        case Type::TypeCategory::catInt64:
+        case Type::TypeCategory::catFloat32:
+        case Type::TypeCategory::catFloat64:
+        case Type::TypeCategory::catString:
+        case Type::TypeCategory::catBytes:
+        case Type::TypeCategory::catValue:
+            return true;
+        case Type::TypeCategory::catForward:
+            return ((Forward*)t)->getTarget() && typeIsMappable(((Forward*)t)->getTarget(), visited);
+        case Type::TypeCategory::catOneOf:
+        case Type::TypeCategory::catTuple:
+        case Type::TypeCategory::catNamedTuple:
+        case Type::TypeCategory::catConcreteAlternative:
+            t->visitContainedTypes(check);
+            return res;
+        case Type::TypeCategory::catListOf:
+        case Type::TypeCategory::catTupleOf:
+        case Type::TypeCategory::catDict:
+        case Type::TypeCategory::catSet:
+        case Type::TypeCategory::catConstDict:
+            t->visitReferencedTypes(check);
+            return res;
+        case Type::TypeCategory::catAlternative:
+            for (auto& nameAndType: ((Alternative*)t)->subtypes()) {
+                check(nameAndType.second);
+            }
+            return res;
+        default:
+            return false;
+    }
+}
+
+void writeAll(int fd, const uint8_t* data, size_t bytecount, const std::string& path) {
+    while (bytecount) {
+        ssize_t written = ::write(fd, data, bytecount);
+
+        if (written < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            throw std::runtime_error("Failed writing to " + path + ": " + strerror(errno));
+        }
+
+        data += written;
+        bytecount -= written;
+    }
+}
+
+}
+
+bool typeIsMappable(Type* t) {
+    std::unordered_set<Type*> visited;
+    return typeIsMappable(t, visited);
+}
+
+void writeInstanceToSlabFile(Type* t, instance_ptr instance, const std::string& path, uint64_t baseAddress) {
+    if (!typeIsMappable(t)) {
+        throw std::runtime_error(
+            "Instances of " + t->name() + " can't be written to a slab file because they "
+            "can hold Class instances or python objects."
+        );
+    }
+
+    size_t pageSize = ::getpagesize();
+
+    std::unordered_set<void*> visited;
+    size_t dataBytecount = t->deepBytecount(instance, visited, nullptr);
+
+    SlabFileHeader header;
+    memset(&header, 0, sizeof(header));
+    memcpy(header.magic, kSlabFileMagic, sizeof(kSlabFileMagic));
+    header.formatVersion = kSlabFileFormatVersion;
+    header.rootOffset = roundUp(sizeof(SlabFileHeader), sizeof(std::max_align_t));
+    header.rootBytecount = t->bytecount();
+    header.slabOffset = roundUp(header.rootOffset + header.rootBytecount, alignof(Slab));
+    header.dataOffset = roundUp(header.slabOffset + sizeof(Slab), pageSize);
+    header.dataBytecount = dataBytecount;
+    header.fileBytecount = roundUp(header.dataOffset + dataBytecount, pageSize);
+    header.rootTypeHash = t->identityHash();
+
+    if (baseAddress) {
+        if (baseAddress % pageSize) {
+            throw std::runtime_error("baseAddress must be a multiple of the page size");
+        }
+        header.baseAddress = baseAddress;
+    } else {
+        uint64_t slotCount = (kMaxRandomBaseAddress - kMinRandomBaseAddress - header.fileBytecount) / kBaseAddressAlignment;
+
+        header.baseAddress = kMinRandomBaseAddress
+            + randomSeed() % slotCount * kBaseAddressAlignment;
+    }
+
+    if (!mapAtAddress(header.baseAddress, header.fileBytecount, -1)) {
+        throw std::runtime_error(
+            "Couldn't reserve " + format(header.fileBytecount) + " bytes at address "
+            + format((void*)header.baseAddress) + " to build the slab file."
+        );
+    }
+
+    uint8_t* mapping = (uint8_t*)header.baseAddress;
+    instance_ptr root = mapping + header.rootOffset;
+
+    Slab* slab = new (mapping + header.slabOffset) Slab(
+        mapping,
+        header.fileBytecount,
+        mapping + header.dataOffset,
+        dataBytecount,
+        0,
+        1
+    );
+
+    bool rootIsInitialized = false;
+
+    try {
+        DeepcopyContext context(slab);
+        t->deepcopy(root, instance, context);
+        rootIsInitialized = true;
+
+        if (slab->getAllocated() != dataBytecount) {
+            throw std::runtime_error(
+                "Bytes wrong: " + format(dataBytecount) + " != " + format(slab->getAllocated())
+            );
+        }
+
+        header.allocationCount = slab->refcount() - 1;
+        memcpy(mapping, &header, sizeof(header));
+
+        int fd = ::open(path.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0644);
+        if (fd == -1) {
+            throw std::runtime_error("Failed to open " + path + ": " + strerror(errno));
+        }
+
+        try {
+            writeAll(fd, mapping, header.fileBytecount, path);
+        } catch(...) {
+            ::close(fd);
+            throw;
+        }
+
+        ::close(fd);
+    } catch(...) {
+        if (rootIsInitialized) {
+            t->destroy(root);
+        }
+        slab->decref();
+        throw;
+    }
+
+    // releasing the copy drops the slab's refcount back down to one, and
+    // releasing that reference unmaps it.
+    t->destroy(root);
+    slab->decref();
+}
+
+void mapInstanceFromSlabFile(Type* t, const std::string& path, std::function<void (instance_ptr)> withRoot) {
+    int fd = ::open(path.c_str(), O_RDONLY);
+    if (fd == -1) {
+        throw std::runtime_error("Failed to open " + path + ": " + strerror(errno));
+    }
+
+    SlabFileHeader header;
+    struct stat fileStat;
+
+    try {
+        if (::pread(fd, &header, sizeof(header), 0) != sizeof(header)
+                || memcmp(header.magic, kSlabFileMagic, sizeof(kSlabFileMagic))) {
+            throw std::runtime_error(path + " is not a slab file.");
+        }
+
+        if (header.formatVersion != kSlabFileFormatVersion) {
+            throw std::runtime_error(
+                path + " was written with slab file format version " + format(header.formatVersion)
+                + ", but this version of typed_python reads version " + format(kSlabFileFormatVersion)
+            );
+        }
+
+        if (header.rootTypeHash != t->identityHash() || header.rootBytecount != t->bytecount()) {
+            throw std::runtime_error(path + " doesn't hold an instance of " + t->name());
+        }
+
+        if (::fstat(fd, &fileStat) || (uint64_t)fileStat.st_size != header.fileBytecount) {
+            throw std::runtime_error(path + " is truncated.");
+        }
+
+        if (!mapAtAddress(header.baseAddress, header.fileBytecount, fd)) {
+            throw std::runtime_error(
+                "Can't map " + path + " at address " + format((void*)header.baseAddress)
+                + " because that address range is already in use in this process. Write it "
+                "again with a different baseAddress."
+            );
+        }
+    } catch(...) {
+        ::close(fd);
+        throw;
+    }
+
+    // the mapping holds its own reference to the file
+    ::close(fd);
+
+    uint8_t* mapping = (uint8_t*)header.baseAddress;
+
+    Slab* slab = new (mapping + header.slabOffset) Slab(
+        mapping,
+        header.fileBytecount,
+        mapping + header.dataOffset,
+        header.dataBytecount,
+        header.dataBytecount,
+        header.allocationCount + 1
+    );
+
+    // the root instance in the file holds references to the objects it points to,
+    // which we have to give back once the caller has taken its own.
+    try {
+        withRoot(mapping + header.rootOffset);
+    } catch(...) {
+        t->destroy(mapping + header.rootOffset);
+        slab->decref();
+        throw;
+    }
+
+    t->destroy(mapping + header.rootOffset);
+    slab->decref();
+}
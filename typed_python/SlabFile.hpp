@@ -0,0 +1,93 @@
+/******************************************************************************
+   Copyright 2017-2021 typed_python Authors
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+******************************************************************************/
+
+#pragma once
+
+#include "Type.hpp"
+#include "ShaHash.hpp"
+
+/****************
+
+SlabFile:
+
+Lays out a typed_python object graph on disk exactly the way it would sit in a
+contiguous Slab in memory, so that loading it is just an mmap: no decompression, no
+parsing, and no copying. Processes that map the same file share its physical pages
+until they write to them.
+
+The graph contains raw pointers, so each file is built to be mapped at one
+particular virtual address, picked when it's written (at random inside a range
+that processes on 64-bit linux leave empty, unless the caller chooses one). If that
+address range is already in use in the loading process, loading fails rather than
+relocating the graph.
+
+The file looks like this:
+
+    SlabFileHeader
+    the bytes of the root instance
+    space for the Slab object that owns the mapping
+    (page aligned) the slab's data, containing every allocation in the graph
+
+Only types whose layouts consist of plain data and pointers within the graph can
+be written: numbers, strings and bytes, ListOf, TupleOf, Dict, Set, ConstDict,
+Tuple, NamedTuple, OneOf and Alternatives of those. Classes (which hold vtable
+pointers) and arbitrary python objects can't be.
+
+Objects in a mapped file behave like any other slab-allocated objects: taking a
+reference writes to their refcount, which gives the process a private copy of that
+page, and mutating them is allowed and stays private to the process.
+
+*****************/
+
+class SlabFileHeader {
+public:
+    char magic[8];
+
+    uint64_t formatVersion;
+
+    // the address the file must be mapped at
+    uint64_t baseAddress;
+
+    uint64_t fileBytecount;
+
+    uint64_t rootOffset;
+
+    uint64_t rootBytecount;
+
+    uint64_t slabOffset;
+
+    uint64_t dataOffset;
+
+    uint64_t dataBytecount;
+
+    // the number of allocations in the slab, each of which holds a reference to it
+    uint64_t allocationCount;
+
+    // identityHash of the root type
+    ShaHash rootTypeHash;
+};
+
+// can instances of 't' be written with writeInstanceToSlabFile?
+bool typeIsMappable(Type* t);
+
+// write 'instance' (of type 't') and everything it refers to into 'path'. If 'baseAddress'
+// is zero, pick one at random.
+void writeInstanceToSlabFile(Type* t, instance_ptr instance, const std::string& path, uint64_t baseAddress);
+
+// map the file at 'path', which must have been written from an instance of 't', and
+// call 'withRoot' with a pointer to the root instance. The mapping stays alive as
+// long as any references to the objects inside of it do.
+void mapInstanceFromSlabFile(Type* t, const std::string& path, std::function<void (instance_ptr)> withRoot);
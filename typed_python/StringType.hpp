@@ -291,6 +291,20 @@ public:
         return (*(layout**)left)->hash_cache;
     }
 
+    static typed_python_wide_hash_type wideHash_static(instance_ptr left) {
+        if (!(*(layout**)left)) {
+            return 0x12345;
+        }
+
+        layout* stringPtr = *(layout**)left;
+
+        WideHashAccumulator acc((int)TypeCategory::catString);
+
+        acc.addBytes(stringPtr->data, stringPtr->bytes_per_codepoint * stringPtr->pointcount);
+
+        return acc.get();
+    }
+
     static uint32_t getpoint(layout *l, uint64_t i);
 
     static uint32_t getord(layout *l);
@@ -17,6 +17,18 @@
 #pragma once
 
 #include "Type.hpp"
+#include "RegisterTypes.hpp"
+
+class NamedTuple;
+
+// defined in ColumnarSerialization.hpp, which needs StringType, which in turn needs us.
+inline bool canSerializeColumnar(Type* eltType);
+
+template<class buf_t>
+void serializeColumnar(NamedTuple* eltType, instance_ptr data, size_t ct, buf_t& buffer);
+
+template<class buf_t>
+void deserializeColumnar(NamedTuple* eltType, instance_ptr data, size_t ct, buf_t& buffer);
 
 class TupleOrListOfType : public Type {
 public:
@@ -61,6 +73,219 @@ public:
 
     bool _updateAfterForwardTypesChanged();
 
+    // lists of register types get serialized as one run of values, rather than
+    // by calling 'serialize' on each element. Overload resolution picks the
+    // RegisterType version for element types that are register types.
+    template<class buf_t, class T>
+    static bool serializeRegisterElements(RegisterType<T>* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+        buffer.writeRegisterTypes(0, (T*)data, ct);
+        return true;
+    }
+
+    template<class buf_t>
+    static bool serializeRegisterElements(Type* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+        return false;
+    }
+
+    // likewise, read 'ct' register elements into 'data' as one run. Returns false,
+    // having read nothing, if the caller needs to call 'deserialize' on each element.
+    template<class buf_t, class T>
+    static bool deserializeRegisterElements(RegisterType<T>* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+        buffer.readRegisterTypes(0, (T*)data, ct, [&](T* out) {
+            deserializeElement(*eltType, (instance_ptr)out, buffer);
+        });
+        return true;
+    }
+
+    template<class buf_t>
+    static bool deserializeRegisterElements(Type* eltType, instance_ptr data, size_t ct, buf_t& buffer) {
+        return false;
+    }
+
+    template<class T>
+    static bool isRegisterElementType(RegisterType<T>* eltType) {
+        return true;
+    }
+
+    static bool isRegisterElementType(Type* eltType) {
+        return false;
+    }
+
+    // write our count and then our elements: a column at a time if we hold NamedTuples
+    // and the context asks for it, and one after the other otherwise.
+    template<class buf_t>
+    void serializeCountAndElements(instance_ptr self, size_t ct, buf_t& buffer) {
+        if (ct && buffer.getContext().isColumnarEncodingEnabled() && canSerializeColumnar(m_element_type)) {
+            buffer.writeUnsignedVarintObject(1, ct);
+            serializeColumnar((NamedTuple*)m_element_type, eltPtr(self, 0), ct, buffer);
+        } else {
+            buffer.writeUnsignedVarintObject(0, ct);
+            serializeElements(self, ct, buffer);
+        }
+    }
+
+    // read the count written by 'serializeCountAndElements'. Returns the count, and
+    // whether the elements were written a column at a time.
+    template<class buf_t>
+    static std::pair<size_t, bool> deserializeCount(buf_t& buffer) {
+        auto fieldAndWire = buffer.readFieldNumberAndWireType();
+        assertWireTypesEqual(fieldAndWire.second, WireType::VARINT);
+
+        size_t ct = buffer.readUnsignedVarint();
+
+        return std::make_pair(ct, fieldAndWire.first == 1);
+    }
+
+    // construct a list of 'ct' elements at 'self' from columns written by
+    // 'serializeCountAndElements'.
+    template<class buf_t>
+    void deserializeColumns(instance_ptr self, size_t ct, buf_t& buffer) {
+        if (m_element_type->getTypeCategory() != TypeCategory::catNamedTuple) {
+            throw std::runtime_error("Can't deserialize " + name() + " from a list written a column at a time.");
+        }
+
+        layout_ptr& selfLayout = allocateUninitialized(self, ct);
+
+        try {
+            deserializeColumnar((NamedTuple*)m_element_type, selfLayout->data, ct, buffer);
+        } catch(...) {
+            tp_free(selfLayout->data);
+            tp_free(selfLayout);
+            selfLayout = nullptr;
+            throw;
+        }
+    }
+
+    // allocate a list at 'self' with room for, and a count of, 'ct' elements, none of
+    // which are initialized yet.
+    layout_ptr& allocateUninitialized(instance_ptr self, size_t ct) {
+        layout_ptr& selfLayout = *(layout_ptr*)self;
+
+        selfLayout = (layout*)tp_malloc(sizeof(layout));
+        selfLayout->count = ct;
+        selfLayout->refcount = 1;
+        selfLayout->reserved = ct;
+        selfLayout->hash_cache = -1;
+        selfLayout->data = (uint8_t*)tp_malloc(getEltType()->bytecount() * ct);
+
+        return selfLayout;
+    }
+
+    // write the 'ct' elements of 'self', splitting them up across threads if the
+    // buffer allows it.
+    template<class buf_t>
+    void serializeElements(instance_ptr self, size_t ct, buf_t& buffer) {
+        m_element_type->check([&](auto& concrete_type) {
+            auto writeRange = [&](auto& rangeBuffer, size_t lo, size_t hi) {
+                if (!serializeRegisterElements(&concrete_type, this->eltPtr(self, lo), hi - lo, rangeBuffer)) {
+                    for (size_t k = lo; k < hi; k++) {
+                        concrete_type.serialize(this->eltPtr(self, k), rangeBuffer, 0);
+                    }
+                }
+            };
+
+            if (buffer.shouldWriteInParallel(ct, {m_element_type})) {
+                buffer.writeInParallel(ct, writeRange);
+            } else {
+                writeRange(buffer, 0, ct);
+            }
+        });
+    }
+
+    template<class buf_t, class concrete_type_t>
+    static void deserializeElement(concrete_type_t& concrete_type, instance_ptr tgt, buf_t& buffer) {
+        auto fieldAndWire = buffer.readFieldNumberAndWireType();
+        if (fieldAndWire.first) {
+            throw std::runtime_error("Corrupt data (count)");
+        }
+        if (fieldAndWire.second == WireType::END_COMPOUND) {
+            throw std::runtime_error("Corrupt data (count)");
+        }
+
+        concrete_type.deserialize(tgt, buffer, fieldAndWire.second);
+    }
+
+    // if we hold register types, construct a list of 'ct' elements at 'self' by reading
+    // them as one run and return true. Otherwise read nothing and return false.
+    template<class buf_t>
+    bool deserializeRegisterList(instance_ptr self, size_t ct, buf_t& buffer) {
+        bool isRegisterList = false;
+
+        if (!ct) {
+            return false;
+        }
+
+        m_element_type->check([&](auto& concrete_type) {
+            if (!isRegisterElementType(&concrete_type)) {
+                return;
+            }
+
+            layout_ptr& selfLayout = allocateUninitialized(self, ct);
+
+            try {
+                deserializeRegisterElements(&concrete_type, selfLayout->data, ct, buffer);
+            } catch(...) {
+                tp_free(selfLayout->data);
+                tp_free(selfLayout);
+                selfLayout = nullptr;
+                throw;
+            }
+
+            isRegisterList = true;
+        });
+
+        return isRegisterList;
+    }
+
+    // if the buffer wants to read 'ct' elements across several threads, construct a
+    // list of them at 'self' that way and return true. Otherwise read nothing and
+    // return false.
+    template<class buf_t>
+    bool deserializeElementsInParallel(instance_ptr self, size_t ct, buf_t& buffer) {
+        if (!buffer.shouldReadInParallel(ct, {m_element_type})) {
+            return false;
+        }
+
+        layout_ptr& selfLayout = allocateUninitialized(self, ct);
+
+        try {
+            m_element_type->check([&](auto& concrete_type) {
+                buffer.readInParallel(
+                    ct,
+                    1,
+                    [&](auto& rangeBuffer, size_t lo, size_t hi) {
+                        if (deserializeRegisterElements(&concrete_type, this->eltPtr(self, lo), hi - lo, rangeBuffer)) {
+                            return;
+                        }
+
+                        for (size_t k = lo; k < hi; k++) {
+                            try {
+                                deserializeElement(concrete_type, this->eltPtr(self, k), rangeBuffer);
+                            } catch(...) {
+                                for (size_t k2 = k; k2 > lo; k2--) {
+                                    concrete_type.destroy(this->eltPtr(self, k2 - 1));
+                                }
+                                throw;
+                            }
+                        }
+                    },
+                    [&](size_t lo, size_t hi) {
+                        for (size_t k = lo; k < hi; k++) {
+                            concrete_type.destroy(this->eltPtr(self, k));
+                        }
+                    }
+                );
+            });
+        } catch(...) {
+            tp_free(selfLayout->data);
+            tp_free(selfLayout);
+            selfLayout = nullptr;
+            throw;
+        }
+
+        return true;
+    }
+
     //serialize, but don't write a count
     template<class buf_t>
     void serializeStream(instance_ptr self, buf_t& buffer) {
@@ -362,13 +587,7 @@ public:
 
         buffer.writeBeginCompound(fieldNumber);
         buffer.writeUnsignedVarintObject(0, id);
-        buffer.writeUnsignedVarintObject(0, ct);
-
-        m_element_type->check([&](auto& concrete_type) {
-            for (long k = 0; k < ct; k++) {
-                concrete_type.serialize(this->eltPtr(self,k), buffer, 0);
-            }
-        });
+        serializeCountAndElements(self, ct, buffer);
 
         buffer.writeEndCompound();
     }
@@ -388,28 +607,34 @@ public:
             return;
         }
 
-        size_t ct = buffer.readUnsignedVarintObject();
+        size_t ct;
+        bool isColumnar;
+        std::tie(ct, isColumnar) = deserializeCount(buffer);
 
         if (ct == 0) {
             constructor(self);
             (*(layout**)self)->refcount++;
             buffer.addCachedPointer(id, *((layout**)self), this);
+        } else if (isColumnar) {
+            // NamedTuples we write as columns can't refer back to us either
+            deserializeColumns(self, ct, buffer);
+            buffer.addCachedPointer(id, *((layout**)self), this);
+            (*(layout**)self)->refcount++;
+        } else if (deserializeElementsInParallel(self, ct, buffer) || deserializeRegisterList(self, ct, buffer)) {
+            // the elements can't refer back to us, so we can memoize ourselves after
+            // they're all read.
+            buffer.addCachedPointer(id, *((layout**)self), this);
+            (*(layout**)self)->refcount++;
         } else {
-            constructor(self, ct, [&](instance_ptr tgt, int k) {
-                if (k == 0) {
-                    buffer.addCachedPointer(id, *((layout**)self), this);
-                    (*(layout**)self)->refcount++;
-                }
-
-                auto fieldAndWire = buffer.readFieldNumberAndWireType();
-                if (fieldAndWire.first) {
-                    throw std::runtime_error("Corrupt data (count)");
-                }
-                if (fieldAndWire.second == WireType::END_COMPOUND) {
-                    throw std::runtime_error("Corrupt data (count)");
-                }
+            m_element_type->check([&](auto& concrete_type) {
+                constructor(self, ct, [&](instance_ptr tgt, int k) {
+                    if (k == 0) {
+                        buffer.addCachedPointer(id, *((layout**)self), this);
+                        (*(layout**)self)->refcount++;
+                    }
 
-                m_element_type->deserialize(tgt, buffer, fieldAndWire.second);
+                    deserializeElement(concrete_type, tgt, buffer);
+                });
             });
         }
 
@@ -445,13 +670,7 @@ public:
 
         buffer.writeBeginCompound(fieldNumber);
 
-        buffer.writeUnsignedVarintObject(0, ct);
-
-        m_element_type->check([&](auto& concrete_type) {
-            for (long k = 0; k < ct; k++) {
-                concrete_type.serialize(this->eltPtr(self,k), buffer, 0);
-            }
-        });
+        serializeCountAndElements(self, ct, buffer);
 
         buffer.writeEndCompound();
     }
@@ -466,19 +685,19 @@ public:
 
         assertNonemptyCompoundWireType(wireType);
 
-        size_t ct = buffer.readUnsignedVarintObject();
-
-        constructor(self, ct, [&](instance_ptr tgt, int k) {
-            auto fieldAndWire = buffer.readFieldNumberAndWireType();
-            if (fieldAndWire.first) {
-                throw std::runtime_error("Corrupt data (count)");
-            }
-            if (fieldAndWire.second == WireType::END_COMPOUND) {
-                throw std::runtime_error("Corrupt data (count)");
-            }
-
-            m_element_type->deserialize(tgt, buffer, fieldAndWire.second);
-        });
+        size_t ct;
+        bool isColumnar;
+        std::tie(ct, isColumnar) = deserializeCount(buffer);
+
+        if (isColumnar && ct) {
+            deserializeColumns(self, ct, buffer);
+        } else if (!deserializeElementsInParallel(self, ct, buffer) && !deserializeRegisterList(self, ct, buffer)) {
+            m_element_type->check([&](auto& concrete_type) {
+                constructor(self, ct, [&](instance_ptr tgt, int k) {
+                    deserializeElement(concrete_type, tgt, buffer);
+                });
+            });
+        }
 
         buffer.finishCompoundMessage(wireType);
     }
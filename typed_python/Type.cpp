@@ -41,6 +41,28 @@ typed_python_hash_type Type::hash(instance_ptr left) {
     });
 }
 
+typed_python_wide_hash_type Type::wideHash(instance_ptr left) {
+    assertForwardsResolvedSufficientlyToInstantiate();
+
+    switch (getTypeCategory()) {
+        case catBool: return *(bool*)left;
+        case catUInt8: return *(uint8_t*)left;
+        case catUInt16: return *(uint16_t*)left;
+        case catUInt32: return *(uint32_t*)left;
+        case catUInt64: return *(uint64_t*)left;
+        case catInt8: return *(int8_t*)left;
+        case catInt16: return *(int16_t*)left;
+        case catInt32: return *(int32_t*)left;
+        case catInt64: return *(int64_t*)left;
+        case catFloat32: return WideHashAccumulator::hashDouble(*(float*)left);
+        case catFloat64: return WideHashAccumulator::hashDouble(*(double*)left);
+        case catString: return StringType::wideHash_static(left);
+        case catBytes: return ((BytesType*)this)->wideHash(left);
+        case catOneOf: return ((OneOfType*)this)->wideHash(left);
+        default: return hash(left);
+    }
+}
+
 bool Type::isValidUpcastType(Type* t1, Type* t2) {
     if (typesEquivalent(t1, t2)) {
         return true;
@@ -344,6 +344,11 @@ public:
 
     typed_python_hash_type hash(instance_ptr left);
 
+    // a 64 bit hash, for hashtables with more items than an int32 can index.
+    // Integers and floats hash to their value, strings and bytes hash all of
+    // their bytes into 64 bits, and other types just widen 'hash'.
+    typed_python_wide_hash_type wideHash(instance_ptr left);
+
     void deepcopy(
         instance_ptr dest,
         instance_ptr src,
@@ -50,7 +50,7 @@ from typed_python._types import (
     getOrSetTypeResolver, Set, Class, Type, BoundMethod,
     TypedCell, pointerTo, refTo, copy, identityHash,
     deepBytecount, deepcopy, deepcopyContiguous, totalBytesAllocatedInSlabs,
-    deepBytecountAndSlabs, Slab,
+    deepBytecountAndSlabs, Slab, writeSlabFile, mapSlabFile,
     totalBytesAllocatedOnFreeStore,
     ModuleRepresentation
 )
@@ -76,7 +76,7 @@ from typed_python.generator import Generator  # noqa
 
 # this has to come at the end to break import cyclic
 from typed_python.lib.map import map  # noqa
-from typed_python.lib.pmap import pmap  # noqa
+from typed_python.lib.pmap import pmap, parallelFor, preduce  # noqa
 from typed_python.lib.reduce import reduce  # noqa
 
 _types.initializeGlobalStatics()
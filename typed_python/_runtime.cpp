@@ -1828,8 +1828,8 @@ extern "C" {
         return result;
     }
 
-    int32_t nativepython_tableAllocateNewSlot(hash_table_layout* layout, size_t kvPairSize) {
-        return layout->allocateNewSlot(kvPairSize);
+    int64_t nativepython_tableAllocateNewSlot(hash_table_layout* layout, size_t kvPairSize, Type* keyType) {
+        return layout->allocateNewSlot(kvPairSize, keyType);
     }
 
     hash_table_layout* nativepython_tableCopy(hash_table_layout* layout, Type* tp) {
@@ -1867,6 +1867,27 @@ extern "C" {
         layout->compressItemTable(kvPairSize);
     }
 
+    // the (key, value) pair at index 'ix' of a ConstDict that's stored as a tree,
+    // or nullptr if 'ix' is out of bounds.
+    uint8_t* nativepython_constDictKvPairPtr(void* record, ConstDictType* tp, int64_t ix) {
+        if (ix < 0 || ix >= tp->size((instance_ptr)&record)) {
+            return nullptr;
+        }
+
+        return tp->kvPairPtrKey((instance_ptr)&record, ix);
+    }
+
+    // the value for 'key' in a ConstDict that's stored as a tree, or nullptr if it's
+    // not there. This descends the tree by key, rather than walking down from the
+    // root for each probe of a binary search by index.
+    uint8_t* nativepython_constDictLookupValue(void* record, ConstDictType* tp, instance_ptr key) {
+        return tp->lookupValueByKey((instance_ptr)&record, key);
+    }
+
+    void nativepython_constDictDestroyRecord(void* record, ConstDictType* tp) {
+        tp->destroyRecord((instance_ptr)&record);
+    }
+
     int32_t nativepython_hash_float32(float val) {
         HashAccumulator acc;
 
@@ -1903,6 +1924,18 @@ extern "C" {
         return StringType::hash_static((instance_ptr)&s);
     }
 
+    int64_t nativepython_wide_hash_float64(double val) {
+        return WideHashAccumulator::hashDouble(val);
+    }
+
+    int64_t nativepython_wide_hash_string(StringType::layout* s) {
+        return StringType::wideHash_static((instance_ptr)&s);
+    }
+
+    int64_t nativepython_wide_hash_bytes(BytesType::layout* s) {
+        return BytesType::Make()->wideHash((instance_ptr)&s);
+    }
+
     int32_t nativepython_hash_bytes(BytesType::layout* s) {
         return BytesType::Make()->hash((instance_ptr)&s);
     }
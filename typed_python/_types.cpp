@@ -36,6 +36,7 @@
 #include "UnicodeProps.hpp"
 #include "PyTemporaryReferenceTracer.hpp"
 #include "PySlab.hpp"
+#include "SlabFile.hpp"
 #include "PyModuleRepresentation.hpp"
 #include "_types.hpp"
 
@@ -1714,6 +1715,108 @@ PyObject* deepcopyContiguous(PyObject* nullValue, PyObject* args, PyObject* kwar
 }
 
 
+PyDoc_STRVAR(writeSlabFile_doc,
+    "writeSlabFile(T, instance, path, baseAddress=None)\n\n"
+    "Write 'instance', converted to type 'T', into 'path' laid out exactly as\n"
+    "deepcopyContiguous would lay it out in memory, so that 'mapSlabFile' can\n"
+    "load it with a single mmap and no parsing. The file can only be mapped at\n"
+    "one virtual address, which is picked at random unless you pass\n"
+    "'baseAddress'. Files you want to load into the same process need to use\n"
+    "non-overlapping addresses.\n\n"
+    "'T' may only contain numbers, strings, bytes, ListOf, TupleOf, Dict, Set,\n"
+    "ConstDict, Tuple, NamedTuple, OneOf and Alternatives of those."
+);
+
+PyObject* writeSlabFile(PyObject* nullValue, PyObject* args, PyObject* kwargs) {
+    static const char *kwlist[] = {"T", "instance", "path", "baseAddress", NULL};
+
+    PyObject* typeArg;
+    PyObject* instanceArg;
+    const char* path;
+    PyObject* baseAddressArg = nullptr;
+
+    if (!PyArg_ParseTupleAndKeywords(
+            args, kwargs, "OOs|O", (char**)kwlist, &typeArg, &instanceArg, &path, &baseAddressArg
+    )) {
+        return NULL;
+    }
+
+    return translateExceptionToPyObject([&]() {
+        Type* t = PyInstance::unwrapTypeArgToTypePtr(typeArg);
+
+        if (!t) {
+            throw std::runtime_error("first argument to writeSlabFile must be a type object");
+        }
+
+        t->assertForwardsResolved();
+
+        uint64_t baseAddress = 0;
+
+        if (baseAddressArg && baseAddressArg != Py_None) {
+            baseAddress = PyLong_AsUnsignedLongLong(baseAddressArg);
+
+            if (PyErr_Occurred()) {
+                throw PythonExceptionSet();
+            }
+        }
+
+        Instance instance = Instance::createAndInitialize(t, [&](instance_ptr p) {
+            PyInstance::copyConstructFromPythonInstance(t, p, instanceArg, ConversionLevel::New);
+        });
+
+        {
+            PyEnsureGilReleased releaseTheGil;
+            writeInstanceToSlabFile(t, instance.data(), path, baseAddress);
+        }
+
+        return incref(Py_None);
+    });
+}
+
+PyDoc_STRVAR(mapSlabFile_doc,
+    "mapSlabFile(T, path) -> T\n\n"
+    "Map a file written by 'writeSlabFile(T, ...)' into memory and return the\n"
+    "instance stored in it. Nothing is copied: the objects live in the mapped\n"
+    "pages, which are shared with every other process that maps the same file\n"
+    "until this process writes to them (which includes taking references to\n"
+    "objects, since that updates their refcounts). The mapping is released when\n"
+    "the last object in it is."
+);
+
+PyObject* mapSlabFile(PyObject* nullValue, PyObject* args, PyObject* kwargs) {
+    static const char *kwlist[] = {"T", "path", NULL};
+
+    PyObject* typeArg;
+    const char* path;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Os", (char**)kwlist, &typeArg, &path)) {
+        return NULL;
+    }
+
+    return translateExceptionToPyObject([&]() {
+        Type* t = PyInstance::unwrapTypeArgToTypePtr(typeArg);
+
+        if (!t) {
+            throw std::runtime_error("first argument to mapSlabFile must be a type object");
+        }
+
+        t->assertForwardsResolved();
+
+        PyObject* res = nullptr;
+
+        mapInstanceFromSlabFile(t, path, [&](instance_ptr root) {
+            res = PyInstance::extractPythonObject(root, t);
+
+            if (!res) {
+                throw PythonExceptionSet();
+            }
+        });
+
+        return res;
+    });
+}
+
+
 PyDoc_STRVAR(
     getAllSlabs_doc,
     "getAllSlabs() -> [Slab]\n\n"
@@ -3221,6 +3324,149 @@ PyObject* _temporaryReferenceTracerActive(PyObject* null, PyObject* args, PyObje
     );
 }
 
+PyObject* hashTableSlotBytes(PyObject* nullValue, PyObject* args) {
+    if (PyTuple_Size(args) != 1) {
+        PyErr_SetString(PyExc_TypeError, "hashTableSlotBytes takes 1 positional argument");
+        return NULL;
+    }
+
+    PyObjectHolder a1(PyTuple_GetItem(args, 0));
+
+    Type* actualType = PyInstance::extractTypeFrom(a1->ob_type);
+
+    if (!actualType || (!actualType->isDict() && !actualType->isSet())) {
+        PyErr_Format(
+            PyExc_TypeError,
+            "first argument to hashTableSlotBytes '%S' must be a Dict or a Set",
+            (PyObject*)a1
+        );
+        return NULL;
+    }
+
+    hash_table_layout& record = **(hash_table_layout**)((PyInstance*)(PyObject*)a1)->dataPtr();
+
+    return PyLong_FromLong(record.hash_table_slot_bytes);
+}
+
+PyObject* hashTableHashBytes(PyObject* nullValue, PyObject* args) {
+    if (PyTuple_Size(args) != 1) {
+        PyErr_SetString(PyExc_TypeError, "hashTableHashBytes takes 1 positional argument");
+        return NULL;
+    }
+
+    PyObjectHolder a1(PyTuple_GetItem(args, 0));
+
+    Type* actualType = PyInstance::extractTypeFrom(a1->ob_type);
+
+    if (!actualType || (!actualType->isDict() && !actualType->isSet())) {
+        PyErr_Format(
+            PyExc_TypeError,
+            "first argument to hashTableHashBytes '%S' must be a Dict or a Set",
+            (PyObject*)a1
+        );
+        return NULL;
+    }
+
+    hash_table_layout& record = **(hash_table_layout**)((PyInstance*)(PyObject*)a1)->dataPtr();
+
+    return PyLong_FromLong(record.item_hash_bytes);
+}
+
+PyObject* setMinimumHashTableSlotBytes(PyObject* nullValue, PyObject* args) {
+    int bytes;
+
+    if (!PyArg_ParseTuple(args, "i", &bytes)) {
+        return NULL;
+    }
+
+    if (bytes != 1 && bytes != 2 && bytes != 4 && bytes != 8) {
+        PyErr_Format(PyExc_ValueError, "hashtable slots can be 1, 2, 4 or 8 bytes, not %d", bytes);
+        return NULL;
+    }
+
+    hash_table_layout::minimumSlotBytes() = bytes;
+
+    return incref(Py_None);
+}
+
+PyObject* hashTableLayout(PyObject* nullValue, PyObject* args) {
+    if (PyTuple_Size(args) != 1) {
+        PyErr_SetString(PyExc_TypeError, "hashTableLayout takes 1 positional argument");
+        return NULL;
+    }
+
+    PyObjectHolder a1(PyTuple_GetItem(args, 0));
+
+    Type* actualType = PyInstance::extractTypeFrom(a1->ob_type);
+
+    if (!actualType || (!actualType->isDict() && !actualType->isSet())) {
+        PyErr_Format(
+            PyExc_TypeError,
+            "first argument to hashTableLayout '%S' must be a Dict or a Set",
+            (PyObject*)a1
+        );
+        return NULL;
+    }
+
+    hash_table_layout& record = **(hash_table_layout**)((PyInstance*)(PyObject*)a1)->dataPtr();
+
+    if (!record.hash_table_slots) {
+        return incref(Py_None);
+    }
+
+    return PyUnicode_FromString(record.hash_table_control ? "swiss" : "probed");
+}
+
+PyObject* setHashTableLayout(PyObject* nullValue, PyObject* args) {
+    const char* layout;
+
+    if (!PyArg_ParseTuple(args, "s", &layout)) {
+        return NULL;
+    }
+
+    if (std::string(layout) != "probed" && std::string(layout) != "swiss") {
+        PyErr_Format(PyExc_ValueError, "hashtable layout must be 'probed' or 'swiss', not '%s'", layout);
+        return NULL;
+    }
+
+    hash_table_layout::useSwissTables() = std::string(layout) == "swiss";
+
+    return incref(Py_None);
+}
+
+PyObject* setCompiledSpecializationHotCallCount(PyObject* nullValue, PyObject* args) {
+    long long count;
+
+    if (!PyArg_ParseTuple(args, "L", &count)) {
+        return NULL;
+    }
+
+    if (count < 0) {
+        PyErr_Format(PyExc_ValueError, "the hot call count can't be negative");
+        return NULL;
+    }
+
+    Function::CompiledSpecialization::hotCallCount() = count;
+
+    return incref(Py_None);
+}
+
+PyObject* setThreadLocalAllocatorEnabled(PyObject* nullValue, PyObject* args) {
+    int enabled;
+
+    if (!PyArg_ParseTuple(args, "p", &enabled)) {
+        return NULL;
+    }
+
+    tpThreadLocalAllocatorEnabled() = enabled;
+
+    return incref(Py_None);
+}
+
+PyObject* isThreadLocalAllocatorEnabled(PyObject* nullValue, PyObject* args) {
+    return incref(tpThreadLocalAllocatorEnabled() ? Py_True : Py_False);
+}
+
 PyObject* gilReleaseThreadLoop(PyObject* null, PyObject* args, PyObject* kwargs) {
     PyEnsureGilReleased releaseTheGil;
 
@@ -3239,6 +3485,8 @@ static PyMethodDef module_methods[] = {
     {"totalBytesAllocatedInSlabs", (PyCFunction)totalBytesAllocatedInSlabs, METH_VARARGS, totalBytesAllocatedInSlabs_doc},
     {"deepcopy", (PyCFunction)deepcopy, METH_VARARGS | METH_KEYWORDS, deepcopy_doc},
     {"deepcopyContiguous", (PyCFunction)deepcopyContiguous, METH_VARARGS | METH_KEYWORDS, deepcopyContiguous_doc},
+    {"writeSlabFile", (PyCFunction)writeSlabFile, METH_VARARGS | METH_KEYWORDS, writeSlabFile_doc},
+    {"mapSlabFile", (PyCFunction)mapSlabFile, METH_VARARGS | METH_KEYWORDS, mapSlabFile_doc},
     {"serialize", (PyCFunction)serialize, METH_VARARGS, NULL},
     {"deserialize", (PyCFunction)deserialize, METH_VARARGS, NULL},
     {"decodeSerializedObject", (PyCFunction)decodeSerializedObject, METH_VARARGS, NULL},
@@ -3302,6 +3550,14 @@ static PyMethodDef module_methods[] = {
     {"isValidArithmeticConversion", (PyCFunction)isValidArithmeticConversion, METH_VARARGS | METH_KEYWORDS, NULL},
     {"_temporaryReferenceTracerActive", (PyCFunction)_temporaryReferenceTracerActive, METH_VARARGS | METH_KEYWORDS, NULL},
     {"gilReleaseThreadLoop", (PyCFunction)gilReleaseThreadLoop, METH_VARARGS | METH_KEYWORDS, NULL},
+    {"hashTableSlotBytes", (PyCFunction)hashTableSlotBytes, METH_VARARGS, NULL},
+    {"hashTableHashBytes", (PyCFunction)hashTableHashBytes, METH_VARARGS, NULL},
+    {"setMinimumHashTableSlotBytes", (PyCFunction)setMinimumHashTableSlotBytes, METH_VARARGS, NULL},
+    {"hashTableLayout", (PyCFunction)hashTableLayout, METH_VARARGS, NULL},
+    {"setHashTableLayout", (PyCFunction)setHashTableLayout, METH_VARARGS, NULL},
+    {"setThreadLocalAllocatorEnabled", (PyCFunction)setThreadLocalAllocatorEnabled, METH_VARARGS, NULL},
+    {"setCompiledSpecializationHotCallCount", (PyCFunction)setCompiledSpecializationHotCallCount, METH_VARARGS, NULL},
+    {"isThreadLocalAllocatorEnabled", (PyCFunction)isThreadLocalAllocatorEnabled, METH_VARARGS, NULL},
     {"setModuleDict", (PyCFunction)setModuleDict, METH_VARARGS | METH_KEYWORDS, NULL},
     {NULL, NULL}
 };
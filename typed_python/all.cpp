@@ -72,6 +72,7 @@ compile the entire group all at once.
 #include "PySlab.cpp"
 #include "PyModuleRepresentation.cpp"
 #include "Slab.cpp"
+#include "SlabFile.cpp"
 #include "PyTemporaryReferenceTracer.cpp"
 
 #include "lz4.c"
@@ -13,7 +13,6 @@
 #   limitations under the License.
 
 
-import llvmlite.binding as llvm
 import tempfile
 import os
 import subprocess
@@ -59,11 +58,7 @@ class BinarySharedObject:
         return BinarySharedObject(binaryForm, functionNameToType, globalVariableDefinitions)
 
     @staticmethod
-    def fromModule(module, globalVariableDefinitions, functionNameToType):
-        target_triple = llvm.get_process_triple()
-        target = llvm.Target.from_triple(target_triple)
-        target_machine_shared_object = target.create_target_machine(reloc='pic', codemodel='default')
-
+    def fromModule(module, globalVariableDefinitions, functionNameToType, target_machine_shared_object):
         # returns the contents of a '.o' file coming out of a c++ compiler like clang
         o_file_contents = target_machine_shared_object.emit_object(module)
 
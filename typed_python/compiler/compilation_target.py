@@ -0,0 +1,107 @@
+#   Copyright 2017-2021 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Describes the machine we generate code for.
+
+By default, we target a generic cpu of the architecture we're running on, so that
+the code in a compiler cache can be shared between machines. Setting
+TP_COMPILER_TARGET_CPU to 'host' targets exactly the cpu we're running on, which
+lets llvm's vectorizers use whatever vector instructions (AVX2, AVX-512, ...) it
+has, and setting it to an llvm cpu name (like 'skylake-avx512') targets that
+microarchitecture.
+"""
+
+import os
+import threading
+
+import llvmlite.binding as llvm
+
+
+class CompilationTarget:
+    """A target triple, plus the cpu and cpu features within it that we may use.
+
+    Args:
+        cpuName - an llvm cpu name, or the empty string for a generic cpu.
+        cpuFeatures - an llvm feature string (like '+avx2,-avx512f'), or the empty
+            string for the cpu's defaults.
+    """
+
+    def __init__(self, cpuName="", cpuFeatures=""):
+        self.triple = llvm.get_process_triple()
+        self.cpuName = cpuName
+        self.cpuFeatures = cpuFeatures
+
+    @staticmethod
+    def generic():
+        return CompilationTarget()
+
+    @staticmethod
+    def host():
+        return CompilationTarget(llvm.get_host_cpu_name(), llvm.get_host_cpu_features().flatten())
+
+    @staticmethod
+    def fromName(name):
+        """Build a target from the value of TP_COMPILER_TARGET_CPU.
+
+        Args:
+            name - 'generic' (or empty), 'host', or an llvm cpu name.
+        """
+        if not name or name == "generic":
+            return CompilationTarget.generic()
+
+        if name == "host":
+            return CompilationTarget.host()
+
+        return CompilationTarget(name)
+
+    @property
+    def key(self):
+        """A string identifying the code this target produces.
+
+        Code compiled for targets with different keys can't be assumed to run on
+        the same machines.
+        """
+        return " ".join([self.triple, self.cpuName or "generic", self.cpuFeatures]).strip()
+
+    def createTargetMachine(self, **kwargs):
+        """Create an llvm TargetMachine for this target, passing along 'kwargs'."""
+        return llvm.Target.from_triple(self.triple).create_target_machine(
+            cpu=self.cpuName,
+            features=self.cpuFeatures,
+            **kwargs
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, CompilationTarget) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"CompilationTarget({self.cpuName or 'generic'})"
+
+
+_defaultTarget = []
+_defaultTargetLock = threading.Lock()
+
+
+def defaultCompilationTarget():
+    """Return the CompilationTarget that TP_COMPILER_TARGET_CPU asks for."""
+    with _defaultTargetLock:
+        if not _defaultTarget:
+            _defaultTarget.append(
+                CompilationTarget.fromName(os.getenv("TP_COMPILER_TARGET_CPU", "generic"))
+            )
+
+        return _defaultTarget[0]
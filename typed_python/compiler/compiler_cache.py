@@ -12,16 +12,40 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import fcntl
+import hashlib
 import os
+import time
 import uuid
 import shutil
 from typed_python.compiler.loaded_module import LoadedModule
 from typed_python.compiler.binary_shared_object import BinarySharedObject
+from typed_python.compiler.compilation_target import CompilationTarget, defaultCompilationTarget
 
 from typed_python.SerializationContext import SerializationContext
 from typed_python import Dict, ListOf
 
 
+# the name of the directory (inside the cache directory) holding the symbol index
+SYMBOL_INDEX_DIR = "symbol_index"
+
+# how many hex digits of the hash of a link name we use to pick its index shard
+SYMBOL_INDEX_SHARD_DIGITS = 2
+
+# module hashes are sha1 hexdigests
+MODULE_HASH_LEN = 40
+
+# the file (inside each module's directory) holding the key of the target it was compiled for
+TARGET_KEY_FILE = "target.txt"
+
+# the file (inside the cache directory) holding the CompilerProfile of the code using it
+PROFILE_FILE = "profile.dat"
+
+# how long (in seconds) garbage collection waits between marking a module invalid
+# and deleting it, to give processes that were already loading it time to finish.
+GARBAGE_COLLECTION_GRACE_PERIOD = 600
+
+
 def ensureDirExists(cacheDir):
     if not os.path.exists(cacheDir):
         try:
@@ -35,42 +59,336 @@ def ensureDirExists(cacheDir):
         raise Exception("Failed to create the cache directory.")
 
 
+def isModuleHash(name):
+    return len(name) == MODULE_HASH_LEN
+
+
+def touch(path):
+    """Create 'path' if it doesn't exist and set its modification time to now."""
+    try:
+        with open(path, "a"):
+            pass
+
+        os.utime(path, None)
+    except OSError:
+        # the cache may be on a read-only filesystem, or the module may have been
+        # garbage collected out from under us.
+        pass
+
+
+def directorySize(path):
+    total = 0
+
+    for root, _, files in os.walk(path):
+        for fname in files:
+            try:
+                total += os.path.getsize(os.path.join(root, fname))
+            except OSError:
+                pass
+
+    return total
+
+
+class CachedModuleInfo:
+    """What garbage collection needs to know about a module stored on disk."""
+    def __init__(self, moduleHash, sizeInBytes, lastUsed, markedInvalidAt, submodules):
+        self.moduleHash = moduleHash
+        self.sizeInBytes = sizeInBytes
+        self.lastUsed = lastUsed
+        # the time at which the module was marked invalid, or None
+        self.markedInvalidAt = markedInvalidAt
+        # a list of submodule hashes, or None if we couldn't read them
+        self.submodules = submodules
+
+    @staticmethod
+    def fromDisk(moduleDir, moduleHash):
+        def mtime(fname):
+            try:
+                return os.path.getmtime(os.path.join(moduleDir, fname))
+            except OSError:
+                return None
+
+        try:
+            with open(os.path.join(moduleDir, "submodules.dat"), "rb") as f:
+                submodules = list(SerializationContext().deserialize(f.read(), ListOf(str)))
+        except Exception:
+            submodules = None
+
+        return CachedModuleInfo(
+            moduleHash,
+            directorySize(moduleDir),
+            mtime("last_used") or mtime("module.so") or mtime(".") or 0.0,
+            mtime("marked_invalid"),
+            submodules
+        )
+
+
+class SymbolIndex:
+    """An append-only on-disk map from link name to the hashes of the modules defining it.
+
+    Entries are spread across a fixed set of shard files chosen by the hash of the
+    link name, so answering a query only requires reading the one shard that could
+    contain it. Each record is a line of the form '<moduleHash> <linkName>'.
+
+    Writers append all of a module's records for a given shard with a single
+    O_APPEND write, so records from concurrent writers never interleave. Readers
+    only consume complete lines, and re-read the tail of a shard when a lookup
+    misses, so they see modules written by other processes after they booted.
+
+    Appending and compacting both hold an exclusive flock on the shard, so that
+    compaction can't drop a record appended while it rewrites the shard.
+    """
+    def __init__(self, indexDir):
+        self.indexDir = indexDir
+
+        ensureDirExists(indexDir)
+
+        # shard -> (inode, bytes consumed, {linkName: [moduleHash]}). We track the
+        # inode so that we notice when garbage collection compacts the shard.
+        self._shards = {}
+
+    @staticmethod
+    def shardFor(linkName):
+        return hashlib.sha1(linkName.encode("utf8")).hexdigest()[:SYMBOL_INDEX_SHARD_DIGITS]
+
+    def shardPath(self, shard):
+        return os.path.join(self.indexDir, shard + ".idx")
+
+    def moduleHashesFor(self, linkName):
+        """Return the hashes of all modules that claim to define 'linkName', oldest first."""
+        shard = self.shardFor(linkName)
+
+        if shard not in self._shards or linkName not in self._shards[shard][2]:
+            self._readShard(shard)
+
+        if shard not in self._shards:
+            return ()
+
+        return self._shards[shard][2].get(linkName, ())
+
+    def addModule(self, moduleHash, linkNames):
+        """Record that the module 'moduleHash' defines each of 'linkNames'."""
+        assert isModuleHash(moduleHash)
+
+        shardToRecords = {}
+
+        for linkName in linkNames:
+            shardToRecords.setdefault(self.shardFor(linkName), []).append(
+                moduleHash + " " + linkName + "\n"
+            )
+
+        for shard, records in shardToRecords.items():
+            self._appendToShard(shard, "".join(records).encode("utf8"))
+
+    def _appendToShard(self, shard, data):
+        shardPath = self.shardPath(shard)
+
+        while True:
+            fd = os.open(shardPath, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+
+                # if 'compact' replaced the shard while we waited for the lock,
+                # we hold the old file, which nobody reads any more.
+                if not self._isCurrentShardFile(fd, shardPath):
+                    continue
+
+                os.write(fd, data)
+                return
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def _isCurrentShardFile(fd, shardPath):
+        try:
+            return os.stat(shardPath).st_ino == os.fstat(fd).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _readShard(self, shard):
+        """Consume any complete records appended to 'shard' since we last read it."""
+        try:
+            with open(self.shardPath(shard), "rb") as f:
+                inode = os.fstat(f.fileno()).st_ino
+
+                if shard in self._shards and self._shards[shard][0] == inode:
+                    _, offset, nameToModuleHashes = self._shards[shard]
+                else:
+                    offset, nameToModuleHashes = 0, {}
+
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # a writer may be midway through appending, so only consume complete lines.
+        consumed = data.rfind(b"\n") + 1
+
+        for moduleHash, linkName in self._parseRecords(data[:consumed]):
+            nameToModuleHashes.setdefault(linkName, []).append(moduleHash)
+
+        self._shards[shard] = (inode, offset + consumed, nameToModuleHashes)
+
+    @staticmethod
+    def _parseRecords(data):
+        for line in data.decode("utf8").splitlines():
+            moduleHash, linkName = line[:MODULE_HASH_LEN], line[MODULE_HASH_LEN + 1:]
+
+            if linkName:
+                yield moduleHash, linkName
+
+    def compact(self, shouldKeep):
+        """Rewrite each shard, dropping records whose module hash fails 'shouldKeep'.
+
+        Shards are replaced by renaming, so readers never see a partial shard. We
+        hold the shard's lock until the new shard is in place, so writers either
+        append before we read it or wait and append to the new one.
+        """
+        for shardFile in os.listdir(self.indexDir):
+            if not shardFile.endswith(".idx"):
+                continue
+
+            shardPath = os.path.join(self.indexDir, shardFile)
+
+            try:
+                f = open(shardPath, "rb")
+            except FileNotFoundError:
+                continue
+
+            with f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+                # another process compacted this shard while we waited for the lock
+                if not self._isCurrentShardFile(f.fileno(), shardPath):
+                    continue
+
+                data = f.read()
+
+                # appends are whole records written under the lock, so the shard
+                # only ends in a partial line if a writer died midway through.
+                data = data[:data.rfind(b"\n") + 1]
+
+                records = list(self._parseRecords(data))
+                keptRecords = [(h, n) for h, n in records if shouldKeep(h)]
+
+                if len(keptRecords) == len(records):
+                    continue
+
+                tempShardPath = shardPath + "_" + str(uuid.uuid4())
+
+                with open(tempShardPath, "wb") as tempFile:
+                    tempFile.write("".join(h + " " + n + "\n" for h, n in keptRecords).encode("utf8"))
+
+                os.replace(tempShardPath, shardPath)
+
+    @staticmethod
+    def buildFromModules(cacheDir):
+        """Build the symbol index for a cache directory written without one.
+
+        We write the index out under a temporary name and rename it into place, so
+        that other processes either see the complete index or none at all.
+        """
+        indexDir = os.path.join(cacheDir, SYMBOL_INDEX_DIR)
+        tempIndexDir = indexDir + "_" + str(uuid.uuid4())
+
+        index = SymbolIndex(tempIndexDir)
+
+        for moduleHash in os.listdir(cacheDir):
+            if isModuleHash(moduleHash):
+                try:
+                    with open(os.path.join(cacheDir, moduleHash, "name_manifest.dat"), "rb") as f:
+                        manifest = SerializationContext().deserialize(f.read(), Dict(str, str))
+                except Exception:
+                    continue
+
+                index.addModule(moduleHash, manifest)
+
+        try:
+            os.rename(tempIndexDir, indexDir)
+        except OSError:
+            if not os.path.exists(indexDir):
+                raise
+            else:
+                shutil.rmtree(tempIndexDir)
+
+
 class CompilerCache:
     """Implements an on-disk cache of compiled code.
 
     This is a pretty simple implementation - it needs to be threadsafe,
-    which we achieve by only ever writing to it, and using directory renames
-    to guarantee atomicity.
-
-    The biggest drawback here is that we have to load a bunch of 'manifest' objects
-    when we first boot up, which could be slow. We could improve this substantially
-    by making it possible to determine if a given function is in the cache by organizing
-    the manifests by, say, function name.
+    which we achieve by only ever adding to it, and using directory renames
+    to guarantee atomicity. The only way modules leave the cache is through
+    'collectGarbage', which first marks them invalid (so no new reader will
+    pick them up) and only deletes them once a grace period has passed.
+
+    To determine whether a given link name is in the cache without reading every
+    module's manifest when we boot, we maintain a SymbolIndex alongside the modules,
+    which we consult lazily as symbols are requested.
+
+    Each module records the key of the CompilationTarget it was compiled for,
+    and we only use modules compiled for our own target, so processes targeting
+    different cpus can share a cache without running each other's code.
+
+    Args:
+        cacheDir - the directory holding the cache.
+        targetKey - the key of the CompilationTarget we compile for. Defaults to
+            the one TP_COMPILER_TARGET_CPU asks for.
     """
-    def __init__(self, cacheDir):
+    def __init__(self, cacheDir, targetKey=None):
         self.cacheDir = cacheDir
+        self.targetKey = targetKey if targetKey is not None else defaultCompilationTarget().key
 
         ensureDirExists(cacheDir)
 
         self.loadedModules = Dict(str, LoadedModule)()
+
+        # link names we've resolved so far, either by querying the index or by
+        # loading or writing the module that defines them.
         self.nameToModuleHash = Dict(str, str)()
 
         self.modulesMarkedValid = set()
         self.modulesMarkedInvalid = set()
 
-        for moduleHash in os.listdir(self.cacheDir):
-            if len(moduleHash) == 40:
-                self.loadNameManifestFromStoredModuleByHash(moduleHash)
+        if not os.path.exists(os.path.join(cacheDir, SYMBOL_INDEX_DIR)):
+            SymbolIndex.buildFromModules(cacheDir)
+
+        self.symbolIndex = SymbolIndex(os.path.join(cacheDir, SYMBOL_INDEX_DIR))
 
     def hasSymbol(self, linkName):
-        return linkName in self.nameToModuleHash
+        return self.moduleHashForSymbol(linkName) is not None
+
+    def moduleHashForSymbol(self, linkName):
+        """Return the hash of a valid module defining 'linkName', or None."""
+        moduleHash = self.nameToModuleHash.get(linkName)
+
+        if moduleHash is not None and moduleHash not in self.modulesMarkedInvalid:
+            return moduleHash
+
+        # prefer the most recently written module
+        for moduleHash in reversed(self.symbolIndex.moduleHashesFor(linkName)):
+            if self.moduleHashIsValid(moduleHash):
+                self.nameToModuleHash[linkName] = moduleHash
+                return moduleHash
+
+        return None
 
     def markModuleHashInvalid(self, hashstr):
-        with open(os.path.join(self.cacheDir, hashstr, "marked_invalid"), "w"):
+        self.modulesMarkedValid.discard(hashstr)
+        self.modulesMarkedInvalid.add(hashstr)
+
+        try:
+            with open(os.path.join(self.cacheDir, hashstr, "marked_invalid"), "w"):
+                pass
+        except FileNotFoundError:
+            # the module has already been garbage collected
             pass
 
     def loadForSymbol(self, linkName):
-        moduleHash = self.nameToModuleHash[linkName]
+        moduleHash = self.moduleHashForSymbol(linkName)
+
+        if moduleHash is None:
+            return None
 
         nameToTypedCallTarget = {}
         nameToNativeFunctionType = {}
@@ -131,6 +449,12 @@ class CompilerCache:
 
         self.loadedModules[moduleHash] = loaded
 
+        touch(os.path.join(targetDir, "last_used"))
+
+        # these names now have to resolve to the copy we actually loaded
+        for n in functionNameToNativeType:
+            self.nameToModuleHash[n] = moduleHash
+
         nameToTypedCallTarget.update(callTargets)
         nameToNativeFunctionType.update(functionNameToNativeType)
 
@@ -160,39 +484,195 @@ class CompilerCache:
         for n in binarySharedObject.definedSymbols:
             self.nameToModuleHash[n] = hashToUse
 
-    def loadNameManifestFromStoredModuleByHash(self, moduleHash):
+        self.modulesMarkedValid.add(hashToUse)
+
+    def moduleHashIsValid(self, moduleHash):
+        """Determine whether a module and all of its submodules are usable.
+
+        We only look at the 'marked_invalid' flags and the submodule lists here,
+        so this is cheap relative to actually loading the module.
+        """
         if moduleHash in self.modulesMarkedValid:
             return True
 
+        if moduleHash in self.modulesMarkedInvalid:
+            return False
+
         targetDir = os.path.join(self.cacheDir, moduleHash)
 
         # ignore 'marked invalid'
         if os.path.exists(os.path.join(targetDir, "marked_invalid")):
-            # just bail - don't try to read it now
-
             # for the moment, we don't try to clean up the cache, because
             # we can't be sure that some process is not still reading the
             # old files.
             self.modulesMarkedInvalid.add(moduleHash)
             return False
 
-        with open(os.path.join(targetDir, "submodules.dat"), "rb") as f:
-            submodules = SerializationContext().deserialize(f.read(), ListOf(str))
+        if self.targetKeyFor(moduleHash) != self.targetKey:
+            # it's fine for processes compiling for that target, so we don't mark it on disk
+            self.modulesMarkedInvalid.add(moduleHash)
+            return False
+
+        try:
+            with open(os.path.join(targetDir, "submodules.dat"), "rb") as f:
+                submodules = SerializationContext().deserialize(f.read(), ListOf(str))
+        except Exception:
+            self.modulesMarkedInvalid.add(moduleHash)
+            return False
 
         for subHash in submodules:
-            if not self.loadNameManifestFromStoredModuleByHash(subHash):
-                self.markModuleHashInvalid(subHash)
+            if not self.moduleHashIsValid(subHash):
+                self.modulesMarkedInvalid.add(moduleHash)
                 return False
 
-        with open(os.path.join(targetDir, "name_manifest.dat"), "rb") as f:
-            self.nameToModuleHash.update(
-                SerializationContext().deserialize(f.read(), Dict(str, str))
-            )
-
         self.modulesMarkedValid.add(moduleHash)
 
         return True
 
+    def targetKeyFor(self, moduleHash):
+        """Return the key of the CompilationTarget the module was compiled for."""
+        try:
+            with open(os.path.join(self.cacheDir, moduleHash, TARGET_KEY_FILE), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            # the module predates our recording targets, when we always used a generic cpu
+            return CompilationTarget.generic().key
+
+    def collectGarbage(self, maxBytes, gracePeriod=GARBAGE_COLLECTION_GRACE_PERIOD):
+        """Evict the least recently used modules until the cache fits in 'maxBytes'.
+
+        Modules are considered used when they're written or loaded. Because a module
+        can't be loaded without its submodules, a module is only as stale as the most
+        recently used module that depends on it, and evicting a module evicts
+        everything that depends on it. Modules that this process has loaded are
+        never evicted.
+
+        Eviction happens in two steps, so that it's safe to run while other
+        processes are using the cache. First we mark a module invalid, which stops
+        any new process from loading it. Then, on some later call, once the module
+        has been marked invalid for at least 'gracePeriod' seconds, we delete it and
+        remove it from the symbol index. Modules marked invalid for other reasons
+        get deleted the same way.
+
+        Args:
+            maxBytes - the number of bytes of module data we're allowed to keep.
+            gracePeriod - how many seconds a module must have been marked invalid
+                before we're willing to delete it.
+
+        Returns:
+            a list of the hashes of the modules we deleted from disk.
+        """
+        now = time.time()
+
+        modules = {}
+        for name in os.listdir(self.cacheDir):
+            path = os.path.join(self.cacheDir, name)
+
+            if isModuleHash(name):
+                modules[name] = CachedModuleInfo.fromDisk(path, name)
+            elif name != SYMBOL_INDEX_DIR and os.path.isdir(path):
+                # a module or index that a writer never finished renaming into place
+                try:
+                    if now - os.path.getmtime(path) >= gracePeriod:
+                        shutil.rmtree(path, ignore_errors=True)
+                except OSError:
+                    pass
+
+        dependents = {h: set() for h in modules}
+        for info in modules.values():
+            for sub in info.submodules or ():
+                if sub in dependents:
+                    dependents[sub].add(info.moduleHash)
+
+        def allDependents(moduleHash):
+            res = set()
+            stack = [moduleHash]
+
+            while stack:
+                for d in dependents[stack.pop()]:
+                    if d not in res:
+                        res.add(d)
+                        stack.append(d)
+
+            return res
+
+        # modules that can't be loaded, together with everything that depends on them
+        invalid = set()
+        for info in modules.values():
+            if (
+                info.markedInvalidAt is not None
+                or info.submodules is None
+                or any(sub not in modules for sub in info.submodules)
+            ):
+                invalid.add(info.moduleHash)
+                invalid.update(allDependents(info.moduleHash))
+
+        # a module is as recently used as anything that depends on it
+        effectiveLastUsed = {}
+        for moduleHash, info in modules.items():
+            effectiveLastUsed[moduleHash] = max(
+                [info.lastUsed] + [modules[d].lastUsed for d in allDependents(moduleHash)]
+            )
+
+        liveBytes = sum(modules[h].sizeInBytes for h in modules if h not in invalid)
+
+        for moduleHash in sorted(modules, key=lambda h: effectiveLastUsed[h]):
+            if liveBytes <= maxBytes:
+                break
+
+            if moduleHash in invalid:
+                continue
+
+            toEvict = {moduleHash} | allDependents(moduleHash)
+
+            if any(h in self.loadedModules for h in toEvict):
+                continue
+
+            for h in toEvict - invalid:
+                self.markModuleHashInvalid(h)
+                modules[h].markedInvalidAt = now
+                liveBytes -= modules[h].sizeInBytes
+                invalid.add(h)
+
+        deleted = []
+        for moduleHash in invalid:
+            info = modules[moduleHash]
+
+            if moduleHash in self.loadedModules:
+                continue
+
+            if info.markedInvalidAt is None:
+                # a dependency is broken, but the module itself hasn't been marked yet.
+                self.markModuleHashInvalid(moduleHash)
+                continue
+
+            if now - info.markedInvalidAt < gracePeriod:
+                continue
+
+            # rename first so that the module disappears from the cache atomically.
+            tempPath = os.path.join(self.cacheDir, moduleHash + "_deleted_" + str(uuid.uuid4()))
+
+            try:
+                os.rename(os.path.join(self.cacheDir, moduleHash), tempPath)
+            except OSError:
+                # someone else collected it already
+                continue
+
+            shutil.rmtree(tempPath, ignore_errors=True)
+            deleted.append(moduleHash)
+
+        if deleted:
+            stillExists = {}
+
+            def shouldKeep(moduleHash):
+                if moduleHash not in stillExists:
+                    stillExists[moduleHash] = os.path.isdir(os.path.join(self.cacheDir, moduleHash))
+                return stillExists[moduleHash]
+
+            self.symbolIndex.compact(shouldKeep)
+
+        return deleted
+
     def writeModuleToDisk(self, binarySharedObject, nameToTypedCallTarget, submodules):
         """Write out a disk representation of this module.
 
@@ -205,7 +685,9 @@ class CompilerCache:
         directory, which we write out under a tempname and then rename to the
         proper name in case we see conflicts. This allows multiple processes
         to interact with the compiler cache simultaneously without relying on
-        individual file-level locking.
+        individual file-level locking. We only add the module's names to the
+        symbol index once the rename has succeeded, so the index never refers to
+        a partially written module.
         """
         hashToUse = SerializationContext().sha_hash(str(uuid.uuid4())).hexdigest
 
@@ -223,8 +705,9 @@ class CompilerCache:
         with open(os.path.join(tempTargetDir, "module.so"), "wb") as f:
             f.write(binarySharedObject.binaryForm)
 
-        # write the manifest. Every TP process using the cache will have to
-        # load the manifest every time, so we try to use compiled code to load it
+        # write the manifest. We don't read this when we boot (we use the symbol
+        # index for that), but it's the authoritative list of the module's names
+        # and lets us rebuild the index if it's missing.
         manifest = Dict(str, str)()
         for n in binarySharedObject.functionTypes:
             manifest[n] = hashToUse
@@ -251,6 +734,11 @@ class CompilerCache:
         with open(os.path.join(tempTargetDir, "submodules.dat"), "wb") as f:
             f.write(SerializationContext().serialize(ListOf(str)(submodules), ListOf(str)))
 
+        with open(os.path.join(tempTargetDir, TARGET_KEY_FILE), "w") as f:
+            f.write(self.targetKey)
+
+        touch(os.path.join(tempTargetDir, "last_used"))
+
         try:
             os.rename(tempTargetDir, targetDir)
         except IOError:
@@ -259,10 +747,12 @@ class CompilerCache:
             else:
                 shutil.rmtree(tempTargetDir)
 
+        self.symbolIndex.addModule(hashToUse, manifest)
+
         return targetDir, hashToUse
 
     def function_pointer_by_name(self, linkName):
-        moduleHash = self.nameToModuleHash.get(linkName)
+        moduleHash = self.moduleHashForSymbol(linkName)
         if moduleHash is None:
             raise Exception("Can't find a module for " + linkName)
 
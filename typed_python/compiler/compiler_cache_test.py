@@ -14,8 +14,38 @@
 
 import tempfile
 import os
+import shutil
+import threading
 import pytest
 from typed_python.test_util import evaluateExprInFreshProcess
+from typed_python.compiler.compiler_cache import isModuleHash, SymbolIndex, SYMBOL_INDEX_DIR, CompilerCache
+from typed_python.compiler.compilation_target import CompilationTarget
+from typed_python.SerializationContext import SerializationContext
+from typed_python import ListOf
+
+
+def moduleDirs(compilerCacheDir):
+    return [x for x in os.listdir(compilerCacheDir) if isModuleHash(x)]
+
+
+def writeFakeModule(cache, moduleHash, lastUsed, submodules=(), sizeInBytes=1000):
+    """Write a module directory containing enough for garbage collection to reason about."""
+    moduleDir = os.path.join(cache.cacheDir, moduleHash)
+    os.makedirs(moduleDir)
+
+    with open(os.path.join(moduleDir, "module.so"), "wb") as f:
+        f.write(b" " * sizeInBytes)
+
+    with open(os.path.join(moduleDir, "submodules.dat"), "wb") as f:
+        f.write(SerializationContext().serialize(ListOf(str)(submodules), ListOf(str)))
+
+    with open(os.path.join(moduleDir, "last_used"), "w"):
+        pass
+
+    os.utime(os.path.join(moduleDir, "last_used"), (lastUsed, lastUsed))
+
+    cache.symbolIndex.addModule(moduleHash, ["f_" + moduleHash])
+
 
 MAIN_MODULE = """
 @Entrypoint
@@ -28,26 +58,109 @@ def f(x):
 def test_compiler_cache_populates():
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10.5)', compilerCacheDir) == 11.5
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(11)', compilerCacheDir) == 12
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
+
+
+@pytest.mark.skipif('sys.platform=="darwin"')
+def test_compiler_cache_rebuilds_missing_symbol_index():
+    with tempfile.TemporaryDirectory() as compilerCacheDir:
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 1
+
+        shutil.rmtree(os.path.join(compilerCacheDir, SYMBOL_INDEX_DIR))
+
+        # the index gets rebuilt from the module manifests, so we don't recompile
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 1
+        assert os.listdir(os.path.join(compilerCacheDir, SYMBOL_INDEX_DIR))
+
+
+def test_symbol_index_sees_writes_from_other_instances():
+    hashA = "a" * 40
+    hashB = "b" * 40
+
+    with tempfile.TemporaryDirectory() as indexDir:
+        reader = SymbolIndex(indexDir)
+        writer = SymbolIndex(indexDir)
+
+        assert reader.moduleHashesFor("f") == ()
+
+        writer.addModule(hashA, ["f", "g"])
+        assert list(reader.moduleHashesFor("f")) == [hashA]
+
+        writer.addModule(hashB, ["f", "name with spaces"])
+        assert list(reader.moduleHashesFor("g")) == [hashA]
+        assert list(reader.moduleHashesFor("name with spaces")) == [hashB]
+        assert list(SymbolIndex(indexDir).moduleHashesFor("f")) == [hashA, hashB]
+
+
+def test_symbol_index_ignores_partially_written_records():
+    hashA = "a" * 40
+
+    with tempfile.TemporaryDirectory() as indexDir:
+        index = SymbolIndex(indexDir)
+
+        with open(index.shardPath(SymbolIndex.shardFor("f")), "w") as f:
+            f.write(hashA + " f")
+
+        assert index.moduleHashesFor("f") == ()
+
+        with open(index.shardPath(SymbolIndex.shardFor("f")), "a") as f:
+            f.write("\n")
+
+        assert list(index.moduleHashesFor("f")) == [hashA]
+
+
+def test_symbol_index_compaction_keeps_concurrent_appends():
+    deadHash = "d" * 40
+    liveHashes = [("%040x" % i) for i in range(1, 201)]
+
+    with tempfile.TemporaryDirectory() as indexDir:
+        SymbolIndex(indexDir).addModule(deadHash, ["f", "g", "h"])
+
+        def append(hashes):
+            writer = SymbolIndex(indexDir)
+            for moduleHash in hashes:
+                writer.addModule(moduleHash, ["f", "g", "h", deadHash])
+
+        writers = [threading.Thread(target=append, args=(liveHashes[i::4],)) for i in range(4)]
+
+        for w in writers:
+            w.start()
+
+        compactor = SymbolIndex(indexDir)
+
+        while any(w.is_alive() for w in writers):
+            compactor.compact(lambda moduleHash: moduleHash != deadHash)
+
+        for w in writers:
+            w.join()
+
+        compactor.compact(lambda moduleHash: moduleHash != deadHash)
+
+        reader = SymbolIndex(indexDir)
+
+        for name in ["f", "g", "h", deadHash]:
+            assert sorted(reader.moduleHashesFor(name)) == liveHashes
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
 def test_compiler_cache_can_handle_conflicting_versions_of_the_same_code():
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE.replace('1', '2')}, 'x.f(10)', compilerCacheDir) == 12
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -68,13 +181,13 @@ def test_compiler_cache_can_detect_invalidation_through_modules():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION1, 'y.g(10)', compilerCacheDir) == 11
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         assert evaluateExprInFreshProcess(VERSION2, 'y.g(10)', compilerCacheDir) == 12
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         assert evaluateExprInFreshProcess(VERSION1, 'y.g(10)', compilerCacheDir) == 11
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -96,10 +209,10 @@ def test_compiler_cache_robust_to_irrelevant_module_changes():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION1, 'y.g(10)', compilerCacheDir) == 11
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         assert evaluateExprInFreshProcess(VERSION2, 'y.g(10)', compilerCacheDir) == 11
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -124,15 +237,15 @@ def test_compiler_cache_understands_type_changes():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION1, 'y.g(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # no recompilation necessary
         assert evaluateExprInFreshProcess(VERSION2, 'y.g(1)', compilerCacheDir) == 3
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # this forces a recompile
         assert evaluateExprInFreshProcess(VERSION3, 'y.g(1)', compilerCacheDir) == 2.5
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -178,11 +291,11 @@ def test_compiler_cache_understands_granular_module_accesses():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION1, 'y.g(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # no recompilation necessary
         assert evaluateExprInFreshProcess(VERSION2, 'y.g(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -205,15 +318,15 @@ def test_load_dependent_modules():
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         # add an item to the cache
         assert evaluateExprInFreshProcess(VERSION1, 'x.f(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # add a dependent function
         assert evaluateExprInFreshProcess(VERSION2, 'x.g(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         # we should be able to load correctly
         assert evaluateExprInFreshProcess(VERSION2, 'x.g(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -241,19 +354,19 @@ def test_reference_existing_function_twice():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION1, 'x.f(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # add some content and nothing recompiles
         assert evaluateExprInFreshProcess(VERSION2, 'x.f(1)', compilerCacheDir) == 2
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # recompiles with 'g1' and 'g2' referencing 'f'
         assert evaluateExprInFreshProcess(VERSION2, 'x.g(1)', compilerCacheDir) == 4
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         # can load it
         assert evaluateExprInFreshProcess(VERSION2, 'x.g(1)', compilerCacheDir) == 4
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -275,11 +388,11 @@ def test_compiler_cache_handles_class_destructors_correctly():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION, 'x.f(1)', compilerCacheDir) == 1
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         # we can reuse the class destructor from the first time around
         assert evaluateExprInFreshProcess(VERSION, 'x.g(1)', compilerCacheDir) == 1
-        assert len(os.listdir(compilerCacheDir)) == 3
+        assert len(moduleDirs(compilerCacheDir)) == 3
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -301,11 +414,11 @@ def test_compiler_cache_handles_classes():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION, 'x.f(1)', compilerCacheDir) == 1
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         # we can reuse the class destructor from the first time around
         assert evaluateExprInFreshProcess(VERSION, 'x.g(1)', compilerCacheDir) == 1
-        assert len(os.listdir(compilerCacheDir)) == 3
+        assert len(moduleDirs(compilerCacheDir)) == 3
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -322,11 +435,11 @@ def test_compiler_cache_handles_references_to_globals():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION, 'x.f(1)', compilerCacheDir) == [1]
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # we can reuse the class destructor from the first time around
         assert evaluateExprInFreshProcess(VERSION, '(x.f(1), x.aList)', compilerCacheDir) == ([1], [1])
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
 
 @pytest.mark.skipif('sys.platform=="darwin"')
@@ -355,15 +468,15 @@ def test_compiler_cache_handles_changed_types():
 
     with tempfile.TemporaryDirectory() as compilerCacheDir:
         assert evaluateExprInFreshProcess(VERSION1, 'x.g1(1)', compilerCacheDir) == 1
-        assert len(os.listdir(compilerCacheDir)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 1
 
         # if we try to use 'f', it should work even though we no longer have
         # a defniition for 'g2'
         assert evaluateExprInFreshProcess(VERSION2, 'x.f(1)', compilerCacheDir) == 1
-        assert len(os.listdir(compilerCacheDir)) == 2
+        assert len(moduleDirs(compilerCacheDir)) == 2
 
         badCt = 0
-        for subdir in os.listdir(compilerCacheDir):
+        for subdir in moduleDirs(compilerCacheDir):
             if 'marked_invalid' in os.listdir(os.path.join(compilerCacheDir, subdir)):
                 badCt += 1
 
@@ -395,3 +508,104 @@ def test_ordering_is_stable_under_code_change():
         )
 
         assert names == names2
+
+
+def test_collect_garbage_evicts_least_recently_used_modules():
+    hashA, hashB, hashC = "a" * 40, "b" * 40, "c" * 40
+
+    with tempfile.TemporaryDirectory() as compilerCacheDir:
+        cache = CompilerCache(compilerCacheDir)
+
+        writeFakeModule(cache, hashA, lastUsed=1)
+        writeFakeModule(cache, hashB, lastUsed=2)
+        writeFakeModule(cache, hashC, lastUsed=3)
+
+        # nothing to do if we fit
+        assert cache.collectGarbage(10000) == []
+        assert sorted(moduleDirs(compilerCacheDir)) == [hashA, hashB, hashC]
+
+        # 'a' is the oldest, so it gets marked invalid, but not deleted yet
+        assert cache.collectGarbage(2500) == []
+        assert sorted(moduleDirs(compilerCacheDir)) == [hashA, hashB, hashC]
+        assert not CompilerCache(compilerCacheDir).hasSymbol("f_" + hashA)
+        assert CompilerCache(compilerCacheDir).hasSymbol("f_" + hashB)
+
+        # once the grace period has passed we delete it and drop it from the index
+        assert cache.collectGarbage(2500, gracePeriod=0) == [hashA]
+        assert sorted(moduleDirs(compilerCacheDir)) == [hashB, hashC]
+        assert SymbolIndex(cache.symbolIndex.indexDir).moduleHashesFor("f_" + hashA) == ()
+
+
+def test_collect_garbage_respects_submodules():
+    hashBase, hashDependent, hashOther = "a" * 40, "b" * 40, "c" * 40
+
+    with tempfile.TemporaryDirectory() as compilerCacheDir:
+        cache = CompilerCache(compilerCacheDir)
+
+        writeFakeModule(cache, hashBase, lastUsed=1)
+        writeFakeModule(cache, hashOther, lastUsed=2)
+        writeFakeModule(cache, hashDependent, lastUsed=3, submodules=[hashBase])
+
+        # 'base' is kept alive by 'dependent', so 'other' is the stalest
+        assert cache.collectGarbage(2500, gracePeriod=0) == [hashOther]
+
+        # we can't evict 'base' without evicting 'dependent' too
+        assert sorted(cache.collectGarbage(1500, gracePeriod=0)) == [hashBase, hashDependent]
+        assert moduleDirs(compilerCacheDir) == []
+
+
+def test_collect_garbage_removes_modules_with_missing_submodules():
+    hashA, hashB = "a" * 40, "b" * 40
+
+    with tempfile.TemporaryDirectory() as compilerCacheDir:
+        cache = CompilerCache(compilerCacheDir)
+
+        writeFakeModule(cache, hashA, lastUsed=1, submodules=["c" * 40])
+        writeFakeModule(cache, hashB, lastUsed=2)
+
+        # the first pass notices 'a' is unusable and marks it, the second deletes it
+        assert cache.collectGarbage(10000, gracePeriod=0) == []
+        assert cache.collectGarbage(10000, gracePeriod=0) == [hashA]
+        assert moduleDirs(compilerCacheDir) == [hashB]
+
+
+@pytest.mark.skipif('sys.platform=="darwin"')
+def test_compiler_cache_recompiles_after_garbage_collection():
+    with tempfile.TemporaryDirectory() as compilerCacheDir:
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 1
+
+        assert len(CompilerCache(compilerCacheDir).collectGarbage(0, gracePeriod=0)) == 1
+        assert len(moduleDirs(compilerCacheDir)) == 0
+
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 1
+
+
+@pytest.mark.skipif('sys.platform=="darwin"')
+def test_compiler_cache_separates_compilation_targets(monkeypatch):
+    with tempfile.TemporaryDirectory() as compilerCacheDir:
+        monkeypatch.setenv("TP_COMPILER_TARGET_CPU", "generic")
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 1
+
+        # code compiled for a generic cpu isn't what a process targeting this one wants
+        monkeypatch.setenv("TP_COMPILER_TARGET_CPU", "host")
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 2
+
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 2
+
+        monkeypatch.setenv("TP_COMPILER_TARGET_CPU", "generic")
+        assert evaluateExprInFreshProcess({'x.py': MAIN_MODULE}, 'x.f(10)', compilerCacheDir) == 11
+        assert len(moduleDirs(compilerCacheDir)) == 2
+
+        cache = CompilerCache(compilerCacheDir, CompilationTarget.host().key)
+
+        assert sorted(cache.targetKeyFor(h) for h in moduleDirs(compilerCacheDir)) == sorted(
+            [CompilationTarget.generic().key, CompilationTarget.host().key]
+        )
+
+        for moduleHash in moduleDirs(compilerCacheDir):
+            assert cache.moduleHashIsValid(moduleHash) == (cache.targetKeyFor(moduleHash) == cache.targetKey)
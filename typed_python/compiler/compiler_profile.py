@@ -0,0 +1,182 @@
+#   Copyright 2017-2021 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Profiles of how compiled code actually runs, for profile-guided optimization.
+
+Setting TP_COMPILER_PROFILE to 'record' makes the compiler instrument the code it
+generates so that it counts how often each function is called and which way each
+of its branches goes. The counts get added to the profile file when the process
+exits. Setting it to 'use' makes the compiler read the profile file and use the
+counts to weight branches, to decide what to inline across modules, and to lay
+out hot functions together.
+
+The profile file is 'profile.dat' in the compiler cache (TP_COMPILER_CACHE), or
+whatever TP_COMPILER_PROFILE_FILE names.
+"""
+
+import hashlib
+import os
+import uuid
+
+from typed_python import Dict, ListOf
+from typed_python.SerializationContext import SerializationContext
+
+
+# counters live in blocks of this many, so that their addresses never move
+COUNTER_BLOCK_SIZE = 4096
+
+# a function is hot if it was called at least this fraction as often as the
+# most-called function in the profile
+HOT_CALL_FRACTION = 0.01
+
+# llvm branch weights are 32 bit, so we scale the counts of busy branches down
+MAX_BRANCH_WEIGHT = 2 ** 31 - 1
+
+ProfileCounts = Dict(str, ListOf(int))
+
+
+class CompilerProfile:
+    """Per-function counts of calls and of the directions branches went.
+
+    For each function (by link name) we hold a list of counters: the number of
+    calls, followed by the number of times each branch in the function went each
+    way (taken, then not taken), in the order the converter emits the branches.
+
+    A recording profile owns counters that instrumented code increments directly.
+    Otherwise, the profile holds counts recorded by earlier processes.
+
+    Args:
+        counts - a map from link name to a list of counters, as described above.
+        recording - if True, the compiler should instrument the code it
+            generates to add to this profile.
+    """
+
+    def __init__(self, counts=None, recording=False):
+        self.counts = ProfileCounts(counts or {})
+        self.recording = recording
+
+        self._counterBlocks = []
+        self._countersUsedInLastBlock = COUNTER_BLOCK_SIZE
+
+        # link name -> list of (block, index) for each of the function's counters
+        self._counterSlots = {}
+
+        self._hotCallCount = None
+
+    @staticmethod
+    def load(path):
+        """Load the profile stored at 'path'. A missing or corrupt file is an empty profile."""
+        try:
+            with open(path, "rb") as f:
+                return CompilerProfile(SerializationContext().deserialize(f.read(), ProfileCounts))
+        except Exception:
+            return CompilerProfile()
+
+    def save(self, path):
+        """Add our counts (or the ones we've recorded) to those in the profile at 'path'."""
+        counts = CompilerProfile.load(path).counts
+
+        for name, functionCounts in (self.recordedCounts() if self.recording else self.counts).items():
+            if name in counts and len(counts[name]) == len(functionCounts):
+                counts[name] = ListOf(int)([a + b for a, b in zip(counts[name], functionCounts)])
+            else:
+                # the function changed shape (or it's new), so older counts don't apply
+                counts[name] = functionCounts
+
+        # write to a temporary file and rename it into place, so that readers never
+        # see a partially written profile.
+        tempPath = path + "_" + str(uuid.uuid4())
+
+        with open(tempPath, "wb") as f:
+            f.write(SerializationContext().serialize(counts, ProfileCounts))
+
+        os.replace(tempPath, path)
+
+    def counterAddress(self, name, counterIx):
+        """Return the address of counter 'counterIx' for the function 'name'.
+
+        Functions get counters as the compiler asks for them, so a function
+        defined in several modules shares one set of counters.
+        """
+        assert self.recording
+
+        slots = self._counterSlots.setdefault(name, [])
+
+        while len(slots) <= counterIx:
+            if self._countersUsedInLastBlock == COUNTER_BLOCK_SIZE:
+                block = ListOf(int)()
+                block.resize(COUNTER_BLOCK_SIZE)
+                self._counterBlocks.append(block)
+                self._countersUsedInLastBlock = 0
+
+            slots.append((self._counterBlocks[-1], self._countersUsedInLastBlock))
+            self._countersUsedInLastBlock += 1
+
+        block, index = slots[counterIx]
+
+        return int(block.pointerUnsafe(index))
+
+    def recordedCounts(self):
+        """Return the counts instrumented code has recorded so far."""
+        return ProfileCounts({
+            name: ListOf(int)([block[index] for block, index in slots])
+            for name, slots in self._counterSlots.items()
+        })
+
+    @property
+    def key(self):
+        """A string identifying the counts in this profile.
+
+        Code compiled using profiles with different keys may be different.
+        """
+        return hashlib.sha1(SerializationContext().serialize(self.counts, ProfileCounts)).hexdigest()
+
+    def callCount(self, name):
+        """Return how often the function 'name' was called, or None if we don't know."""
+        if name not in self.counts:
+            return None
+
+        return self.counts[name][0]
+
+    def branchWeights(self, name, branchIx):
+        """Return (taken, notTaken) weights for branch 'branchIx' of 'name', or None."""
+        functionCounts = self.counts.get(name)
+
+        if functionCounts is None or len(functionCounts) < 3 + branchIx * 2:
+            return None
+
+        taken, notTaken = functionCounts[1 + branchIx * 2], functionCounts[2 + branchIx * 2]
+
+        if not taken and not notTaken:
+            return None
+
+        scale = max(taken, notTaken) // (MAX_BRANCH_WEIGHT - 1) + 1
+
+        # add one to each side so that a branch we never saw go one way stays possible
+        return (taken // scale + 1, notTaken // scale + 1)
+
+    def isHot(self, name):
+        """Was 'name' called often, relative to the busiest function in the profile?"""
+        if self._hotCallCount is None:
+            self._hotCallCount = max(
+                1, HOT_CALL_FRACTION * max((c[0] for c in self.counts.values() if len(c)), default=0)
+            )
+
+        calls = self.callCount(name)
+
+        return calls is not None and calls >= self._hotCallCount
+
+    def isCold(self, name):
+        """Is 'name' a function that we compiled while profiling, but that never got called?"""
+        return self.callCount(name) == 0
@@ -0,0 +1,161 @@
+#   Copyright 2017-2021 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import ctypes
+import os
+import tempfile
+
+import pytest
+
+from typed_python.compiler.native_ast import (
+    Expression, Int64, Function, FunctionBody, const_int_expr
+)
+from typed_python.compiler.compiler_profile import CompilerProfile
+from typed_python.compiler.compiler_cache import isModuleHash, PROFILE_FILE, TARGET_KEY_FILE
+from typed_python.compiler import llvm_compiler
+from typed_python.test_util import evaluateExprInFreshProcess
+
+
+def isPositive():
+    x = Expression.Variable(name='x')
+
+    return Function(
+        args=[('x', Int64)],
+        output_type=Int64,
+        body=FunctionBody.Internal(
+            Expression.Branch(
+                cond=x.cast(Int64),
+                true=Expression.Return(arg=const_int_expr(1)),
+                false=Expression.Return(arg=const_int_expr(0))
+            )
+        )
+    )
+
+
+def test_recording_profile_counts_calls_and_branches():
+    compiler = llvm_compiler.Compiler(inlineThreshold=100)
+
+    profile = CompilerProfile(recording=True)
+    compiler.setProfile(profile)
+
+    module = compiler.buildModule({'__test_profiled_f': isPositive()})
+
+    f = ctypes.CFUNCTYPE(ctypes.c_long, ctypes.c_long)(module.functionPointers['__test_profiled_f'].fp)
+
+    assert sum(f(i % 10) for i in range(100)) == 90
+
+    assert list(profile.recordedCounts()['__test_profiled_f']) == [100, 90, 10]
+
+
+def test_profile_guides_code_generation():
+    compiler = llvm_compiler.Compiler(inlineThreshold=100)
+
+    compiler.setProfile(
+        CompilerProfile({
+            '__test_pgo_hot': [1000, 990, 10],
+            '__test_pgo_cold': [0, 0, 0],
+        })
+    )
+
+    moduleText = compiler.converter.add_functions({
+        '__test_pgo_cold': isPositive(),
+        '__test_pgo_hot': isPositive(),
+        '__test_pgo_unknown': isPositive(),
+    }).moduleText
+
+    definitions = [line for line in moduleText.splitlines() if line.startswith("define")]
+
+    # the hot function comes first, and gets hinted for inlining
+    assert '__test_pgo_hot' in definitions[0] and 'inlinehint' in definitions[0]
+
+    # the function that never ran is cold
+    assert [d for d in definitions if '__test_pgo_cold' in d and 'cold' in d.split('@')[1]]
+
+    # only the branch we've seen run gets weights
+    assert moduleText.count('!prof') == 1
+    assert '!"branch_weights", i32 991, i32 11' in moduleText
+
+
+def test_profile_branch_weights_fit_in_32_bits():
+    weights = CompilerProfile({'f': [2 ** 40, 2 ** 40, 2 ** 20]}).branchWeights('f', 0)
+
+    assert max(weights) < 2 ** 31
+    assert weights[0] > weights[1] > 0
+
+
+def test_saving_profiles_accumulates_counts():
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, PROFILE_FILE)
+
+        assert not CompilerProfile.load(path).counts
+
+        CompilerProfile({'f': [1, 2, 3]}).save(path)
+        CompilerProfile({'f': [1, 2, 3], 'g': [5]}).save(path)
+
+        assert CompilerProfile.load(path).counts == {'f': [2, 4, 6], 'g': [5]}
+
+        # if a function's shape changes, its old counts are meaningless
+        CompilerProfile({'f': [1]}).save(path)
+
+        assert CompilerProfile.load(path).counts == {'f': [1], 'g': [5]}
+
+
+PROFILED_MODULE = """
+@Entrypoint
+def classify(x: int):
+    if x % 10 == 0:
+        return 1
+    return 0
+
+def classifyMany(n):
+    return sum(classify(i) for i in range(n))
+"""
+
+
+@pytest.mark.skipif('sys.platform=="darwin"')
+def test_record_and_use_profile_with_compiler_cache(monkeypatch):
+    with tempfile.TemporaryDirectory() as compilerCacheDir:
+        monkeypatch.setenv("TP_COMPILER_PROFILE", "record")
+
+        assert evaluateExprInFreshProcess(
+            {'x.py': PROFILED_MODULE}, 'x.classifyMany(1000)', compilerCacheDir
+        ) == 100
+
+        # instrumented code can't be reused, so it doesn't go in the cache
+        assert not [x for x in os.listdir(compilerCacheDir) if isModuleHash(x)]
+
+        counts = CompilerProfile.load(os.path.join(compilerCacheDir, PROFILE_FILE)).counts
+
+        classifyCounts = [
+            c for name, c in counts.items() if 'classify' in name and not name.endswith('.dispatch')
+        ]
+        assert len(classifyCounts) == 1
+
+        branches = list(zip(classifyCounts[0][1::2], classifyCounts[0][2::2]))
+        assert classifyCounts[0][0] == 1000
+        assert (100, 900) in branches
+
+        monkeypatch.setenv("TP_COMPILER_PROFILE", "use")
+
+        assert evaluateExprInFreshProcess(
+            {'x.py': PROFILED_MODULE}, 'x.classifyMany(1000)', compilerCacheDir
+        ) == 100
+
+        modules = [x for x in os.listdir(compilerCacheDir) if isModuleHash(x)]
+        assert modules
+
+        # code compiled with the profile is only valid with that profile
+        for moduleHash in modules:
+            with open(os.path.join(compilerCacheDir, moduleHash, TARGET_KEY_FILE)) as f:
+                assert "profile=" in f.read()
@@ -23,6 +23,7 @@ from typed_python.compiler.python_ast_analysis import (
     computeReadVariables,
     computeFunctionArgVariables,
     computeVariablesAssignedOnlyOnce,
+    computeVariablesOnlyUsedForMemberAccess,
     computeVariablesReadByClosures,
     countYieldStatements,
     extractFunctionDefs,
@@ -37,6 +38,8 @@ import typed_python.compiler.type_wrappers.runtime_functions as runtime_function
 from typed_python.compiler.expression_conversion_context import ExpressionConversionContext
 from typed_python.compiler.function_stack_state import FunctionStackState
 from typed_python.compiler.type_wrappers.none_wrapper import NoneWrapper
+from typed_python.compiler.type_wrappers.class_wrapper import ClassWrapper
+from typed_python.compiler.type_wrappers.python_type_object_wrapper import PythonTypeObjectWrapper
 from typed_python.compiler.typed_expression import TypedExpression
 from typed_python.compiler.conversion_exception import ConversionException
 from typed_python import OneOf, Function, Tuple, Forward, Class
@@ -182,6 +185,8 @@ class ConversionContextBase:
         self._output_type = output_type
         self._argumentsWithoutStackslots = set()  # arguments that we don't bother to copy into the stack
         self._varname_to_type = {}
+        # variables whose Class instances we construct on the stack -> the ClassWrapper
+        self._stackAllocatedVariables = {}
         self._globals = globalVars
         self._globalsRaw = globalVarsRaw
         self._closureVarnames = closureVarnames
@@ -458,6 +463,7 @@ class ConversionContextBase:
         self.tempLetVarIx = 0
         self._tempStackVarIx = 0
         self._tempIterVarIx = 0
+        self._stackAllocatedVariables = {}
         self.functionMetadata = FunctionMetadata()
 
         variableStates = FunctionStackState()
@@ -476,7 +482,7 @@ class ConversionContextBase:
             # destroy our variables if they are in scope
             destructors = self.generateDestructors(variableStates)
 
-            body_native_expr = initializer_expr >> body_native_expr
+            body_native_expr = initializer_expr >> self.stackInstanceInitializer() >> body_native_expr
 
             if destructors:
                 body_native_expr = native_ast.Expression.Finally(teardowns=destructors, expr=body_native_expr)
@@ -850,11 +856,49 @@ class ConversionContextBase:
                     )
                 )
 
+        for name, classWrapper in self._stackAllocatedVariables.items():
+            context = ExpressionConversionContext(self, variableStates)
+
+            with context.ifelse(self.stackInstanceIsConstructed(context, name)) as (true, false):
+                with true:
+                    classWrapper.convert_destroy_members(context, self.stackInstance(context, name, classWrapper))
+
+            destructors.append(
+                native_ast.Teardown.Always(
+                    expr=context.finalize(None).with_comment(f"Cleanup for stack instance {name}")
+                )
+            )
+
         for expr in self.closureDestructor(variableStates):
             destructors.append(native_ast.Teardown.Always(expr=expr))
 
         return destructors
 
+    def stackInstanceInitializer(self):
+        """Mark the stack storage for each Class instance we construct on the stack as empty."""
+        return native_ast.makeSequence([
+            native_ast.Expression.StackSlot(
+                name=name + ".stackInstance.isInitialized", type=native_ast.Bool
+            ).store(native_ast.falseExpr)
+            for name in self._stackAllocatedVariables
+        ])
+
+    def stackInstanceIsConstructed(self, context, name):
+        return TypedExpression(
+            context,
+            native_ast.Expression.StackSlot(name=name + ".stackInstance.isInitialized", type=native_ast.Bool),
+            bool,
+            isReference=True,
+        )
+
+    def stackInstance(self, context, name, classWrapper):
+        """Return a TypedExpression for the Class instance living in 'name's stack storage."""
+        storage = native_ast.Expression.StackSlot(
+            name=name + ".stackInstance", type=classWrapper.stackInstanceType()
+        )
+
+        return context.pushLet(classWrapper, storage.cast(classWrapper.getNativeLayoutType()), False)
+
     def isInitializedVarExpr(self, context, name):
         if self.variableIsAlwaysEmpty(name):
             return context.constant(True)
@@ -1079,6 +1123,10 @@ class FunctionConversionContext(ConversionContextBase):
         # since they get bound in the closure varnames.
         self.variablesReadByClosures = computeVariablesReadByClosures(statements)
 
+        # variables holding a value we construct and then only access members of. If
+        # that value is a Class instance, we can build it on the stack.
+        self.variablesOnlyUsedForMemberAccess = computeVariablesOnlyUsedForMemberAccess(statements)
+
         # if this is not zero, then we are a generator
         self._bodyHasYieldStatements = countYieldStatements(statements) > 0
 
@@ -1343,6 +1391,102 @@ class FunctionConversionContext(ConversionContextBase):
         exception_occurred_name = ".exc_occurred"
         return native_ast.Expression.StackSlot(name=exception_occurred_name, type=native_ast.Bool)
 
+    def mightConstructOnStack(self, ast):
+        """Is 'ast' an assignment like 'x = C(a=1)' whose value might not need the heap?"""
+        if not (
+            len(ast.targets) == 1
+            and ast.targets[0].matches.Name
+            and ast.targets[0].id in self.variablesOnlyUsedForMemberAccess
+            and ast.value.matches.Call
+        ):
+            return False
+
+        varname = ast.targets[0].id
+
+        return (
+            not ast.value.args
+            and all(k.arg is not None for k in ast.value.keywords)
+            and not self.isGenerator
+            and varname not in self.variablesReadByClosures
+            and varname not in self.variablesBound
+        )
+
+    def convert_construction_maybe_on_stack(self, context, varname, callAst):
+        """Convert 'callAst', the value assigned to 'varname', building it on the stack if we can.
+
+        'varname' only ever holds this value and we only ever access its members, so if
+        it's an instance of a Class whose construction and attributes never see the
+        instance itself, nothing can hold a reference to it after this function exits.
+        In that case we construct it in stack storage reserved for 'varname' instead of
+        on the heap.
+        """
+        lhs = context.convert_expression_ast(callAst.func)
+
+        if lhs is None:
+            return None
+
+        kwargs = {}
+
+        for keywordArg in callAst.keywords:
+            kwargs[keywordArg.arg] = context.convert_expression_ast(keywordArg.value)
+
+            if kwargs[keywordArg.arg] is None:
+                return None
+
+        classWrapper = self.stackConstructibleClass(
+            lhs.expr_type, varname, self.variablesOnlyUsedForMemberAccess[varname] | set(kwargs)
+        )
+
+        if classWrapper is None:
+            return lhs.convert_call([], kwargs)
+
+        # our arguments might refer to the members of the instance we're about to replace,
+        # so we take our own copies of them first.
+        for name, arg in kwargs.items():
+            if arg.isReference:
+                kwargs[name] = context.push(arg.expr_type, lambda slot, arg=arg: slot.convert_copy_initialize(arg))
+
+        # the last instance that lived here (if this statement runs more than once) can't be
+        # seen by anyone anymore, since the variable is the only thing that refers to it.
+        with context.ifelse(self.stackInstanceIsConstructed(context, varname)) as (true, false):
+            with true:
+                classWrapper.convert_destroy_members(context, self.stackInstance(context, varname, classWrapper))
+
+        self.stackInstanceIsConstructed(context, varname).convert_copy_initialize(context.constant(True))
+
+        self._stackAllocatedVariables[varname] = classWrapper
+
+        return classWrapper.convert_type_call_on_stack(
+            context,
+            native_ast.Expression.StackSlot(
+                name=varname + ".stackInstance", type=classWrapper.stackInstanceType()
+            ),
+            kwargs
+        )
+
+    def stackConstructibleClass(self, callableType, varname, attributes):
+        """Return the ClassWrapper if calling 'callableType' makes a Class we could build on the stack."""
+        if not isinstance(callableType, PythonTypeObjectWrapper):
+            return None
+
+        T = callableType.typeRepresentation.Value
+
+        if not (isinstance(T, type) and issubclass(T, Class) and T is not Class):
+            return None
+
+        classWrapper = typeWrapper(T)
+
+        if not isinstance(classWrapper, ClassWrapper):
+            return None
+
+        if self._varname_to_type.get(varname) not in (None, classWrapper):
+            return None
+
+        if not classWrapper.canConstructOnStack(attributes):
+            return None
+
+        return classWrapper
+
     def convert_statement_ast(self, ast, variableStates: FunctionStackState, controlFlowBlocks):
         """Convert a single statement to native_ast.
 
@@ -1447,7 +1591,10 @@ class FunctionConversionContext(ConversionContextBase):
 
             subcontext = ExpressionConversionContext(self, variableStates)
 
-            val_to_store = subcontext.convert_expression_ast(ast.value)
+            if self.mightConstructOnStack(ast):
+                val_to_store = self.convert_construction_maybe_on_stack(subcontext, ast.targets[0].id, ast.value)
+            else:
+                val_to_store = subcontext.convert_expression_ast(ast.value)
 
             if val_to_store is None:
                 return subcontext.finalize(None, exceptionsTakeFrom=ast), False
@@ -20,7 +20,11 @@ import typed_python.compiler.native_ast_to_llvm as native_ast_to_llvm
 from typed_python.compiler.loaded_module import LoadedModule
 from typed_python.compiler.native_function_pointer import NativeFunctionPointer
 from typed_python.compiler.binary_shared_object import BinarySharedObject
+from typed_python.compiler.module_definition import ModuleDefinition
+from typed_python.compiler.parallel_codegen import CodegenWorkerPool
+from typed_python.compiler.compilation_target import defaultCompilationTarget
 
+import itertools
 import sys
 import ctypes
 from typed_python import _types
@@ -29,10 +33,9 @@ llvm.initialize()
 llvm.initialize_native_target()
 llvm.initialize_native_asmprinter()  # yes, even this one
 
-target_triple = llvm.get_process_triple()
-target = llvm.Target.from_triple(target_triple)
-target_machine = target.create_target_machine()
-target_machine_shared_object = target.create_target_machine(reloc='pic', codemodel='default')
+compilation_target = defaultCompilationTarget()
+target_machine = compilation_target.createTargetMachine()
+target_machine_shared_object = compilation_target.createTargetMachine(reloc='pic', codemodel='default')
 
 # we need to load the appropriate libstdc++ so that we can get __cxa_begin_catch and friends
 if sys.platform == "darwin":
@@ -64,22 +67,40 @@ def sizeof_native_type(native_type):
 # there can be only one llvm engine alive at once.
 _engineCache = []
 
+# used to give each module we load as an object file its own global variable accessor
+_objectModuleCounter = itertools.count()
+
+# the optimization level we use for the first tier of tiered compilation. It's much
+# faster to produce than full optimization, but still gets rid of most of the
+# stack traffic in the code we generate.
+FIRST_TIER_OPT_LEVEL = 1
 
-def create_execution_engine(inlineThreshold):
-    if _engineCache:
-        return _engineCache[0]
 
+def create_pass_manager(optLevel, inlineThreshold):
     pmb = llvm.create_pass_manager_builder()
-    pmb.opt_level = 3
+    pmb.opt_level = optLevel
     pmb.size_level = 0
-    pmb.inlining_threshold = inlineThreshold
-    pmb.loop_vectorize = True
-    pmb.slp_vectorize = True
+
+    if optLevel >= 2:
+        pmb.inlining_threshold = inlineThreshold
+        pmb.loop_vectorize = True
+        pmb.slp_vectorize = True
 
     pass_manager = llvm.create_module_pass_manager()
-    pmb.populate(pass_manager)
 
+    # the vectorizers only know what the cpu can do if the target's analyses are
+    # registered before they get added.
     target_machine.add_analysis_passes(pass_manager)
+    pmb.populate(pass_manager)
+
+    return pass_manager
+
+
+def create_execution_engine(inlineThreshold):
+    if _engineCache:
+        return _engineCache[0]
+
+    pass_manager = create_pass_manager(3, inlineThreshold)
 
     # And an execution engine with an empty backing module
     backing_mod = llvm.parse_assembly("")
@@ -91,18 +112,46 @@ def create_execution_engine(inlineThreshold):
 
 
 class Compiler:
-    def __init__(self, inlineThreshold):
+    def __init__(self, inlineThreshold, codegenWorkers=0):
         self.engine, self.module_pass_manager = create_execution_engine(inlineThreshold)
+        self._firstTierPassManager = None
         self.converter = native_ast_to_llvm.Converter()
         self.functions_by_name = {}
         self.inlineThreshold = inlineThreshold
+        self.target = compilation_target
         self.verbose = False
         self.optimize = True
+        self.codegenWorkerPool = None
+        self.setCodegenWorkerCount(codegenWorkers)
+
+    def setCodegenWorkerCount(self, codegenWorkers):
+        """Set how many processes 'buildModules' may use to optimize code in parallel.
+
+        Zero or one means we do everything in-process.
+        """
+        if self.codegenWorkerPool is not None:
+            self.codegenWorkerPool.shutdown()
+            self.codegenWorkerPool = None
+
+        if codegenWorkers > 1:
+            self.codegenWorkerPool = CodegenWorkerPool(codegenWorkers, self.inlineThreshold, self.target)
+
+    @property
+    def codegenWorkerCount(self):
+        return self.codegenWorkerPool.workerCount if self.codegenWorkerPool is not None else 1
 
     def markExternal(self, functionNameToType):
         """Provide type signatures for a set of external functions."""
         self.converter.markExternal(functionNameToType)
 
+    def setProfile(self, profile):
+        """Instrument code we build from now on for 'profile', or optimize it using it.
+
+        Args:
+            profile - a CompilerProfile, or None.
+        """
+        self.converter.profile = profile
+
     def mark_converter_verbose(self):
         self.converter.verbose = True
 
@@ -130,16 +179,19 @@ class Compiler:
             mod,
             module.globalVariableDefinitions,
             module.functionNameToType,
+            target_machine_shared_object
         )
 
     def function_pointer_by_name(self, name):
         return self.functions_by_name.get(name)
 
-    def buildModule(self, functions):
+    def buildModule(self, functions, firstTier=False):
         """Compile a list of functions into a new module.
 
         Args:
             functions - a map from name to native_ast.Function
+            firstTier - if True, optimize the module at FIRST_TIER_OPT_LEVEL
+                rather than fully, so that it compiles quickly.
 
         Returns:
             None, or a LoadedModule object.
@@ -161,14 +213,122 @@ class Compiler:
         self.engine.add_module(mod)
 
         if self.optimize:
-            self.module_pass_manager.run(mod)
+            if firstTier:
+                if self._firstTierPassManager is None:
+                    self._firstTierPassManager = create_pass_manager(FIRST_TIER_OPT_LEVEL, self.inlineThreshold)
+
+                self._firstTierPassManager.run(mod)
+            else:
+                self.module_pass_manager.run(mod)
 
         if self.verbose:
             print(mod)
 
         self.engine.finalize_object()
 
-        # Look up the function pointer (a Python int)
+        return self._loadedModuleFor(functions, module, module.GET_GLOBAL_VARIABLES_NAME)
+
+    def buildModules(self, partitions):
+        """Compile several sets of functions into new modules, in parallel if we can.
+
+        Each partition becomes its own module. Functions may call functions in
+        other partitions, but can't be inlined into them, so callers should
+        split along the call graph. We optimize and generate code for the modules
+        in our worker processes and then load the resulting object files into
+        the engine, which links them to each other and to everything we've
+        compiled before.
+
+        Args:
+            partitions - a list of maps from name to native_ast.Function
+
+        Returns:
+            a list of LoadedModule objects, one per partition.
+        """
+        partitions = [p for p in partitions if p]
+
+        if self.codegenWorkerPool is None or not self.optimize or self.verbose or len(partitions) < 2:
+            return [self.buildModule(p) for p in partitions]
+
+        modules = []
+        accessorNames = []
+
+        for functions in partitions:
+            # the modules get loaded side by side, so each one needs its own accessor
+            accessorName = ModuleDefinition.GET_GLOBAL_VARIABLES_NAME + "." + str(next(_objectModuleCounter))
+
+            modules.append(self.converter.add_functions(functions, accessorName))
+            accessorNames.append(accessorName)
+
+        objectFiles = self.codegenWorkerPool.compileModules([m.moduleText for m in modules])
+
+        for objectFile in objectFiles:
+            self.engine.add_object_file(llvm.ObjectFileRef.from_data(objectFile))
+
+        self.engine.finalize_object()
+
+        return [
+            self._loadedModuleFor(functions, module, accessorName)
+            for functions, module, accessorName in zip(partitions, modules, accessorNames)
+        ]
+
+    def buildOptimizedCopy(self, functions, rootName):
+        """Compile a fully optimized copy of some functions we've already compiled.
+
+        The copy lives in its own module, where everything other than 'rootName'
+        is private, so it doesn't collide with the originals and llvm can inline
+        as aggressively as it likes. Functions that 'functions' call but that
+        aren't in it resolve to the existing definitions.
+
+        Args:
+            functions - a map from name to native_ast.Function, all of which we've
+                compiled before.
+            rootName - the name of the function in 'functions' to return a pointer to.
+
+        Returns:
+            a NativeFunctionPointer to the new copy of 'rootName'.
+        """
+        converter = native_ast_to_llvm.Converter()
+        converter.profile = self.converter.profile
+
+        converter.markExternal(self.converter._externallyDefinedFunctionTypes)
+        converter.markExternal({
+            name: native_ast.Type.Function(
+                output=definition.output_type,
+                args=[x[1] for x in definition.args],
+                varargs=False,
+                can_throw=True
+            )
+            for name, definition in self.converter._function_definitions.items()
+            if name not in functions
+        })
+
+        index = str(next(_objectModuleCounter))
+        accessorName = ModuleDefinition.GET_GLOBAL_VARIABLES_NAME + "." + index
+        copyName = rootName + ".optimized." + index
+
+        module = converter.add_functions(functions, accessorName)
+
+        mod = llvm.parse_assembly(module.moduleText)
+
+        for name in functions:
+            if name == rootName:
+                mod.get_function(name).name = copyName
+            else:
+                mod.get_function(name).linkage = "internal"
+
+        mod.verify()
+
+        self.engine.add_module(mod)
+        self.module_pass_manager.run(mod)
+        self.engine.finalize_object()
+
+        loadedModule = self._loadedModuleFor({copyName: functions[rootName]}, module, accessorName)
+        loadedModule.linkGlobalVariables()
+
+        return loadedModule.functionPointers[copyName]
+
+    def _loadedModuleFor(self, functions, module, accessorName):
+        """Look up the function pointers for a module we've added to the engine."""
         native_function_pointers = {}
 
         for fname in functions:
@@ -184,9 +344,7 @@ class Compiler:
         native_function_pointers[module.GET_GLOBAL_VARIABLES_NAME] = (
             NativeFunctionPointer(
                 module.GET_GLOBAL_VARIABLES_NAME,
-                self.engine.get_function_address(
-                    module.GET_GLOBAL_VARIABLES_NAME
-                ),
+                self.engine.get_function_address(accessorName),
                 [native_ast.Void.pointer().pointer()],
                 native_ast.Void
             )
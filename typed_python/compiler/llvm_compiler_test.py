@@ -13,15 +13,18 @@
 #   limitations under the License.
 
 from typed_python.compiler.native_ast import (
-    Expression, Int64, Function, FunctionBody
+    Expression, Int64, Function, FunctionBody, CallTarget, NamedCallTarget, const_int_expr
 )
 import tempfile
 from typed_python import PointerTo, ListOf, Runtime
 from typed_python.compiler.module_definition import ModuleDefinition
 from typed_python.compiler.global_variable_definition import GlobalVariableMetadata
+from typed_python.compiler.compilation_target import CompilationTarget
 
+import llvmlite.binding as llvm
 import pytest
 import ctypes
+import psutil
 
 
 def test_global_variable_pointers():
@@ -103,3 +106,133 @@ def test_create_binary_shared_object():
         pointers[0].set(5)
 
         assert loaded.functionPointers['__test_f_2']() == 5
+
+
+def test_build_modules_in_parallel():
+    def returnsGlobal(name):
+        return Function(
+            args=[],
+            output_type=Int64,
+            body=FunctionBody.Internal(
+                Expression.Return(
+                    arg=Expression.GlobalVariable(name=name, type=Int64, metadata=name).load()
+                )
+            )
+        )
+
+    callsOtherPartition = Function(
+        args=[],
+        output_type=Int64,
+        body=FunctionBody.Internal(
+            Expression.Return(
+                arg=CallTarget.Named(
+                    target=NamedCallTarget(
+                        name='__test_parallel_d',
+                        arg_types=(),
+                        output_type=Int64,
+                        external=False,
+                        varargs=False,
+                        intrinsic=False,
+                        can_throw=True
+                    )
+                ).call()
+            )
+        )
+    )
+
+    returnsThree = Function(
+        args=[],
+        output_type=Int64,
+        body=FunctionBody.Internal(Expression.Return(arg=const_int_expr(3)))
+    )
+
+    llvmCompiler = Runtime.singleton().llvm_compiler
+    llvmCompiler.setCodegenWorkerCount(2)
+
+    try:
+        moduleA, moduleB = llvmCompiler.buildModules([
+            {'__test_parallel_a': returnsGlobal('globalA'), '__test_parallel_d': returnsThree},
+            {'__test_parallel_b': returnsGlobal('globalB'), '__test_parallel_c': callsOtherPartition},
+        ])
+    finally:
+        llvmCompiler.setCodegenWorkerCount(0)
+
+    # shutting the pool down stops its worker processes
+    assert not [
+        p for p in psutil.Process().children() if 'parallel_codegen' in ' '.join(p.cmdline())
+    ]
+
+    # each module has its own global variable accessor
+    for module, fname, value in [(moduleA, '__test_parallel_a', 1), (moduleB, '__test_parallel_b', 2)]:
+        pointers = ListOf(PointerTo(int))()
+        pointers.resize(1)
+
+        getGlobals = module.functionPointers[module.GET_GLOBAL_VARIABLES_NAME]
+        ctypes.CFUNCTYPE(None, ctypes.c_void_p)(getGlobals.fp)(
+            ctypes.c_void_p(int(pointers.pointerUnsafe(0)))
+        )
+        pointers[0].set(value)
+
+        assert ctypes.CFUNCTYPE(ctypes.c_long)(module.functionPointers[fname].fp)() == value
+
+    # and calls between partitions work
+    assert ctypes.CFUNCTYPE(ctypes.c_long)(moduleB.functionPointers['__test_parallel_c'].fp)() == 3
+
+
+SUM_OF_DOUBLES = """
+define double @sum(double* %data, i64 %count) {
+entry:
+  br label %loop
+loop:
+  %i = phi i64 [ 0, %entry ], [ %next, %loop ]
+  %acc = phi double [ 0.0, %entry ], [ %acc2, %loop ]
+  %ptr = getelementptr double, double* %data, i64 %i
+  %val = load double, double* %ptr
+  %acc2 = fadd fast double %acc, %val
+  %next = add i64 %i, 1
+  %done = icmp eq i64 %next, %count
+  br i1 %done, label %exit, label %loop
+exit:
+  ret double %acc2
+}
+"""
+
+
+def assemblyFor(target, moduleText):
+    targetMachine = target.createTargetMachine()
+
+    pmb = llvm.create_pass_manager_builder()
+    pmb.opt_level = 3
+    pmb.loop_vectorize = True
+    pmb.slp_vectorize = True
+
+    passManager = llvm.create_module_pass_manager()
+    targetMachine.add_analysis_passes(passManager)
+    pmb.populate(passManager)
+
+    mod = llvm.parse_assembly(moduleText)
+    passManager.run(mod)
+
+    return targetMachine.emit_assembly(mod)
+
+
+def test_compilation_targets():
+    # make sure llvm is initialized
+    Runtime.singleton()
+
+    assert CompilationTarget.fromName("generic") == CompilationTarget.fromName("")
+    assert CompilationTarget.fromName("host").cpuName == llvm.get_host_cpu_name()
+    assert CompilationTarget.fromName("skylake-avx512").cpuName == "skylake-avx512"
+
+    assert len(set(
+        CompilationTarget.fromName(name).key for name in ["generic", "host", "skylake-avx512"]
+    )) == 3
+
+    hostAssembly = assemblyFor(CompilationTarget.host(), SUM_OF_DOUBLES)
+    genericAssembly = assemblyFor(CompilationTarget.generic(), SUM_OF_DOUBLES)
+
+    # a generic x86-64 cpu only has SSE2, so it can't use the wide registers
+    assert "%ymm" not in genericAssembly
+
+    if "+avx2" in CompilationTarget.host().cpuFeatures.split(","):
+        assert "%ymm" in hostAssembly or "%zmm" in hostAssembly
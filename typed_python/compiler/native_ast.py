@@ -312,6 +312,12 @@ def expr_str(self):
         return "(" + str(self.ptr) + ")[0]=" + str(self.val)
     if self.matches.AtomicAdd:
         return "atomic_add(" + str(self.ptr) + "," + str(self.val) + ")"
+    if self.matches.AtomicLoad:
+        return "atomic_load(" + str(self.ptr) + ")"
+    if self.matches.AtomicStore:
+        return "atomic_store(" + str(self.ptr) + "," + str(self.val) + ")"
+    if self.matches.AtomicCompareExchange:
+        return "atomic_cmpxchg(" + str(self.ptr) + "," + str(self.expected) + "," + str(self.val) + ")"
     if self.matches.Alloca:
         return "alloca(" + str(self.type) + ")"
     if self.matches.Cast:
@@ -416,6 +422,8 @@ def expr_str(self):
         return "throw (%s)" % str(self.expr)
     if self.matches.ActivatesTeardown:
         return "mark slot %s initialized" % self.name
+    if self.matches.DeactivatesTeardown:
+        return "mark slot %s torn down" % self.name
     if self.matches.StackSlot:
         return "slot(name=%s,t=%s)" % (self.name, str(self.type))
     if self.matches.GlobalVariable:
@@ -528,6 +536,11 @@ Expression = Expression.define(Alternative(
     Load={'ptr': Expression},
     Store={'ptr': Expression, 'val': Expression},
     AtomicAdd={'ptr': Expression, 'val': Expression},
+    # sequentially consistent loads, stores, and compare-and-swaps.
+    # AtomicCompareExchange evaluates to a Bool which is true if we stored 'val'
+    AtomicLoad={'ptr': Expression},
+    AtomicStore={'ptr': Expression, 'val': Expression},
+    AtomicCompareExchange={'ptr': Expression, 'expected': Expression, 'val': Expression},
     Alloca={'type': Type},
     Cast={'left': Expression, 'to_type': Type},
     Binop={'op': BinaryOp, 'left': Expression, 'right': Expression},
@@ -575,6 +588,8 @@ Expression = Expression.define(Alternative(
     Finally={'expr': Expression, 'teardowns': TupleOf(Teardown), 'name': OneOf(None, str)},
     Sequence={'vals': TupleOf(Expression)},
     ActivatesTeardown={'name': str},
+    # undo an 'ActivatesTeardown', because something else took ownership of the slot's contents
+    DeactivatesTeardown={'name': str},
     StackSlot={'name': str, 'type': Type},
     GlobalVariable={'name': str, 'type': Type, 'metadata': object},
     ApplyIntermediates={'base': Expression, 'intermediates': TupleOf(ExpressionIntermediate)},
@@ -613,6 +628,11 @@ Expression = Expression.define(Alternative(
     load=lambda self: Expression.Load(ptr=self),
     store=lambda self, val: Expression.Store(ptr=self, val=ensureExpr(val)),
     atomic_add=lambda self, val: Expression.AtomicAdd(ptr=self, val=ensureExpr(val)),
+    atomic_load=lambda self: Expression.AtomicLoad(ptr=self),
+    atomic_store=lambda self, val: Expression.AtomicStore(ptr=self, val=ensureExpr(val)),
+    atomic_compare_exchange=lambda self, expected, val: Expression.AtomicCompareExchange(
+        ptr=self, expected=ensureExpr(expected), val=ensureExpr(val)
+    ),
     cast=lambda self, targetType: Expression.Cast(left=self, to_type=targetType),
     with_comment=lambda self, c: Expression.Comment(comment=c, expr=self),
     elemPtr=lambda self, *exprs: Expression.ElementPtr(left=self, offsets=[ensureExpr(e) for e in exprs]),
@@ -15,6 +15,7 @@
 import typed_python.compiler.native_ast as native_ast
 from typed_python.compiler.module_definition import ModuleDefinition
 from typed_python.compiler.global_variable_definition import GlobalVariableDefinition
+import contextlib
 import llvmlite.ir
 import os
 
@@ -33,6 +34,10 @@ pointer_size = 8
 
 CROSS_MODULE_INLINE_COMPLEXITY = 40
 
+# how many times more complex than CROSS_MODULE_INLINE_COMPLEXITY a function the
+# profile says is hot may be, and still get repeated in the modules that call it
+HOT_CROSS_MODULE_INLINE_FACTOR = 4
+
 
 def llvmBool(i):
     return llvmlite.ir.Constant(llvm_i1, i)
@@ -523,6 +528,10 @@ class FunctionConverter:
         self.tags_initialized = {}
         self.stack_slots = {}
 
+        # the number of branches we've emitted, which is how we identify them
+        # in the profile
+        self.branch_count = 0
+
     def tags_as(self, new_tags):
         class scoper():
             def __init__(scoper_self):
@@ -547,6 +556,9 @@ class FunctionConverter:
 
         self.exception_slot = builder.alloca(llvm_i8ptr, name="exception_slot")
 
+        if self.converter.profile is not None and self.converter.profile.recording:
+            self.increment_profile_counter(0)
+
         # if populated, we are expected to write our return value to 'return_slot' and jump here
         # on return
         self.teardown_handler = TeardownHandler(self, None)
@@ -554,6 +566,54 @@ class FunctionConverter:
     def finalize(self):
         self.teardown_handler.generate_teardown(lambda tags: None, self.return_slot, self.exception_slot)
 
+        # the handler points back at us, so drop it rather than leaving a cycle
+        # (and everything we hold onto) for the garbage collector.
+        self.teardown_handler = None
+
+    def increment_profile_counter(self, counterIx):
+        """Emit code adding one to counter 'counterIx' of this function in the profile.
+
+        Like gcov, we don't bother making this atomic. Threads racing on a
+        counter can lose counts, which is fine for a profile.
+        """
+        counter = llvmlite.ir.Constant(
+            llvm_i64,
+            self.converter.profile.counterAddress(self.function.name, counterIx)
+        ).inttoptr(llvm_i64.as_pointer())
+
+        self.builder.store(self.builder.add(self.builder.load(counter), llvmI64(1)), counter)
+
+    @contextlib.contextmanager
+    def _counting_branch(self, branch, counterIx):
+        with branch:
+            self.increment_profile_counter(counterIx)
+            yield
+
+    @contextlib.contextmanager
+    def if_else(self, cond_llvm):
+        """Like 'builder.if_else', but instrumented or weighted according to the profile."""
+        profile = self.converter.profile
+
+        branchIx = self.branch_count
+        self.branch_count += 1
+
+        with self.builder.if_else(cond_llvm) as (then, otherwise):
+            if profile is None:
+                yield then, otherwise
+            elif profile.recording:
+                yield (
+                    self._counting_branch(then, 1 + branchIx * 2),
+                    self._counting_branch(otherwise, 2 + branchIx * 2)
+                )
+            else:
+                weights = profile.branchWeights(self.function.name, branchIx)
+
+                if weights is not None:
+                    # the block we're in now ends with the conditional branch
+                    self.builder.block.terminator.set_weights(list(weights))
+
+                yield then, otherwise
+
     def generate_exception_landing_pad(self, block):
         with self.builder.goto_block(block):
             res = self.builder.landingpad(exception_type_llvm)
@@ -670,10 +730,7 @@ class FunctionConverter:
 
             if func.module is not self.module:
                 # first, see if we'd like to inline this module
-                if (
-                    self.converter.totalFunctionComplexity(target.name) < CROSS_MODULE_INLINE_COMPLEXITY
-                    and self.converter.canBeInlined(target.name)
-                ):
+                if self.converter.shouldRepeatFunctionInModule(target.name):
                     func = self.converter.repeatFunctionInModule(target.name, self.module)
                 else:
                     if target.name not in self.external_function_references:
@@ -876,6 +933,32 @@ class FunctionConverter:
                 val.native_type
             )
 
+        if expr.matches.AtomicLoad:
+            ptr = self.convert(expr.ptr)
+            valueType = ptr.native_type.value_type
+
+            return TypedLLVMValue(
+                self.builder.load_atomic(ptr.llvm_value, "seq_cst", valueType.bits // 8),
+                valueType
+            )
+
+        if expr.matches.AtomicStore:
+            ptr = self.convert(expr.ptr)
+            val = self.convert(expr.val)
+
+            self.builder.store_atomic(val.llvm_value, ptr.llvm_value, "seq_cst", val.native_type.bits // 8)
+
+            return TypedLLVMValue(None, native_ast.Type.Void())
+
+        if expr.matches.AtomicCompareExchange:
+            ptr = self.convert(expr.ptr)
+            expected = self.convert(expr.expected)
+            val = self.convert(expr.val)
+
+            result = self.builder.cmpxchg(ptr.llvm_value, expected.llvm_value, val.llvm_value, "seq_cst", "seq_cst")
+
+            return TypedLLVMValue(self.builder.extract_value(result, 1), native_ast.Bool)
+
         if expr.matches.Load:
             ptr = self.convert(expr.ptr)
 
@@ -1016,7 +1099,7 @@ class FunctionConverter:
             true_tags = dict(orig_tags)
             false_tags = dict(orig_tags)
 
-            with self.builder.if_else(cond_llvm) as (then, otherwise):
+            with self.if_else(cond_llvm) as (then, otherwise):
                 with then:
                     self.tags_initialized = true_tags
                     true = self.convert(expr.true)
@@ -1106,7 +1189,7 @@ class FunctionConverter:
             else:
                 cond_llvm = llvmlite.ir.Constant(llvm_i1, 0)
 
-            with self.builder.if_else(cond_llvm) as (then, otherwise):
+            with self.if_else(cond_llvm) as (then, otherwise):
                 with then:
                     true = self.convert(expr.while_true)
                     if true is not None:
@@ -1339,6 +1422,11 @@ class FunctionConverter:
             self.tags_initialized[expr.name] = True
             return TypedLLVMValue(None, native_ast.Type.Void())
 
+        if expr.matches.DeactivatesTeardown:
+            assert expr.name in self.tags_initialized, "tag %s is not initialized" % expr.name
+            del self.tags_initialized[expr.name]
+            return TypedLLVMValue(None, native_ast.Type.Void())
+
         if expr.matches.Throw:
             arg = self.convert(expr.expr)
 
@@ -1500,6 +1588,10 @@ class Converter:
         self._printAllNativeCalls = os.getenv("TP_COMPILER_LOG_NATIVE_CALLS")
         self.verbose = False
 
+        # a CompilerProfile to instrument the code we generate for, or to
+        # optimize it with, or None.
+        self.profile = None
+
     def markExternal(self, functionNameToType):
         """Provide type signatures for a set of external functions."""
         self._externallyDefinedFunctionTypes.update(functionNameToType)
@@ -1507,6 +1599,49 @@ class Converter:
     def canBeInlined(self, name):
         return name not in self._externallyDefinedFunctionTypes
 
+    def shouldRepeatFunctionInModule(self, name):
+        """Should we repeat 'name' in other modules that call it, so that llvm can inline it?
+
+        We do this for simple functions, and, when we have a profile, for
+        somewhat more complex functions that are hot, but never for functions
+        the profile says are cold.
+        """
+        if not self.canBeInlined(name):
+            return False
+
+        complexity = self.totalFunctionComplexity(name)
+
+        if self.profile is not None and not self.profile.recording:
+            if self.profile.isCold(name):
+                return False
+
+            if self.profile.isHot(name):
+                return complexity < CROSS_MODULE_INLINE_COMPLEXITY * HOT_CROSS_MODULE_INLINE_FACTOR
+
+        return complexity < CROSS_MODULE_INLINE_COMPLEXITY
+
+    def addProfileAttributes(self, func):
+        """Mark 'func' as hot or cold according to the profile."""
+        if self.profile is None or self.profile.recording:
+            return
+
+        if self.profile.isCold(func.name):
+            func.attributes.add("cold")
+        elif self.profile.isHot(func.name):
+            func.attributes.add("inlinehint")
+
+    def functionEmissionOrder(self, names):
+        """Return 'names' in the order we should emit them into a module.
+
+        Without a profile that's lexical order. With one, we emit the most
+        frequently called functions first, so that the hot code ends up
+        together in memory.
+        """
+        if self.profile is None or self.profile.recording:
+            return sorted(names)
+
+        return sorted(names, key=lambda name: (-(self.profile.callCount(name) or 0), name))
+
     def totalFunctionComplexity(self, name):
         """Return the total number of instructions contained in a function.
 
@@ -1544,12 +1679,25 @@ class Converter:
         assert isinstance(funcType, llvmlite.ir.FunctionType)
 
         self._functions_by_name[name] = llvmlite.ir.Function(module, funcType, name)
+        self.addProfileAttributes(self._functions_by_name[name])
 
         self._inlineRequests.append(name)
 
         return self._functions_by_name[name]
 
-    def add_functions(self, names_to_definitions):
+    def add_functions(self, names_to_definitions, globalsAccessorName=ModuleDefinition.GET_GLOBAL_VARIABLES_NAME):
+        """Convert a set of native functions into a new llvm module.
+
+        Args:
+            names_to_definitions - a dict from link name to native_ast.Function
+            globalsAccessorName - the symbol to give the module's global variable
+                accessor. Modules whose object code gets loaded side by side need
+                distinct names. The accessor is always listed in the resulting
+                ModuleDefinition under ModuleDefinition.GET_GLOBAL_VARIABLES_NAME.
+
+        Returns:
+            a ModuleDefinition.
+        """
         names_to_definitions = dict(names_to_definitions)
 
         for name in names_to_definitions:
@@ -1566,7 +1714,9 @@ class Converter:
 
         functionTypes = {}
 
-        for name, function in names_to_definitions.items():
+        for name in self.functionEmissionOrder(names_to_definitions):
+            function = names_to_definitions[name]
+
             functionTypes[name] = native_ast.Type.Function(
                 output=function.output_type,
                 args=[x[1] for x in function.args],
@@ -1580,6 +1730,7 @@ class Converter:
             self._functions_by_name[name] = llvmlite.ir.Function(module, func_type, name)
 
             self._functions_by_name[name].linkage = 'external'
+            self.addProfileAttributes(self._functions_by_name[name])
             self._function_definitions[name] = function
 
         if self.verbose:
@@ -1604,7 +1755,7 @@ class Converter:
         globalDefinitionsLlvmValues = {}
 
         while names_to_definitions:
-            for name in sorted(names_to_definitions):
+            for name in self.functionEmissionOrder(names_to_definitions):
                 definition = names_to_definitions.pop(name)
                 func = self._functions_by_name[name]
                 func.attributes.personality = external_function_references["__gxx_personality_v0"]
@@ -1663,7 +1814,7 @@ class Converter:
 
         # define a function that accepts a pointer and fills it out with a table of pointer values
         # so that we can link in any type objects that are defined within the source code.
-        self.defineGlobalMetadataAccessor(module, globalDefinitions, globalDefinitionsLlvmValues)
+        self.defineGlobalMetadataAccessor(module, globalDefinitions, globalDefinitionsLlvmValues, globalsAccessorName)
 
         functionTypes[ModuleDefinition.GET_GLOBAL_VARIABLES_NAME] = native_ast.Type.Function(
             output=native_ast.Void,
@@ -1676,10 +1827,10 @@ class Converter:
             globalDefinitions
         )
 
-    def defineGlobalMetadataAccessor(self, module, globalDefinitions, globalDefinitionsLlvmValues):
+    def defineGlobalMetadataAccessor(self, module, globalDefinitions, globalDefinitionsLlvmValues, accessorName):
         """Given a list of global variables, make a function to access them.
 
-        The function will be named '.get_global_variables' and will accept
+        The function will be named 'accessorName' and will accept
         a single argument that takes a PointerTo(PointerTo(None)) and fills
         it out with the values of the globalDefinitions in their lexical
         ordering.
@@ -1694,7 +1845,7 @@ class Converter:
                     can_throw=False
                 )
             ),
-            ModuleDefinition.GET_GLOBAL_VARIABLES_NAME
+            accessorName
         )
 
         accessorFunction.linkage = "external"
@@ -0,0 +1,210 @@
+#   Copyright 2020 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Optimize and generate machine code for llvm modules on several cores.
+
+llvmlite serializes every call into LLVM behind a single process-wide lock, so
+we can't get any parallelism out of threads. Instead, we keep a pool of worker
+processes, each of which accepts llvm IR on stdin and writes back an object file
+that we can hand to the MCJIT engine with 'add_object_file'.
+
+This file is also the worker's entrypoint. It gets run as a script (rather than
+with -m) so that workers don't have to import typed_python itself, and so it
+must not import anything other than the standard library and llvmlite at the
+top level.
+"""
+
+import concurrent.futures
+import queue
+import struct
+import subprocess
+import sys
+import threading
+
+
+class CodegenError(Exception):
+    """A worker failed to parse, verify, or generate code for a module."""
+
+
+def writeMessage(stream, payload):
+    stream.write(struct.pack("<Q", len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+
+def readMessage(stream):
+    """Read a message written by 'writeMessage', or return None at end of stream."""
+    header = stream.read(8)
+
+    if len(header) < 8:
+        return None
+
+    size, = struct.unpack("<Q", header)
+    payload = stream.read(size)
+
+    if len(payload) < size:
+        return None
+
+    return payload
+
+
+class CodegenWorker:
+    """A single worker process that turns llvm IR into object code."""
+
+    def __init__(self, inlineThreshold, target):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", __file__, str(inlineThreshold), target.cpuName, target.cpuFeatures],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+
+    def compile(self, moduleText):
+        """Optimize 'moduleText' and return the bytes of the resulting object file."""
+        try:
+            writeMessage(self.process.stdin, moduleText.encode("utf8"))
+            response = readMessage(self.process.stdout)
+        except (BrokenPipeError, OSError):
+            response = None
+
+        if response is None:
+            raise CodegenError(f"Codegen worker exited with code {self.process.poll()}")
+
+        if response[:1] != b"\x00":
+            raise CodegenError(response[1:].decode("utf8"))
+
+        return response[1:]
+
+    def isAlive(self):
+        return self.process.poll() is None
+
+    def shutdown(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class CodegenWorkerPool:
+    """A lazily started pool of CodegenWorker processes.
+
+    Args:
+        workerCount - the maximum number of worker processes to run.
+        inlineThreshold - the llvm inlining threshold the workers should use.
+            This should match the one used by the in-process pass manager.
+        target - the CompilationTarget the workers should generate code for.
+    """
+
+    def __init__(self, workerCount, inlineThreshold, target):
+        self.workerCount = workerCount
+        self.inlineThreshold = inlineThreshold
+        self.target = target
+
+        self._lock = threading.Lock()
+        self._idleWorkers = queue.Queue()
+        self._liveWorkerCount = 0
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workerCount)
+
+    def _acquireWorker(self):
+        with self._lock:
+            if self._idleWorkers.empty() and self._liveWorkerCount < self.workerCount:
+                self._liveWorkerCount += 1
+                return CodegenWorker(self.inlineThreshold, self.target)
+
+        return self._idleWorkers.get()
+
+    def _releaseWorker(self, worker):
+        if worker.isAlive():
+            self._idleWorkers.put(worker)
+        else:
+            with self._lock:
+                self._liveWorkerCount -= 1
+
+    def _compileOne(self, moduleText):
+        worker = self._acquireWorker()
+
+        try:
+            return worker.compile(moduleText)
+        finally:
+            self._releaseWorker(worker)
+
+    def compileModules(self, moduleTexts):
+        """Optimize and codegen each module in parallel.
+
+        Returns:
+            a list containing the object file bytes for each module, in order.
+        """
+        return list(self._executor.map(self._compileOne, moduleTexts))
+
+    def shutdown(self):
+        # let any compiles in flight hand their workers back before we stop them
+        self._executor.shutdown(wait=True)
+
+        with self._lock:
+            while not self._idleWorkers.empty():
+                self._idleWorkers.get().shutdown()
+                self._liveWorkerCount -= 1
+
+
+def main(argv):
+    import llvmlite.binding as llvm
+
+    inlineThreshold = int(argv[1])
+    cpuName = argv[2]
+    cpuFeatures = argv[3]
+
+    llvm.initialize()
+    llvm.initialize_native_target()
+    llvm.initialize_native_asmprinter()
+
+    # this has to produce the same code that the in-process pass manager created
+    # in llvm_compiler.create_execution_engine would.
+    target_machine = llvm.Target.from_triple(llvm.get_process_triple()).create_target_machine(
+        cpu=cpuName,
+        features=cpuFeatures
+    )
+
+    pmb = llvm.create_pass_manager_builder()
+    pmb.opt_level = 3
+    pmb.size_level = 0
+    pmb.inlining_threshold = inlineThreshold
+    pmb.loop_vectorize = True
+    pmb.slp_vectorize = True
+
+    pass_manager = llvm.create_module_pass_manager()
+    target_machine.add_analysis_passes(pass_manager)
+    pmb.populate(pass_manager)
+
+    while True:
+        request = readMessage(sys.stdin.buffer)
+
+        if request is None:
+            return 0
+
+        try:
+            mod = llvm.parse_assembly(request.decode("utf8"))
+            mod.verify()
+
+            pass_manager.run(mod)
+
+            response = b"\x00" + target_machine.emit_object(mod)
+        except Exception as e:
+            response = b"\x01" + str(e).encode("utf8")
+
+        writeMessage(sys.stdout.buffer, response)
+
+
+if __name__ == "__main__":
+    # don't let modules in this directory shadow anything llvmlite imports
+    del sys.path[0]
+
+    sys.exit(main(sys.argv))
@@ -0,0 +1,196 @@
+#   Copyright 2020 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Compile a set of entrypoints ahead of time, populating a compiler cache.
+
+Usage:
+
+    python -m typed_python.compiler.precompile \\
+        --codebase /path/to/mymodule \\
+        --manifest manifest.json \\
+        --cache-dir /path/to/compiler_cache
+
+The manifest is a json file listing the entrypoints to compile, by their
+dotted names, along with the argument type signatures to compile them for.
+Each type is a python expression evaluated in the namespace of the module
+defining the entrypoint, with everything from typed_python available:
+
+    {
+        "entrypoints": [
+            {
+                "function": "mymodule.submodule.f",
+                "signatures": [["int"], ["float"], ["ListOf(str)"]]
+            }
+        ]
+    }
+
+The resulting cache directory can be shipped alongside the code and pointed to
+by TP_COMPILER_CACHE, so that processes don't pay for compilation on first call.
+"""
+
+import argparse
+import importlib
+import json
+import sys
+import time
+import traceback
+
+import typed_python
+from typed_python import _types
+from typed_python.Codebase import Codebase
+from typed_python.compiler.runtime import Runtime, Entrypoint, typeWrapper
+from typed_python.compiler.expression_conversion_context import ExpressionConversionContext
+
+
+def resolveQualifiedName(qualifiedName):
+    """Find the object named by a dotted name like 'module.submodule.Class.method'.
+
+    Returns:
+        a pair (module, obj) containing the module we imported and the object.
+    """
+    parts = qualifiedName.split(".")
+
+    for i in range(len(parts) - 1, 0, -1):
+        try:
+            module = importlib.import_module(".".join(parts[:i]))
+        except ImportError:
+            continue
+
+        obj = module
+        for attr in parts[i:]:
+            obj = getattr(obj, attr)
+
+        return module, obj
+
+    raise Exception(f"Can't find a module containing {qualifiedName}")
+
+
+def parseSignature(module, signature):
+    """Evaluate a list of type expressions in the namespace of 'module'."""
+    namespace = dict(typed_python.__dict__)
+    namespace.update(module.__dict__)
+
+    return tuple(eval(typeExpr, namespace) if isinstance(typeExpr, str) else typeExpr for typeExpr in signature)
+
+
+def checkSignatureMatches(func, signature):
+    """Raise an exception if no overload of 'func' could accept arguments of these types."""
+    argTypes = [typeWrapper(t) for t in signature]
+
+    for overload in func.overloads:
+        if ExpressionConversionContext.computeFunctionArgumentTypeSignature(overload, argTypes, {}) is not None:
+            return
+
+    raise TypeError(f"No overload of {func.__qualname__} accepts arguments of these types")
+
+
+def precompile(entrypoints, verbose=False):
+    """Compile each entrypoint for each of its signatures.
+
+    The runtime must be using a compiler cache (see TP_COMPILER_CACHE and
+    Runtime.setCompilerCacheDir) or none of the compiled code will be kept.
+
+    Args:
+        entrypoints - a list of pairs (func, signatures) where 'func' is a python
+            or typed_python function and 'signatures' is a list of tuples of
+            argument types.
+        verbose - if True, print each signature as we compile it.
+
+    Returns:
+        a list of (func, signature, exception) triples for each signature we
+        failed to compile.
+    """
+    if Runtime.singleton().compilerCache is None:
+        raise Exception("Precompiling requires a compiler cache.")
+
+    failures = []
+
+    for func, signatures in entrypoints:
+        if not isinstance(func, _types.Function):
+            func = Entrypoint(func)
+
+        for signature in signatures:
+            t0 = time.time()
+
+            try:
+                checkSignatureMatches(func, signature)
+                func.resultTypeFor(*signature)
+            except Exception as e:
+                failures.append((func, signature, e))
+
+                if verbose:
+                    traceback.print_exc()
+                continue
+
+            if verbose:
+                print(
+                    f"compiled {func.__qualname__}({', '.join(str(t) for t in signature)}) "
+                    f"in {time.time() - t0:.2f} seconds"
+                )
+
+    return failures
+
+
+def loadManifest(manifestPath):
+    """Load a json manifest, importing the entrypoints it names.
+
+    Returns:
+        a list of pairs (func, signatures) suitable for passing to 'precompile'.
+    """
+    with open(manifestPath, "r") as f:
+        manifest = json.load(f)
+
+    entrypoints = []
+
+    for entry in manifest["entrypoints"]:
+        module, func = resolveQualifiedName(entry["function"])
+
+        entrypoints.append(
+            (func, [parseSignature(module, signature) for signature in entry["signatures"]])
+        )
+
+    return entrypoints
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Populate a typed_python compiler cache ahead of time.")
+    parser.add_argument(
+        "--codebase",
+        required=True,
+        help="path to the root-level module directory containing the entrypoints"
+    )
+    parser.add_argument("--manifest", required=True, help="json file listing entrypoints and signatures")
+    parser.add_argument("--cache-dir", required=True, help="the compiler cache directory to populate")
+    parser.add_argument("--verbose", action="store_true")
+
+    args = parser.parse_args(argv[1:])
+
+    Runtime.singleton().setCompilerCacheDir(args.cache_dir)
+
+    codebase = Codebase.FromRootlevelPath(args.codebase)
+    sys.path.insert(0, codebase.rootDirectory)
+
+    failures = precompile(loadManifest(args.manifest), verbose=args.verbose)
+
+    for func, signature, exception in failures:
+        print(
+            f"failed to compile {func.__qualname__}({', '.join(str(t) for t in signature)}): {exception}",
+            file=sys.stderr
+        )
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
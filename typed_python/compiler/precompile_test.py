@@ -0,0 +1,109 @@
+#   Copyright 2020 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+from typed_python.compiler.compiler_cache import isModuleHash
+from typed_python.test_util import evaluateExprInFreshProcess, instantiateFiles
+
+MODULE = """
+@Entrypoint
+def f(x):
+    return x + 1
+
+def g(x, y):
+    return x * y
+"""
+
+FILES = {'pkg/__init__.py': '', 'pkg/m.py': MODULE}
+
+
+def moduleDirs(compilerCacheDir):
+    return [x for x in os.listdir(compilerCacheDir) if isModuleHash(x)]
+
+
+def runPrecompile(codeDir, compilerCacheDir, manifest):
+    manifestPath = os.path.join(codeDir, "manifest.json")
+
+    with open(manifestPath, "w") as f:
+        json.dump(manifest, f)
+
+    return subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "typed_python.compiler.precompile",
+            "--codebase", os.path.join(codeDir, "pkg"),
+            "--manifest", manifestPath,
+            "--cache-dir", compilerCacheDir,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+
+@pytest.mark.skipif('sys.platform=="darwin"')
+def test_precompile_populates_compiler_cache():
+    with tempfile.TemporaryDirectory() as codeDir, tempfile.TemporaryDirectory() as compilerCacheDir:
+        instantiateFiles(FILES, codeDir)
+
+        result = runPrecompile(
+            codeDir,
+            compilerCacheDir,
+            {'entrypoints': [
+                {'function': 'pkg.m.f', 'signatures': [['int'], ['float']]},
+                {'function': 'pkg.m.g', 'signatures': [['int', 'ListOf(int)']]},
+            ]}
+        )
+
+        assert result.returncode == 0, result.stderr.decode()
+
+        precompiledModules = set(moduleDirs(compilerCacheDir))
+        assert precompiledModules
+
+        # calling the entrypoint in a fresh process shouldn't compile anything new
+        assert evaluateExprInFreshProcess(FILES, 'pkg.m.f(10)', compilerCacheDir) == 11
+        assert evaluateExprInFreshProcess(FILES, 'pkg.m.f(10.5)', compilerCacheDir) == 11.5
+        assert set(moduleDirs(compilerCacheDir)) == precompiledModules
+
+        # but new signatures still get compiled lazily
+        assert evaluateExprInFreshProcess(FILES, 'pkg.m.f(True)', compilerCacheDir) == 2
+        assert len(moduleDirs(compilerCacheDir)) > len(precompiledModules)
+
+
+@pytest.mark.skipif('sys.platform=="darwin"')
+def test_precompile_reports_failures():
+    with tempfile.TemporaryDirectory() as codeDir, tempfile.TemporaryDirectory() as compilerCacheDir:
+        instantiateFiles(FILES, codeDir)
+
+        result = runPrecompile(
+            codeDir,
+            compilerCacheDir,
+            {'entrypoints': [
+                {'function': 'pkg.m.g', 'signatures': [['int']]},
+                {'function': 'pkg.m.f', 'signatures': [['int']]},
+            ]}
+        )
+
+        assert result.returncode == 1
+        assert b'failed to compile' in result.stderr
+
+        # the signature that worked still made it into the cache
+        assert moduleDirs(compilerCacheDir)
@@ -200,6 +200,79 @@ def computeVariablesReadByClosures(astNode, isInsideClassDef=False):
     return closureVars
 
 
+def computeVariablesOnlyUsedForMemberAccess(astNode):
+    """Determine the variables whose values never escape, because we only touch their members.
+
+    Such a variable is assigned exactly once, by a statement like 'x = C(a=1)', and
+    is otherwise only mentioned as 'x.attr' (read, written, or deleted) where 'x.attr'
+    is not itself being called. Nothing but the function can ever see the value the
+    variable holds, so it can't outlive the function's stack frame.
+
+    Of course 'x.attr' could still be a method or a property that gets 'x' as
+    'self', so callers need to check that each attribute is a plain data member
+    once they know the variable's type.
+
+    Args:
+        astNode - the statements of a function body.
+
+    Returns:
+        a dict from variable name to the set of attribute names used on it.
+    """
+    mentions = collections.defaultdict(int)
+    memberAccesses = collections.defaultdict(int)
+    attributes = collections.defaultdict(set)
+    constructions = collections.defaultdict(int)
+    escaped = set()
+
+    def visit(x):
+        if isinstance(x, Statement):
+            if x.matches.FunctionDef or x.matches.ClassDef:
+                escaped.update(computeReadVariables(x))
+                return False
+
+            if (
+                x.matches.Assign
+                and len(x.targets) == 1
+                and x.targets[0].matches.Name
+                and x.value.matches.Call
+            ):
+                constructions[x.targets[0].id] += 1
+
+        if isinstance(x, Expr):
+            if x.matches.Name:
+                mentions[x.id] += 1
+
+            if (
+                x.matches.Lambda
+                or x.matches.ListComp
+                or x.matches.SetComp
+                or x.matches.DictComp
+                or x.matches.GeneratorExp
+            ):
+                escaped.update(computeReadVariables(x))
+                return False
+
+            if x.matches.Call and x.func.matches.Attribute and x.func.value.matches.Name:
+                # calling a method passes the object along as 'self'
+                escaped.add(x.func.value.id)
+
+            if x.matches.Attribute and x.value.matches.Name:
+                memberAccesses[x.value.id] += 1
+                attributes[x.value.id].add(x.attr)
+
+        return True
+
+    visitPyAstChildren(astNode, visit)
+
+    return {
+        name: attributes[name]
+        for name, count in constructions.items()
+        if count == 1
+        and name not in escaped
+        and mentions[name] == memberAccesses[name] + 1
+    }
+
+
 def extractLineNumbersWithStatements(astNode):
     res = set()
 
@@ -223,3 +223,27 @@ class TestPythonAstAnalysis(unittest.TestCase):
         pyast = python_ast.convertFunctionToAlgebraicPyAst(f)
 
         assert python_ast_analysis.computeAssignedVariables(pyast.body) == {'a', 'blah'}
+
+    def test_variables_only_used_for_member_access(self):
+        C = None
+        g = None
+
+        def f(x):
+            a = C(x=1)
+            a.x += a.y
+
+            b = C()
+            b.f()
+
+            c = C()
+            g(c)
+
+            d = C()
+            d = C()  # noqa
+
+            e = C()
+            return lambda: e.x
+
+        pyast = python_ast.convertFunctionToAlgebraicPyAst(f)
+
+        assert python_ast_analysis.computeVariablesOnlyUsedForMemberAccess(pyast.body) == {'a': {'x', 'y'}}
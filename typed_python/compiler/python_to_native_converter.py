@@ -33,6 +33,7 @@ from typed_python.compiler.type_wrappers.python_typed_function_wrapper import (
     PythonTypedFunctionWrapper, CannotBeDetermined, NoReturnTypeSpecified
 )
 from typed_python.compiler.typed_call_target import TypedCallTarget
+from typed_python.compiler.refcount_elision import elideRefcountPairs
 
 typeWrapper = lambda t: typed_python.compiler.python_object_representation.typedPythonTypeToTypeWrapper(t)
 
@@ -124,6 +125,13 @@ class PythonToNativeConverter:
         # if True, then insert additional code to check for undefined behavior.
         self.generateDebugChecks = False
 
+        # if True, then turn copies out of slots that are about to be destroyed
+        # into moves, removing the incref and the decref.
+        self.elideRefcountPairs = True
+
+        # the number of incref/decref pairs we've removed that way.
+        self.refcountPairsElided = 0
+
         # all link names for which we have a definition.
         self._allDefinedNames = set()
 
@@ -175,15 +183,31 @@ class PythonToNativeConverter:
         """
         return self._link_name_for_identity.get(identity)
 
-    def buildAndLinkNewModule(self):
+    def buildAndLinkNewModule(self, firstTier=False):
+        """Compile and link everything we've defined since the last call.
+
+        Args:
+            firstTier - if True, and we're not writing to a compiler cache, compile
+                the code quickly rather than fully optimizing it. See
+                'buildOptimizedCopy'.
+        """
         targets = self.extract_new_function_definitions()
 
         if not targets:
             return
 
         if self.compilerCache is None:
-            loadedModule = self.llvmCompiler.buildModule(targets)
-            loadedModule.linkGlobalVariables()
+            if firstTier:
+                loadedModule = self.llvmCompiler.buildModule(targets, firstTier=True)
+                loadedModule.linkGlobalVariables()
+            elif self.llvmCompiler.codegenWorkerCount > 1:
+                partitions = self.partitionFunctionDefinitions(targets, self.llvmCompiler.codegenWorkerCount)
+
+                for loadedModule in self.llvmCompiler.buildModules(partitions):
+                    loadedModule.linkGlobalVariables()
+            else:
+                loadedModule = self.llvmCompiler.buildModule(targets)
+                loadedModule.linkGlobalVariables()
             return
 
         # get a set of function names that we depend on
@@ -205,6 +229,90 @@ class PythonToNativeConverter:
             externallyUsed
         )
 
+    def buildOptimizedCopy(self, linkName, dispatchName):
+        """Compile a fully optimized copy of a function and everything it calls.
+
+        Args:
+            linkName - the link name of a function we've compiled.
+            dispatchName - the name of the call converter for 'linkName' (see
+                'generateCallConverter').
+
+        Returns:
+            a NativeFunctionPointer to the copy of the call converter.
+        """
+        functions = {dispatchName: self._definitions[dispatchName]}
+
+        toVisit = [self._identity_for_link_name[linkName]]
+        seen = set(toVisit)
+
+        while toVisit:
+            identity = toVisit.pop()
+            name = self._link_name_for_identity.get(identity)
+
+            # functions we loaded from the compiler cache have no definition
+            if name in self._definitions:
+                functions[name] = self._definitions[name]
+
+            for dep in self._dependencies.getNamesDependedOn(identity):
+                if dep not in seen:
+                    seen.add(dep)
+                    toVisit.append(dep)
+
+        return self.llvmCompiler.buildOptimizedCopy(functions, dispatchName)
+
+    def partitionFunctionDefinitions(self, targets, maxPartitions):
+        """Split a set of function definitions into groups that don't call each other.
+
+        We take the connected components of the call graph restricted to 'targets',
+        so that no call between two functions we're compiling crosses a partition
+        (where it couldn't be inlined), and then pack the components into at most
+        'maxPartitions' groups of roughly equal size.
+
+        Args:
+            targets - a dict from link name to native_ast.Function
+            maxPartitions - the maximum number of partitions to produce
+
+        Returns:
+            a list of dicts from link name to native_ast.Function.
+        """
+        parent = {name: name for name in targets}
+
+        def find(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        def union(n1, n2):
+            parent[find(n1)] = find(n2)
+
+        for name in targets:
+            # call converters have no identity of their own, and only call the
+            # function they convert
+            if name.endswith(".dispatch") and name[:-len(".dispatch")] in targets:
+                union(name, name[:-len(".dispatch")])
+
+            ident = self._identity_for_link_name.get(name)
+
+            if ident is not None:
+                for dep in self._dependencies.getNamesDependedOn(ident):
+                    depLN = self._link_name_for_identity.get(dep)
+
+                    if depLN in targets:
+                        union(name, depLN)
+
+        components = {}
+        for name in sorted(targets):
+            components.setdefault(find(name), []).append(name)
+
+        partitions = [[] for _ in range(min(maxPartitions, len(components)))]
+
+        # put the biggest components down first, each into the smallest partition so far
+        for component in sorted(components.values(), key=len, reverse=True):
+            min(partitions, key=len).extend(component)
+
+        return [{name: targets[name] for name in partition} for partition in partitions]
+
     def extract_new_function_definitions(self):
         """Return a list of all new function definitions from the last conversion."""
         res = {}
@@ -886,5 +994,9 @@ class PythonToNativeConverter:
 
             name = self._link_name_for_identity[identifier]
 
+            if self.elideRefcountPairs:
+                nativeFunction, pairsElided = elideRefcountPairs(nativeFunction)
+                self.refcountPairsElided += pairsElided
+
             self._definitions[name] = nativeFunction
             self._new_native_functions.add(name)
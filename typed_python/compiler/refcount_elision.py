@@ -0,0 +1,374 @@
+#   Copyright 2017-2021 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Remove pairs of refcount operations that cancel each other out.
+
+The converter copies values between slots freely, and every copy of a refcounted
+value increfs it. Very often the slot we copied from is a temporary (or a local
+variable we're about to return) that nobody reads again, so the decref in its
+teardown just undoes the incref. This pass finds those copies in native code and
+turns them into moves: we store the pointer without an incref, and mark the
+source slot as torn down so that its decref never happens.
+"""
+
+from collections import Counter
+
+from typed_python import TupleOf, Tuple
+from typed_python.compiler.native_ast import (
+    Expression, ExpressionIntermediate, Teardown, CallTarget, Function, FunctionBody, makeSequence, Bool
+)
+
+
+def elideRefcountPairs(nativeFunction):
+    """Remove redundant incref/decref pairs from a native Function.
+
+    Returns:
+        a pair (nativeFunction, count) of the rewritten function and the number
+        of incref/decref pairs we removed from it.
+    """
+    if not nativeFunction.body.matches.Internal:
+        return nativeFunction, 0
+
+    elider = RefcountElider(nativeFunction.body.body)
+
+    body = elider.rewrite(nativeFunction.body.body, ())
+
+    if not elider.pairsElided:
+        return nativeFunction, 0
+
+    return (
+        Function(
+            args=nativeFunction.args,
+            body=FunctionBody.Internal(body=body),
+            output_type=nativeFunction.output_type
+        ),
+        elider.pairsElided
+    )
+
+
+class RefcountElider:
+    """Rewrites refcounted copies out of dying slots into moves.
+
+    We recognize two shapes of code:
+
+        * a temporary 'StackSlot' intermediate (which has a 'ByTag' teardown that
+          destroys it) that gets copied somewhere by a later intermediate, and is
+          never referred to again.
+        * a copy out of a local variable immediately followed by a 'return', where
+          the only code that still sees the variable is its 'Cleanup for variable'
+          teardown, which checks the variable's '.isInitialized' flag.
+
+    Args:
+        body - the body of the function we'll be rewriting. We count the uses of
+            each stack slot in it, which tells us when a temporary's uses are all
+            local to the expression that creates it.
+    """
+
+    def __init__(self, body):
+        self.slotUses = Counter()
+        _countSlotUses(body, self.slotUses)
+
+        self.pairsElided = 0
+
+    def rewrite(self, expr, teardowns):
+        """Rewrite 'expr', which executes within the 'Finally' teardowns in 'teardowns'."""
+        if expr.matches.ApplyIntermediates:
+            return self.rewriteApplyIntermediates(expr, teardowns)
+
+        if expr.matches.Finally:
+            newExpr = self.rewrite(expr.expr, teardowns + tuple(expr.teardowns))
+            newTeardowns = [self.rewriteTeardown(t, teardowns) for t in expr.teardowns]
+
+            if newExpr is expr.expr and all(t is old for t, old in zip(newTeardowns, expr.teardowns)):
+                return expr
+
+            return Expression.Finally(expr=newExpr, teardowns=newTeardowns, name=expr.name)
+
+        changed = False
+        kwargs = {}
+
+        for name in expr.ElementType.ElementNames:
+            child = getattr(expr, name)
+
+            if isinstance(child, Expression):
+                kwargs[name] = self.rewrite(child, teardowns)
+                changed |= kwargs[name] is not child
+            elif isinstance(child, TupleOf(Expression)):
+                kwargs[name] = [self.rewrite(c, teardowns) for c in child]
+                changed |= any(new is not old for new, old in zip(kwargs[name], child))
+            else:
+                kwargs[name] = child
+
+        if not changed:
+            return expr
+
+        return type(expr)(**kwargs)
+
+    def rewriteTeardown(self, teardown, teardowns):
+        expr = self.rewrite(teardown.expr, teardowns)
+
+        if expr is teardown.expr:
+            return teardown
+
+        if teardown.matches.ByTag:
+            return Teardown.ByTag(tag=teardown.tag, expr=expr)
+
+        return Teardown.Always(expr=expr)
+
+    def rewriteApplyIntermediates(self, expr, teardowns):
+        intermediates = list(expr.intermediates)
+
+        # work out which copies become moves before rewriting anything inside them,
+        # since 'slotUses' counts uses in the original code.
+        moves = {}
+
+        for ix, intermediate in enumerate(intermediates):
+            if intermediate.matches.StackSlot:
+                copy = self.movableCopyOfTemporary(intermediates, ix, teardowns)
+
+                if copy is not None:
+                    moves[copy[0]] = copy[1]
+            elif intermediate.matches.Effect and ix + 1 < len(intermediates):
+                move = self.movableCopyBeforeReturn(intermediate.expr, intermediates[ix + 1], teardowns)
+
+                if move is not None:
+                    moves[ix] = move
+
+        changed = False
+
+        for ix, intermediate in enumerate(intermediates):
+            if ix in moves:
+                newIntermediate = ExpressionIntermediate.Effect(expr=moves[ix])
+                self.pairsElided += 1
+            else:
+                newIntermediate = self.rewriteIntermediate(intermediate, teardowns)
+
+            if newIntermediate is not intermediate:
+                intermediates[ix] = newIntermediate
+                changed = True
+
+        base = self.rewrite(expr.base, teardowns)
+
+        if not changed and base is expr.base:
+            return expr
+
+        return Expression.ApplyIntermediates(base=base, intermediates=intermediates)
+
+    def rewriteIntermediate(self, intermediate, teardowns):
+        expr = self.rewrite(intermediate.expr, teardowns)
+
+        if expr is intermediate.expr:
+            return intermediate
+
+        if intermediate.matches.Effect:
+            return ExpressionIntermediate.Effect(expr=expr)
+        if intermediate.matches.Terminal:
+            return ExpressionIntermediate.Terminal(expr=expr)
+        if intermediate.matches.Simple:
+            return ExpressionIntermediate.Simple(name=intermediate.name, expr=expr)
+
+        return ExpressionIntermediate.StackSlot(name=intermediate.name, expr=expr)
+
+    def movableCopyOfTemporary(self, intermediates, slotIx, teardowns):
+        """Find a copy out of the temporary created by 'intermediates[slotIx]' that can be a move.
+
+        Returns:
+            None, or a pair (ix, expr) where 'expr' should replace 'intermediates[ix]'.
+        """
+        slotName = intermediates[slotIx].name
+
+        teardown = [t for t in teardowns if t.matches.ByTag and t.tag == slotName]
+
+        if len(teardown) != 1:
+            return None
+
+        uses = Counter()
+        _countSlotUses(intermediates[slotIx].expr, uses)
+        _countSlotUses(teardown[0].expr, uses)
+
+        for ix in range(slotIx + 1, len(intermediates)):
+            intermediate = intermediates[ix]
+
+            if intermediate.matches.Effect:
+                copy = _refcountedCopy(intermediate.expr)
+
+                if copy is not None and copy[1] == slotName:
+                    _countSlotUses(intermediate.expr, uses)
+
+                    # if anything other than the code we've looked at uses the slot,
+                    # it might still need the reference.
+                    if uses[slotName] != self.slotUses[slotName]:
+                        return None
+
+                    return ix, makeSequence([
+                        copy[0].store(Expression.Load(ptr=copy[2])),
+                        Expression.DeactivatesTeardown(name=slotName)
+                    ])
+
+            # the slot's value has to be intact when we copy it, so we
+            # don't let anything in between touch it.
+            intermediateUses = Counter()
+            _countSlotUses(intermediate, intermediateUses)
+
+            if intermediateUses[slotName]:
+                return None
+
+        return None
+
+    def movableCopyBeforeReturn(self, expr, nextIntermediate, teardowns):
+        """If 'expr' copies out of a local variable and we then return, make it a move.
+
+        Returns:
+            None, or an expression to replace 'expr' with.
+        """
+        if not (
+            nextIntermediate.matches.Terminal
+            and nextIntermediate.expr.matches.Return
+            and nextIntermediate.expr.arg is None
+            and nextIntermediate.expr.blockName is None
+        ):
+            return None
+
+        copy = _refcountedCopy(expr)
+
+        if copy is None:
+            return None
+
+        target, slotName, slot = copy
+        flagName = slotName + ".isInitialized"
+
+        # the variable's cleanup has to be the only code that sees the variable
+        # on the way out of the function.
+        cleanups = []
+
+        for teardown in teardowns:
+            uses = Counter()
+            _countSlotUses(teardown, uses)
+
+            if uses[slotName] or uses[flagName]:
+                cleanups.append(teardown)
+
+        if len(cleanups) != 1 or not cleanups[0].matches.Always:
+            return None
+
+        if not _isGuardedByFlag(cleanups[0].expr, flagName):
+            return None
+
+        return makeSequence([
+            target.store(Expression.Load(ptr=slot)),
+            Expression.StackSlot(name=flagName, type=Bool).store(Bool.zero())
+        ])
+
+
+def _countSlotUses(obj, counts):
+    """Add the number of times each stack slot appears in 'obj' to 'counts'."""
+    if isinstance(obj, Expression) and obj.matches.StackSlot:
+        counts[obj.name] += 1
+    elif isinstance(obj, (Expression, ExpressionIntermediate, Teardown, CallTarget)):
+        for name in obj.ElementType.ElementNames:
+            _countSlotUses(getattr(obj, name), counts)
+    elif isinstance(obj, (
+        TupleOf(Expression),
+        TupleOf(ExpressionIntermediate),
+        TupleOf(Teardown),
+        TupleOf(Tuple(str, Expression)),
+        Tuple(str, Expression)
+    )):
+        for child in obj:
+            _countSlotUses(child, counts)
+
+
+def _refcountedCopy(expr):
+    """Recognize the code RefcountedWrapper generates to copy out of a stack slot.
+
+    That's 'target = slot' followed by an incref of 'target', possibly inside a
+    check that 'slot' isn't null.
+
+    Returns:
+        None, or a triple (target, slotName, slot).
+    """
+    if expr.matches.Branch:
+        if not (expr.cond.matches.Load and expr.false.matches.Store and expr.false.val == expr.cond):
+            return None
+
+        copy = _refcountedCopy(expr.true)
+
+        if copy is None or expr.false.ptr != copy[0] or expr.cond.ptr != copy[2]:
+            return None
+
+        return copy
+
+    if not (
+        expr.matches.Sequence
+        and len(expr.vals) == 3
+        and expr.vals[0].matches.Store
+        and expr.vals[0].val.matches.Load
+        and expr.vals[0].val.ptr.matches.StackSlot
+        and expr.vals[2].matches.Constant
+        and expr.vals[2].val.matches.Void
+    ):
+        return None
+
+    target = expr.vals[0].ptr
+    slot = expr.vals[0].val.ptr
+
+    if not _isIncrefOf(expr.vals[1], target) or target == slot:
+        return None
+
+    return target, slot.name, slot
+
+
+def _isIncrefOf(expr, target):
+    """Is 'expr' an atomic increment of a refcount inside the object 'target' points to?"""
+    if not (
+        expr.matches.AtomicAdd
+        and expr.val.matches.Constant
+        and expr.val.val.matches.Int
+        and expr.val.val.val == 1
+    ):
+        return False
+
+    ptr = expr.ptr
+
+    while ptr.matches.ElementPtr or ptr.matches.Cast:
+        if ptr.matches.ElementPtr and not all(o.matches.Constant for o in ptr.offsets):
+            return False
+
+        ptr = ptr.left
+
+    return ptr == Expression.Load(ptr=target)
+
+
+def _isGuardedByFlag(expr, flagName):
+    """Is 'expr' a branch on the stack slot 'flagName' that does nothing if it's false?"""
+    while True:
+        if expr.matches.Comment:
+            expr = expr.expr
+        elif (
+            expr.matches.ApplyIntermediates
+            and expr.base.matches.Constant
+            and len(expr.intermediates) == 1
+            and expr.intermediates[0].matches.Effect
+        ):
+            expr = expr.intermediates[0].expr
+        else:
+            break
+
+    return (
+        expr.matches.Branch
+        and expr.cond.matches.Load
+        and expr.cond.ptr.matches.StackSlot
+        and expr.cond.ptr.name == flagName
+        and expr.false.matches.Constant
+    )
@@ -0,0 +1,106 @@
+#   Copyright 2017-2021 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import pytest
+
+import typed_python._types as _types
+from typed_python import Entrypoint, ListOf
+from typed_python.compiler.runtime import Runtime
+
+
+def pairsElidedBy(f, *args):
+    converter = Runtime.singleton().converter
+
+    before = converter.refcountPairsElided
+    result = f(*args)
+
+    return result, converter.refcountPairsElided - before
+
+
+def test_returning_a_temporary_moves_it():
+    @Entrypoint
+    def concatenate(x: ListOf(int)):
+        return x + x
+
+    x = ListOf(int)([1, 2])
+
+    result, elided = pairsElidedBy(concatenate, x)
+
+    assert result == [1, 2, 1, 2]
+    assert elided > 0
+
+    assert _types.refcount(result) == 1
+    assert _types.refcount(x) == 1
+
+
+def test_returning_a_local_moves_it():
+    @Entrypoint
+    def copyOf(x: ListOf(int)):
+        y = ListOf(int)(x)
+        y.append(3)
+        return y
+
+    x = ListOf(int)([1, 2])
+
+    result, elided = pairsElidedBy(copyOf, x)
+
+    assert result == [1, 2, 3]
+    assert elided > 0
+
+    assert _types.refcount(result) == 1
+    assert _types.refcount(x) == 1
+
+
+def test_values_still_in_use_are_copied():
+    @Entrypoint
+    def aliases(x: ListOf(int)):
+        y = x + x
+        z = y
+        y.append(0)
+        return z
+
+    x = ListOf(int)([1])
+
+    result = aliases(x)
+
+    assert result == [1, 1, 0]
+    assert _types.refcount(result) == 1
+    assert _types.refcount(x) == 1
+
+
+def test_moves_in_loops_and_exceptions():
+    @Entrypoint
+    def build(x: ListOf(int), n: int):
+        res = ListOf(ListOf(int))()
+
+        for i in range(n):
+            y = x + x
+            if i == 3:
+                raise Exception("boom")
+            res.append(y)
+
+        return res
+
+    x = ListOf(int)([1])
+
+    assert len(build(x, 3)) == 3
+
+    with pytest.raises(Exception, match="boom"):
+        build(x, 10)
+
+    assert _types.refcount(x) == 1
+
+    element = build(x, 2)[0]
+
+    assert _types.refcount(element) == 1
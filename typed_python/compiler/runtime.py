@@ -12,6 +12,9 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import atexit
+import logging
+import queue
 import threading
 import os
 import time
@@ -21,7 +24,8 @@ import typed_python.compiler.llvm_compiler as llvm_compiler
 import typed_python
 from typed_python.compiler.runtime_lock import runtimeLock
 from typed_python.compiler.conversion_level import ConversionLevel
-from typed_python.compiler.compiler_cache import CompilerCache
+from typed_python.compiler.compiler_cache import CompilerCache, PROFILE_FILE
+from typed_python.compiler.compiler_profile import CompilerProfile
 from typed_python.type_function import TypeFunction
 from typed_python.compiler.type_wrappers.typed_tuple_masquerading_as_tuple_wrapper import TypedTupleMasqueradingAsTuple
 from typed_python.compiler.type_wrappers.named_tuple_masquerading_as_dict_wrapper import NamedTupleMasqueradingAsDict
@@ -158,19 +162,43 @@ class Runtime:
         return _singleton[0]
 
     def __init__(self):
-        if os.getenv("TP_COMPILER_CACHE"):
+        self.compilerProfile = self._compilerProfileFromEnvironment()
+
+        if os.getenv("TP_COMPILER_CACHE") and not self.isRecordingCompilerProfile:
             self.compilerCache = CompilerCache(
-                os.path.abspath(os.getenv("TP_COMPILER_CACHE"))
+                os.path.abspath(os.getenv("TP_COMPILER_CACHE")),
+                self._compilerCacheTargetKey()
             )
         else:
             self.compilerCache = None
-        self.llvm_compiler = llvm_compiler.Compiler(inlineThreshold=100)
+        self.llvm_compiler = llvm_compiler.Compiler(
+            inlineThreshold=100,
+            codegenWorkers=int(os.getenv("TP_COMPILER_CODEGEN_WORKERS", "0"))
+        )
+        self.llvm_compiler.setProfile(self.compilerProfile)
         self.converter = python_to_native_converter.PythonToNativeConverter(
             self.llvm_compiler,
             self.compilerCache
         )
         self.lock = runtimeLock
         self.timesCompiled = 0
+        self.timesOptimized = 0
+
+        self.backgroundCompilation = bool(os.getenv("TP_COMPILER_BACKGROUND"))
+        self._backgroundQueue = queue.Queue()
+        self._backgroundThread = None
+        self._backgroundLock = threading.Lock()
+        # keys of work queued for the background thread, and of work that failed
+        self._pendingBackgroundCompilations = set()
+        self._failedBackgroundCompilations = set()
+
+        # map from the function pointer of each specialization we compiled quickly
+        # to what we need to recompile it with full optimization once it gets hot.
+        self._firstTierSpecializations = {}
+        self.setTieredCompilation(
+            bool(os.getenv("TP_COMPILER_TIERED")),
+            int(os.getenv("TP_COMPILER_TIER_UP_CALLS", "1000"))
+        )
 
         if os.getenv("TP_COMPILER_VERBOSE"):
             self.verbosityLevel = int(os.getenv("TP_COMPILER_VERBOSE"))
@@ -186,6 +214,228 @@ class Runtime:
         else:
             self.verbosityLevel = 0
 
+    @staticmethod
+    def _compilerProfileFromEnvironment():
+        """Build the CompilerProfile that TP_COMPILER_PROFILE asks for, or return None."""
+        mode = os.getenv("TP_COMPILER_PROFILE")
+
+        if not mode:
+            return None
+
+        if mode not in ("record", "use"):
+            raise Exception(f"TP_COMPILER_PROFILE must be 'record' or 'use', not {mode!r}")
+
+        if os.getenv("TP_COMPILER_PROFILE_FILE"):
+            path = os.path.abspath(os.getenv("TP_COMPILER_PROFILE_FILE"))
+        elif os.getenv("TP_COMPILER_CACHE"):
+            path = os.path.join(os.path.abspath(os.getenv("TP_COMPILER_CACHE")), PROFILE_FILE)
+        else:
+            raise Exception("TP_COMPILER_PROFILE requires TP_COMPILER_CACHE or TP_COMPILER_PROFILE_FILE")
+
+        if mode == "record":
+            profile = CompilerProfile(recording=True)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atexit.register(profile.save, path)
+
+            return profile
+
+        profile = CompilerProfile.load(path)
+
+        return profile if profile.counts else None
+
+    @property
+    def isRecordingCompilerProfile(self):
+        return self.compilerProfile is not None and self.compilerProfile.recording
+
+    def _compilerCacheTargetKey(self):
+        """The key identifying the code we compile, for the compiler cache.
+
+        Code compiled using a profile depends on the profile as well as the target.
+        """
+        if self.compilerProfile is None:
+            return llvm_compiler.compilation_target.key
+
+        return llvm_compiler.compilation_target.key + " profile=" + self.compilerProfile.key
+
+    def setCompilerCacheDir(self, cacheDir):
+        """Store code we compile from now on in the compiler cache at 'cacheDir'.
+
+        This is equivalent to having booted with TP_COMPILER_CACHE set, and so
+        it must be called before we've compiled anything, since code in the cache
+        can't depend on code that isn't.
+        """
+        with self.lock:
+            if self.converter.getDefinitionCount():
+                raise Exception("Can't change the compiler cache after code has been compiled.")
+
+            if self.isRecordingCompilerProfile:
+                raise Exception("Can't use a compiler cache while recording a compiler profile.")
+
+            self.compilerCache = CompilerCache(os.path.abspath(cacheDir), self._compilerCacheTargetKey())
+            self.converter.compilerCache = self.compilerCache
+
+    def setBackgroundCompilation(self, enabled):
+        """Control whether Entrypoints compile new signatures on a background thread.
+
+        This is equivalent to having booted with TP_COMPILER_BACKGROUND set. When
+        enabled, a call to an Entrypoint with a signature we haven't compiled yet
+        runs in the interpreter (as if inside of DisableCompiledCode) while the
+        specialization gets compiled on a background thread. Once it's installed,
+        subsequent calls dispatch to the compiled code.
+        """
+        self.backgroundCompilation = bool(enabled)
+
+    def setTieredCompilation(self, enabled, tierUpCallCount=1000):
+        """Control whether we compile new specializations quickly and optimize them later.
+
+        This is equivalent to having booted with TP_COMPILER_TIERED set (and
+        TP_COMPILER_TIER_UP_CALLS set to 'tierUpCallCount'). When enabled, we compile
+        each new specialization of an Entrypoint with very little optimization,
+        which is much faster, and count the calls the interpreter makes to it. Once
+        it's been called 'tierUpCallCount' times, we recompile it and everything it
+        calls with full optimization on a background thread, and swap the result
+        in. Code we write into the compiler cache is always fully optimized.
+        """
+        self.tieredCompilation = bool(enabled)
+        self.tierUpCallCount = tierUpCallCount
+
+        _types.setCompiledSpecializationHotCallCount(tierUpCallCount if enabled else 0)
+
+    def waitForBackgroundCompilation(self, timeout=None):
+        """Block until all background work queued so far has finished.
+
+        This includes both compiling new specializations and optimizing hot ones.
+
+        Returns:
+            True if the queue drained, False if we timed out.
+        """
+        t0 = time.time()
+
+        while True:
+            with self._backgroundLock:
+                if not self._pendingBackgroundCompilations:
+                    return True
+
+            if timeout is not None and time.time() - t0 > timeout:
+                return False
+
+            time.sleep(0.001)
+
+    @staticmethod
+    def _signatureKeyFor(overload, arguments):
+        """Compute a hashable key for the specialization 'arguments' will select.
+
+        This has to be cheap and mustn't need the runtime lock, since the whole
+        point is to avoid blocking the caller while the compiler is busy.
+        """
+        key = []
+
+        for overloadArg, argValue in zip(overload.args, arguments):
+            if overloadArg.isStarArg:
+                key.append(tuple(Runtime.passingTypeForValue(v) for v in argValue))
+            elif overloadArg.isKwarg:
+                key.append(tuple((k, Runtime.passingTypeForValue(v)) for k, v in argValue.items()))
+            else:
+                key.append(Runtime.passingTypeForValue(argValue))
+
+        return tuple(key)
+
+    def compileFunctionOverloadForEntrypoint(self, functionType, overloadIx, arguments):
+        """Compile an overload of an Entrypoint that just got called with 'arguments'.
+
+        This is what native dispatch calls when it can't find a matching
+        specialization. In background mode, we queue the compilation and return
+        immediately so that the caller can run the function in the interpreter.
+
+        Returns:
+            True if a specialization has been installed and dispatch should try
+            again, False if the caller should fall back to the interpreter.
+        """
+        if not self.backgroundCompilation or threading.current_thread() is self._backgroundThread:
+            self.compileFunctionOverload(functionType, overloadIx, arguments)
+            return True
+
+        key = (functionType, overloadIx, self._signatureKeyFor(functionType.overloads[overloadIx], arguments))
+
+        self._queueBackgroundWork(
+            key,
+            lambda: self.compileFunctionOverload(functionType, overloadIx, arguments) is not None
+        )
+
+        return False
+
+    def specializationIsHot(self, fp):
+        """Called by native dispatch once the specialization at 'fp' has been called often.
+
+        If we compiled it quickly, queue a fully optimized recompile of it. Like
+        'compileFunctionOverloadForEntrypoint', this mustn't block on the runtime lock.
+        """
+        firstTier = self._firstTierSpecializations.pop(fp, None)
+
+        if firstTier is not None:
+            self._queueBackgroundWork(("optimize", fp), lambda: self._optimizeSpecialization(*firstTier))
+
+    def _optimizeSpecialization(self, overload, linkName, dispatchName, returnType, argTypes):
+        with self.lock:
+            t0 = time.time()
+
+            fp = self.converter.buildOptimizedCopy(linkName, dispatchName)
+
+            overload._installNativePointer(fp.fp, returnType, argTypes)
+
+            self.timesOptimized += 1
+
+            if self.verbosityLevel > 0:
+                print(f"typed_python runtime spent {time.time()-t0:.3f} seconds optimizing {linkName}.")
+
+        return True
+
+    def _queueBackgroundWork(self, key, work):
+        """Call 'work' on the background thread, unless 'key' is pending or has failed.
+
+        'work' returns False (or throws) if it failed, in which case we won't queue
+        anything under 'key' again.
+        """
+        with self._backgroundLock:
+            if key in self._pendingBackgroundCompilations or key in self._failedBackgroundCompilations:
+                return
+
+            self._pendingBackgroundCompilations.add(key)
+
+            if self._backgroundThread is None:
+                self._backgroundThread = threading.Thread(
+                    target=self._backgroundCompilationLoop,
+                    name="typed_python background compiler",
+                    daemon=True
+                )
+                self._backgroundThread.start()
+
+        self._backgroundQueue.put((key, work))
+
+    def _backgroundCompilationLoop(self):
+        while True:
+            key, work = self._backgroundQueue.get()
+
+            failed = False
+
+            try:
+                failed = not work()
+            except Exception:
+                failed = True
+                logging.exception("background compilation of %s failed", key[0])
+
+            # drop our reference to the work (and the arguments it holds) before anybody
+            # waiting on us wakes up
+            del work
+
+            with self._backgroundLock:
+                self._pendingBackgroundCompilations.discard(key)
+
+                if failed:
+                    # leave this signature in the interpreter rather than retrying it forever
+                    self._failedBackgroundCompilations.add(key)
+
     def addEventVisitor(self, visitor: RuntimeEventVisitor):
         self.converter.addVisitor(visitor)
 
@@ -270,6 +520,7 @@ class Runtime:
             t1 = None
             t2 = None
             defCount = self.converter.getDefinitionCount()
+            elidedCount = self.converter.refcountPairsElided
 
             with self.lock:
                 inputWrappers = []
@@ -298,17 +549,25 @@ class Runtime:
 
                 wrappingCallTargetName = self.converter.generateCallConverter(callTarget)
 
+                # code in the compiler cache lives forever, so it's always fully optimized
+                firstTier = self.tieredCompilation and self.compilerCache is None
+
                 t1 = time.time()
-                self.converter.buildAndLinkNewModule()
+                self.converter.buildAndLinkNewModule(firstTier=firstTier)
                 t2 = time.time()
 
                 fp = self.converter.functionPointerByName(wrappingCallTargetName)
 
-                overload._installNativePointer(
-                    fp.fp,
-                    callTarget.output_type.typeRepresentation if callTarget.output_type is not None else type(None),
-                    [i.typeRepresentation for i in callTarget.input_types]
-                )
+                returnType = callTarget.output_type.typeRepresentation if callTarget.output_type is not None else type(None)
+                argTypes = [i.typeRepresentation for i in callTarget.input_types]
+
+                overload._installNativePointer(fp.fp, returnType, argTypes)
+
+                if firstTier:
+                    self._firstTierSpecializations.setdefault(
+                        fp.fp,
+                        (overload, callTarget.name, wrappingCallTargetName, returnType, argTypes)
+                    )
 
                 return callTarget
         finally:
@@ -317,7 +576,8 @@ class Runtime:
                     f"typed_python runtime spent {time.time()-t0:.3f} seconds "
                     + (f"({t2 - t1:.3f})" if t2 is not None else "")
                     + " adding " +
-                    f"{self.converter.getDefinitionCount() - defCount} functions."
+                    f"{self.converter.getDefinitionCount() - defCount} functions "
+                    f"(eliding {self.converter.refcountPairsElided - elidedCount} incref/decref pairs)."
                 )
 
     def compileClassDispatch(self, interfaceClass, implementingClass, slotIndex):
@@ -418,7 +678,9 @@ def Entrypoint(pyFunc):
     Each time you call 'pyFunc', we look at the argument signature and see whether
     we have already compiled a form of that function. If so, we dispatch to that.
     Otherwise, we compile a new form (which blocks) and then use that when
-    compilation has completed.
+    compilation has completed. If background compilation is enabled (see
+    Runtime.setBackgroundCompilation) we run the call in the interpreter instead
+    and compile the new form on a background thread.
     """
     Runtime.singleton()
 
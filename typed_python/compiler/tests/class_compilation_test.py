@@ -286,6 +286,51 @@ class TestClassCompilationCompilation(unittest.TestCase):
         # tun this test. Note that we generate two entrypoints (one for float, one for int)
         self.assertTrue(0.5 <= elapsed1 / elapsed2 <= 2.0, elapsed1 / elapsed2)
 
+    @flaky(max_runs=3, min_passes=1)
+    def test_allocation_heavy_perf_with_thread_local_allocator(self):
+        class Point(Class):
+            x = Member(int)
+            y = Member(float)
+
+        @Entrypoint
+        def churn(count: int):
+            res = 0.0
+
+            for i in range(count):
+                p = Point(x=i, y=i * 0.5)
+                s = str(i) + "x"
+                t = TupleOf(int)((i, i + 1, i + 2))
+                aList = ListOf(int)()
+                for j in range(i % 10):
+                    aList.append(j)
+
+                res += p.y + len(s) + t[2] + len(aList)
+
+            return res
+
+        churn(10)
+
+        wasEnabled = _types.isThreadLocalAllocatorEnabled()
+
+        try:
+            _types.setThreadLocalAllocatorEnabled(False)
+            t0 = time.time()
+            mallocRes = churn(1000000)
+            mallocTime = time.time() - t0
+
+            _types.setThreadLocalAllocatorEnabled(True)
+            t0 = time.time()
+            pooledRes = churn(1000000)
+            pooledTime = time.time() - t0
+        finally:
+            _types.setThreadLocalAllocatorEnabled(wasEnabled)
+
+        self.assertEqual(mallocRes, pooledRes)
+
+        # I get about 1.7x
+        print("thread-local allocator speedup is ", mallocTime / pooledTime)
+        self.assertLess(pooledTime, mallocTime * 1.1)
+
     def test_compile_class_method(self):
         c = AClass(x=20)
 
@@ -2855,3 +2900,67 @@ class TestClassCompilationCompilation(unittest.TestCase):
         t0 = time.time()
         assert constructOne(C, 0, 1000000) == C(0).f() * 1000000
         print(time.time() - t0)
+
+    def test_non_escaping_class_instances_live_on_the_stack(self):
+        class StackPoint(Class):
+            x = Member(int)
+            y = Member(float)
+            z = Member(TupleOf(int))
+
+        @Entrypoint
+        def sumPoints(n: int, z: TupleOf(int)):
+            res = 0.0
+            for i in range(n):
+                p = StackPoint(x=i, y=2.0, z=z)
+                p.x += 1
+                if i == 100:
+                    raise Exception("boom")
+                res += p.x * p.y + len(p.z)
+            return res
+
+        @Entrypoint
+        def escapes(n: int, z: TupleOf(int)):
+            p = StackPoint(x=n, z=z)
+            return p
+
+        aTupleOfInt = TupleOf(int)([1, 2])
+
+        assert sumPoints(10, aTupleOfInt) == sum((i + 1) * 2.0 + 2 for i in range(10))
+
+        with self.assertRaisesRegex(Exception, "boom"):
+            sumPoints(1000, aTupleOfInt)
+
+        assert _types.refcount(aTupleOfInt) == 1
+
+        # only the function returning the instance needs to put it on the heap
+        constructors = [
+            name for name in Runtime.singleton().converter._definitions if 'construct(StackPoint' in name
+        ]
+        assert len(constructors) == 0
+
+        p = escapes(3, aTupleOfInt)
+
+        assert p.x == 3 and p.z == aTupleOfInt
+        assert _types.refcount(p) == 1
+
+        assert [name for name in Runtime.singleton().converter._definitions if 'construct(StackPoint' in name]
+
+    def test_classes_that_see_self_are_not_constructed_on_the_stack(self):
+        class InitializedPoint(Class):
+            x = Member(int)
+            seen = Member(ListOf(object))
+
+            def __init__(self, seen):
+                self.seen = seen
+                self.seen.append(self)
+                self.x = 1
+
+        @Entrypoint
+        def make(seen: ListOf(object)):
+            p = InitializedPoint(seen=seen)
+            return p.x
+
+        seen = ListOf(object)()
+
+        assert make(seen) == 1
+        assert seen[0].x == 1
@@ -354,3 +354,123 @@ class TestConstDictCompilation(unittest.TestCase):
         # I get about 70x
         print("ConstDict iteration speedup is ", speedup)
         self.assertGreater(speedup, 2)
+
+    @flaky(max_runs=3, min_passes=1)
+    def test_const_dict_tree_lookup_perf(self):
+        T = ConstDict(int, int)
+
+        flat = T({k: k for k in range(0, 2000000, 2)})
+        tree = flat + {1: 1}
+
+        @Entrypoint
+        def sumLookups(d: T, count: int):
+            res = 0
+            for k in range(count):
+                res += d.get(k, 0)
+            return res
+
+        sumLookups(flat, 1)
+        sumLookups(tree, 1)
+
+        t0 = time.time()
+        flatSum = sumLookups(flat, 2000000)
+        t1 = time.time()
+        treeSum = sumLookups(tree, 2000000)
+        t2 = time.time()
+
+        self.assertEqual(treeSum, flatSum + 1)
+
+        # trees are searched by key in one native call, comparing keys through
+        # the runtime. That takes about 2.5 times as long as searching a flat dict,
+        # rather than the 5 to 6 times it took to look up each probe by index.
+        ratio = (t2 - t1) / (t1 - t0)
+        print("tree lookups take", ratio, "times as long as flat ones")
+        self.assertLess(ratio, 4)
+
+    def test_const_dict_stored_as_tree(self):
+        TOI = TupleOf(int)
+        T = ConstDict(int, TOI)
+
+        toi = TOI((1, 2, 3))
+
+        # small updates to big ConstDicts share most of their structure
+        t = T({k: toi for k in range(0, 2000, 2)})
+        for k in range(1, 41, 2):
+            t = t + {k: TOI((k,))}
+        t = t - (0, 10)
+
+        pyT = {k: toi for k in range(0, 2000, 2)}
+        pyT.update({k: TOI((k,)) for k in range(1, 41, 2)})
+        del pyT[0]
+        del pyT[10]
+
+        @Entrypoint
+        def lookup(d: T, k: int):
+            return d[k]
+
+        @Entrypoint
+        def contains(d: T, k: int):
+            return k in d
+
+        @Entrypoint
+        def keys(d: T):
+            res = ListOf(int)()
+            for k in d:
+                res.append(k)
+            return res
+
+        @Entrypoint
+        def items(d: T):
+            res = ListOf(Tuple(int, TOI))()
+            for kv in d.items():
+                res.append(kv)
+            return res
+
+        @Entrypoint
+        def equal(d1: T, d2: T):
+            return d1 == d2
+
+        self.assertEqual(len(t), len(pyT))
+        self.assertEqual(keys(t), sorted(pyT))
+        self.assertEqual(items(t), [(k, pyT[k]) for k in sorted(pyT)])
+        self.assertTrue(equal(t, T(pyT)))
+
+        @Entrypoint
+        def get(d: T, k: int):
+            return d.get(k, TOI())
+
+        for k in range(-1, 2001):
+            self.assertEqual(contains(t, k), k in pyT)
+            self.assertEqual(get(t, k), pyT.get(k, TOI()))
+            if k in pyT:
+                self.assertEqual(lookup(t, k), pyT[k])
+            else:
+                with self.assertRaises(KeyError):
+                    lookup(t, k)
+
+        # keys that are passed by reference
+        S = ConstDict(str, int)
+        s = S({str(k): k for k in range(2000)}) + {"x": -1}
+
+        @Entrypoint
+        def lookupStr(d: S, k: str):
+            return d.get(k, -2)
+
+        for k in list(range(-5, 2005)) + ["x"]:
+            self.assertEqual(lookupStr(s, str(k)), s.get(str(k), -2))
+
+        @Entrypoint
+        def dropLast(l: ListOf(T)):
+            l.pop()
+
+        # let compiled code release the last reference to the tree
+        refcountBefore = _types.refcount(toi)
+        holder = ListOf(T)([t + {5001: toi}])
+        self.assertGreater(_types.refcount(toi), refcountBefore)
+
+        dropLast(holder)
+
+        self.assertEqual(_types.refcount(toi), refcountBefore)
+
+        t = None
+        self.assertEqual(_types.refcount(toi), 1)
@@ -855,3 +855,242 @@ class TestDictCompilation(unittest.TestCase):
 
             if time.time() - t0 > 1e-5:
                 print(i, time.time() - t0)
+
+    def test_dict_churn_with_tombstones_compiled_and_interpreted(self):
+        @Entrypoint
+        def churn(d: Dict(int, int), lo: int, hi: int):
+            for i in range(lo, hi):
+                d[i] = i
+
+            for i in range(lo, hi, 3):
+                del d[i]
+
+        @Entrypoint
+        def countPresent(d: Dict(int, int), hi: int):
+            res = 0
+            for i in range(hi):
+                if i in d:
+                    res += 1
+            return res
+
+        for layout in ["probed", "swiss"]:
+            _types.setHashTableLayout(layout)
+
+            try:
+                d = Dict(int, int)()
+                model = {}
+
+                for passIx in range(20):
+                    lo = passIx * 500
+
+                    if passIx % 2:
+                        churn(d, lo, lo + 1000)
+                    else:
+                        for i in range(lo, lo + 1000):
+                            d[i] = i
+                        for i in range(lo, lo + 1000, 3):
+                            del d[i]
+
+                    for i in range(lo, lo + 1000):
+                        model[i] = i
+                    for i in range(lo, lo + 1000, 3):
+                        model.pop(i, None)
+
+                    self.assertEqual(dict(d), model)
+
+                self.assertEqual(_types.hashTableLayout(d), layout)
+                self.assertEqual(countPresent(d, 20000), len(model))
+                self.assertEqual(len([i for i in range(20000) if i in d]), len(model))
+            finally:
+                _types.setHashTableLayout("probed")
+
+    @flaky(max_runs=3, min_passes=1)
+    def test_dict_large_str_table_perf_probed_vs_swiss(self):
+        @Entrypoint
+        def insertAll(d: Dict(str, int), keys: ListOf(str)):
+            for i in range(len(keys)):
+                d[keys[i]] = i
+
+        @Entrypoint
+        def lookupAll(d: Dict(str, int), keys: ListOf(str)):
+            res = 0
+            for i in range(len(keys)):
+                res += d.get(keys[i], -1)
+            return res
+
+        keys = ListOf(str)([str(i) + "_key" for i in range(1000000)])
+        missing = ListOf(str)([str(i) + "_missing" for i in range(1000000)])
+
+        insertAll(Dict(str, int)(), keys[:10])
+        lookupAll(Dict(str, int)(), keys[:10])
+
+        def timeLayout(layout):
+            _types.setHashTableLayout(layout)
+
+            try:
+                d = Dict(str, int)()
+                t0 = time.time()
+                insertAll(d, keys)
+                t1 = time.time()
+                total = lookupAll(d, keys)
+                t2 = time.time()
+                self.assertEqual(lookupAll(d, missing), -len(missing))
+                t3 = time.time()
+
+                self.assertEqual(total, sum(range(len(keys))))
+                self.assertEqual(_types.hashTableLayout(d), layout)
+
+                print(
+                    layout, "inserted 1mm strings in", t1 - t0,
+                    "looked them up in", t2 - t1,
+                    "and missed 1mm in", t3 - t2
+                )
+
+                return t3 - t0
+            finally:
+                _types.setHashTableLayout("probed")
+
+        probed = timeLayout("probed")
+        swiss = timeLayout("swiss")
+
+        # on a 2.6GHz box these each take about 0.5 seconds, and are within
+        # 20% of each other.
+        self.assertLess(swiss, probed * 1.5)
+        self.assertLess(probed, swiss * 1.5)
+
+    def test_dict_with_wide_hash_table_slots_compiled(self):
+        @Entrypoint
+        def fill(d: Dict(int, int), count: int):
+            for i in range(count):
+                d[i] = i * 2
+
+            for i in range(0, count, 3):
+                del d[i]
+
+        @Entrypoint
+        def total(d: Dict(int, int), count: int):
+            res = 0
+            for i in range(count):
+                res += d.get(i, 0)
+            return res
+
+        _types.setMinimumHashTableSlotBytes(8)
+
+        try:
+            d = Dict(int, int)()
+            fill(d, 5000)
+
+            self.assertEqual(_types.hashTableSlotBytes(d), 8)
+            self.assertEqual(_types.hashTableHashBytes(d), 8)
+        finally:
+            _types.setMinimumHashTableSlotBytes(1)
+
+        expected = {i: i * 2 for i in range(5000) if i % 3}
+
+        self.assertEqual(dict(d), expected)
+        self.assertEqual(total(d, 5000), sum(expected.values()))
+
+        # mutating the wide table from the interpreter and then the compiler
+        for i in range(5000, 6000):
+            d[i] = i * 2
+            expected[i] = i * 2
+
+        fill(d, 100)
+
+        for i in range(100):
+            expected.pop(i, None)
+            if i % 3:
+                expected[i] = i * 2
+
+        self.assertEqual(dict(d), expected)
+        self.assertEqual(total(d, 6000), sum(expected.values()))
+
+    def test_dict_switching_to_wide_hashes_compiled(self):
+        @Entrypoint
+        def fill(d: Dict(OneOf(int, str), float), count: int):
+            for i in range(count):
+                d[str(i)] = i
+                d[i] = i / 2
+
+        @Entrypoint
+        def lookup(d: Dict(OneOf(int, str), float), key: OneOf(int, str)):
+            return d.get(key, -1.0)
+
+        @Entrypoint
+        def lookupFloat(d: Dict(float, str), key: float):
+            return d.get(key, "")
+
+        d = Dict(OneOf(int, str), float)()
+        fill(d, 10)
+
+        self.assertEqual(_types.hashTableHashBytes(d), 4)
+
+        _types.setMinimumHashTableSlotBytes(8)
+
+        try:
+            # the compiled code adds the item that makes the table wide
+            fill(d, 2000)
+
+            floats = Dict(float, str)({i / 2: str(i) for i in range(2000)})
+        finally:
+            _types.setMinimumHashTableSlotBytes(1)
+
+        self.assertEqual(_types.hashTableHashBytes(d), 8)
+        self.assertEqual(_types.hashTableHashBytes(floats), 8)
+
+        for i in range(2000):
+            self.assertEqual(lookup(d, i), i / 2)
+            self.assertEqual(lookup(d, str(i)), i)
+            self.assertEqual(d[i], i / 2)
+            self.assertEqual(d[str(i)], i)
+
+        self.assertEqual(lookup(d, "2000"), -1.0)
+        self.assertEqual(lookupFloat(floats, 3.0), "6")
+        self.assertEqual(lookupFloat(floats, 3.5), "7")
+        self.assertEqual(lookupFloat(floats, 0.25), "")
+
+    def test_dict_growing_through_slot_widths_compiled(self):
+        @Entrypoint
+        def fill(d: Dict(int, int), lo: int, hi: int):
+            for i in range(lo, hi):
+                d[i] = i
+
+        @Entrypoint
+        def check(d: Dict(int, int), hi: int):
+            res = 0
+            for i in range(hi):
+                if i in d:
+                    if d[i] != i:
+                        return -1
+                    res += 1
+            return res
+
+        @Entrypoint
+        def removeSome(d: Dict(int, int), hi: int, mod: int):
+            for i in range(hi):
+                if i % mod:
+                    d.pop(i, 0)
+
+        d = Dict(int, int)()
+
+        for lo, hi, width in [(0, 5, 0), (5, 8, 0), (8, 100, 1), (100, 1000, 2), (1000, 40000, 4)]:
+            # alternate between compiled and interpreted inserts
+            if width % 2:
+                for i in range(lo, hi):
+                    d[i] = i
+            else:
+                fill(d, lo, hi)
+
+            self.assertEqual(_types.hashTableSlotBytes(d), width)
+            self.assertEqual(check(d, hi + 10), hi)
+
+        removeSome(d, 40000, 5)
+
+        self.assertEqual(check(d, 40000), 8000)
+        self.assertEqual(dict(d), {i: i for i in range(0, 40000, 5)})
+
+        removeSome(d, 40000, 40000)
+
+        self.assertLessEqual(_types.hashTableSlotBytes(d), 1)
+        self.assertEqual(dict(d), {0: 0})
+        self.assertEqual(check(d, 10), 1)
@@ -14,7 +14,7 @@
 
 from typed_python import (
     ListOf, Class, Member, Final, TupleOf, DisableCompiledCode,
-    isCompiled, SerializationContext
+    isCompiled, SerializationContext, NamedTuple
 )
 from typed_python._types import touchCompiledSpecializations
 from typed_python import Entrypoint, NotCompiled
@@ -118,6 +118,45 @@ class TestCompileSpecializedEntrypoints(unittest.TestCase):
 
             print("speedup for ", T, " is ", speedup)  # I get about 70x
 
+    @flaky(max_runs=3, min_passes=1)
+    def test_dispatch_perf_doesnt_depend_on_specialization_count(self):
+        @Entrypoint
+        def getX(t):
+            return t.x
+
+        types = [NamedTuple(x=int, **{f"f{i}": int}) for i in range(20)]
+        instances = [T(x=i) for i, T in enumerate(types)]
+
+        for i, inst in enumerate(instances):
+            assert getX(inst) == i
+
+        def callOverhead(inst):
+            t0 = time.time()
+            for _ in range(100000):
+                getX(inst)
+            return time.time() - t0
+
+        # the first specialization is found immediately by a linear scan, the
+        # last one would have to reject 19 others first.
+        firstTime = callOverhead(instances[0])
+        lastTime = callOverhead(instances[-1])
+
+        print(f"dispatch to first specialization: {firstTime:.3f}, to last: {lastTime:.3f}")
+
+        self.assertLess(lastTime, firstTime * 1.5)
+
+    def test_dispatch_with_types_that_dont_determine_specialization(self):
+        # all of these arguments have python type 'type', so the lookup cache
+        # can't tell the specializations apart and has to check its guess.
+        @Entrypoint
+        def name(T):
+            return T.__name__
+
+        for _ in range(3):
+            assert name(int) == "int"
+            assert name(float) == "float"
+            assert name(str) == "str"
+
     def test_many_threads_compiling_same_specialization(self):
         @Entrypoint
         def sumFun(a, b):
@@ -621,3 +660,68 @@ class TestCompileSpecializedEntrypoints(unittest.TestCase):
         assert callIt(f1) is l1
         assert callIt(f2) is l2
         assert callIt(f3) is l1
+
+    def test_background_compilation_falls_back_to_interpreter(self):
+        @Entrypoint
+        def checkCompiled(x):
+            return isCompiled()
+
+        runtime = Runtime.singleton()
+        runtime.setBackgroundCompilation(True)
+
+        try:
+            # the first call can't wait for the compiler, so it runs in the interpreter
+            assert not checkCompiled(1)
+            assert runtime.waitForBackgroundCompilation(timeout=60)
+            assert checkCompiled(1)
+
+            # a new signature goes back to the interpreter while it compiles
+            assert not checkCompiled(1.5)
+            assert runtime.waitForBackgroundCompilation(timeout=60)
+            assert checkCompiled(1.5)
+        finally:
+            runtime.setBackgroundCompilation(False)
+
+    def test_tiered_compilation_optimizes_hot_specializations(self):
+        @Entrypoint
+        def sumSquares(x: ListOf(float)):
+            res = 0.0
+            for v in x:
+                res += v * v
+            return res
+
+        @Entrypoint
+        def checkPositive(x: int):
+            if x < 0:
+                raise ValueError("negative")
+            return sumSquares(ListOf(float)([x] * x))
+
+        runtime = Runtime.singleton()
+        runtime.setTieredCompilation(True, tierUpCallCount=10)
+
+        try:
+            timesOptimized = runtime.timesOptimized
+
+            for i in range(9):
+                assert checkPositive(i) == i ** 3
+
+            assert runtime.waitForBackgroundCompilation(timeout=60)
+            assert runtime.timesOptimized == timesOptimized
+
+            # the tenth call makes it hot
+            assert checkPositive(9) == 9 ** 3
+            assert runtime.waitForBackgroundCompilation(timeout=60)
+            assert runtime.timesOptimized == timesOptimized + 1
+
+            # the optimized copy behaves just like the original
+            for i in range(100):
+                assert checkPositive(i) == i ** 3
+
+            with self.assertRaisesRegex(ValueError, "negative"):
+                checkPositive(-1)
+
+            # and we don't optimize it again
+            assert runtime.waitForBackgroundCompilation(timeout=60)
+            assert runtime.timesOptimized == timesOptimized + 1
+        finally:
+            runtime.setTieredCompilation(False)
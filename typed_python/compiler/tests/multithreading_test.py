@@ -11,6 +11,7 @@
 #   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
+import gc
 import os
 import threading
 import time
@@ -23,6 +24,7 @@ from typed_python import (
 )
 
 import typed_python._types as _types
+from typed_python.compiler.runtime import Runtime
 
 
 def thread_apply(f, argtuples):
@@ -43,6 +45,14 @@ def thread_apply(f, argtuples):
     return [results.get(i) for i in range(len(argtuples))]
 
 
+def quiescedBytesOnFreeStore():
+    """Read the (process-wide) free store counter once nothing else should be moving it."""
+    Runtime.singleton().waitForBackgroundCompilation()
+    gc.collect()
+
+    return _types.totalBytesAllocatedOnFreeStore()
+
+
 class AClass(Class):
     x = Member(int)
 
@@ -113,6 +123,42 @@ class TestMultithreading(unittest.TestCase):
 
         self.assertEqual(_types.refcount(instance), 1)
 
+    def test_allocations_freed_on_other_threads(self):
+        @Entrypoint
+        def makeLists(count: int):
+            res = ListOf(ListOf(int))()
+
+            for i in range(count):
+                aList = ListOf(int)()
+                for j in range(i % 20):
+                    aList.append(j)
+                res.append(aList)
+
+            return res
+
+        @Entrypoint
+        def dropLists(lists: ListOf(ListOf(int))):
+            lists.clear()
+
+        dropLists(makeLists(10))
+
+        baseline = quiescedBytesOnFreeStore()
+
+        # allocate on a set of threads that then exit, and release the memory
+        # from some other set of threads, so no block is freed where it was allocated.
+        lists = thread_apply(makeLists, [(10000,)] * 4)
+
+        allocated = quiescedBytesOnFreeStore() - baseline
+
+        self.assertGreater(allocated, 10000 * 4 * 16)
+
+        thread_apply(dropLists, [(lists[(i + 1) % 4],) for i in range(4)])
+        lists = None
+
+        # other tests' objects and threads share the counter with us, so we can
+        # only check that what we allocated went away, not that it's exact.
+        self.assertLess(abs(quiescedBytesOnFreeStore() - baseline), allocated / 20)
+
     def test_serialize_is_parallel(self):
         if os.environ.get('TRAVIS_CI', None):
             return
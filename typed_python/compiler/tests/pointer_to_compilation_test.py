@@ -14,6 +14,7 @@
 
 from typed_python import ListOf, Tuple, Compiled, Entrypoint, Class, Member, Final, NamedTuple, PointerTo, Set
 import typed_python._types as _types
+import threading
 import unittest
 
 
@@ -201,3 +202,44 @@ class TestPointerToCompilation(unittest.TestCase):
             assert P().ElementType is Set(int), P().ElementType
 
         check()
+
+    def test_atomic_pointer_operations(self):
+        def exerciseAtomics(p):
+            p.atomicStore(10)
+            results = ListOf(int)()
+            results.append(p.atomicLoad())
+            results.append(1 if p.compareExchange(11, 20) else 0)
+            results.append(p.atomicLoad())
+            results.append(1 if p.compareExchange(10, 20) else 0)
+            results.append(p.atomicLoad())
+            return results
+
+        for f in [exerciseAtomics, Entrypoint(exerciseAtomics)]:
+            aList = ListOf(int)([0])
+            self.assertEqual(f(aList.pointerUnsafe(0)), [10, 0, 10, 1, 20])
+
+        with self.assertRaisesRegex(TypeError, "only defined on PointerTo"):
+            ListOf(float)([0.0]).pointerUnsafe(0).atomicLoad()
+
+    def test_compare_exchange_from_many_threads(self):
+        @Entrypoint
+        def incrementMany(p: PointerTo(int), count: int) -> None:
+            for _ in range(count):
+                while True:
+                    value = p.atomicLoad()
+                    if p.compareExchange(value, value + 1):
+                        break
+
+        counter = ListOf(int)([0])
+
+        threads = [
+            threading.Thread(target=incrementMany, args=(counter.pointerUnsafe(0), 100000))
+            for _ in range(4)
+        ]
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(counter[0], 400000)
@@ -1152,3 +1152,159 @@ class TestSetCompilation(unittest.TestCase):
 
         with self.assertRaisesRegex(RuntimeError, "set size changed"):
             checkIt()
+
+    def test_set_churn_with_tombstones_compiled_and_interpreted(self):
+        @Entrypoint
+        def churn(s: Set(int), lo: int, hi: int):
+            for i in range(lo, hi):
+                s.add(i)
+
+            for i in range(lo, hi, 2):
+                s.discard(i)
+
+        @Entrypoint
+        def countPresent(s: Set(int), hi: int):
+            res = 0
+            for i in range(hi):
+                if i in s:
+                    res += 1
+            return res
+
+        for layout in ["probed", "swiss"]:
+            _types.setHashTableLayout(layout)
+
+            try:
+                s = Set(int)()
+                model = set()
+
+                for passIx in range(20):
+                    lo = passIx * 500
+
+                    if passIx % 2:
+                        churn(s, lo, lo + 1000)
+                    else:
+                        for i in range(lo, lo + 1000):
+                            s.add(i)
+                        for i in range(lo, lo + 1000, 2):
+                            s.discard(i)
+
+                    model.update(range(lo, lo + 1000))
+                    model.difference_update(range(lo, lo + 1000, 2))
+
+                    self.assertEqual(set(s), model)
+
+                self.assertEqual(_types.hashTableLayout(s), layout)
+                self.assertEqual(countPresent(s, 20000), len(model))
+            finally:
+                _types.setHashTableLayout("probed")
+
+    def test_set_with_wide_hash_table_slots_compiled(self):
+        @Entrypoint
+        def fill(s: Set(int), count: int):
+            for i in range(count):
+                s.add(i)
+
+            for i in range(0, count, 3):
+                s.discard(i)
+
+        _types.setMinimumHashTableSlotBytes(8)
+
+        try:
+            s = Set(int)()
+            fill(s, 5000)
+
+            self.assertEqual(_types.hashTableSlotBytes(s), 8)
+            self.assertEqual(_types.hashTableHashBytes(s), 8)
+        finally:
+            _types.setMinimumHashTableSlotBytes(1)
+
+        self.assertEqual(set(s), {i for i in range(5000) if i % 3})
+
+    def test_set_switching_to_wide_hashes_compiled(self):
+        @Entrypoint
+        def fill(s: Set(str), count: int):
+            for i in range(count):
+                s.add(str(i))
+
+        @Entrypoint
+        def fillBytes(s: Set(bytes), count: int):
+            for i in range(count):
+                s.add(str(i).encode())
+
+        @Entrypoint
+        def toggle(s: Set(bytes), other: Set(bytes)):
+            return s ^ other
+
+        @Entrypoint
+        def countIn(s: Set(str), count: int):
+            res = 0
+            for i in range(count):
+                if str(i) in s:
+                    res += 1
+            return res
+
+        s = Set(str)()
+        b = Set(bytes)()
+        fill(s, 10)
+        fillBytes(b, 10)
+
+        self.assertEqual(_types.hashTableHashBytes(s), 4)
+
+        _types.setMinimumHashTableSlotBytes(8)
+
+        try:
+            fill(s, 2000)
+            fillBytes(b, 2000)
+        finally:
+            _types.setMinimumHashTableSlotBytes(1)
+
+        self.assertEqual(_types.hashTableHashBytes(s), 8)
+        self.assertEqual(_types.hashTableHashBytes(b), 8)
+
+        self.assertEqual(set(s), {str(i) for i in range(2000)})
+        self.assertEqual(
+            set(toggle(b, Set(bytes)([b"1", b"2", b"x"]))),
+            {str(i).encode() for i in range(2000)} - {b"1", b"2"} | {b"x"}
+        )
+        self.assertEqual(countIn(s, 3000), 2000)
+
+        for i in range(0, 2000, 2):
+            s.discard(str(i))
+
+        self.assertEqual(countIn(s, 3000), 1000)
+
+    def test_small_set_compiled(self):
+        @Entrypoint
+        def fill(s: Set(str), count: int):
+            for i in range(count):
+                s.add(str(i))
+
+        @Entrypoint
+        def countIn(s: Set(str), count: int):
+            res = 0
+            for i in range(count):
+                if str(i) in s:
+                    res += 1
+            return res
+
+        @Entrypoint
+        def discardAll(s: Set(str), count: int):
+            for i in range(count):
+                s.discard(str(i))
+
+        s = Set(str)()
+        fill(s, 6)
+
+        self.assertEqual(_types.hashTableSlotBytes(s), 0)
+        self.assertEqual(countIn(s, 100), 6)
+
+        s.add("10")
+        discardAll(s, 3)
+
+        self.assertEqual(set(s), {"3", "4", "5", "10"})
+        self.assertEqual(countIn(s, 100), 4)
+
+        fill(s, 50)
+
+        self.assertEqual(_types.hashTableSlotBytes(s), 1)
+        self.assertEqual(set(s), {str(i) for i in range(50)})
@@ -439,6 +439,22 @@ class IntWrapper(ArithmeticTypeWrapper):
                 float,
                 runtime_functions.pow_uint64_uint64.call(left.toUInt64().nonref_expr, right.toUInt64().nonref_expr)
             ).toFloat64()
+        if (
+            (op.matches.LShift or op.matches.RShift)
+            and not isSignedInt(left.expr_type.typeRepresentation)
+            and right.isConstant
+            and 0 <= right.constantValue < bitness(self.typeRepresentation)
+        ):
+            # an unsigned shift by a constant that's in range can't fail, so
+            # there's no need to call into the runtime.
+            return context.pushPod(
+                self,
+                native_ast.Expression.Binop(
+                    left=left.nonref_expr,
+                    right=right.nonref_expr,
+                    op=pyOpToNative[op]
+                )
+            )
         if op.matches.LShift:
             if isSignedInt(left.expr_type.typeRepresentation):
                 return context.pushPod(
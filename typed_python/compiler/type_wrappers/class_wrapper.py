@@ -132,6 +132,10 @@ class ClassWrapper(ClassOrAlternativeWrapperMixin, RefcountedWrapper):
     BYTES_BEFORE_INIT_BITS = 16  # the refcount and vtable are both 8 byte integers.
     CAN_BE_NULL = False
 
+    # the refcount of instances we construct on the stack. It's far too big for
+    # decrefs to ever bring it to zero, which would try to free the stack.
+    STACK_INSTANCE_REFCOUNT = 2 ** 62
+
     def __init__(self, t):
         super().__init__(t)
 
@@ -498,6 +502,12 @@ class ClassWrapper(ClassOrAlternativeWrapperMixin, RefcountedWrapper):
     def generateNativeDestructorFunction(self, context, out, instance):
         instance = self.stripClassDispatchIndex(context, instance)
 
+        self.convert_destroy_members(context, instance)
+
+        context.pushEffect(runtime_functions.free.call(self.get_layout_pointer(instance).cast(native_ast.UInt8Ptr)))
+
+    def convert_destroy_members(self, context, instance):
+        """Destroy the initialized members of 'instance', without freeing it."""
         for i in range(len(self.typeRepresentation.MemberTypes)):
             if not typeWrapper(self.typeRepresentation.MemberTypes[i]).is_pod:
                 with context.ifelse(context.pushPod(bool, self.isInitializedNativeExpr(instance, i))) as (true_block, false_block):
@@ -506,8 +516,6 @@ class ClassWrapper(ClassOrAlternativeWrapperMixin, RefcountedWrapper):
                             self.convert_attribute(context, instance, i, nocheck=True).convert_destroy()
                         )
 
-        context.pushEffect(runtime_functions.free.call(self.get_layout_pointer(instance).cast(native_ast.UInt8Ptr)))
-
     def memberPtr(self, instance, ix):
         return (
             self.get_layout_pointer(instance)
@@ -1355,7 +1363,44 @@ class ClassWrapper(ClassOrAlternativeWrapperMixin, RefcountedWrapper):
                 ).call(new_class, *args)
         )
 
-    def generateConstructor(self, context, out, argNames, *args):
+    def canConstructOnStack(self, attributes):
+        """Could an instance that we only access through 'attributes' live on the stack?
+
+        It can if none of the code that constructs it or touches those attributes
+        ever gets the instance itself, which would let it hold onto a reference.
+        """
+        for methodName in ['__init__', '__getattr__', '__setattr__', '__delattr__']:
+            if self.has_method(methodName):
+                return False
+
+        return all(
+            a in self.nameToIndex and a not in self.typeRepresentation.PropertyFunctions
+            for a in attributes
+        )
+
+    def stackInstanceType(self):
+        """The native type of stack storage big enough to hold an instance."""
+        return native_ast.Type.Array(
+            element_type=native_ast.Int64,
+            count=(_types.bytecount(self.typeRepresentation.HeldClass) + self.BYTES_BEFORE_INIT_BITS + 7) // 8
+        )
+
+    def convert_type_call_on_stack(self, context, storage, kwargs):
+        """Construct an instance in 'storage', a pointer to a 'stackInstanceType'.
+
+        The instance's refcount starts at STACK_INSTANCE_REFCOUNT, so it never gets
+        destroyed or freed through refcounting. The caller is responsible for
+        calling 'convert_destroy_members' on it once nothing can refer to it.
+        """
+        out = context.allocateUninitializedSlot(self)
+
+        self.generateConstructor(context, out, tuple(kwargs), *kwargs.values(), storage=storage)
+
+        context.markUninitializedSlotInitialized(out)
+
+        return out
+
+    def generateConstructor(self, context, out, argNames, *args, storage=None):
         """Generate native code to initialize a Class object from a set of args/kwargs.
 
         Args:
@@ -1363,17 +1408,24 @@ class ClassWrapper(ClassOrAlternativeWrapperMixin, RefcountedWrapper):
             out - a TypedExpression pointing to an uninitialized Class instance.
             argNames - a tuple of (None|str) with the names of the args as they were passed.
             *args - Typed expressions representing each argument passed to us.
+            storage - if not None, a native pointer to memory to build the instance in,
+                rather than allocating it on the heap.
         """
+        if storage is None:
+            memory = runtime_functions.malloc.call(
+                native_ast.const_int_expr(
+                    _types.bytecount(self.typeRepresentation.HeldClass) + self.BYTES_BEFORE_INIT_BITS
+                )
+            )
+            refcount = 1
+        else:
+            memory = storage
+            refcount = self.STACK_INSTANCE_REFCOUNT
+
         context.pushEffect(
-            out.expr.store(
-                runtime_functions.malloc.call(
-                    native_ast.const_int_expr(
-                        _types.bytecount(self.typeRepresentation.HeldClass) + self.BYTES_BEFORE_INIT_BITS
-                    )
-                ).cast(self.getNativeLayoutType())
-            ) >>
+            out.expr.store(memory.cast(self.getNativeLayoutType())) >>
             # store a refcount
-            out.expr.load().ElementPtrIntegers(0, 0).store(native_ast.const_int_expr(1)) >>
+            out.expr.load().ElementPtrIntegers(0, 0).store(native_ast.const_int_expr(refcount)) >>
             # store the vtable
             out.expr.load().ElementPtrIntegers(0, 1).store(self.vtableExpr)
         )
@@ -20,7 +20,7 @@ from typed_python.compiler.type_wrappers.bound_method_wrapper import BoundMethod
 from typed_python.compiler.type_wrappers.util import min
 from typed_python.compiler.typed_expression import TypedExpression
 
-from typed_python import Tuple
+from typed_python import Tuple, PointerTo
 
 import typed_python.compiler.native_ast as native_ast
 import typed_python.compiler
@@ -91,6 +91,16 @@ def const_dict_gte(left, right):
 
 
 def const_dict_getitem(constDict, key):
+    # trees are searched by key in the runtime. Looking their items up by index
+    # would walk down from the root on every probe of the binary search.
+    if constDict.is_tree_unsafe():
+        valuePtr = constDict.lookup_value_ptr_unsafe(key)
+
+        if not valuePtr:
+            raise KeyError(key)
+
+        return valuePtr.get()
+
     # perform a binary search
     lowIx = 0
     highIx = len(constDict)
@@ -111,6 +121,14 @@ def const_dict_getitem(constDict, key):
 
 
 def const_dict_get(constDict, key, default):
+    if constDict.is_tree_unsafe():
+        valuePtr = constDict.lookup_value_ptr_unsafe(key)
+
+        if not valuePtr:
+            return default
+
+        return valuePtr.get()
+
     # perform a binary search
     lowIx = 0
     highIx = len(constDict)
@@ -131,6 +149,9 @@ def const_dict_get(constDict, key, default):
 
 
 def const_dict_contains(constDict, key):
+    if constDict.is_tree_unsafe():
+        return bool(constDict.lookup_value_ptr_unsafe(key))
+
     # perform a binary search
     lowIx = 0
     highIx = len(constDict)
@@ -186,27 +207,63 @@ class ConstDictWrapperBase(RefcountedWrapper):
     def on_refcount_zero(self, context, instance):
         assert instance.isReference
 
-        if self.keyType.is_pod and self.valueType.is_pod:
-            return runtime_functions.free.call(instance.nonref_expr.cast(native_ast.UInt8Ptr))
-        else:
-            return (
-                context.converter.defineNativeFunction(
-                    "destructor_" + str(self.constDictType),
-                    ('destructor', self),
-                    [self],
-                    typeWrapper(type(None)),
-                    self.generateNativeDestructorFunction
-                )
-                .call(instance)
+        return (
+            context.converter.defineNativeFunction(
+                "destructor_" + str(self.constDictType),
+                ('destructor', self),
+                [self],
+                typeWrapper(type(None)),
+                self.generateNativeDestructorFunction
             )
+            .call(instance)
+        )
 
     def generateNativeDestructorFunction(self, context, out, inst):
-        with context.loop(inst.convert_len()) as i:
-            self.convert_getkey_by_index_unsafe(context, inst, i).convert_destroy()
-            self.convert_getvalue_by_index_unsafe(context, inst, i).convert_destroy()
+        with context.ifelse(inst.nonref_expr.ElementPtrIntegers(0, 3).load()) as (isTree, isFlat):
+            with isTree:
+                # tree records share their subtrees, so let the runtime release them
+                context.pushEffect(
+                    runtime_functions.const_dict_destroy_record.call(
+                        inst.nonref_expr.cast(native_ast.VoidPtr),
+                        context.getTypePointer(self.constDictType)
+                    )
+                )
 
-        context.pushEffect(
-            runtime_functions.free.call(inst.nonref_expr.cast(native_ast.UInt8Ptr))
+            with isFlat:
+                if not (self.keyType.is_pod and self.valueType.is_pod):
+                    with context.loop(inst.convert_len()) as i:
+                        self.convert_getkey_by_index_unsafe(context, inst, i).convert_destroy()
+                        self.convert_getvalue_by_index_unsafe(context, inst, i).convert_destroy()
+
+                context.pushEffect(
+                    runtime_functions.free.call(inst.nonref_expr.cast(native_ast.UInt8Ptr))
+                )
+
+    def convert_kv_pair_ptr(self, context, expr, item):
+        """Return a native UInt8 pointer to the (key, value) pair at index 'item' of 'expr'.
+
+        Big ConstDicts that have had a few keys added or removed are stored as trees
+        (their 'subpointers' field is nonzero), in which case we ask the runtime to walk
+        down to the leaf holding the pair. Iterators compute the pointer for one past
+        the last item (and for empty dicts) before checking it, so those cases have
+        to be safe to compute, if not to dereference.
+        """
+        flatPtr = expr.nonref_expr.ElementPtrIntegers(0, 4).elemPtr(
+            item.nonref_expr.mul(native_ast.const_int_expr(self.kvBytecount))
+        )
+
+        return native_ast.Expression.Branch(
+            cond=expr.nonref_expr,
+            true=native_ast.Expression.Branch(
+                cond=expr.nonref_expr.ElementPtrIntegers(0, 3).load().eq(0),
+                true=flatPtr,
+                false=runtime_functions.const_dict_kv_pair_ptr.call(
+                    expr.nonref_expr.cast(native_ast.VoidPtr),
+                    context.getTypePointer(self.constDictType),
+                    item.nonref_expr
+                )
+            ),
+            false=flatPtr
         )
 
 
@@ -215,7 +272,10 @@ class ConstDictWrapper(ConstDictWrapperBase):
         super().__init__(constDictType, None)
 
     def convert_attribute(self, context, instance, attr):
-        if attr in ("get_key_by_index_unsafe", "get_value_by_index_unsafe", "keys", "values", "items", "get"):
+        if attr in (
+            "get_key_by_index_unsafe", "get_value_by_index_unsafe", "is_tree_unsafe", "lookup_value_ptr_unsafe",
+            "keys", "values", "items", "get"
+        ):
             return instance.changeType(BoundMethodWrapper.Make(self, attr))
 
         return super().convert_attribute(context, instance, attr)
@@ -276,31 +336,64 @@ class ConstDictWrapper(ConstDictWrapperBase):
 
                 return self.convert_getvalue_by_index_unsafe(context, instance, ix)
 
+        if methodname == "is_tree_unsafe" and not args:
+            return self.convert_is_tree(context, instance)
+
+        if methodname == "lookup_value_ptr_unsafe":
+            if len(args) == 1:
+                key = args[0].convert_to_type(self.keyType, ConversionLevel.UpcastContainers)
+                if key is None:
+                    return
+
+                return self.convert_lookup_value_ptr(context, instance, key)
+
         return super().convert_method_call(context, instance, methodname, args, kwargs)
 
+    def convert_is_tree(self, context, expr):
+        """Is 'expr' stored as a tree, rather than as a flat sorted array of pairs?"""
+        return context.pushPod(
+            bool,
+            native_ast.Expression.Branch(
+                cond=expr.nonref_expr,
+                true=expr.nonref_expr.ElementPtrIntegers(0, 3).load().neq(0),
+                false=native_ast.const_bool_expr(False)
+            )
+        )
+
+    def convert_lookup_value_ptr(self, context, expr, key):
+        """Return a PointerTo(ValueType) to the value for 'key' in 'expr', which must be a tree, or a null pointer."""
+        if not key.isReference:
+            key = context.pushMove(key)
+
+        return context.pushPod(
+            PointerTo(self.constDictType.ValueType),
+            runtime_functions.const_dict_lookup_value.call(
+                expr.nonref_expr.cast(native_ast.VoidPtr),
+                context.getTypePointer(self.constDictType),
+                key.expr.cast(native_ast.VoidPtr)
+            ).cast(self.valueType.getNativeLayoutType().pointer())
+        )
+
     def convert_getkey_by_index_unsafe(self, context, expr, item):
         return context.pushReference(
             self.keyType,
-            expr.nonref_expr.ElementPtrIntegers(0, 4).elemPtr(
-                item.nonref_expr.mul(native_ast.const_int_expr(self.kvBytecount))
-            ).cast(self.keyType.getNativeLayoutType().pointer())
+            self.convert_kv_pair_ptr(context, expr, item)
+            .cast(self.keyType.getNativeLayoutType().pointer())
         )
 
     def convert_getitem_by_index_unsafe(self, context, expr, item):
         return context.pushReference(
             self.itemType,
-            expr.nonref_expr.ElementPtrIntegers(0, 4).elemPtr(
-                item.nonref_expr.mul(native_ast.const_int_expr(self.kvBytecount))
-            ).cast(self.itemType.getNativeLayoutType().pointer())
+            self.convert_kv_pair_ptr(context, expr, item)
+            .cast(self.itemType.getNativeLayoutType().pointer())
         )
 
     def convert_getvalue_by_index_unsafe(self, context, expr, item):
         return context.pushReference(
             self.valueType,
-            expr.nonref_expr.ElementPtrIntegers(0, 4).elemPtr(
-                item.nonref_expr.mul(native_ast.const_int_expr(self.kvBytecount))
-                .add(native_ast.const_int_expr(self.keyBytecount))
-            ).cast(self.valueType.getNativeLayoutType().pointer())
+            self.convert_kv_pair_ptr(context, expr, item)
+            .elemPtr(native_ast.const_int_expr(self.keyBytecount))
+            .cast(self.valueType.getNativeLayoutType().pointer())
         )
 
     def convert_bin_op(self, context, left, op, right, inplace):
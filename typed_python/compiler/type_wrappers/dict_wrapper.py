@@ -20,7 +20,7 @@ from typed_python.compiler.type_wrappers.bound_method_wrapper import BoundMethod
 from typed_python.compiler.type_wrappers.wrapper import Wrapper
 from typed_python.compiler.type_wrappers.hash_table_implementation import table_next_slot, table_clear, table_contains, \
     dict_delitem, dict_getitem, dict_get, dict_setitem
-from typed_python import Tuple, PointerTo, Int32, UInt8, Dict, ConstDict
+from typed_python import Tuple, PointerTo, UInt8, Dict, ConstDict
 
 import typed_python.compiler.native_ast as native_ast
 import typed_python.compiler
@@ -133,12 +133,14 @@ class DictWrapperBase(RefcountedWrapper):
             ('items_populated', native_ast.UInt8Ptr),
             ('items_reserved', native_ast.Int64),
             ('top_item_slot', native_ast.Int64),
-            ('hash_table_slots', native_ast.Int32Ptr),
-            ('hash_table_hashes', native_ast.Int32Ptr),
+            ('hash_table_slots', native_ast.UInt8Ptr),
+            ('item_hashes', native_ast.UInt8Ptr),
             ('hash_table_size', native_ast.Int64),
             ('hash_table_count', native_ast.Int64),
             ('hash_table_empty_slots', native_ast.Int64),
-            ('setdefault', native_ast.Int64)
+            ('hash_table_control', native_ast.UInt8Ptr),
+            ('hash_table_slot_bytes', native_ast.Int64),
+            ('item_hash_bytes', native_ast.Int64)
         ), name="DictWrapper").pointer()
 
     def on_refcount_zero(self, context, instance):
@@ -179,7 +181,7 @@ class DictWrapper(DictWrapperBase):
                 "getItemByIndexUnsafe", "getKeyByIndexUnsafe", "getValueByIndexUnsafe", "deleteItemByIndexUnsafe",
                 "initializeValueByIndexUnsafe", "assignValueByIndexUnsafe",
                 "initializeKeyByIndexUnsafe", "_allocateNewSlotUnsafe", "_resizeTableUnsafe",
-                "_top_item_slot", "_compressItemTableUnsafe", "get", "items", "keys", "values", "setdefault",
+                "_compressItemTableUnsafe", "get", "items", "keys", "values", "setdefault",
                 "pop", "clear", "copy", "update"):
             return expr.changeType(BoundMethodWrapper.Make(self, attr))
 
@@ -203,13 +205,13 @@ class DictWrapper(DictWrapperBase):
 
         if attr == '_hash_table_slots':
             return context.pushPod(
-                PointerTo(Int32),
+                PointerTo(UInt8),
                 expr.nonref_expr.ElementPtrIntegers(0, 5).load()
             )
 
-        if attr == '_hash_table_hashes':
+        if attr == '_item_hashes':
             return context.pushPod(
-                PointerTo(Int32),
+                PointerTo(UInt8),
                 expr.nonref_expr.ElementPtrIntegers(0, 6).load()
             )
 
@@ -231,6 +233,24 @@ class DictWrapper(DictWrapperBase):
                 expr.nonref_expr.ElementPtrIntegers(0, 9).load()
             )
 
+        if attr == '_hash_table_control':
+            return context.pushPod(
+                PointerTo(UInt8),
+                expr.nonref_expr.ElementPtrIntegers(0, 10).load()
+            )
+
+        if attr == '_hash_table_slot_bytes':
+            return context.pushPod(
+                int,
+                expr.nonref_expr.ElementPtrIntegers(0, 11).load()
+            )
+
+        if attr == '_item_hash_bytes':
+            return context.pushPod(
+                int,
+                expr.nonref_expr.ElementPtrIntegers(0, 12).load()
+            )
+
         return super().convert_attribute(context, expr, attr)
 
     @staticmethod
@@ -362,10 +382,11 @@ class DictWrapper(DictWrapperBase):
 
             if methodname == "_allocateNewSlotUnsafe":
                 return context.pushPod(
-                    Int32,
+                    int,
                     runtime_functions.table_allocate_new_slot.call(
                         instance.nonref_expr.cast(native_ast.VoidPtr),
-                        context.constant(self.kvBytecount)
+                        context.constant(self.kvBytecount),
+                        context.getTypePointer(self.dictType.KeyType)
                     )
                 )
 
@@ -565,6 +586,7 @@ class DictWrapper(DictWrapperBase):
             runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 2).load().cast(native_ast.UInt8Ptr)) >>
             runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 5).load().cast(native_ast.UInt8Ptr)) >>
             runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 6).load().cast(native_ast.UInt8Ptr)) >>
+            runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 10).load().cast(native_ast.UInt8Ptr)) >>
             runtime_functions.free.call(inst.nonref_expr.cast(native_ast.UInt8Ptr))
         )
 
@@ -12,13 +12,24 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from typed_python import UInt64
+from typed_python import Int8, Int16, Int32, UInt8, UInt16, UInt32, UInt64, Float32
+from typed_python.compiler.conversion_level import ConversionLevel
+from typed_python.compiler.native_ast import VoidPtr
 from typed_python.compiler.type_wrappers.compilable_builtin import CompilableBuiltin
+import typed_python.compiler.type_wrappers.runtime_functions as runtime_functions
 
 
+# These have to match the constants in hash_table_layout.hpp, which describes
+# the layout of the table and implements the same probing schemes. A table
+# whose '_hash_table_control' is null is probed the way python's dicts are;
+# otherwise it's a Swiss table.
 EMPTY = -1
 DELETED = -2
 PERTURB_SHIFT = 5
+CONTROL_EMPTY = 0x80
+CONTROL_DELETED = 0xFE
+GROUP_WIDTH = 16
+SMALL_TABLE_ITEMS = 8
 
 
 class NativeHash(CompilableBuiltin):
@@ -45,68 +56,382 @@ class NativeHash(CompilableBuiltin):
         return super().convert_call(context, instance, args, kwargs)
 
 
+class NativeWideHash(CompilableBuiltin):
+    """Hash a typed python value to 64 bits, the way 'Type::wideHash' does.
+
+    Tables whose item indices are int64 hash their keys with this rather than
+    'NativeHash'.
+    """
+    def __eq__(self, other):
+        return isinstance(other, NativeWideHash)
+
+    def __hash__(self):
+        return hash("NativeWideHash")
+
+    def convert_call(self, context, instance, args, kwargs):
+        if len(args) == 1:
+            return self.convert_wide_hash(context, args[0])
+
+        return super().convert_call(context, instance, args, kwargs)
+
+    def convert_wide_hash(self, context, arg):
+        T = arg.expr_type.typeRepresentation
+
+        if T in (bool, Int8, Int16, Int32, int, UInt8, UInt16, UInt32, UInt64):
+            return arg.convert_to_type(int, ConversionLevel.New)
+
+        if T in (Float32, float):
+            arg = arg.convert_to_type(float, ConversionLevel.New)
+
+            if arg is None:
+                return None
+
+            return context.pushPod(int, runtime_functions.wide_hash_float64.call(arg.nonref_expr))
+
+        if T is str:
+            return context.pushPod(int, runtime_functions.wide_hash_string.call(arg.nonref_expr.cast(VoidPtr)))
+
+        if T is bytes:
+            return context.pushPod(int, runtime_functions.wide_hash_bytes.call(arg.nonref_expr.cast(VoidPtr)))
+
+        if getattr(T, '__typed_python_category__', None) == "OneOf":
+            return arg.expr_type.unwrap(
+                context,
+                arg,
+                lambda realInstance: self.convert_wide_hash(context, realInstance)
+            )
+
+        hashed = arg.convert_hash()
+
+        if hashed is None:
+            return None
+
+        return hashed.convert_to_type(int, ConversionLevel.New)
+
+
+def key_hash(hashBytes, key):
+    """Hash 'key' the way a table whose '_item_hash_bytes' is 'hashBytes' hashes its items.
+
+    This takes the width rather than the table so that callers don't pay to
+    pass the table along.
+    """
+    if hashBytes == 8:
+        return NativeWideHash()(key)
+
+    return int(NativeHash()(key))
+
+
+def mix_hash(itemHash):
+    """Spread the bits of a hash over 64 bits, like 'hash_table_layout::mixHash'."""
+    return UInt64(itemHash) * UInt64(0x9E3779B97F4A7C15)
+
+
+def control_byte_for(mixed):
+    return (mixed >> UInt64(25)) & UInt64(0x7F)
+
+
+# we don't have SIMD instructions in compiled code, so we check the 16 control
+# bytes of a group as two 64-bit words, one byte per 'lane'. The masks are
+# written out inline because module-level constants have to fit in an int64,
+# and shift amounts are UInt64 so that the shifts stay unsigned.
+
+
+def word_match_byte(word, byte):
+    """Set the high bit of each byte in 'word' that equals 'byte'.
+
+    This can also set the high bit of a byte that follows a genuine match, so
+    callers have to check the byte itself.
+    """
+    x = word ^ (UInt64(0x0101010101010101) * byte)
+    return (x - UInt64(0x0101010101010101)) & ~x & UInt64(0x8080808080808080)
+
+
+def word_match_empty(word):
+    # CONTROL_EMPTY is the only control byte with the high bit set and bit 1 clear.
+    return word & (~word << UInt64(6)) & UInt64(0x8080808080808080)
+
+
+def word_match_empty_or_deleted(word):
+    return word & UInt64(0x8080808080808080)
+
+
+def word_lowest_match(mask):
+    """Return the index of the lowest byte of 'mask' that has its high bit set."""
+    lowest = mask & (~mask + UInt64(1))
+    return ((lowest >> UInt64(7)) * UInt64(0x0001020304050607)) >> UInt64(56)
+
+
+def table_get_slot(instance, pos):
+    """Return the item index held at 'pos' in the hashtable, or EMPTY or DELETED."""
+    slotBytes = instance._hash_table_slot_bytes
+
+    if slotBytes == 1:
+        return int(instance._hash_table_slots.cast(Int8)[pos])
+    if slotBytes == 2:
+        return int(instance._hash_table_slots.cast(Int16)[pos])
+    if slotBytes == 4:
+        return int(instance._hash_table_slots.cast(Int32)[pos])
+
+    return instance._hash_table_slots.cast(int)[pos]
+
+
+def table_set_slot(instance, pos, slot):
+    slotBytes = instance._hash_table_slot_bytes
+
+    if slotBytes == 1:
+        instance._hash_table_slots.cast(Int8)[pos] = slot
+    elif slotBytes == 2:
+        instance._hash_table_slots.cast(Int16)[pos] = slot
+    elif slotBytes == 4:
+        instance._hash_table_slots.cast(Int32)[pos] = slot
+    else:
+        instance._hash_table_slots.cast(int)[pos] = slot
+
+
+def table_slot_fits(instance, slot):
+    slotBytes = instance._hash_table_slot_bytes
+
+    if slotBytes == 1:
+        return slot <= 0x7F
+    if slotBytes == 2:
+        return slot <= 0x7FFF
+    if slotBytes == 4:
+        return slot <= 0x7FFFFFFF
+
+    return True
+
+
 def table_add_slot(instance, itemHash, slot):
-    if (instance._hash_table_count * 2 + 1 > instance._hash_table_size or
-            instance._hash_table_empty_slots < (instance._hash_table_size >> 2) + 1):
+    if instance._item_hash_bytes == 8:
+        instance._item_hashes.cast(int)[slot] = itemHash
+    else:
+        instance._item_hashes.cast(Int32)[slot] = itemHash
+
+    instance._items_populated[slot] = 1
+    instance._hash_table_count += 1
+
+    # resizing places every item, including this one, and builds the hashtable
+    # for tables that have outgrown scanning their items, or widens its item
+    # indices if 'slot' doesn't fit.
+    if not instance._hash_table_slots:
+        if slot >= SMALL_TABLE_ITEMS:
+            instance._resizeTableUnsafe()
+        return
+
+    if (instance._hash_table_count * 2 - 1 > instance._hash_table_size or
+            instance._hash_table_empty_slots < (instance._hash_table_size >> 2) + 1 or
+            not table_slot_fits(instance, slot)):
         instance._resizeTableUnsafe()
+        return
 
-    if itemHash < 0:
-        itemHash = -itemHash
+    control = instance._hash_table_control
 
-    mask = UInt64(instance._hash_table_size) - UInt64(1)
-    perturb = UInt64(itemHash)
-    offset = UInt64(itemHash)
+    if not control:
+        mask = UInt64(instance._hash_table_size) - UInt64(1)
+        perturb = UInt64(itemHash)
+        offset = UInt64(itemHash)
+
+        while True:
+            existing = table_get_slot(instance, offset & mask)
+
+            if existing == EMPTY or existing == DELETED:
+                if existing == EMPTY:
+                    instance._hash_table_empty_slots -= 1
+
+                table_set_slot(instance, offset & mask, slot)
+
+                return
+
+            offset = (offset << UInt64(2)) + offset + perturb + UInt64(1)
+            perturb >>= UInt64(PERTURB_SHIFT)
+
+    mixed = mix_hash(itemHash)
+    mask = UInt64(instance._hash_table_size) // UInt64(GROUP_WIDTH) - UInt64(1)
+    group = (mixed >> UInt64(32)) & mask
+    step = UInt64(1)
 
     while True:
-        if (
-            instance._hash_table_slots[offset & mask] == EMPTY
-            or instance._hash_table_slots[offset & mask] == DELETED
-        ):
-            if instance._hash_table_slots[offset & mask] == EMPTY:
+        base = group * UInt64(GROUP_WIDTH)
+        words = (control + base).cast(UInt64)
+
+        # look at each half of the group in turn. This is written out rather
+        # than looping over range(2) so that it compiles to straight-line code.
+        available = word_match_empty_or_deleted(words[0])
+
+        if not available:
+            base += UInt64(8)
+            available = word_match_empty_or_deleted(words[1])
+
+        if available:
+            pos = base + word_lowest_match(available)
+
+            if control[pos] == CONTROL_EMPTY:
                 instance._hash_table_empty_slots -= 1
 
-            instance._hash_table_slots[offset & mask] = slot
-            instance._hash_table_hashes[offset & mask] = itemHash
-            instance._items_populated[slot] = 1
-            instance._hash_table_count += 1
+            control[pos] = control_byte_for(mixed)
+            table_set_slot(instance, pos, slot)
 
             return
 
-        offset = UInt64(offset << 2) + offset + perturb + UInt64(1)
-        perturb = UInt64(perturb >> PERTURB_SHIFT)
+        group = (group + step) & mask
+        step += UInt64(1)
 
 
-def table_slot_for_key(instance, itemHash, item):
-    slots = instance._hash_table_slots
+def scan_for_key(instance, hashes, itemHash, item):
+    populated = instance._items_populated
+    topSlot = instance._top_item_slot
+    slotIx = 0
 
-    if not slots:
-        return -1
+    while slotIx < topSlot:
+        if populated[slotIx] and hashes[slotIx] == itemHash:
+            if instance.getKeyByIndexUnsafe(slotIx) == item:
+                return slotIx
+
+        slotIx += 1
 
-    if itemHash < 0:
-        itemHash = -itemHash
+    return -1
+
+
+def table_scan_for_key(instance, itemHash, item):
+    """Return the slot of 'item' in a table with no hashtable, or -1."""
+    if instance._item_hash_bytes == 8:
+        return scan_for_key(instance, instance._item_hashes.cast(int), itemHash, item)
+
+    return scan_for_key(instance, instance._item_hashes.cast(Int32), itemHash, item)
+
+
+def word_position_for_key(instance, word, base, controlByte, item):
+    """Return the position of 'item' among the 8 slots starting at 'base', whose control bytes are 'word', or -1."""
+    matches = word_match_byte(word, controlByte)
+
+    while matches:
+        pos = base + word_lowest_match(matches)
+        matches &= matches - UInt64(1)
+
+        if instance._hash_table_control[pos] == controlByte:
+            if instance.getKeyByIndexUnsafe(table_get_slot(instance, pos)) == item:
+                return int(pos)
+
+    return -1
 
+
+def probed_search(instance, slots, hashes, itemHash, item, wantPosition):
     mask = UInt64(instance._hash_table_size) - UInt64(1)
     perturb = UInt64(itemHash)
     offset = UInt64(itemHash)
 
     while True:
-        slotIndex = int((slots + (offset & mask)).get())
+        slotIndex = int(slots[offset & mask])
 
         if slotIndex == EMPTY:
             return -1
 
-        if slotIndex != DELETED and (instance._hash_table_hashes + (offset & mask)).get() == itemHash:
+        if slotIndex != DELETED and hashes[slotIndex] == itemHash:
             if instance.getKeyByIndexUnsafe(slotIndex) == item:
+                if wantPosition:
+                    return int(offset & mask)
                 return slotIndex
 
-        offset = UInt64(offset << 2) + offset + perturb + UInt64(1)
-        perturb = UInt64(perturb >> PERTURB_SHIFT)
+        offset = (offset << UInt64(2)) + offset + perturb + UInt64(1)
+        perturb >>= UInt64(PERTURB_SHIFT)
 
     # not necessary, but currently we don't realize that the while loop
     # never exits, and so we think there's a possibility we return None
     return 0
 
 
+def table_probed_search(instance, itemHash, item, wantPosition):
+    """Find 'item' in a probed hashtable, returning its position or its item index, or -1.
+
+    We pick the width of the item indices and of the hashes once, rather than
+    on every probe, and lookups get the item index back directly, because each
+    extra call on this path shows up in the time of a dict lookup.
+    """
+    slotBytes = instance._hash_table_slot_bytes
+    slots = instance._hash_table_slots
+
+    if instance._item_hash_bytes == 8:
+        hashes = instance._item_hashes.cast(int)
+
+        if slotBytes == 1:
+            return probed_search(instance, slots.cast(Int8), hashes, itemHash, item, wantPosition)
+        if slotBytes == 2:
+            return probed_search(instance, slots.cast(Int16), hashes, itemHash, item, wantPosition)
+        if slotBytes == 4:
+            return probed_search(instance, slots.cast(Int32), hashes, itemHash, item, wantPosition)
+
+        return probed_search(instance, slots.cast(int), hashes, itemHash, item, wantPosition)
+
+    narrowHashes = instance._item_hashes.cast(Int32)
+
+    if slotBytes == 1:
+        return probed_search(instance, slots.cast(Int8), narrowHashes, itemHash, item, wantPosition)
+    if slotBytes == 2:
+        return probed_search(instance, slots.cast(Int16), narrowHashes, itemHash, item, wantPosition)
+    if slotBytes == 4:
+        return probed_search(instance, slots.cast(Int32), narrowHashes, itemHash, item, wantPosition)
+
+    return probed_search(instance, slots.cast(int), narrowHashes, itemHash, item, wantPosition)
+
+
+def table_position_for_key(instance, itemHash, item):
+    """Return the position of 'item' in the hashtable, or -1.
+
+    The table must have a hashtable.
+    """
+    control = instance._hash_table_control
+
+    if not control:
+        return table_probed_search(instance, itemHash, item, True)
+
+    mixed = mix_hash(itemHash)
+    controlByte = control_byte_for(mixed)
+    mask = UInt64(instance._hash_table_size) // UInt64(GROUP_WIDTH) - UInt64(1)
+    group = (mixed >> UInt64(32)) & mask
+    step = UInt64(1)
+
+    while True:
+        base = group * UInt64(GROUP_WIDTH)
+        words = (control + base).cast(UInt64)
+
+        pos = word_position_for_key(instance, words[0], base, controlByte, item)
+
+        if pos >= 0:
+            return pos
+
+        pos = word_position_for_key(instance, words[1], base + UInt64(8), controlByte, item)
+
+        if pos >= 0:
+            return pos
+
+        # an item can only live past a group that was full when it was added,
+        # and a group that has ever been full never has an EMPTY slot again.
+        if word_match_empty(words[0]) or word_match_empty(words[1]):
+            return -1
+
+        group = (group + step) & mask
+        step += UInt64(1)
+
+    # not necessary, but currently we don't realize that the while loop
+    # never exits, and so we think there's a possibility we return None
+    return 0
+
+
+def table_slot_for_key(instance, itemHash, item):
+    if not instance._hash_table_slots:
+        return table_scan_for_key(instance, itemHash, item)
+
+    if not instance._hash_table_control:
+        return table_probed_search(instance, itemHash, item, False)
+
+    pos = table_position_for_key(instance, itemHash, item)
+
+    if pos == -1:
+        return -1
+
+    return table_get_slot(instance, pos)
+
+
 def table_next_slot(instance, slotIx):
     slotIx += 1
 
@@ -122,49 +447,48 @@ def table_remove_key(instance, item, itemHash, raises):
     if instance._items_reserved > (instance._hash_table_count + 2) * 4:
         instance._compressItemTableUnsafe()
 
-    if instance._hash_table_count < instance._hash_table_size >> 3:
+    if instance._hash_table_slots and instance._hash_table_count < instance._hash_table_size >> 3:
         instance._resizeTableUnsafe()
 
-    slots = instance._hash_table_slots
-
-    if not slots:
-        if raises:
-            raise KeyError(item)
-        else:
-            return 0
+    if not instance._hash_table_slots:
+        slotIndex = table_scan_for_key(instance, itemHash, item)
 
-    if itemHash < 0:
-        itemHash = -itemHash
-
-    mask = UInt64(instance._hash_table_size) - UInt64(1)
-    perturb = UInt64(itemHash)
-    offset = UInt64(itemHash)
-
-    while True:
-        slotIndex = int((slots + (offset & mask)).get())
+        if slotIndex == -1:
+            if raises:
+                raise KeyError(item)
+            else:
+                return 0
+    else:
+        pos = table_position_for_key(instance, itemHash, item)
 
-        if slotIndex == EMPTY:
+        if pos == -1:
             if raises:
                 raise KeyError(item)
             else:
                 return 0
 
-        if slotIndex != DELETED and (instance._hash_table_hashes + (offset & mask)).get() == itemHash:
-            if instance.getKeyByIndexUnsafe(slotIndex) == item:
-                instance._hash_table_hashes[offset & mask] = -1
-                instance._hash_table_slots[offset & mask] = DELETED
-                instance._hash_table_count -= 1
-                instance._items_populated[slotIndex] = 0
+        slotIndex = table_get_slot(instance, pos)
+        control = instance._hash_table_control
 
-                instance.deleteItemByIndexUnsafe(slotIndex)
-                return
+        if not control:
+            table_set_slot(instance, pos, DELETED)
+        else:
+            groupBase = (control + (UInt64(pos) & ~UInt64(GROUP_WIDTH - 1))).cast(UInt64)
+
+            # if the group has never been full, no lookup ever probed past it, so we
+            # can mark the position EMPTY rather than leaving a tombstone.
+            if word_match_empty(groupBase[0]) or word_match_empty(groupBase[1]):
+                control[pos] = CONTROL_EMPTY
+                table_set_slot(instance, pos, EMPTY)
+                instance._hash_table_empty_slots += 1
+            else:
+                control[pos] = CONTROL_DELETED
+                table_set_slot(instance, pos, DELETED)
 
-        offset = (offset << 2) + offset + perturb + UInt64(1)
-        perturb = perturb >> PERTURB_SHIFT
+    instance._hash_table_count -= 1
+    instance._items_populated[slotIndex] = 0
 
-    # not necessary, but currently we don't currently realize that the while loop
-    # never exits, and so we think there's a possibility we return None
-    return 0
+    instance.deleteItemByIndexUnsafe(slotIndex)
 
 
 def table_clear(instance):
@@ -178,16 +502,34 @@ def table_clear(instance):
         slotIx += 1
 
     for i in range(instance._hash_table_size):
-        instance._hash_table_hashes[i] = EMPTY
-        instance._hash_table_slots[i] = -1
+        table_set_slot(instance, i, EMPTY)
+
+        if instance._hash_table_control:
+            instance._hash_table_control[i] = CONTROL_EMPTY
 
     instance._hash_table_count = 0
     instance._hash_table_empty_slots = instance._hash_table_size
     instance._top_item_slot = 0
 
 
+def table_add_key(instance, key, itemHash):
+    """Add 'key', which isn't in the table and hashes to 'itemHash', and return its slot."""
+    wasWide = instance._item_hash_bytes == 8
+
+    newSlot = instance._allocateNewSlotUnsafe()
+
+    # allocating can switch the table to 64 bit hashes
+    if not wasWide and instance._item_hash_bytes == 8:
+        itemHash = NativeWideHash()(key)
+
+    table_add_slot(instance, itemHash, newSlot)
+    instance.initializeKeyByIndexUnsafe(newSlot, key)
+
+    return newSlot
+
+
 def table_contains(instance, item):
-    itemHash = NativeHash()(item)
+    itemHash = key_hash(instance._item_hash_bytes, item)
 
     slot = table_slot_for_key(instance, itemHash, item)
 
@@ -198,13 +540,13 @@ def table_contains(instance, item):
 
 
 def dict_delitem(instance, item):
-    itemHash = NativeHash()(item)
+    itemHash = key_hash(instance._item_hash_bytes, item)
 
     table_remove_key(instance, item, itemHash, True)
 
 
 def dict_getitem(instance, item):
-    itemHash = NativeHash()(item)
+    itemHash = key_hash(instance._item_hash_bytes, item)
 
     slot = table_slot_for_key(instance, itemHash, item)
 
@@ -215,7 +557,7 @@ def dict_getitem(instance, item):
 
 
 def dict_get(instance, item, default):
-    itemHash = NativeHash()(item)
+    itemHash = key_hash(instance._item_hash_bytes, item)
 
     slot = table_slot_for_key(instance, itemHash, item)
 
@@ -226,14 +568,12 @@ def dict_get(instance, item, default):
 
 
 def dict_setitem(instance, key, value):
-    itemHash = NativeHash()(key)
+    itemHash = key_hash(instance._item_hash_bytes, key)
 
     slot = table_slot_for_key(instance, itemHash, key)
 
     if slot == -1:
-        newSlot = instance._allocateNewSlotUnsafe()
-        table_add_slot(instance, itemHash, newSlot)
-        instance.initializeKeyByIndexUnsafe(newSlot, key)
+        newSlot = table_add_key(instance, key, itemHash)
         instance.initializeValueByIndexUnsafe(newSlot, value)
     else:
         instance.assignValueByIndexUnsafe(slot, value)
@@ -243,37 +583,33 @@ def dict_setitem(instance, key, value):
 
 
 def set_add(instance, key):
-    itemHash = NativeHash()(key)
+    itemHash = key_hash(instance._item_hash_bytes, key)
 
     slot = table_slot_for_key(instance, itemHash, key)
 
     if slot == -1:
-        newSlot = instance._allocateNewSlotUnsafe()
-        table_add_slot(instance, itemHash, newSlot)
-        instance.initializeKeyByIndexUnsafe(newSlot, key)
+        table_add_key(instance, key, itemHash)
 
 
 def set_add_or_remove(instance, key):
-    itemHash = NativeHash()(key)
+    itemHash = key_hash(instance._item_hash_bytes, key)
 
     slot = table_slot_for_key(instance, itemHash, key)
 
     if slot == -1:
-        newSlot = instance._allocateNewSlotUnsafe()
-        table_add_slot(instance, itemHash, newSlot)
-        instance.initializeKeyByIndexUnsafe(newSlot, key)
+        table_add_key(instance, key, itemHash)
     else:
         table_remove_key(instance, key, itemHash, False)
 
 
 def set_remove(instance, key):
-    itemHash = NativeHash()(key)
+    itemHash = key_hash(instance._item_hash_bytes, key)
 
     table_remove_key(instance, key, itemHash, True)
 
 
 def set_discard(instance, key):
-    itemHash = NativeHash()(key)
+    itemHash = key_hash(instance._item_hash_bytes, key)
 
     table_remove_key(instance, key, itemHash, False)
 
@@ -131,6 +131,9 @@ class PointerToWrapper(Wrapper):
         if attr in ("set", "get", "initialize", "cast", "destroy"):
             return instance.changeType(BoundMethodWrapper.Make(self, attr))
 
+        if attr in ("atomicLoad", "atomicStore", "compareExchange") and self.typeRepresentation.ElementType is int:
+            return instance.changeType(BoundMethodWrapper.Make(self, attr))
+
         return typeWrapper(self.typeRepresentation.ElementType).convert_attribute_pointerTo(
             context,
             instance,
@@ -188,6 +191,32 @@ class PointerToWrapper(Wrapper):
             if len(args) == 0:
                 return context.pushReference(self.typeRepresentation.ElementType, instance.nonref_expr)
 
+        if self.typeRepresentation.ElementType is int:
+            if methodname == "atomicLoad" and len(args) == 0:
+                return context.pushPod(int, instance.nonref_expr.atomic_load())
+
+            if methodname == "atomicStore" and len(args) == 1:
+                val = args[0].convert_to_type(int, ConversionLevel.Implicit)
+                if val is None:
+                    return None
+
+                context.pushEffect(instance.nonref_expr.atomic_store(val.nonref_expr))
+                return context.pushVoid()
+
+            if methodname == "compareExchange" and len(args) == 2:
+                expected = args[0].convert_to_type(int, ConversionLevel.Implicit)
+                if expected is None:
+                    return None
+
+                val = args[1].convert_to_type(int, ConversionLevel.Implicit)
+                if val is None:
+                    return None
+
+                return context.pushPod(
+                    bool,
+                    instance.nonref_expr.atomic_compare_exchange(expected.nonref_expr, val.nonref_expr)
+                )
+
         if methodname == "cast":
             if len(args) == 1 and isinstance(args[0].expr_type, PythonTypeObjectWrapper):
                 tgtType = typeWrapper(PointerTo(args[0].expr_type.typeRepresentation.Value))
@@ -932,8 +932,8 @@ table_create = externalCallTarget(
 
 table_allocate_new_slot = externalCallTarget(
     "nativepython_tableAllocateNewSlot",
-    Int32,
-    Void.pointer(), Int64
+    Int64,
+    Void.pointer(), Int64, Void.pointer()
 )
 
 table_copy = externalCallTarget(
@@ -943,6 +943,29 @@ table_copy = externalCallTarget(
     Void.pointer()
 )
 
+const_dict_kv_pair_ptr = externalCallTarget(
+    "nativepython_constDictKvPairPtr",
+    UInt8Ptr,
+    Void.pointer(),
+    Void.pointer(),
+    Int64
+)
+
+const_dict_lookup_value = externalCallTarget(
+    "nativepython_constDictLookupValue",
+    UInt8Ptr,
+    Void.pointer(),
+    Void.pointer(),
+    Void.pointer()
+)
+
+const_dict_destroy_record = externalCallTarget(
+    "nativepython_constDictDestroyRecord",
+    Void,
+    Void.pointer(),
+    Void.pointer()
+)
+
 table_resize = externalCallTarget(
     "nativepython_tableResize",
     Void,
@@ -991,6 +1014,24 @@ hash_bytes = externalCallTarget(
     Void.pointer()
 )
 
+wide_hash_float64 = externalCallTarget(
+    "nativepython_wide_hash_float64",
+    Int64,
+    Float64
+)
+
+wide_hash_string = externalCallTarget(
+    "nativepython_wide_hash_string",
+    Int64,
+    Void.pointer()
+)
+
+wide_hash_bytes = externalCallTarget(
+    "nativepython_wide_hash_bytes",
+    Int64,
+    Void.pointer()
+)
+
 hash_alternative = externalCallTarget(
     "nativepython_hash_alternative",
     Int32,
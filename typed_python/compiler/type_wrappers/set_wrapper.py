@@ -20,7 +20,7 @@ from typed_python.compiler.type_wrappers.wrapper import Wrapper
 from typed_python.compiler.conversion_level import ConversionLevel
 from typed_python.compiler.type_wrappers.hash_table_implementation import table_next_slot, table_clear, \
     table_contains, set_add, set_add_or_remove, set_remove, set_discard, set_pop
-from typed_python import PointerTo, Int32, UInt8, ListOf, TupleOf, Set, Tuple, NamedTuple, Dict, ConstDict
+from typed_python import PointerTo, UInt8, ListOf, TupleOf, Set, Tuple, NamedTuple, Dict, ConstDict
 
 import typed_python.compiler.native_ast as native_ast
 import typed_python.compiler
@@ -306,12 +306,14 @@ class SetWrapperBase(RefcountedWrapper):
             ('items_populated', native_ast.UInt8Ptr),
             ('items_reserved', native_ast.Int64),
             ('top_item_slot', native_ast.Int64),
-            ('hash_table_slots', native_ast.Int32Ptr),
-            ('hash_table_hashes', native_ast.Int32Ptr),
+            ('hash_table_slots', native_ast.UInt8Ptr),
+            ('item_hashes', native_ast.UInt8Ptr),
             ('hash_table_size', native_ast.Int64),
             ('hash_table_count', native_ast.Int64),
             ('hash_table_empty_slots', native_ast.Int64),
-            ('reserved', native_ast.Int64)  # not used
+            ('hash_table_control', native_ast.UInt8Ptr),
+            ('hash_table_slot_bytes', native_ast.Int64),
+            ('item_hash_bytes', native_ast.Int64)
         ), name="SetWrapper").pointer()
 
     def on_refcount_zero(self, context, instance):
@@ -384,13 +386,13 @@ class SetWrapper(SetWrapperBase):
 
         if attr == '_hash_table_slots':
             return context.pushPod(
-                PointerTo(Int32),
+                PointerTo(UInt8),
                 expr.nonref_expr.ElementPtrIntegers(0, 5).load()
             )
 
-        if attr == '_hash_table_hashes':
+        if attr == '_item_hashes':
             return context.pushPod(
-                PointerTo(Int32),
+                PointerTo(UInt8),
                 expr.nonref_expr.ElementPtrIntegers(0, 6).load()
             )
 
@@ -412,6 +414,24 @@ class SetWrapper(SetWrapperBase):
                 expr.nonref_expr.ElementPtrIntegers(0, 9).load()
             )
 
+        if attr == '_hash_table_control':
+            return context.pushPod(
+                PointerTo(UInt8),
+                expr.nonref_expr.ElementPtrIntegers(0, 10).load()
+            )
+
+        if attr == '_hash_table_slot_bytes':
+            return context.pushPod(
+                int,
+                expr.nonref_expr.ElementPtrIntegers(0, 11).load()
+            )
+
+        if attr == '_item_hash_bytes':
+            return context.pushPod(
+                int,
+                expr.nonref_expr.ElementPtrIntegers(0, 12).load()
+            )
+
         return super().convert_attribute(context, expr, attr)
 
     def convert_set_attribute(self, context, instance, attr, expr):
@@ -553,10 +573,11 @@ class SetWrapper(SetWrapperBase):
 
             if methodname == "_allocateNewSlotUnsafe":
                 return context.pushPod(
-                    Int32,
+                    int,
                     runtime_functions.table_allocate_new_slot.call(
                         instance.nonref_expr.cast(native_ast.VoidPtr),
-                        context.constant(self.keyBytecount)
+                        context.constant(self.keyBytecount),
+                        context.getTypePointer(self.setType.ElementType)
                     )
                 )
 
@@ -705,6 +726,7 @@ class SetWrapper(SetWrapperBase):
             runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 2).load().cast(native_ast.UInt8Ptr)) >>
             runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 5).load().cast(native_ast.UInt8Ptr)) >>
             runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 6).load().cast(native_ast.UInt8Ptr)) >>
+            runtime_functions.free.call(inst.nonref_expr.ElementPtrIntegers(0, 10).load().cast(native_ast.UInt8Ptr)) >>
             runtime_functions.free.call(inst.nonref_expr.cast(native_ast.UInt8Ptr))
         )
 
@@ -15,11 +15,13 @@
 from typed_python import (
     TupleOf, ListOf, Dict, Class, Member, NamedTuple, ConstDict, Tuple, Set,
     Alternative, Forward, OneOf, deepcopy, deepcopyContiguous, totalBytesAllocatedInSlabs,
-    deepBytecountAndSlabs, refcount, totalBytesAllocatedOnFreeStore
+    deepBytecountAndSlabs, refcount, totalBytesAllocatedOnFreeStore, Slab, Entrypoint
 )
+from typed_python import _types
 from typed_python.test_util import currentMemUsageMb
 import time
 import numpy
+import pytest
 
 
 def checkDeepcopySimple(obj, requiresSlab, objectIsSlabRoot=False):
@@ -294,6 +296,23 @@ def test_deepcopy_with_Set():
     assert totalBytesAllocatedInSlabs() == initSlabBytes
 
 
+@pytest.mark.parametrize("layout", ["probed", "swiss"])
+def test_deepcopy_contiguous_dict_and_set_with_hashtables(layout):
+    _types.setHashTableLayout(layout)
+
+    try:
+        d = Dict(int, int)({i: i * 2 for i in range(20)})
+        s = Set(int)(range(1000))
+
+        assert _types.hashTableLayout(d) == layout
+        assert _types.hashTableLayout(s) == layout
+
+        assert deepcopyContiguous(d) == d
+        assert deepcopyContiguous(s) == s
+    finally:
+        _types.setHashTableLayout("probed")
+
+
 def test_deepcopy_with_ConstDict():
     initSlabBytes = totalBytesAllocatedInSlabs()
     mem = currentMemUsageMb()
@@ -347,6 +366,104 @@ def test_see_slabs():
         assert slab.allocCount()
 
 
+def test_arena_allocations_come_from_slab():
+    initSlabBytes = totalBytesAllocatedInSlabs()
+
+    with Slab.arena(bytecount=1024) as arena:
+        d = Dict(int, ListOf(int))()
+        for i in range(100):
+            d[i] = ListOf(int)(range(i))
+
+    assert arena.bytecount() > 1024
+    assert totalBytesAllocatedInSlabs() == initSlabBytes + arena.bytecount()
+
+    # the dict, its hashtable and the lists all hold the arena
+    assert arena.refcount() > 100
+
+    # allocations made after the block go back to the free store
+    aList = ListOf(int)(range(100))
+    assert arena.refcount() > 100
+    del aList
+
+    d = None
+    assert arena.refcount() == 1
+
+    arena = None
+    assert totalBytesAllocatedInSlabs() == initSlabBytes
+
+
+def test_arena_shows_escaped_objects():
+    with Slab.arena(trackInternalReferences=True) as arena:
+        kept = ListOf(int)(range(10))
+        ListOf(int)(range(10))
+        ListOf(str)(["a", "b"])
+
+    assert arena.allocCount() > arena.liveAllocCount() > 0
+
+    escaped = [i for i in range(arena.allocCount()) if arena.allocIsAlive(i)]
+    assert len(escaped) == arena.liveAllocCount()
+
+    del kept
+    assert arena.liveAllocCount() == 0
+
+
+def test_arenas_nest():
+    with Slab.arena(trackInternalReferences=True) as outer:
+        ListOf(int)([1])
+
+        with Slab.arena(trackInternalReferences=True) as inner:
+            innerList = ListOf(int)([1])
+
+        outerList = ListOf(int)([1])
+
+    innerCount = inner.liveAllocCount()
+    assert innerCount > 0
+    assert outer.liveAllocCount() == innerCount
+
+    del innerList, outerList
+
+    assert inner.liveAllocCount() == outer.liveAllocCount() == 0
+
+
+def test_arena_misuse_throws():
+    arena = Slab.arena()
+
+    with arena:
+        with pytest.raises(Exception, match="already entered"):
+            arena.__enter__()
+
+    with pytest.raises(Exception, match="reverse order"):
+        arena.__exit__(None, None, None)
+
+    aList = deepcopyContiguous(ListOf(int)(range(10)))
+    _, slabs = deepBytecountAndSlabs(aList)
+
+    with pytest.raises(Exception, match="Slab.arena"):
+        slabs[0].__enter__()
+
+
+def test_arena_in_compiled_code():
+    @Entrypoint
+    def sumInArena(arena: object, n):
+        res = 0
+
+        with arena:
+            aList = ListOf(int)()
+            for i in range(n):
+                aList.append(i)
+
+            for x in aList:
+                res += x
+
+        return res
+
+    arena = Slab.arena(trackInternalReferences=True)
+
+    assert sumInArena(arena, 1000) == 999 * 1000 // 2
+    assert arena.allocCount() > 0
+    assert arena.liveAllocCount() == 0
+
+
 def test_deepcopy_class_with_dual_references():
     class C(Class):
         x = Member(Dict(int, int))
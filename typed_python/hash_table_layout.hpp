@@ -16,10 +16,53 @@
 
 #pragma once
 
+#include <algorithm>
+#include <cstdint>
 #include <cstring>
 
+#ifdef __SSE2__
+#include <emmintrin.h>
+#endif
+
 // for Dict, items would be key, value pairs
 // for Set, items would be keys
+//
+// The hashtable maps positions to item indices, and comes in two layouts.
+//
+// By default we follow the same probing scheme as the internals of python's
+// dictionaries, as detailed here:
+//      https://hg.python.org/cpython/file/52f68c95e025/Objects/dictobject.c#l296
+//
+// Alternatively, the hashtable can be a 'Swiss table': alongside the item
+// index of each entry we keep a control byte, which is either EMPTY, DELETED,
+// or seven bits of the entry's hash. Control bytes are arranged in aligned
+// groups of GROUP_WIDTH, and a lookup checks a whole group at once (with SSE2
+// where we have it) and only looks at the items whose control bytes match.
+// Groups get probed in triangular order, which visits every group since the
+// number of groups is a power of two. A table is a Swiss table exactly when it
+// has 'hash_table_control', and tables pick their layout from
+// 'useSwissTables()' whenever they build their hashtable.
+//
+// Item indices in 'hash_table_slots' are as narrow as the item table allows:
+// int8 for up to 128 items, then int16, int32, and int64.
+// 'hash_table_slot_bytes' says which we're using. We keep the hash of each
+// item in 'item_hashes', next to the item, so that we can rebuild the
+// hashtable without rehashing anything.
+//
+// Tables whose item table needs int64 indices are 'wide': they hash their
+// keys with Type::wideHash and keep 64 bit 'item_hashes', since 32 bits of
+// hash would collide constantly at that size. Other tables keep the keys'
+// ordinary int32 hashes. 'item_hash_bytes' says which we're using, and a
+// table rehashes its items when it first becomes wide. Callers should hash
+// keys with 'hashKey', and allocate a new slot before hashing the key they
+// put in it.
+//
+// Tables that have only ever used SMALL_TABLE_ITEMS item slots don't have a
+// hashtable at all. We just scan the items, comparing hashes first.
+//
+// The compiler implements the same schemes in
+// compiler/type_wrappers/hash_table_implementation.py, so the two have to be
+// kept in sync.
 class hash_table_layout {
   public:
     hash_table_layout()
@@ -29,49 +72,240 @@ class hash_table_layout {
         , items_reserved(0)
         , top_item_slot(0)
         , hash_table_slots(nullptr)
-        , hash_table_hashes(nullptr)
+        , item_hashes(nullptr)
         , hash_table_size(0)
         , hash_table_count(0)
-        , hash_table_empty_slots(0) {}
+        , hash_table_empty_slots(0)
+        , hash_table_control(nullptr)
+        , hash_table_slot_bytes(0)
+        , item_hash_bytes(0) {}
+
+    enum {
+        EMPTY = -1,
+        DELETED = -2,
+        PERTURB_SHIFT = 5,
+        MIN_SIZE = 16,
+        GROUP_WIDTH = 16,
+        SMALL_TABLE_ITEMS = 8
+    };
+
+    enum { CONTROL_EMPTY = 0x80, CONTROL_DELETED = 0xFE };
+
+    // the smallest number of bytes we'll use for an item index. Normally
+    // this is 1, but tests can force tables to use wider indices without
+    // having to allocate billions of items.
+    static size_t& minimumSlotBytes() {
+        static size_t bytes = sizeof(int8_t);
+        return bytes;
+    }
 
-    // We follow the same hashing scheme as the internals of pythons dictionaries
-    // as detailed here:
-    //      https://hg.python.org/cpython/file/52f68c95e025/Objects/dictobject.c#l296
+    // whether hashtables we build from now on are Swiss tables. Tables we've
+    // already built keep their layout until they're next rebuilt.
+    static bool& useSwissTables() {
+        static bool swiss = false;
+        return swiss;
+    }
 
-    enum { EMPTY = -1, DELETED = -2, PERTURB_SHIFT = 5, MIN_SIZE = 8 };
+    // the number of bytes we need to index an item table with 'itemCount' entries
+    static size_t slotBytesFor(size_t itemCount) {
+        size_t bytes = sizeof(int8_t);
 
-    void setTo(int32_t* ptr, int32_t value, size_t count) {
-        for (size_t k = 0; k < count; k++) {
-            *(ptr++) = value;
+        if (itemCount > (size_t)INT8_MAX + 1) {
+            bytes = sizeof(int16_t);
+        }
+        if (itemCount > (size_t)INT16_MAX + 1) {
+            bytes = sizeof(int32_t);
         }
+        if (itemCount > (size_t)INT32_MAX + 1) {
+            bytes = sizeof(int64_t);
+        }
+
+        return std::max(bytes, minimumSlotBytes());
     }
 
-    // return the index of the object indexed by 'hash', or -1
+    // the number of bytes of hash we keep for each item of an item table with
+    // 'itemCount' entries
+    static size_t hashBytesFor(size_t itemCount) {
+        if (slotBytesFor(itemCount) == sizeof(int64_t)) {
+            return sizeof(typed_python_wide_hash_type);
+        }
+
+        return sizeof(typed_python_hash_type);
+    }
+
+    bool hasWideHashes() const {
+        return item_hash_bytes == sizeof(typed_python_wide_hash_type);
+    }
+
+    // hash 'key' the way this table hashes its items
+    typed_python_wide_hash_type hashKey(Type* keyType, instance_ptr key) {
+        if (hasWideHashes()) {
+            return keyType->wideHash(key);
+        }
+
+        return keyType->hash(key);
+    }
+
+    typed_python_wide_hash_type getItemHash(size_t slot) const {
+        if (hasWideHashes()) {
+            return ((typed_python_wide_hash_type*)item_hashes)[slot];
+        }
+
+        return ((typed_python_hash_type*)item_hashes)[slot];
+    }
+
+    void setItemHash(size_t slot, typed_python_wide_hash_type hash) {
+        if (hasWideHashes()) {
+            ((typed_python_wide_hash_type*)item_hashes)[slot] = hash;
+        } else {
+            ((typed_python_hash_type*)item_hashes)[slot] = hash;
+        }
+    }
+
+    bool slotFits(int64_t slot) const {
+        switch (hash_table_slot_bytes) {
+            case sizeof(int8_t): return slot <= INT8_MAX;
+            case sizeof(int16_t): return slot <= INT16_MAX;
+            case sizeof(int32_t): return slot <= INT32_MAX;
+            default: return true;
+        }
+    }
+
+    // the item index held at 'pos' in the hashtable, or EMPTY or DELETED
+    int64_t getSlot(size_t pos) const {
+        switch (hash_table_slot_bytes) {
+            case sizeof(int8_t): return ((int8_t*)hash_table_slots)[pos];
+            case sizeof(int16_t): return ((int16_t*)hash_table_slots)[pos];
+            case sizeof(int32_t): return ((int32_t*)hash_table_slots)[pos];
+            default: return ((int64_t*)hash_table_slots)[pos];
+        }
+    }
+
+    void setSlot(size_t pos, int64_t slot) {
+        switch (hash_table_slot_bytes) {
+            case sizeof(int8_t): ((int8_t*)hash_table_slots)[pos] = slot; break;
+            case sizeof(int16_t): ((int16_t*)hash_table_slots)[pos] = slot; break;
+            case sizeof(int32_t): ((int32_t*)hash_table_slots)[pos] = slot; break;
+            default: ((int64_t*)hash_table_slots)[pos] = slot; break;
+        }
+    }
+
+    // spread the bits of 'hash' over 64 bits. We take the group to start probing
+    // from the high half and the control byte from the low half.
+    static uint64_t mixHash(typed_python_wide_hash_type hash) {
+        return (uint64_t)hash * 0x9E3779B97F4A7C15ULL;
+    }
+
+    static uint8_t controlByteFor(uint64_t mixed) {
+        return (mixed >> 25) & 0x7F;
+    }
+
+    size_t groupMask() const {
+        return hash_table_size / GROUP_WIDTH - 1;
+    }
+
+    // return a bitmask of the positions in the group starting at 'group' whose
+    // control byte is 'value'.
+    static uint32_t matchControlByte(const uint8_t* group, uint8_t value) {
+#ifdef __SSE2__
+        return _mm_movemask_epi8(
+            _mm_cmpeq_epi8(
+                _mm_loadu_si128((const __m128i*)group),
+                _mm_set1_epi8((char)value)
+            )
+        );
+#else
+        uint32_t result = 0;
+        for (long k = 0; k < GROUP_WIDTH; k++) {
+            if (group[k] == value) {
+                result |= 1 << k;
+            }
+        }
+        return result;
+#endif
+    }
+
+    // return a bitmask of the positions in the group that are EMPTY or DELETED,
+    // which are exactly the control bytes with the high bit set.
+    static uint32_t matchEmptyOrDeleted(const uint8_t* group) {
+#ifdef __SSE2__
+        return _mm_movemask_epi8(_mm_loadu_si128((const __m128i*)group));
+#else
+        uint32_t result = 0;
+        for (long k = 0; k < GROUP_WIDTH; k++) {
+            if (group[k] & 0x80) {
+                result |= 1 << k;
+            }
+        }
+        return result;
+#endif
+    }
+
+    // return the index of the object indexed by 'hash' in a table with no
+    // hashtable, or -1
     template <class eq_func>
-    int32_t find(int32_t item_size, typed_python_hash_type hash, const eq_func& compare) {
-        if (!hash_table_slots) {
-            return -1;
+    int64_t findInItems(int32_t item_size, typed_python_wide_hash_type hash, const eq_func& compare) {
+        for (long k = 0; k < top_item_slot; k++) {
+            if (items_populated[k] && getItemHash(k) == hash && compare(items + item_size * k)) {
+                return k;
+            }
         }
 
-        if (hash < 0) {
-            hash = -hash;
+        return -1;
+    }
+
+    // return the position in the hashtable of the object indexed by 'hash', or -1.
+    template <class eq_func>
+    int64_t findPosition(int32_t item_size, typed_python_wide_hash_type hash, const eq_func& compare) {
+        if (!hash_table_control) {
+            return findProbedPosition(item_size, hash, compare);
         }
 
+        uint64_t mixed = mixHash(hash);
+        uint8_t control = controlByteFor(mixed);
+        size_t mask = groupMask();
+        size_t group = (mixed >> 32) & mask;
+
+        for (size_t step = 1; true; step++) {
+            const uint8_t* groupControl = hash_table_control + group * GROUP_WIDTH;
+
+            uint32_t matches = matchControlByte(groupControl, control);
+
+            while (matches) {
+                size_t pos = group * GROUP_WIDTH + __builtin_ctz(matches);
+
+                if (compare(items + item_size * getSlot(pos))) {
+                    return pos;
+                }
+
+                matches &= matches - 1;
+            }
+
+            // an object can only live past a group that was full when it was added,
+            // and a group that has ever been full never has an EMPTY slot again.
+            if (matchControlByte(groupControl, CONTROL_EMPTY)) {
+                return -1;
+            }
+
+            group = (group + step) & mask;
+        }
+    }
+
+    template <class eq_func>
+    int64_t findProbedPosition(int32_t item_size, typed_python_wide_hash_type hash, const eq_func& compare) {
         uint64_t mask = hash_table_size - 1;
         uint64_t perturb = hash;
         uint64_t offset = hash;
 
         while (true) {
-            // slot is empty
-            int32_t slot = hash_table_slots[offset & mask];
+            int64_t slot = getSlot(offset & mask);
 
             if (slot == EMPTY) {
                 return -1;
             }
 
-            if (slot != DELETED && hash_table_hashes[offset & mask] == hash
-                && compare(items + item_size * slot)) {
-                return slot;
+            if (slot != DELETED && getItemHash(slot) == hash && compare(items + item_size * slot)) {
+                return offset & mask;
             }
 
             offset = (offset << 2) + offset + perturb + 1;
@@ -79,31 +313,93 @@ class hash_table_layout {
         }
     }
 
+    // return the index of the object indexed by 'hash', or -1
+    template <class eq_func>
+    int64_t find(int32_t item_size, typed_python_wide_hash_type hash, const eq_func& compare) {
+        if (!hash_table_slots) {
+            return findInItems(item_size, hash, compare);
+        }
+
+        int64_t pos = findPosition(item_size, hash, compare);
+
+        if (pos == -1) {
+            return -1;
+        }
+
+        return getSlot(pos);
+    }
+
     // add an item to the hash table
-    void add(typed_python_hash_type hash, int32_t slot) {
-        if (hash_table_count * 2 + 1 > hash_table_size
-            || hash_table_empty_slots < hash_table_size / 4 + 1) {
+    void add(typed_python_wide_hash_type hash, int64_t slot) {
+        setItemHash(slot, hash);
+        items_populated[slot] = 1;
+        hash_table_count++;
+
+        if (!hash_table_slots) {
+            if (slot < SMALL_TABLE_ITEMS) {
+                return;
+            }
+
+            // this also places the new item
+            resizeTable();
+            return;
+        }
+
+        if (hash_table_count * 2 - 1 > hash_table_size
+            || hash_table_empty_slots < hash_table_size / 4 + 1
+            || !slotFits(slot)) {
+            // this also places the new item
             resizeTable();
+            return;
         }
 
-        if (hash < 0) {
-            hash = -hash;
+        placeInHashTable(hash, slot);
+    }
+
+    // put the item in 'slot' into a free position in the hashtable
+    void placeInHashTable(typed_python_wide_hash_type hash, int64_t slot) {
+        if (!hash_table_control) {
+            placeInProbedHashTable(hash, slot);
+            return;
         }
 
+        uint64_t mixed = mixHash(hash);
+        size_t mask = groupMask();
+        size_t group = (mixed >> 32) & mask;
+
+        for (size_t step = 1; true; step++) {
+            uint32_t available = matchEmptyOrDeleted(hash_table_control + group * GROUP_WIDTH);
+
+            if (available) {
+                size_t pos = group * GROUP_WIDTH + __builtin_ctz(available);
+
+                if (hash_table_control[pos] == CONTROL_EMPTY) {
+                    hash_table_empty_slots--;
+                }
+
+                hash_table_control[pos] = controlByteFor(mixed);
+                setSlot(pos, slot);
+                return;
+            }
+
+            group = (group + step) & mask;
+        }
+    }
+
+    void placeInProbedHashTable(typed_python_wide_hash_type hash, int64_t slot) {
         uint64_t mask = hash_table_size - 1;
         uint64_t perturb = hash;
         uint64_t offset = hash;
 
         while (true) {
-            if (hash_table_slots[offset & mask] == EMPTY || hash_table_slots[offset & mask] == DELETED) {
-                if (hash_table_slots[offset & mask] == EMPTY) {
+            int64_t existing = getSlot(offset & mask);
+
+            if (existing == EMPTY || existing == DELETED) {
+                if (existing == EMPTY) {
                     hash_table_empty_slots--;
                 }
 
-                hash_table_slots[offset & mask] = slot;
-                hash_table_hashes[offset & mask] = hash;
-                items_populated[slot] = 1;
-                hash_table_count++;
+                setSlot(offset & mask, slot);
                 return;
             }
 
@@ -119,8 +415,8 @@ class hash_table_layout {
     // held by the caller. In particular, the caller should NOT pass a 'compare' function
     // that compares to a pointer to our internals.
     template <class eq_func>
-    int32_t remove(int32_t item_size, typed_python_hash_type hash, const eq_func& compare) {
-        if (!hash_table_slots) {
+    int64_t remove(int32_t item_size, typed_python_wide_hash_type hash, const eq_func& compare) {
+        if (!hash_table_count) {
             return -1;
         }
 
@@ -129,44 +425,51 @@ class hash_table_layout {
         }
 
         // compress the hashtable if it's really empty
-        if (hash_table_count < hash_table_size / 8) {
+        if (hash_table_slots && hash_table_count < hash_table_size / 8) {
             resizeTable();
         }
 
-        if (hash < 0) {
-            hash = -hash;
-        }
-
-        uint64_t mask = hash_table_size - 1;
-        uint64_t perturb = hash;
-        uint64_t offset = hash;
+        int64_t slot;
 
-        while (true) {
-            int32_t slot = hash_table_slots[offset & mask];
+        if (!hash_table_slots) {
+            slot = findInItems(item_size, hash, compare);
 
-            if (slot == EMPTY) {
-                // we never found the item
+            if (slot == -1) {
                 return -1;
             }
+        } else {
+            int64_t pos = findPosition(item_size, hash, compare);
 
-            if (slot != DELETED && compare(items + item_size * slot)) {
-                items_populated[slot] = 0;
-
-                hash_table_slots[offset & mask] = DELETED;
-                hash_table_hashes[offset & mask] = -1;
-                hash_table_count -= 1;
-
-                return slot;
+            if (pos == -1) {
+                return -1;
             }
 
-            offset = (offset << 2) + offset + perturb + 1;
-            perturb >>= PERTURB_SHIFT;
+            slot = getSlot(pos);
+
+            // in a Swiss table, if the group has never been full, no lookup ever
+            // probed past it, so we can mark the position EMPTY rather than
+            // leaving a tombstone.
+            if (!hash_table_control) {
+                setSlot(pos, DELETED);
+            } else if (matchControlByte(hash_table_control + (pos & ~(size_t)(GROUP_WIDTH - 1)), CONTROL_EMPTY)) {
+                hash_table_control[pos] = CONTROL_EMPTY;
+                setSlot(pos, EMPTY);
+                hash_table_empty_slots++;
+            } else {
+                hash_table_control[pos] = CONTROL_DELETED;
+                setSlot(pos, DELETED);
+            }
         }
+
+        items_populated[slot] = 0;
+        hash_table_count -= 1;
+
+        return slot;
     }
 
     void compressItemTable(size_t item_size) {
-        std::vector<int32_t> newItemPositions;
-        int32_t count_so_far = 0;
+        std::vector<int64_t> newItemPositions;
+        int64_t count_so_far = 0;
 
         for (long k = 0; k < items_reserved; k++) {
             if (items_populated[k]) {
@@ -175,6 +478,7 @@ class hash_table_layout {
                 if (k != count_so_far) {
                     items_populated[count_so_far] = 1;
                     items_populated[k] = 0;
+                    setItemHash(count_so_far, getItemHash(k));
 
                     memcpy(items + item_size * count_so_far, items + item_size * k,
                            item_size);
@@ -188,44 +492,47 @@ class hash_table_layout {
 
         items_populated = (uint8_t*)tp_realloc(items_populated, items_reserved, count_so_far);
         items = (uint8_t*)tp_realloc(items, items_reserved * item_size, count_so_far * item_size);
+        item_hashes = (uint8_t*)tp_realloc(item_hashes, items_reserved * item_hash_bytes, count_so_far * item_hash_bytes);
 
         items_reserved = count_so_far;
         top_item_slot = items_reserved;
 
         for (long k = 0; k < hash_table_size; k++) {
-            if (hash_table_slots[k] >= 0) {
-                if (hash_table_slots[k] >= newItemPositions.size()) {
+            int64_t slot = getSlot(k);
+
+            if (slot >= 0) {
+                if (slot >= newItemPositions.size()) {
                     throw std::runtime_error("corrupt slot");
                 }
 
-                hash_table_slots[k] = newItemPositions[hash_table_slots[k]];
+                slot = newItemPositions[slot];
 
-                if (hash_table_slots[k] < 0) {
+                if (slot < 0) {
                     throw std::runtime_error("invalid slot");
                 }
-            }
-        }
 
-        for (long k = 0; k < hash_table_size; k++) {
-            if (hash_table_slots[k] >= 0) {
-                if (hash_table_slots[k] >= items_reserved) {
+                if (slot >= items_reserved) {
                     throw std::runtime_error("failed during compression");
                 }
+
+                setSlot(k, slot);
             }
         }
     }
 
-    int32_t allocateNewSlot(size_t item_size) {
+    // allocate a slot for a new item, whose key has type 'keyType'. If the table
+    // has to become wide, this rehashes the items it already has, so callers
+    // need to hash the new key afterwards.
+    int64_t allocateNewSlot(size_t item_size, Type* keyType) {
         if (!items) {
             items_reserved = 4;
             items = (uint8_t*)tp_malloc(items_reserved * item_size);
             std::memset(items, 0, items_reserved * item_size);
             items_populated = (uint8_t*)tp_malloc(items_reserved);
             std::memset(items_populated, 0, items_reserved);
+            item_hash_bytes = hashBytesFor(items_reserved);
+            item_hashes = (uint8_t*)tp_malloc(items_reserved * item_hash_bytes);
             top_item_slot = 0;
-            for (long k = 0; k < items_reserved; k++) {
-                items_populated[k] = 0;
-            }
         }
 
         while (top_item_slot >= items_reserved) {
@@ -233,17 +540,48 @@ class hash_table_layout {
             items_reserved = items_reserved * 1.25 + 1;
             items = (uint8_t*)tp_realloc(items, item_size * old_reserved, item_size * items_reserved);
             items_populated = (uint8_t*)tp_realloc(items_populated, old_reserved, items_reserved);
+            item_hashes = (uint8_t*)tp_realloc(item_hashes, old_reserved * item_hash_bytes, items_reserved * item_hash_bytes);
 
             for (long k = old_reserved; k < items_reserved; k++) {
                 items_populated[k] = 0;
             }
         }
 
+        if (hashBytesFor(items_reserved) > item_hash_bytes) {
+            widenItemHashes(item_size, keyType);
+        }
+
         return top_item_slot++;
     }
 
-    int32_t pickHashTableSize(int32_t minSize) {
-        int32_t ct = MIN_SIZE;
+    // switch to 64 bit hashes, rehashing every item. Tables only do this once,
+    // when their item table first needs int64 indices.
+    void widenItemHashes(size_t item_size, Type* keyType) {
+        typed_python_wide_hash_type* wideHashes = (typed_python_wide_hash_type*)tp_malloc(
+            items_reserved * sizeof(typed_python_wide_hash_type)
+        );
+
+        try {
+            for (long k = 0; k < top_item_slot; k++) {
+                if (items_populated[k]) {
+                    wideHashes[k] = keyType->wideHash(items + item_size * k);
+                }
+            }
+        } catch(...) {
+            tp_free(wideHashes);
+            throw;
+        }
+
+        tp_free(item_hashes);
+        item_hashes = (uint8_t*)wideHashes;
+        item_hash_bytes = sizeof(typed_python_wide_hash_type);
+
+        // every item's position depends on its hash
+        resizeTable();
+    }
+
+    size_t pickHashTableSize(size_t minSize) {
+        size_t ct = MIN_SIZE;
         while (ct < minSize) {
             ct <<= 1;
         }
@@ -253,17 +591,25 @@ class hash_table_layout {
     // called after we have deleted everything that's populated, and need to
     // zero out the hash_table's internals.
     void allItemsHaveBeenRemoved() {
+        hash_table_count = 0;
+        top_item_slot = 0;
+
+        if (items_populated) {
+            std::memset(items_populated, 0, items_reserved);
+        }
+
         if (!hash_table_slots) {
             return;
         }
 
-        hash_table_count = 0;
-        top_item_slot = 0;
         hash_table_empty_slots = hash_table_size;
 
-        setTo(hash_table_slots, EMPTY, hash_table_size);
-        setTo(hash_table_hashes, EMPTY, hash_table_size);
-        std::memset(items_populated, 0, items_reserved);
+        // EMPTY is -1, so every byte of an EMPTY slot is 0xFF whatever its width
+        std::memset(hash_table_slots, 0xFF, hash_table_size * hash_table_slot_bytes);
+
+        if (hash_table_control) {
+            std::memset(hash_table_control, CONTROL_EMPTY, hash_table_size);
+        }
     }
 
     template <class copy_constructor_type>
@@ -280,6 +626,8 @@ class hash_table_layout {
         result->hash_table_size = hash_table_size;
         result->hash_table_count = hash_table_count;
         result->hash_table_empty_slots = hash_table_empty_slots;
+        result->hash_table_slot_bytes = hash_table_slot_bytes;
+        result->item_hash_bytes = item_hash_bytes;
 
         result->items = (uint8_t*)tp_malloc(item_size * items_reserved);
         if (isPOD) {
@@ -296,52 +644,59 @@ class hash_table_layout {
         result->items_populated = (uint8_t*)tp_malloc(items_reserved);
         memcpy(result->items_populated, items_populated, items_reserved);
 
-        result->hash_table_slots = (int32_t*)tp_malloc(hash_table_size * sizeof(int32_t));
-        memcpy(result->hash_table_slots, hash_table_slots, hash_table_size * sizeof(int32_t));
+        result->item_hashes = (uint8_t*)tp_malloc(items_reserved * item_hash_bytes);
+        memcpy(result->item_hashes, item_hashes, items_reserved * item_hash_bytes);
+
+        if (hash_table_slots) {
+            result->hash_table_slots = (uint8_t*)tp_malloc(hash_table_size * hash_table_slot_bytes);
+            memcpy(result->hash_table_slots, hash_table_slots, hash_table_size * hash_table_slot_bytes);
+        }
+
+        if (hash_table_control) {
+            result->hash_table_control = (uint8_t*)tp_malloc(hash_table_size);
+            memcpy(result->hash_table_control, hash_table_control, hash_table_size);
+        }
 
-        result->hash_table_hashes = (typed_python_hash_type*)tp_malloc(hash_table_size * sizeof(typed_python_hash_type));
-        memcpy(result->hash_table_hashes, hash_table_hashes, hash_table_size * sizeof(typed_python_hash_type));
         return result;
     }
 
+    // rebuild the hashtable from 'item_hashes', picking its size and the width
+    // of its item indices from the current items, and its layout from
+    // 'useSwissTables()'. Tables that only use the first SMALL_TABLE_ITEMS item
+    // slots get no hashtable at all.
     void resizeTable() {
-        if (!hash_table_slots) {
-            hash_table_size = pickHashTableSize(hash_table_count * 4);
-            hash_table_slots = (int32_t*)tp_malloc(hash_table_size * sizeof(int32_t));
-            setTo(hash_table_slots, EMPTY, hash_table_size);
-            hash_table_hashes = (typed_python_hash_type*)tp_malloc(hash_table_size * sizeof(typed_python_hash_type));
-            setTo(hash_table_hashes, EMPTY, hash_table_size);
-            hash_table_count = 0;
-            hash_table_empty_slots = hash_table_size;
+        tp_free(hash_table_slots);
+        tp_free(hash_table_control);
 
-        } else {
-            int32_t oldSize = hash_table_size;
-            int32_t* oldSlots = hash_table_slots;
-            typed_python_hash_type* oldHashes = hash_table_hashes;
-
-            // make sure the table's not too small
-            hash_table_size = pickHashTableSize(hash_table_count * 4);
-
-            hash_table_slots = (int32_t*)tp_malloc(hash_table_size * sizeof(int32_t));
-            setTo(hash_table_slots, EMPTY, hash_table_size);
-            hash_table_hashes =
-              (typed_python_hash_type*)tp_malloc(hash_table_size * sizeof(typed_python_hash_type));
-            setTo(hash_table_hashes, EMPTY, hash_table_size);
-            hash_table_count = 0;
-            hash_table_empty_slots = hash_table_size;
-
-            for (long k = 0; k < oldSize; k++) {
-                if (oldSlots[k] != EMPTY && oldSlots[k] != DELETED) {
-                    add(oldHashes[k], oldSlots[k]);
-                }
-            }
+        hash_table_slots = nullptr;
+        hash_table_control = nullptr;
+        hash_table_size = 0;
+        hash_table_empty_slots = 0;
+        hash_table_slot_bytes = 0;
 
-            tp_free(oldSlots);
-            tp_free(oldHashes);
+        if (top_item_slot <= SMALL_TABLE_ITEMS) {
+            return;
+        }
+
+        hash_table_size = pickHashTableSize(hash_table_count * 4);
+        hash_table_slot_bytes = slotBytesFor(items_reserved);
+        hash_table_slots = (uint8_t*)tp_malloc(hash_table_size * hash_table_slot_bytes);
+        std::memset(hash_table_slots, 0xFF, hash_table_size * hash_table_slot_bytes);
+        hash_table_empty_slots = hash_table_size;
+
+        if (useSwissTables()) {
+            hash_table_control = (uint8_t*)tp_malloc(hash_table_size);
+            std::memset(hash_table_control, CONTROL_EMPTY, hash_table_size);
+        }
+
+        for (long k = 0; k < top_item_slot; k++) {
+            if (items_populated[k]) {
+                placeInHashTable(getItemHash(k), k);
+            }
         }
     }
 
-    void prepareForDeserialization(uint32_t slotCount, size_t item_size) {
+    void prepareForDeserialization(size_t slotCount, size_t item_size) {
         if (hash_table_size) {
             throw std::runtime_error("deserialization prepare should only be called on "
                                      "empty tables");
@@ -350,6 +705,8 @@ class hash_table_layout {
         items_reserved = slotCount;
         items_populated = (uint8_t*)tp_malloc(slotCount);
         items = (uint8_t*)tp_malloc(slotCount * item_size);
+        item_hash_bytes = hashBytesFor(slotCount);
+        item_hashes = (uint8_t*)tp_malloc(slotCount * item_hash_bytes);
 
         for (long k = 0; k < items_reserved; k++) {
             items_populated[k] = true;
@@ -358,23 +715,14 @@ class hash_table_layout {
         top_item_slot = items_reserved;
     }
 
-    template <class hash_fun_type>
-    void buildHashTableAfterDeserialization(size_t item_size, const hash_fun_type& hash_fun) {
-        hash_table_size = pickHashTableSize(items_reserved * 2);
-        hash_table_slots = (int32_t*)tp_malloc(hash_table_size * sizeof(int32_t));
-        hash_table_hashes =
-          (typed_python_hash_type*)tp_malloc(hash_table_size * sizeof(typed_python_hash_type));
-        hash_table_count = 0;
-        hash_table_empty_slots = hash_table_size;
-
-        for (long k = 0; k < hash_table_size; k++) {
-            hash_table_slots[k] = EMPTY;
-            hash_table_hashes[k] = -1;
-        }
-
+    void buildHashTableAfterDeserialization(size_t item_size, Type* keyType) {
         for (long k = 0; k < items_reserved; k++) {
-            add(hash_fun(items + item_size * k), k);
+            setItemHash(k, hashKey(keyType, items + item_size * k));
         }
+
+        hash_table_count = items_reserved;
+
+        resizeTable();
     }
 
     hash_table_layout* deepcopy(
@@ -431,6 +779,16 @@ class hash_table_layout {
             this->items_reserved
         );
 
+        dest->item_hashes = (uint8_t*)context.slab->allocate(
+            this->item_hash_bytes * this->items_reserved,
+            nullptr
+        );
+        memcpy(
+            dest->item_hashes,
+            this->item_hashes,
+            this->item_hash_bytes * this->items_reserved
+        );
+
         dest->items_reserved = this->items_reserved;
 
         dest->top_item_slot = this->top_item_slot;
@@ -438,23 +796,29 @@ class hash_table_layout {
         dest->hash_table_count = this->hash_table_count;
         dest->hash_table_size = this->hash_table_size;
         dest->hash_table_empty_slots = this->hash_table_empty_slots;
+        dest->hash_table_slot_bytes = this->hash_table_slot_bytes;
+        dest->item_hash_bytes = this->item_hash_bytes;
 
-        dest->hash_table_slots = (int32_t*)context.slab->allocate(sizeof(int32_t) * this->hash_table_size, nullptr);
-        memcpy(
-            dest->hash_table_slots,
-            this->hash_table_slots,
-            sizeof(int32_t) * this->hash_table_size
-        );
+        if (this->hash_table_slots) {
+            dest->hash_table_slots = (uint8_t*)context.slab->allocate(
+                this->hash_table_slot_bytes * this->hash_table_size,
+                nullptr
+            );
+            memcpy(
+                dest->hash_table_slots,
+                this->hash_table_slots,
+                this->hash_table_slot_bytes * this->hash_table_size
+            );
+        }
 
-        dest->hash_table_hashes = (typed_python_hash_type*)context.slab->allocate(
-            sizeof(typed_python_hash_type) * this->hash_table_size,
-            nullptr
-        );
-        memcpy(
-            dest->hash_table_hashes,
-            this->hash_table_hashes,
-            sizeof(typed_python_hash_type) * this->hash_table_size
-        );
+        if (this->hash_table_control) {
+            dest->hash_table_control = (uint8_t*)context.slab->allocate(this->hash_table_size, nullptr);
+            memcpy(
+                dest->hash_table_control,
+                this->hash_table_control,
+                this->hash_table_size
+            );
+        }
 
         return dest;
     }
@@ -480,25 +844,46 @@ class hash_table_layout {
                                        "hashtable count");
         }
 
+        if (!hash_table_slots) {
+            if (top_item_slot > SMALL_TABLE_ITEMS) {
+                throw std::runtime_error(reason + ": large table has no hashtable");
+            }
+            return;
+        }
+
         int64_t filledSlots = 0;
         int64_t deletedSlots = 0;
         for (long k = 0; k < hash_table_size; k++) {
-            if (hash_table_slots[k] == DELETED) {
+            int64_t slot = getSlot(k);
+
+            if (slot == DELETED) {
                 deletedSlots++;
-            } else if (hash_table_slots[k] != EMPTY) {
+
+                if (hash_table_control && hash_table_control[k] != CONTROL_DELETED) {
+                    throw std::runtime_error(reason + ": deleted slot has the wrong control byte");
+                }
+            } else if (slot == EMPTY) {
+                if (hash_table_control && hash_table_control[k] != CONTROL_EMPTY) {
+                    throw std::runtime_error(reason + ": empty slot has the wrong control byte");
+                }
+            } else {
                 filledSlots++;
 
-                if (hash_table_slots[k] >= items_reserved) {
+                if (slot >= items_reserved) {
                     throw std::runtime_error(reason
                                              + ": hash table has slot entry out "
                                                "of bounds with item list");
                 }
 
-                if (!items_populated[hash_table_slots[k]]) {
+                if (!items_populated[slot]) {
                     throw std::runtime_error(reason
                                              + ": hash table points to unmarked "
                                                "slot");
                 }
+
+                if (hash_table_control && hash_table_control[k] != controlByteFor(mixHash(getItemHash(slot)))) {
+                    throw std::runtime_error(reason + ": filled slot has the wrong control byte");
+                }
             }
         }
 
@@ -515,7 +900,7 @@ class hash_table_layout {
     }
 
     bool empty() const { return hash_table_count == 0; }
-    int32_t size() const { return hash_table_count; }
+    int64_t size() const { return hash_table_count; }
 
     std::atomic<int64_t> refcount;
 
@@ -524,17 +909,23 @@ class hash_table_layout {
     size_t items_reserved; // count of items reserved
     size_t top_item_slot; // index of the next item slot to use
 
-    int32_t* hash_table_slots; // a hashtable. each actual object hash to
+    uint8_t* hash_table_slots; // a hashtable. each actual object hash to
                                // the slot index it holds. -1 if not
-                               // populated.
-    typed_python_hash_type* hash_table_hashes; // a hashtable. each actual object hash to
-                                               // the hash in that part of the table. -1 if
-                                               // not populated.
+                               // populated. Entries are hash_table_slot_bytes
+                               // wide. nullptr for small tables.
+    uint8_t* item_hashes; // the hash of each item, indexed like 'items'.
+                          // Entries are item_hash_bytes wide.
     size_t hash_table_size; // size of the table
     size_t hash_table_count; // populated count of the table
     size_t hash_table_empty_slots; // slots that are not empty in the
                                    // table. Recall that some slots are
                                    // 'deleted'
+    uint8_t* hash_table_control; // a control byte for each slot in the hashtable.
+                                 // CONTROL_EMPTY, CONTROL_DELETED, or seven bits
+                                 // of the hash of the object in the slot.
+                                 // nullptr unless this is a Swiss table.
+    size_t hash_table_slot_bytes; // bytes in each entry of hash_table_slots: 1, 2, 4 or 8.
+    size_t item_hash_bytes; // bytes in each entry of item_hashes: 4, or 8 for wide tables.
 };
 
 
@@ -15,103 +15,118 @@
 """
 Utilities for running operations in parallel.
 
-We require operations to be compilable for this to work.
+We require operations to be compilable for this to work. Work gets spread
+across threads by the work-stealing scheduler in typed_python.lib.work_stealing.
 """
 
-import threading
-from typed_python import Class, Final, Member, ListOf, TypeFunction, Tuple, NotCompiled, Entrypoint, PointerTo
-from typed_python.typed_queue import TypedQueue
-import os
-
-_threads = []
-
-
-isJobExecutor = threading.local()
-
-
-class Job(Class):
-    def execute(self, i: int) -> None:
-        pass
-
-
-work_queue = TypedQueue(Tuple(Job, int))()
+from typed_python import Final, Member, ListOf, TypeFunction, PointerTo, Entrypoint, NotCompiled
+from typed_python.lib.work_stealing import RangeJob, getScheduler, getMaxThreads, setMaxThreads
 
 
 @TypeFunction
 def ListJob(InputT, FuncT, OutT):
-    class ListJob(Job, Final):
+    class ListJob(RangeJob, Final):
         OutputType = OutT
 
-        outputQueue = Member(TypedQueue(int))
-        exceptionQueue = Member(TypedQueue(Tuple(int, object)))
         inputPtr = Member(PointerTo(InputT))
         isInitializedPtr = Member(PointerTo(bool))
         outputPtr = Member(PointerTo(OutT))
-        jobGranularity = Member(int)
-        maxIndex = Member(int)
         f = Member(FuncT)
 
-        def __init__(self, inputPtr, f, outputPtr, isInitializedPtr, jobGranularity, maxIndex):
+        def __init__(self, inputPtr, f, outputPtr, isInitializedPtr, size, minGranularity):
             self.inputPtr = inputPtr
             self.outputPtr = outputPtr
             self.isInitializedPtr = isInitializedPtr
-            self.outputQueue = TypedQueue(int)()
-            self.exceptionQueue = TypedQueue(Tuple(int, object))()
-            self.jobGranularity = jobGranularity
-            self.maxIndex = maxIndex
+            self.size = size
+            self.minGranularity = minGranularity
             self.f = f
 
-        def execute(self, i: int) -> None:
-            try:
-                for jobIx in range(i * self.jobGranularity, min(self.maxIndex, (i + 1) * self.jobGranularity)):
+        def execute(self, lo: int, hi: int) -> None:
+            for jobIx in range(lo, hi):
+                try:
                     (self.outputPtr + jobIx).initialize(self.f(self.inputPtr[jobIx]))
                     self.isInitializedPtr[jobIx] = True
-            except Exception as e:
-                self.exceptionQueue.put(Tuple(int, object)((jobIx, e)))
-
-            self.outputQueue.put(i)
+                except Exception as e:
+                    self.recordException(jobIx, e)
+                    return
 
     return ListJob
 
 
-@NotCompiled
-def isExecutorThread() -> bool:
-    return getattr(isJobExecutor, 'isExecutor', False)
-
-
-@Entrypoint
-def workExecutor():
-    isJobExecutor.isExecutor = True
+@TypeFunction
+def ForJob(FuncT):
+    class ForJob(RangeJob, Final):
+        start = Member(int)
+        body = Member(FuncT)
 
-    while True:
-        Job, ix = work_queue.get()
+        def __init__(self, start, body, size, minGranularity):
+            self.start = start
+            self.body = body
+            self.size = size
+            self.minGranularity = minGranularity
 
-        if ix >= 0:
-            Job.execute(ix)
-        else:
-            return
+        def execute(self, lo: int, hi: int) -> None:
+            for i in range(self.start + lo, self.start + hi):
+                try:
+                    self.body(i)
+                except Exception as e:
+                    self.recordException(i - self.start, e)
+                    return
 
-        Job = None
+    return ForJob
 
 
-_maxPmapThreads = [1000]
+@TypeFunction
+def ReduceJob(ListT, MapperT, CombinerT, T):
+    class ReduceJob(RangeJob, Final):
+        lst = Member(ListT)
+        mapper = Member(MapperT)
+        combiner = Member(CombinerT)
+        identity = Member(T)
+        chunkSize = Member(int)
+        partials = Member(ListOf(T))
+
+        def __init__(self, lst, mapper, combiner, identity, chunkSize, chunkCount):
+            self.lst = lst
+            self.mapper = mapper
+            self.combiner = combiner
+            self.identity = identity
+            self.chunkSize = chunkSize
+            self.size = chunkCount
+            self.minGranularity = 1
+            self.partials = ListOf(T)()
+
+            for _ in range(chunkCount):
+                self.partials.append(identity)
+
+        def execute(self, lo: int, hi: int) -> None:
+            # each index of the job is a whole chunk of the list. If anything
+            # throws, the scheduler records it against the chunk, and since a
+            # chunk stops at its first exception, the lowest chunk's exception
+            # is also the one for the lowest element.
+            for chunk in range(lo, hi):
+                acc: T = self.identity
+
+                for i in range(chunk * self.chunkSize, min(len(self.lst), (chunk + 1) * self.chunkSize)):
+                    acc = self.combiner(acc, self.mapper(self.lst[i]))
+
+                self.partials[chunk] = acc
+
+    return ReduceJob
 
 
 def getMaxPmapThreads():
-    return _maxPmapThreads[0]
+    return getMaxThreads()
 
 
 def setMaxPmapThreads(count):
-    assert count > 0
-    _maxPmapThreads[0] = count
+    setMaxThreads(count)
 
 
 @NotCompiled
 def ensureThreads():
-    if not _threads:
-        for i in range(min(_maxPmapThreads[0], os.cpu_count())):
-            _threads.append(threading.Thread(target=workExecutor, daemon=True))
-            _threads[-1].start()
+    """Make sure the scheduler's worker threads are running."""
+    getScheduler()
 
 
 @Entrypoint
@@ -122,20 +137,12 @@ def pmap(lst, f, OutT, minGranularity=1):
         lst - a ListOf of some type
         f - a function from lst.ElementType to OutT
         OutT - the result type
-        jobGranularity - how many items we should dispatch at once.
-            If you have very small tasks, you'll spend far more time
-            locking and unlocking the queue than you will actually
-            doing work. If None, this will pick something that tries to
-            avoid creating too many jobs
-        minGranularity - the smallest batch size we'll allow.
-            If this is 1, then each item in the list is a job. If
-            greater than 1, then we will do no fewer than this many
-            jobs per thread dispatch.
+        minGranularity - the smallest batch of items a thread will process
+            at once. The scheduler splits the list up on demand as threads
+            run out of work, so this only needs to be larger than 1 if
+            calling 'f' is so cheap that checking for idle threads between
+            items would dominate.
     """
-    ensureThreads()
-
-    jobGranularity = max(1, len(lst) // (int(os.cpu_count()) * 30), minGranularity)
-
     # make a list of objects but don't initialize any of them.
     # some objects don't have default constructors and we want to
     # still be able to pmap them.
@@ -146,58 +153,19 @@ def pmap(lst, f, OutT, minGranularity=1):
     isInitialized = ListOf(bool)()
     isInitialized.resize(len(lst))
 
-    # create the 'job'
     job = ListJob(lst.ElementType, type(f), OutT)(
         lst.pointerUnsafe(0),
         f,
         res.pointerUnsafe(0),
         isInitialized.pointerUnsafe(0),
-        jobGranularity,
-        len(lst)
+        len(lst),
+        minGranularity
     )
 
-    # fill out the work queue
-    jobCount = len(lst) // jobGranularity
-
-    if jobCount * jobGranularity < len(lst):
-        jobCount += 1
-
-    for i in range(jobCount):
-        tup = Tuple(Job, int)((job, i))
-        work_queue.put(tup)
-
-    # block until the work queue is complete
-    # if we're an executor thread, then we are part of a
-    # 'recursive' pmap call, and we need to do work!
-    if isExecutorThread():
-        while True:
-            jobAndIndex = work_queue.getNonblocking()
-            if jobAndIndex is None:
-                # it's OK to block now because if
-                # there are no outstanding jobs, then
-                # all of _our_ jobs have been picked up
-                job.outputQueue.getMany(jobCount, jobCount)
-                break
-            else:
-                j = jobAndIndex[0]
-                ix = jobAndIndex[1]
-
-                if ix >= 0:
-                    j.execute(ix)
-    else:
-        # we can just block on the queue
-        job.outputQueue.getMany(jobCount, jobCount)
-
-    # check if any of our threads excepted, and if so
-    # raise the earliest one in the sequence.
-    exceptionObj = None
-    minI = len(lst)
-
-    while job.exceptionQueue:
-        i, eo = job.exceptionQueue.get()
-        if i < minI:
-            minI = i
-            exceptionObj = eo
+    getScheduler().run(job)
+
+    # if any of the calls excepted, raise the earliest one in the sequence.
+    exceptionObj = job.exception()
 
     if exceptionObj is not None:
         # if we're raising, we need to clean up our
@@ -211,3 +179,88 @@ def pmap(lst, f, OutT, minGranularity=1):
     res.setSizeUnsafe(len(lst))
 
     return res
+
+
+@Entrypoint
+def parallelFor(start, stop, body, minGranularity=1):
+    """Call 'body(i)' for every 'i' in range(start, stop), in parallel.
+
+    Calls may happen in any order and on any thread. If any of them throw,
+    we raise the exception thrown by the lowest 'i' once they've all finished.
+
+    Args:
+        start - the first index
+        stop - one past the last index
+        body - a function taking an integer index
+        minGranularity - the smallest batch of indices a thread will process
+            at once.
+    """
+    job = ForJob(type(body))(start, body, max(stop - start, 0), minGranularity)
+
+    getScheduler().run(job)
+
+    exceptionObj = job.exception()
+
+    if exceptionObj is not None:
+        raise exceptionObj
+
+
+@Entrypoint
+def preduce(lst, mapper, combiner, identity):
+    """Compute combiner(...combiner(combiner(identity, mapper(lst[0])), mapper(lst[1]))...) in parallel.
+
+    The list is cut into chunks, each of which is reduced on its own thread
+    starting from 'identity', and then the partial results are combined
+    pairwise in a tree. This only gives the same answer as a sequential
+    reduction if 'combiner' is associative and 'identity' is an identity for
+    it. 'combiner' must not modify its arguments, since 'identity' is shared
+    between chunks.
+
+    Args:
+        lst - a ListOf or TupleOf of some type
+        mapper - a function from lst.ElementType to the type of 'identity'
+        combiner - an associative function taking two values of the type of
+            'identity' and returning another
+        identity - the result for an empty list. Its type is the type of
+            the result.
+
+    Returns:
+        the combined result, as an instance of type(identity).
+    """
+    T = type(identity)
+
+    if len(lst) == 0:
+        return identity
+
+    # have enough chunks that threads can balance uneven work by stealing,
+    # but not so many that combining partials costs anything.
+    chunkCount = min(len(lst), (getScheduler().workerCount + 1) * 16)
+    chunkSize = (len(lst) + chunkCount - 1) // chunkCount
+    chunkCount = (len(lst) + chunkSize - 1) // chunkSize
+
+    job = ReduceJob(type(lst), type(mapper), type(combiner), T)(
+        lst, mapper, combiner, identity, chunkSize, chunkCount
+    )
+
+    getScheduler().run(job)
+
+    exceptionObj = job.exception()
+
+    if exceptionObj is not None:
+        raise exceptionObj
+
+    partials = job.partials
+
+    while len(partials) > 1:
+        combined = ListOf(T)()
+        combined.reserve((len(partials) + 1) // 2)
+
+        for i in range(0, len(partials) - 1, 2):
+            combined.append(combiner(partials[i], partials[i + 1]))
+
+        if len(partials) % 2:
+            combined.append(partials[len(partials) - 1])
+
+        partials = combined
+
+    return partials[0]
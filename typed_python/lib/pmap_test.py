@@ -17,9 +17,9 @@ import os
 import traceback
 
 from flaky import flaky
-from typed_python.lib.pmap import pmap
+from typed_python.lib.pmap import pmap, parallelFor, preduce
 from typed_python.typed_queue import TypedQueue
-from typed_python import ListOf, Entrypoint, Class, Member, Final, Tuple, refcount, NotCompiled
+from typed_python import ListOf, TupleOf, Entrypoint, Class, Member, Final, Tuple, refcount, NotCompiled
 import time
 
 
@@ -233,3 +233,111 @@ def test_pmap_func_refcounts():
     closure = None
 
     assert refcount(x) == 1
+
+
+def test_parallel_for():
+    out = ListOf(int)()
+    out.resize(10000)
+
+    def setIt(i):
+        out[i] = i * i
+
+    parallelFor(0, len(out), setIt)
+
+    for i in range(len(out)):
+        assert out[i] == i * i
+
+
+def test_parallel_for_raises_lowest_exception():
+    def throwsSometimes(i):
+        if i % 10 == 7:
+            raise Exception(f"failed at {i}")
+
+    with pytest.raises(Exception, match="failed at 17"):
+        parallelFor(10, 100, throwsSometimes)
+
+
+def test_parallel_for_empty_range():
+    def throws(i):
+        raise Exception("shouldn't get called")
+
+    parallelFor(10, 10, throws)
+    parallelFor(10, 0, throws)
+
+
+def test_nested_parallel_for():
+    counts = ListOf(int)()
+    counts.resize(100)
+
+    def inner(i):
+        def setIt(j):
+            counts[i * 10 + j] += 1
+
+        parallelFor(0, 10, setIt)
+
+    parallelFor(0, 10, inner)
+
+    assert counts == [1] * 100
+
+
+def test_preduce_sum_and_max():
+    someInts = ListOf(int)(range(100000))
+
+    def identity(x):
+        return x
+
+    def add(x, y):
+        return x + y
+
+    def square(x):
+        return float(x * x)
+
+    assert preduce(someInts, identity, add, 0) == sum(range(100000))
+    assert preduce(someInts, square, add, 0.0) == float(sum(x * x for x in range(100000)))
+    assert preduce(TupleOf(int)(range(1000)), identity, max, -1) == 999
+
+
+def test_preduce_preserves_order():
+    # concatenation is associative but not commutative
+    def toStr(x):
+        return str(x % 10)
+
+    def concat(x, y):
+        return x + y
+
+    lst = ListOf(int)(range(1000))
+
+    assert preduce(lst, toStr, concat, "") == "".join(str(x % 10) for x in range(1000))
+
+
+def test_preduce_histogram():
+    def bucketOf(x):
+        res = ListOf(int)()
+        res.resize(10)
+        res[x % 10] = 1
+        return res
+
+    def addBuckets(x, y):
+        res = ListOf(int)()
+        for i in range(len(x)):
+            res.append(x[i] + y[i])
+        return res
+
+    identity = ListOf(int)([0] * 10)
+
+    assert preduce(ListOf(int)(range(1005)), bucketOf, addBuckets, identity) == [101] * 5 + [100] * 5
+
+
+def test_preduce_empty_and_exceptions():
+    def throwsOn37(x):
+        if x >= 37:
+            raise Exception(f"failed at {x}")
+        return x
+
+    def add(x, y):
+        return x + y
+
+    assert preduce(ListOf(int)(), throwsOn37, add, 5) == 5
+
+    with pytest.raises(Exception, match="failed at 37"):
+        preduce(ListOf(int)(range(10000)), throwsOn37, add, 0)
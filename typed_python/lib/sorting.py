@@ -12,9 +12,30 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-"""Code for sorting containers."""
+"""Code for sorting containers.
 
-from typed_python import ListOf, Entrypoint
+'sort' and 'sorted' are a simple single-threaded quicksort. 'mergeSort' is a
+stable merge sort that spreads its work over the pmap threads, 'radixSort'
+is an LSD radix sort for lists of ints and floats, and 'argsort' returns the
+permutation that would sort a list, using whichever of the two fits.
+"""
+
+from typed_python import ListOf, UInt64, Entrypoint
+from typed_python.lib.pmap import parallelFor
+from typed_python.lib.work_stealing import getScheduler
+
+# runs of this many elements get insertion-sorted before we start merging
+_INSERTION_SORT_RUN = 32
+
+# the smallest number of outputs a single merge task produces
+_MIN_MERGE_BLOCK = 8192
+
+# lists shorter than this get sorted on the calling thread
+_PARALLEL_SORT_THRESHOLD = 50000
+
+# the number of bits of the key that each radix sort pass consumes
+_RADIX_BITS = 8
+_RADIX = 1 << _RADIX_BITS
 
 
 def _sortAroundPivot(values, start, end, ixPivot, less):
@@ -80,3 +101,337 @@ def sorted(values, key=None):
     valuesCopy = ListOf(type(values).ElementType)(values)
     sort(valuesCopy, key)
     return valuesCopy
+
+
+def _forEach(start, stop, body, parallel):
+    if parallel:
+        parallelFor(start, stop, body)
+    else:
+        for i in range(start, stop):
+            body(i)
+
+
+def _insertionSortBetween(values, lo, hi, less):
+    """Stably sort values[lo:hi]."""
+    for i in range(lo + 1, hi):
+        v = values[i]
+        j = i
+
+        while j > lo and less(v, values[j - 1]):
+            values[j] = values[j - 1]
+            j -= 1
+
+        values[j] = v
+
+
+def _mergeSplit(src, aLo, aHi, bHi, k, less):
+    """Return how many of the first 'k' outputs of merging src[aLo:aHi] and src[aHi:bHi] come from the first run.
+
+    This is a binary search along the 'merge path', which lets us cut one
+    large merge into independent pieces.
+    """
+    lo = max(0, k - (bHi - aHi))
+    hi = min(k, aHi - aLo)
+
+    while lo < hi:
+        i = (lo + hi) // 2
+
+        # if src[aLo + i] doesn't belong after src[aHi + k - i - 1] then a
+        # stable merge would have taken it already.
+        if not less(src[aHi + k - i - 1], src[aLo + i]):
+            lo = i + 1
+        else:
+            hi = i
+
+    return lo
+
+
+def _mergeBlock(src, dst, aLo, aHi, bHi, outLo, outHi, less):
+    """Write outputs [outLo, outHi) of the stable merge of src[aLo:aHi] and src[aHi:bHi] to dst[aLo + outLo:]."""
+    i = aLo + _mergeSplit(src, aLo, aHi, bHi, outLo, less)
+    j = aHi + outLo - (i - aLo)
+
+    for k in range(aLo + outLo, aLo + outHi):
+        if j >= bHi or (i < aHi and not less(src[j], src[i])):
+            dst[k] = src[i]
+            i += 1
+        else:
+            dst[k] = src[j]
+            j += 1
+
+
+def _mergeRound(src, dst, runLen, blockSize, less, parallel):
+    """Merge each adjacent pair of sorted runs of length 'runLen' in 'src' into 'dst'."""
+    n = len(src)
+    pairCount = (n + 2 * runLen - 1) // (2 * runLen)
+    blocksPerPair = (2 * runLen + blockSize - 1) // blockSize
+
+    def mergeOneBlock(task):
+        aLo = (task // blocksPerPair) * 2 * runLen
+        aHi = min(aLo + runLen, n)
+        bHi = min(aLo + 2 * runLen, n)
+        outLo = (task % blocksPerPair) * blockSize
+
+        if aLo + outLo < bHi:
+            _mergeBlock(src, dst, aLo, aHi, bHi, outLo, min(outLo + blockSize, bHi - aLo), less)
+
+    _forEach(0, pairCount * blocksPerPair, mergeOneBlock, parallel)
+
+
+def _mergeSort(values, less):
+    """Stably sort 'values' in place, given a strict 'less than' function."""
+    n = len(values)
+    parallel = n >= _PARALLEL_SORT_THRESHOLD
+
+    def sortRun(run):
+        _insertionSortBetween(
+            values,
+            run * _INSERTION_SORT_RUN,
+            min(n, (run + 1) * _INSERTION_SORT_RUN),
+            less
+        )
+
+    _forEach(0, (n + _INSERTION_SORT_RUN - 1) // _INSERTION_SORT_RUN, sortRun, parallel)
+
+    if n <= _INSERTION_SORT_RUN:
+        return
+
+    blockSize = _MIN_MERGE_BLOCK
+
+    if parallel:
+        blockSize = max(blockSize, n // ((getScheduler().workerCount + 1) * 8))
+
+    buffer = ListOf(type(values).ElementType)(values)
+
+    # we ping-pong between 'values' and 'buffer', so track which one holds
+    # the current runs.
+    inBuffer = False
+    runLen = _INSERTION_SORT_RUN
+
+    while runLen < n:
+        if inBuffer:
+            _mergeRound(buffer, values, runLen, blockSize, less, parallel)
+        else:
+            _mergeRound(values, buffer, runLen, blockSize, less, parallel)
+
+        inBuffer = not inBuffer
+        runLen *= 2
+
+    if inBuffer:
+        def copyBack(block):
+            for i in range(block * blockSize, min(n, (block + 1) * blockSize)):
+                values[i] = buffer[i]
+
+        _forEach(0, (n + blockSize - 1) // blockSize, copyBack, parallel)
+
+
+@Entrypoint
+def mergeSort(values, key=None):
+    """Perform a stable in-place sort on 'values', which must be a ListOf.
+
+    Large lists are sorted on the pmap threads. Elements that compare equal
+    (or whose keys compare equal) keep their original order.
+    """
+    if len(values) <= 1:
+        return
+
+    if key is None:
+        _mergeSort(values, lambda x, y: x < y)
+    else:
+        _mergeSort(values, lambda x, y: key(x) < key(y))
+
+
+def _radixKeys(values):
+    """Map each element of a ListOf(int) or ListOf(float) to a UInt64 that sorts the same way.
+
+    For ints we flip the sign bit. For floats we flip the sign bit of positive
+    numbers and every bit of negative ones, which orders them by value except
+    that -0.0 sorts before 0.0 and NaNs end up at the ends.
+    """
+    T = type(values).ElementType
+    signBit = UInt64(1) << UInt64(63)
+
+    keys = ListOf(UInt64)()
+    keys.resize(len(values))
+
+    for i in range(len(values)):
+        bits = values.pointerUnsafe(i).cast(UInt64).get()
+
+        if T is float and bits & signBit:
+            keys[i] = ~bits
+        else:
+            keys[i] = bits ^ signBit
+
+    return keys
+
+
+def _radixHistogram(keys, counts, base, lo, hi, shift):
+    # the lists can't change size under us, so skip the bounds checks.
+    keysPtr = keys.pointerUnsafe(0)
+    countsPtr = counts.pointerUnsafe(base)
+    mask = UInt64(_RADIX - 1)
+
+    for i in range(lo, hi):
+        countsPtr[int((keysPtr[i] >> shift) & mask)] += 1
+
+
+def _radixScatter(keys, keysOut, indices, indicesOut, counts, base, lo, hi, shift):
+    keysPtr = keys.pointerUnsafe(0)
+    keysOutPtr = keysOut.pointerUnsafe(0)
+    countsPtr = counts.pointerUnsafe(base)
+    mask = UInt64(_RADIX - 1)
+
+    if len(indices):
+        indicesPtr = indices.pointerUnsafe(0)
+        indicesOutPtr = indicesOut.pointerUnsafe(0)
+
+        for i in range(lo, hi):
+            key = keysPtr[i]
+            digit = int((key >> shift) & mask)
+            pos = countsPtr[digit]
+            countsPtr[digit] = pos + 1
+
+            keysOutPtr[pos] = key
+            indicesOutPtr[pos] = indicesPtr[i]
+    else:
+        for i in range(lo, hi):
+            key = keysPtr[i]
+            digit = int((key >> shift) & mask)
+            pos = countsPtr[digit]
+            countsPtr[digit] = pos + 1
+
+            keysOutPtr[pos] = key
+
+
+def _radixPass(keys, keysOut, indices, indicesOut, shift, chunkCount, parallel):
+    """Stably scatter 'keys' (and 'indices', if nonempty) into the outputs by one digit.
+
+    Returns:
+        False if every key had the same digit, in which case we didn't
+        write anything.
+    """
+    n = len(keys)
+    chunkSize = (n + chunkCount - 1) // chunkCount
+    # counts[chunk * _RADIX + digit] holds the number of keys in 'chunk'
+    # with 'digit', and then the position where the next one goes.
+    counts = ListOf(int)()
+    counts.resize(chunkCount * _RADIX, 0)
+
+    def histogram(chunk):
+        _radixHistogram(keys, counts, chunk * _RADIX, chunk * chunkSize, min(n, (chunk + 1) * chunkSize), shift)
+
+    _forEach(0, chunkCount, histogram, parallel)
+
+    total = 0
+
+    for digit in range(_RADIX):
+        digitCount = 0
+
+        for chunk in range(chunkCount):
+            count = counts[chunk * _RADIX + digit]
+            counts[chunk * _RADIX + digit] = total
+            total += count
+            digitCount += count
+
+        if digitCount == n:
+            return False
+
+    def scatter(chunk):
+        _radixScatter(
+            keys, keysOut, indices, indicesOut, counts,
+            chunk * _RADIX, chunk * chunkSize, min(n, (chunk + 1) * chunkSize), shift
+        )
+
+    _forEach(0, chunkCount, scatter, parallel)
+
+    return True
+
+
+def _radixSortKeys(keys, indices):
+    """Stably sort 'keys', applying the same permutation to 'indices' unless it's empty.
+
+    Returns:
+        a pair of the sorted keys and indices. These may or may not be the
+        lists we were passed.
+    """
+    n = len(keys)
+    parallel = n >= _PARALLEL_SORT_THRESHOLD
+    chunkCount = 1
+
+    if parallel:
+        chunkCount = getScheduler().workerCount + 1
+
+    keysOut = ListOf(UInt64)()
+    keysOut.resize(n)
+
+    indicesOut = ListOf(int)()
+    indicesOut.resize(len(indices))
+
+    for shift in range(0, 64, _RADIX_BITS):
+        if _radixPass(keys, keysOut, indices, indicesOut, UInt64(shift), chunkCount, parallel):
+            keys, keysOut = keysOut, keys
+            indices, indicesOut = indicesOut, indices
+
+    return keys, indices
+
+
+@Entrypoint
+def radixSort(values):
+    """Sort a ListOf(int) or ListOf(float) in place.
+
+    This takes a fixed number of passes over the data regardless of its
+    order, skipping the passes for any byte that's the same in every element.
+    Floats are ordered by value, except that -0.0 sorts before 0.0, and NaNs
+    with the sign bit set come first and the rest come last.
+    """
+    T = type(values).ElementType
+
+    if T is not int and T is not float:
+        raise TypeError("radixSort only knows how to sort ListOf(int) and ListOf(float)")
+
+    if len(values) <= 1:
+        return
+
+    keys, _ = _radixSortKeys(_radixKeys(values), ListOf(int)())
+
+    signBit = UInt64(1) << UInt64(63)
+
+    for i in range(len(keys)):
+        bits = keys[i]
+
+        if T is float and not (bits & signBit):
+            bits = ~bits
+        else:
+            bits = bits ^ signBit
+
+        values.pointerUnsafe(i).cast(UInt64).set(bits)
+
+
+@Entrypoint
+def argsort(values, key=None) -> ListOf(int):
+    """Return the indices that would stably sort 'values'.
+
+    That is, 'values[argsort(values)[i]]' is the i'th smallest element (or
+    the one with the i'th smallest key). If there's no key and 'values' is a
+    ListOf(int) or ListOf(float) we use a radix sort, with the same ordering
+    of floats as 'radixSort'. Otherwise we use 'mergeSort'.
+    """
+    T = type(values).ElementType
+
+    indices = ListOf(int)()
+    indices.resize(len(values))
+
+    for i in range(len(values)):
+        indices[i] = i
+
+    if len(values) <= 1:
+        return indices
+
+    if key is None and (T is int or T is float):
+        _, indices = _radixSortKeys(_radixKeys(values), indices)
+    elif key is None:
+        _mergeSort(indices, lambda i, j: values[i] < values[j])
+    else:
+        _mergeSort(indices, lambda i, j: key(values[i]) < key(values[j]))
+
+    return indices
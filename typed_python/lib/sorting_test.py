@@ -117,3 +117,108 @@ class TestSorting(unittest.TestCase):
             sorting.sorted(x, key=lambda x: Tuple(int, int)((x % 10, x))),
             sorted(x, key=lambda x: (x % 10, x))
         )
+
+    def test_merge_sort_correct(self):
+        for length in [0, 1, 2, 31, 33, 1000, 100000]:
+            x = ListOf(int)(numpy.random.choice(length + 1, size=length, replace=True))
+            sorting.mergeSort(x)
+            self.assertEqual(x, ListOf(int)(sorted(x)))
+
+            x = ListOf(float)(numpy.random.uniform(size=length))
+            sorting.mergeSort(x)
+            self.assertEqual(x, ListOf(float)(sorted(x)))
+
+    def test_merge_sort_is_stable(self):
+        for length in [100, 100000]:
+            x = ListOf(Tuple(int, int))((numpy.random.choice(10), i) for i in range(length))
+
+            sorting.mergeSort(x, key=lambda pair: pair[0])
+
+            self.assertEqual(x, ListOf(Tuple(int, int))(sorted(x, key=lambda pair: pair[0])))
+
+    def test_merge_sort_strings(self):
+        x = ListOf(str)(str(i) for i in numpy.random.choice(1000, size=1000))
+
+        sorting.mergeSort(x)
+
+        self.assertEqual(x, ListOf(str)(sorted(x)))
+
+    def test_radix_sort_int_correct(self):
+        for length in [0, 1, 2, 1000, 100000]:
+            x = ListOf(int)(numpy.random.randint(-2 ** 62, 2 ** 62, size=length))
+            x.extend([2 ** 63 - 1, -2 ** 63, 0, -1, 1])
+
+            expected = ListOf(int)(sorted(x))
+            sorting.radixSort(x)
+            self.assertEqual(x, expected)
+
+    def test_radix_sort_small_ints(self):
+        # every high byte is the same, so most passes get skipped
+        x = ListOf(int)(numpy.random.choice(100, size=1000))
+        expected = ListOf(int)(sorted(x))
+
+        sorting.radixSort(x)
+
+        self.assertEqual(x, expected)
+
+    def test_radix_sort_float_correct(self):
+        for length in [0, 1, 2, 1000, 100000]:
+            x = ListOf(float)(numpy.random.normal(size=length) * 1e10)
+            x.extend([float("inf"), float("-inf"), 0.0, 1e-300, -1e-300, 5e-324, -5e-324])
+
+            expected = ListOf(float)(sorted(x))
+            sorting.radixSort(x)
+            self.assertEqual(x, expected)
+
+    def test_radix_sort_rejects_other_types(self):
+        with self.assertRaises(TypeError):
+            sorting.radixSort(ListOf(str)(["a", "b"]))
+
+    def test_argsort(self):
+        for length in [0, 1, 1000, 100000]:
+            ints = numpy.random.choice(100, size=length)
+            floats = numpy.random.normal(size=length)
+
+            self.assertEqual(
+                sorting.argsort(ListOf(int)(ints)),
+                ListOf(int)(numpy.argsort(ints, kind='stable'))
+            )
+            self.assertEqual(
+                sorting.argsort(ListOf(float)(floats)),
+                ListOf(int)(numpy.argsort(floats, kind='stable'))
+            )
+
+            strs = ListOf(str)(str(i) for i in ints)
+
+            self.assertEqual(
+                sorting.argsort(strs),
+                ListOf(int)(sorted(range(length), key=lambda i: strs[i]))
+            )
+
+    def test_argsort_with_key(self):
+        x = ListOf(int)(range(1000))
+
+        self.assertEqual(
+            sorting.argsort(x, key=lambda i: -(i % 10)),
+            ListOf(int)(sorted(range(1000), key=lambda i: -(i % 10)))
+        )
+
+    @flaky(max_runs=3, min_passes=1)
+    def test_radix_sort_perf(self):
+        x = ListOf(float)(numpy.random.uniform(size=1000000))
+
+        # prime the compiler and the worker threads
+        sorting.radixSort(ListOf(float)(x))
+
+        y = ListOf(float)(x)
+
+        t0 = time.time()
+        sorting.radixSort(y)
+        t1 = time.time()
+        sorted(x)
+        t2 = time.time()
+
+        speedup = (t2 - t1) / (t1 - t0)
+
+        # I get about 3 on a single core
+        self.assertGreater(speedup, 1.5)
@@ -0,0 +1,349 @@
+#   Copyright 2017-2020 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+A work-stealing scheduler for running compiled loops on many threads.
+
+Each worker thread owns a deque of tasks. It pushes and pops tasks at the
+bottom of its own deque, and only when it runs dry does it steal from the top
+of somebody else's. Every deque has its own lock, so in the common case a
+thread only ever touches a lock nobody else wants.
+
+A task is a half-open range of indices of a RangeJob. Rather than cutting the
+range into fixed-size pieces up front, the thread running a range executes it
+'minGranularity' indices at a time, and splits off the upper half of whatever
+is left only when its own deque is empty (meaning a thief may have taken
+everything it had). Ranges get split just often enough to keep every thread
+busy, regardless of how expensive each index turns out to be. This is known
+as 'lazy binary splitting'.
+"""
+
+import os
+import threading
+
+from typed_python import Class, Final, Member, ListOf, Tuple, OneOf, NotCompiled, Entrypoint
+from typed_python.typed_queue import TypedQueue
+
+
+_threadState = threading.local()
+
+
+class RangeJob(Class):
+    """A parallel loop over the indices [0, size) that a Scheduler can run.
+
+    Subclasses override 'execute'. If it throws, the scheduler records the
+    exception against the first index of the range, and 'exception' returns
+    whichever recorded exception had the lowest index.
+    """
+    size = Member(int)
+    minGranularity = Member(int)
+
+    _remaining = Member(int)
+    _lock = Member(threading.Lock)
+    _doneLock = Member(threading.Lock)
+    _exception = Member(object)
+    _exceptionIndex = Member(int)
+
+    def execute(self, lo: int, hi: int) -> None:
+        pass
+
+    def recordException(self, index: int, exception: object) -> None:
+        with self._lock:
+            if self._exception is None or index < self._exceptionIndex:
+                self._exception = exception
+                self._exceptionIndex = index
+
+    def exception(self) -> object:
+        """Return the exception thrown at the lowest index, or None."""
+        return self._exception
+
+    def _begin(self) -> None:
+        self._remaining = self.size
+        self._lock = threading.Lock()
+        self._doneLock = threading.Lock()
+        self._doneLock.acquire()
+        self._exception = None
+
+        if self.size == 0:
+            self._doneLock.release()
+
+    def _finishIndices(self, count: int) -> None:
+        with self._lock:
+            self._remaining -= count
+
+            if self._remaining == 0:
+                self._doneLock.release()
+
+    def _isDone(self) -> bool:
+        with self._lock:
+            return self._remaining == 0
+
+    def _waitUntilDone(self) -> None:
+        self._doneLock.acquire()
+        self._doneLock.release()
+
+
+Task = Tuple(RangeJob, int, int)
+
+
+class TaskDeque(Class, Final):
+    """A deque of Tasks owned by a single thread, which other threads may steal from."""
+    _tasks = Member(ListOf(Task))
+    _head = Member(int)
+    _lock = Member(threading.Lock)
+
+    def __init__(self):
+        self._tasks = ListOf(Task)()
+        self._lock = threading.Lock()
+
+    def push(self, task: Task) -> None:
+        with self._lock:
+            self._tasks.append(task)
+
+    def pop(self) -> OneOf(None, Task):
+        """Take the most recently pushed task, or return None."""
+        with self._lock:
+            if len(self._tasks) == self._head:
+                return None
+
+            result = self._tasks.pop()
+
+            if len(self._tasks) == self._head:
+                self._tasks.clear()
+                self._head = 0
+
+            return result
+
+    def steal(self) -> OneOf(None, Task):
+        """Take the oldest task (which usually covers the largest range), or return None."""
+        with self._lock:
+            if len(self._tasks) == self._head:
+                return None
+
+            result = self._tasks[self._head]
+            self._head += 1
+
+            if len(self._tasks) == self._head:
+                self._tasks.clear()
+                self._head = 0
+
+            return result
+
+    def looksEmpty(self) -> bool:
+        """Check whether the deque is empty without taking the lock.
+
+        Only the owning thread should call this. The answer may be stale if
+        somebody is stealing from us right now, so it's only good as a hint.
+        """
+        return len(self._tasks) == self._head
+
+
+class Scheduler(Class, Final):
+    """A pool of worker threads that execute RangeJobs by work stealing.
+
+    There's a deque for each worker, plus one extra deque shared by all the
+    threads that aren't workers, so any thread may call 'run'.
+    """
+    workerCount = Member(int)
+
+    _deques = Member(ListOf(TaskDeque))
+
+    # workers with nothing to do block on their doorbell until somebody
+    # pushes new work. '_parkLock' protects '_isParked' and '_parkedCount'.
+    _parkLock = Member(threading.Lock)
+    _isParked = Member(ListOf(bool))
+    _parkedCount = Member(int)
+    _doorbells = Member(ListOf(TypedQueue(int)))
+
+    def __init__(self, workerCount):
+        self.workerCount = workerCount
+        self._deques = ListOf(TaskDeque)()
+        self._doorbells = ListOf(TypedQueue(int))()
+        self._isParked = ListOf(bool)()
+        self._parkLock = threading.Lock()
+
+        for _ in range(workerCount + 1):
+            self._deques.append(TaskDeque())
+
+        for _ in range(workerCount):
+            self._doorbells.append(TypedQueue(int)())
+            self._isParked.append(False)
+
+    @Entrypoint
+    def run(self, job: RangeJob) -> None:
+        """Execute every index of 'job' and return once they're all done.
+
+        The calling thread works on the job (and on anything else it can
+        steal) until there's nothing left to take, and then blocks until the
+        threads still working on pieces of the job have finished. Exceptions
+        are recorded on the job rather than raised.
+        """
+        ix = currentWorkerIndex(self)
+
+        if ix < 0:
+            ix = self.workerCount
+
+        job._begin()
+
+        if job.size == 0:
+            return
+
+        self._deques[ix].push(Task((job, 0, job.size)))
+
+        while not job._isDone():
+            task = self._findTask(ix)
+
+            if task is None:
+                break
+
+            self._runTask(ix, task)
+
+        job._waitUntilDone()
+
+    @Entrypoint
+    def runWorker(self, ix: int) -> None:
+        while True:
+            task = self._findTask(ix)
+
+            if task is None:
+                task = self._park(ix)
+
+            if task is not None:
+                self._runTask(ix, task)
+
+    def _findTask(self, ix: int) -> OneOf(None, Task):
+        task = self._deques[ix].pop()
+
+        if task is not None:
+            return task
+
+        dequeCount = len(self._deques)
+
+        for i in range(1, dequeCount):
+            task = self._deques[(ix + i) % dequeCount].steal()
+
+            if task is not None:
+                return task
+
+        return None
+
+    def _runTask(self, ix: int, task: Task) -> None:
+        job, lo, hi = task
+
+        granularity = max(job.minGranularity, 1)
+        executed = 0
+
+        while lo < hi:
+            if hi - lo > granularity and self._deques[ix].looksEmpty():
+                # somebody may have stolen everything we had, so give them
+                # half of what's left.
+                mid = lo + (hi - lo) // 2
+                self._deques[ix].push(Task((job, mid, hi)))
+                self._wakeOne()
+                hi = mid
+
+            top = min(hi, lo + granularity)
+
+            try:
+                job.execute(lo, top)
+            except Exception as e:
+                job.recordException(lo, e)
+
+            executed += top - lo
+            lo = top
+
+        job._finishIndices(executed)
+
+    def _wakeOne(self) -> None:
+        # this read is racy, but we can afford to miss a parked worker: any
+        # task we push either gets stolen or we pop it ourselves later.
+        if self._parkedCount == 0:
+            return
+
+        with self._parkLock:
+            for i in range(self.workerCount):
+                if self._isParked[i]:
+                    self._isParked[i] = False
+                    self._parkedCount -= 1
+                    self._doorbells[i].put(0)
+                    return
+
+    def _park(self, ix: int) -> OneOf(None, Task):
+        with self._parkLock:
+            self._isParked[ix] = True
+            self._parkedCount += 1
+
+        # check again now that we're visibly parked, so that we can't miss
+        # work pushed by somebody who thought we were awake.
+        task = self._findTask(ix)
+
+        if task is not None:
+            with self._parkLock:
+                if self._isParked[ix]:
+                    self._isParked[ix] = False
+                    self._parkedCount -= 1
+                    return task
+
+            # somebody rang our doorbell in the meantime. Consume it.
+            self._doorbells[ix].get()
+            return task
+
+        self._doorbells[ix].get()
+
+        return None
+
+
+@NotCompiled
+def currentWorkerIndex(scheduler: Scheduler) -> int:
+    """Return the index of the current thread within 'scheduler', or -1 if it's not one of its workers."""
+    if getattr(_threadState, 'scheduler', None) is not scheduler:
+        return -1
+
+    return _threadState.workerIndex
+
+
+def _workerThreadMain(scheduler, ix):
+    _threadState.scheduler = scheduler
+    _threadState.workerIndex = ix
+    scheduler.runWorker(ix)
+
+
+_scheduler = []
+_schedulerLock = threading.Lock()
+_maxThreads = [1000]
+
+
+def getMaxThreads():
+    return _maxThreads[0]
+
+
+def setMaxThreads(count):
+    """Limit the number of worker threads. Has no effect once the scheduler has started."""
+    assert count > 0
+    _maxThreads[0] = count
+
+
+@NotCompiled
+def getScheduler() -> Scheduler:
+    """Return the process-wide Scheduler, starting its worker threads if necessary."""
+    with _schedulerLock:
+        if not _scheduler:
+            scheduler = Scheduler(min(_maxThreads[0], os.cpu_count()))
+
+            for i in range(scheduler.workerCount):
+                threading.Thread(target=_workerThreadMain, args=(scheduler, i), daemon=True).start()
+
+            _scheduler.append(scheduler)
+
+        return _scheduler[0]
@@ -0,0 +1,140 @@
+#   Copyright 2017-2020 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import threading
+
+from typed_python import Final, Member, ListOf, Entrypoint
+from typed_python.lib.work_stealing import (
+    RangeJob, Scheduler, TaskDeque, Task, getScheduler, _workerThreadMain
+)
+
+
+class CountingJob(RangeJob, Final):
+    counts = Member(ListOf(int))
+
+    def __init__(self, size, minGranularity):
+        self.size = size
+        self.minGranularity = minGranularity
+        self.counts = ListOf(int)()
+        self.counts.resize(size)
+
+    def execute(self, lo: int, hi: int) -> None:
+        for i in range(lo, hi):
+            # make later indices much more expensive, so that the first
+            # thread to get a range can't do all of them itself.
+            x = 0
+            for j in range(i * 10):
+                x += j
+            self.counts[i] += 1
+
+
+class ThrowingJob(RangeJob, Final):
+    def __init__(self, size):
+        self.size = size
+        self.minGranularity = 1
+
+    def execute(self, lo: int, hi: int) -> None:
+        if lo >= 50:
+            raise Exception(f"failed at {lo}")
+
+
+class NestedJob(RangeJob, Final):
+    inner = Member(Scheduler)
+    innerJobs = Member(ListOf(CountingJob))
+
+    def __init__(self, size, inner):
+        self.size = size
+        self.minGranularity = 1
+        self.inner = inner
+        self.innerJobs = ListOf(CountingJob)()
+
+        for _ in range(size):
+            self.innerJobs.append(CountingJob(100, 1))
+
+    def execute(self, lo: int, hi: int) -> None:
+        for i in range(lo, hi):
+            self.inner.run(self.innerJobs[i])
+
+
+def test_task_deque_pops_newest_and_steals_oldest():
+    job = CountingJob(10, 1)
+    deque = TaskDeque()
+
+    for i in range(3):
+        deque.push(Task((job, i, i + 1)))
+
+    assert deque.steal()[1] == 0
+    assert deque.pop()[1] == 2
+    assert deque.pop()[1] == 1
+    assert deque.pop() is None
+    assert deque.steal() is None
+    assert deque.looksEmpty()
+
+
+def test_scheduler_runs_every_index_once():
+    job = CountingJob(5000, 1)
+
+    getScheduler().run(job)
+
+    assert job.exception() is None
+    assert job.counts == [1] * 5000
+
+
+def test_scheduler_records_lowest_exception():
+    job = ThrowingJob(100)
+
+    getScheduler().run(job)
+
+    assert str(job.exception()) == "failed at 50"
+
+
+def test_scheduler_from_many_threads():
+    scheduler = Scheduler(2)
+
+    for i in range(2):
+        threading.Thread(target=scheduler.runWorker, args=(i,), daemon=True).start()
+
+    jobs = [CountingJob(1000, 3) for _ in range(4)]
+
+    @Entrypoint
+    def runIt(scheduler: Scheduler, job: CountingJob):
+        scheduler.run(job)
+
+    threads = [threading.Thread(target=runIt, args=(scheduler, job)) for job in jobs]
+
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for job in jobs:
+        assert job.counts == [1] * 1000
+
+
+def test_workers_of_one_scheduler_can_run_jobs_on_another():
+    outer = Scheduler(3)
+
+    for i in range(3):
+        threading.Thread(target=_workerThreadMain, args=(outer, i), daemon=True).start()
+
+    # 'inner' has no workers, so its only deque is the one for outsiders
+    job = NestedJob(30, Scheduler(0))
+
+    outer.run(job)
+
+    assert job.exception() is None
+
+    for innerJob in job.innerJobs:
+        assert innerJob.exception() is None
+        assert innerJob.counts == [1] * 100
@@ -0,0 +1,220 @@
+#   Copyright 2017-2021 typed_python Authors
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+import os
+import tempfile
+import time
+
+import pytest
+
+from typed_python import (
+    ListOf, TupleOf, NamedTuple, Dict, ConstDict, Set, OneOf, Alternative, Class, Member,
+    writeSlabFile, mapSlabFile, deepBytecountAndSlabs, totalBytesAllocatedOnFreeStore,
+    serialize, deserialize
+)
+from typed_python.test_util import evaluateExprInFreshProcess
+
+
+Row = NamedTuple(a=int, b=str, c=OneOf(None, float))
+
+Shape = Alternative("Shape", Circle=dict(r=float), Poly=dict(points=TupleOf(float)))
+
+Table = NamedTuple(
+    rows=ListOf(Row),
+    index=Dict(str, int),
+    tags=Set(str),
+    names=ConstDict(int, str),
+    shapes=ListOf(Shape),
+)
+
+
+def makeTable(count):
+    return Table(
+        rows=ListOf(Row)([Row(a=i, b=str(i) * 3, c=None if i % 2 else i / 2) for i in range(count)]),
+        index={str(i): i for i in range(count)},
+        tags={"a", "b"},
+        names={i: str(i) for i in range(count)},
+        shapes=[Shape.Circle(r=1.0), Shape.Poly(points=(1.0, 2.0))],
+    )
+
+
+def test_slab_file_roundtrip():
+    table = makeTable(1000)
+
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, "table.slab")
+
+        writeSlabFile(Table, table, path)
+
+        mapped = mapSlabFile(Table, path)
+
+        assert mapped == table
+        assert mapped.index["999"] == 999
+        assert mapped.names[10] == "10"
+        assert mapped.shapes[1].points == (1.0, 2.0)
+
+
+def test_mapped_slab_file_is_not_copied():
+    table = makeTable(10000)
+
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, "table.slab")
+
+        writeSlabFile(Table, table, path)
+
+        bytesOnFreeStore = totalBytesAllocatedOnFreeStore()
+
+        mapped = mapSlabFile(Table, path)
+
+        assert totalBytesAllocatedOnFreeStore() - bytesOnFreeStore < 1024
+
+        _, slabs = deepBytecountAndSlabs(mapped)
+        assert len(slabs) == 1
+
+
+def test_mapped_slab_file_released_with_last_reference():
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, "table.slab")
+
+        writeSlabFile(Table, makeTable(100), path)
+
+        rows = mapSlabFile(Table, path).rows
+
+        # the file is still mapped at its address, so we can't map it again
+        with pytest.raises(Exception, match="already in use"):
+            mapSlabFile(Table, path)
+
+        row = rows[10]
+        del rows
+
+        with pytest.raises(Exception, match="already in use"):
+            mapSlabFile(Table, path)
+
+        del row
+
+        assert mapSlabFile(Table, path).rows[10].a == 10
+
+
+def test_modifying_mapped_objects_is_private():
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, "table.slab")
+
+        writeSlabFile(Table, makeTable(100), path)
+
+        mapped = mapSlabFile(Table, path)
+        mapped.rows.append(Row(a=-1))
+        mapped.index["new"] = 1
+        mapped.rows[0] = Row(a=100)
+
+        assert len(mapped.rows) == 101
+        assert mapped.rows[0].a == 100
+
+        mapped = None
+
+        mapped = mapSlabFile(Table, path)
+
+        assert len(mapped.rows) == 100
+        assert mapped.rows[0].a == 0
+        assert "new" not in mapped.index
+
+
+def test_slab_file_in_other_process():
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, "table.slab")
+
+        writeSlabFile(Table, makeTable(100), path)
+
+        assert evaluateExprInFreshProcess(
+            {
+                'table_type.py':
+                    "from typed_python import *\n"
+                    "Row = NamedTuple(a=int, b=str, c=OneOf(None, float))\n"
+                    "Shape = Alternative('Shape', Circle=dict(r=float), Poly=dict(points=TupleOf(float)))\n"
+                    "Table = NamedTuple(\n"
+                    "    rows=ListOf(Row),\n"
+                    "    index=Dict(str, int),\n"
+                    "    tags=Set(str),\n"
+                    "    names=ConstDict(int, str),\n"
+                    "    shapes=ListOf(Shape),\n"
+                    ")\n"
+            },
+            f"mapSlabFile(table_type.Table, {path!r}).rows[10].b"
+        ) == "101010"
+
+
+def test_slab_file_checks_types():
+    class C(Class):
+        x = Member(int)
+
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, "table.slab")
+
+        with pytest.raises(Exception, match="can't be written"):
+            writeSlabFile(ListOf(C), [C()], path)
+
+        with pytest.raises(Exception, match="can't be written"):
+            writeSlabFile(ListOf(object), [1], path)
+
+        writeSlabFile(ListOf(int), [1, 2, 3], path)
+
+        with pytest.raises(Exception, match="doesn't hold an instance of ListOf\\(str\\)"):
+            mapSlabFile(ListOf(str), path)
+
+        with open(path, "wb") as f:
+            f.write(b"not a slab file")
+
+        with pytest.raises(Exception, match="not a slab file"):
+            mapSlabFile(ListOf(int), path)
+
+
+def test_slab_file_explicit_base_address():
+    with tempfile.TemporaryDirectory() as tf:
+        path1 = os.path.join(tf, "table1.slab")
+        path2 = os.path.join(tf, "table2.slab")
+
+        writeSlabFile(ListOf(int), [1, 2, 3], path1, baseAddress=0x300000000000)
+        writeSlabFile(ListOf(int), [4, 5, 6], path2, baseAddress=0x300000000000)
+
+        list1 = mapSlabFile(ListOf(int), path1)
+
+        with pytest.raises(Exception, match="already in use"):
+            mapSlabFile(ListOf(int), path2)
+
+        del list1
+
+        assert mapSlabFile(ListOf(int), path2) == [4, 5, 6]
+
+
+def test_mapping_slab_file_faster_than_deserializing():
+    table = makeTable(200000)
+
+    with tempfile.TemporaryDirectory() as tf:
+        path = os.path.join(tf, "table.slab")
+
+        writeSlabFile(Table, table, path)
+
+        t0 = time.time()
+        mapped = mapSlabFile(Table, path)
+        mapTime = time.time() - t0
+
+        serialized = serialize(Table, table)
+
+        t0 = time.time()
+        deserialized = deserialize(Table, serialized)
+        deserializeTime = time.time() - t0
+
+        print(f"mapping took {mapTime}, deserializing took {deserializeTime}")
+
+        assert mapped.rows[-1] == deserialized.rows[-1]
+        assert mapTime * 20 < deserializeTime
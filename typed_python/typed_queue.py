@@ -1,6 +1,7 @@
-from typed_python import Class, Final, Member, TypeFunction, ListOf, OneOf, Entrypoint
+from typed_python import Class, Final, Member, TypeFunction, ListOf, OneOf, Entrypoint, NotCompiled
 
 from threading import Lock
+import time
 
 
 @TypeFunction
@@ -163,3 +164,249 @@ def TypedQueue(T):
             return len(self._pushable) + len(self._poppable)
 
     return TypedQueue
+
+
+@NotCompiled
+def _now() -> float:
+    return time.time()
+
+
+@NotCompiled
+def _sleep(seconds: float) -> None:
+    time.sleep(seconds)
+
+
+# how many times a blocked put/get retries before it starts sleeping, and the
+# longest it sleeps between attempts.
+_SPINS_BEFORE_SLEEPING = 100
+_MIN_SLEEP = 0.00001
+_MAX_SLEEP = 0.001
+
+
+@TypeFunction
+def BoundedQueue(T):
+    """Create a fixed-capacity, multi-producer multi-consumer Queue with typed elements.
+
+    Unlike TypedQueue, this doesn't take any locks. Each slot in a ring buffer
+    carries a sequence number that says whether it's ready to be written or
+    read in the current lap around the ring, and producers and consumers claim
+    slots with a compare-and-swap on a shared position counter. (This is
+    Dmitry Vyukov's bounded MPMC queue.)
+
+    'put' blocks while the queue is full, which gives producers backpressure
+    rather than letting the queue grow without bound. Blocked calls spin
+    briefly and then back off by sleeping, so they're meant for pipelines
+    where the queue is rarely full or empty for long.
+    """
+    class BoundedQueue(Class, Final):
+        capacity = Member(int)
+        _mask = Member(int)
+
+        # the enqueue position is at index 0 and the dequeue position at
+        # index 8, so that they don't share a cache line.
+        _positions = Member(ListOf(int))
+        _sequences = Member(ListOf(int))
+        _slots = Member(ListOf(OneOf(None, T)))
+
+        def __init__(self, capacity):
+            """Create a queue holding up to 'capacity' elements, rounded up to a power of 2.
+
+            The ring needs at least two slots to tell a full slot from an empty
+            one, so the capacity is always at least 2.
+            """
+            if capacity < 1:
+                raise ValueError("BoundedQueue capacity must be positive")
+
+            self.capacity = 2
+            while self.capacity < capacity:
+                self.capacity *= 2
+
+            self._mask = self.capacity - 1
+            self._positions = ListOf(int)()
+            self._positions.resize(16)
+            self._sequences = ListOf(int)()
+            self._slots = ListOf(OneOf(None, T))()
+
+            for i in range(self.capacity):
+                self._sequences.append(i)
+                self._slots.append(None)
+
+        @Entrypoint
+        def tryPut(self, element: T) -> bool:
+            """Add 'element' to the queue and return True, or return False if it's full."""
+            enqueuePos = self._positions.pointerUnsafe(0)
+            pos = enqueuePos.atomicLoad()
+
+            while True:
+                cell = pos & self._mask
+                delta = self._sequences.pointerUnsafe(cell).atomicLoad() - pos
+
+                if delta == 0:
+                    if enqueuePos.compareExchange(pos, pos + 1):
+                        break
+                    pos = enqueuePos.atomicLoad()
+                elif delta < 0:
+                    # the slot still holds an element from the previous lap.
+                    return False
+                else:
+                    pos = enqueuePos.atomicLoad()
+
+            self._slots[cell] = element
+            self._sequences.pointerUnsafe(cell).atomicStore(pos + 1)
+
+            return True
+
+        def _claimForGet(self) -> int:
+            """Claim the oldest filled slot, returning its position, or -1 if the queue is empty."""
+            dequeuePos = self._positions.pointerUnsafe(8)
+            pos = dequeuePos.atomicLoad()
+
+            while True:
+                delta = self._sequences.pointerUnsafe(pos & self._mask).atomicLoad() - (pos + 1)
+
+                if delta == 0:
+                    if dequeuePos.compareExchange(pos, pos + 1):
+                        return pos
+                    pos = dequeuePos.atomicLoad()
+                elif delta < 0:
+                    # nobody has filled this slot in the current lap.
+                    return -1
+                else:
+                    pos = dequeuePos.atomicLoad()
+
+        def _takeClaimed(self, pos: int) -> T:
+            cell = pos & self._mask
+
+            result = self._slots[cell]
+            self._slots[cell] = None
+            self._sequences.pointerUnsafe(cell).atomicStore(pos + self._mask + 1)
+
+            return result
+
+        @Entrypoint
+        def tryGet(self) -> OneOf(None, T):
+            """Return a value from the Queue, or None if it's empty."""
+            pos = self._claimForGet()
+
+            if pos < 0:
+                return None
+
+            return self._takeClaimed(pos)
+
+        @Entrypoint
+        def put(self, element: T, timeout: OneOf(None, float) = None) -> bool:
+            """Add 'element' to the queue, blocking while it's full.
+
+            Returns:
+                True if we added the element, or False if 'timeout' seconds
+                passed first.
+            """
+            spins = 0
+            sleepTime = _MIN_SLEEP
+            deadline = 0.0
+
+            if timeout is not None:
+                deadline = _now() + timeout
+
+            while not self.tryPut(element):
+                spins += 1
+
+                if spins >= _SPINS_BEFORE_SLEEPING:
+                    if timeout is not None and _now() >= deadline:
+                        return False
+
+                    _sleep(sleepTime)
+                    sleepTime = min(sleepTime * 2, _MAX_SLEEP)
+
+            return True
+
+        @Entrypoint
+        def get(self, timeout: OneOf(None, float) = None) -> OneOf(None, T):
+            """Return a value from the queue, blocking while it's empty.
+
+            Returns:
+                the value, or None if 'timeout' seconds passed first.
+            """
+            spins = 0
+            sleepTime = _MIN_SLEEP
+            deadline = 0.0
+
+            if timeout is not None:
+                deadline = _now() + timeout
+
+            while True:
+                pos = self._claimForGet()
+
+                if pos >= 0:
+                    return self._takeClaimed(pos)
+
+                spins += 1
+
+                if spins >= _SPINS_BEFORE_SLEEPING:
+                    if timeout is not None and _now() >= deadline:
+                        return None
+
+                    _sleep(sleepTime)
+                    sleepTime = min(sleepTime * 2, _MAX_SLEEP)
+
+        @Entrypoint
+        def putMany(self, elementSeq: ListOf(T), timeout: OneOf(None, float) = None) -> int:
+            """Add each element of 'elementSeq' in order, blocking while the queue is full.
+
+            Returns:
+                the number of elements added, which is less than len(elementSeq)
+                only if we timed out.
+            """
+            for i in range(len(elementSeq)):
+                if not self.put(elementSeq[i], timeout):
+                    return i
+
+            return len(elementSeq)
+
+        @Entrypoint
+        def getMany(self, minCount: int, maxCount: int, timeout: OneOf(None, float) = None) -> ListOf(T):
+            """Return up to 'maxCount' values, blocking until we have at least 'minCount'.
+
+            If 'timeout' seconds pass while we're waiting for an element, return
+            whatever we have.
+            """
+            res = ListOf(T)()
+
+            spins = 0
+            sleepTime = _MIN_SLEEP
+            deadline = 0.0
+
+            while len(res) < maxCount:
+                pos = self._claimForGet()
+
+                if pos >= 0:
+                    res.append(self._takeClaimed(pos))
+                    spins = 0
+                    sleepTime = _MIN_SLEEP
+                elif len(res) >= minCount:
+                    return res
+                else:
+                    # the timeout runs from the moment we start waiting, not
+                    # from when we give up spinning.
+                    if spins == 0 and timeout is not None:
+                        deadline = _now() + timeout
+
+                    spins += 1
+
+                    if spins >= _SPINS_BEFORE_SLEEPING:
+                        if timeout is not None and _now() >= deadline:
+                            return res
+
+                        _sleep(sleepTime)
+                        sleepTime = min(sleepTime * 2, _MAX_SLEEP)
+
+            return res
+
+        @Entrypoint
+        def __len__(self) -> int:
+            """The number of elements in the queue, which is just a snapshot if other threads are using it."""
+            size = self._positions.pointerUnsafe(0).atomicLoad() - self._positions.pointerUnsafe(8).atomicLoad()
+
+            return max(0, min(size, self.capacity))
+
+    return BoundedQueue
@@ -18,7 +18,7 @@ import time
 import queue
 
 from flaky import flaky
-from typed_python.typed_queue import TypedQueue
+from typed_python.typed_queue import TypedQueue, BoundedQueue
 from typed_python import ListOf, Entrypoint, Tuple
 from typed_python._types import refcount
 
@@ -209,3 +209,88 @@ class TypedQueueTests(unittest.TestCase):
         x.get()
 
         assert refcount(a) == 1
+
+
+class BoundedQueueTests(unittest.TestCase):
+    def test_basic(self):
+        q = BoundedQueue(float)(3)
+
+        self.assertEqual(q.capacity, 4)
+        self.assertEqual(q.tryGet(), None)
+
+        for i in range(4):
+            self.assertTrue(q.tryPut(float(i)))
+
+        self.assertFalse(q.tryPut(4.0))
+        self.assertEqual(len(q), 4)
+
+        self.assertEqual(q.get(), 0.0)
+        self.assertTrue(q.tryPut(4.0))
+        self.assertEqual(q.getMany(0, 10), [1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(len(q), 0)
+
+    def test_timeouts(self):
+        q = BoundedQueue(int)(1)
+
+        self.assertEqual(q.capacity, 2)
+        self.assertTrue(q.put(0, 0.01))
+        self.assertTrue(q.put(1, 0.01))
+
+        t0 = time.time()
+        self.assertFalse(q.put(2, 0.05))
+        self.assertGreater(time.time() - t0, 0.04)
+
+        self.assertEqual(q.getMany(2, 2, 0.01), [0, 1])
+        self.assertEqual(q.get(0.05), None)
+
+        # a zero timeout still tries once, and then gives up without waiting
+        self.assertEqual(q.get(0.0), None)
+        self.assertTrue(q.put(5, 0.0))
+        self.assertEqual(q.get(0.0), 5)
+        self.assertEqual(q.getMany(1, 10, 0.05), [])
+        self.assertEqual(q.putMany(ListOf(int)([1, 2, 3]), 0.05), 2)
+
+    def test_refcounts(self):
+        q = BoundedQueue(ListOf(int))(2)
+        a = ListOf(int)()
+
+        q.put(a)
+        self.assertEqual(refcount(a), 2)
+
+        q.get()
+        self.assertEqual(refcount(a), 1)
+
+        q.put(a)
+        q = None
+        self.assertEqual(refcount(a), 1)
+
+    def test_many_producers_and_consumers(self):
+        q = BoundedQueue(int)(16)
+        results = ListOf(int)()
+        results.resize(4)
+
+        @Entrypoint
+        def produce(q: BoundedQueue(int), start: int, count: int) -> None:
+            for i in range(start, start + count):
+                q.put(i)
+
+        @Entrypoint
+        def consume(q: BoundedQueue(int), count: int) -> int:
+            total = 0
+            for _ in range(count):
+                total += q.get()
+            return total
+
+        def consumeInto(ix):
+            results[ix] = consume(q, 25000)
+
+        threads = [threading.Thread(target=produce, args=(q, i * 25000, 25000)) for i in range(4)]
+        threads += [threading.Thread(target=consumeInto, args=(i,)) for i in range(4)]
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sum(results), sum(range(100000)))
+        self.assertEqual(len(q), 0)
@@ -26,6 +26,7 @@ import numpy
 import numpy.linalg
 import datetime
 import pytest
+from flaky import flaky
 import pytz
 import gc
 import pprint
@@ -1106,6 +1107,261 @@ class TypesSerializationTest(unittest.TestCase):
 
         self.assertEqual(lst, l2)
 
+    def test_serialize_register_type_lists(self):
+        from typed_python import UInt8, UInt16, UInt32, UInt64, Int8, Int16, Int32, Float32
+
+        for T, values in [
+            (bool, [True, False]),
+            (int, [0, 1, -1, 2 ** 63 - 1, -2 ** 63, 127, -128]),
+            (float, [0.0, -0.0, 1.5, float("inf"), -float("inf"), 1e300]),
+            (Float32, [0.0, 1.5, -2.25]),
+            (UInt8, [0, 1, 255]),
+            (UInt16, [0, 1, 65535]),
+            (UInt32, [0, 1, 2 ** 32 - 1]),
+            (UInt64, [0, 1, 2 ** 64 - 1]),
+            (Int8, [0, -128, 127]),
+            (Int16, [0, -32768, 32767]),
+            (Int32, [0, -2 ** 31, 2 ** 31 - 1]),
+        ]:
+            # enough elements that the buffer crosses its chunk boundaries
+            for ct in [0, 1, len(values), 10000]:
+                lst = ListOf(T)([values[i % len(values)] for i in range(ct)])
+
+                self.assertEqual(deserialize(ListOf(T), serialize(ListOf(T), lst)), lst)
+                tup = TupleOf(T)(lst)
+                self.assertEqual(deserialize(TupleOf(T), serialize(TupleOf(T), tup)), tup)
+
+                # each element is written exactly the way it would be on its own
+                if ct == len(values):
+                    self.assertIn(
+                        b"".join(serialize(T, v) for v in lst),
+                        serialize(ListOf(T), lst)
+                    )
+
+        lst = ListOf(float)([float("nan")])
+        self.assertNotEqual(deserialize(ListOf(float), serialize(ListOf(float), lst))[0], 0.0)
+
+    def test_serialize_register_type_lists_across_blocks(self):
+        # values whose encodings have every length, so that some of them
+        # straddle the ends of the blocks we decompress.
+        values = [(-1) ** i * 3 ** (i % 40) for i in range(200000)]
+
+        for sc in [SerializationContext(), SerializationContext().withoutCompression()]:
+            for T in [ListOf(int), TupleOf(int)]:
+                lst = T(values)
+
+                self.assertEqual(sc.deserialize(sc.serialize(lst, T), T), lst)
+
+        data = serialize(ListOf(int), ListOf(int)(values))
+
+        # running out of data partway through is an error, not a crash
+        for cut in [1, 2, 11, 1000]:
+            with self.assertRaises(Exception):
+                deserialize(ListOf(int), data[:-cut])
+
+        # as is an element with the wrong wire type
+        floats = serialize(ListOf(float), ListOf(float)([1.0] * 100))
+        with self.assertRaisesRegex(Exception, "expected VARINT"):
+            deserialize(ListOf(int), floats)
+
+    @flaky(max_runs=3, min_passes=1)
+    def test_serialize_register_type_list_throughput(self):
+        # compare lists of register types, and of NamedTuples of them, against
+        # the same values held in OneOfs, which go through the generic
+        # per-element path.
+        NT = NamedTuple(a=int, b=float)
+        GenericNT = NamedTuple(a=OneOf(None, int), b=OneOf(None, float))
+
+        def bestTimes(T, lst):
+            serializeTime = deserializeTime = None
+
+            for _ in range(3):
+                t0 = time.time()
+                data = serialize(T, lst)
+                t1 = time.time()
+                lst2 = deserialize(T, data)
+                t2 = time.time()
+
+                self.assertEqual(lst, lst2)
+
+                serializeTime = min(serializeTime or t1 - t0, t1 - t0)
+                deserializeTime = min(deserializeTime or t2 - t1, t2 - t1)
+
+            return serializeTime, deserializeTime
+
+        for T, GenericT, values in [
+            (ListOf(int), ListOf(OneOf(None, int)), list(range(1000000))),
+            (ListOf(float), ListOf(OneOf(None, float)), [float(i) for i in range(1000000)]),
+            (ListOf(NT), ListOf(GenericNT), [NT(a=i, b=i) for i in range(1000000)]),
+        ]:
+            fastSerialize, fastDeserialize = bestTimes(T, T(values))
+            slowSerialize, slowDeserialize = bestTimes(GenericT, GenericT(values))
+
+            print(
+                f"{T.__name__}: serialize {fastSerialize / slowSerialize:.2f}, "
+                f"deserialize {fastDeserialize / slowDeserialize:.2f} of the generic path's time"
+            )
+
+            # typically 0.1 to 0.25 for lists of register types, and 0.5 to 0.65
+            # for the NamedTuples
+            self.assertLess(fastSerialize, slowSerialize * .8)
+            self.assertLess(fastDeserialize, slowDeserialize * .8)
+
+    def test_serialize_in_parallel(self):
+        NT = NamedTuple(a=int, b=OneOf(None, float), c=str)
+
+        values = [
+            (ListOf(int), ListOf(int)(range(100000))),
+            (TupleOf(NT), TupleOf(NT)([NT(a=i, b=None if i % 3 else i, c=str(i)) for i in range(100000)])),
+            (Dict(int, str), Dict(int, str)({i: str(i) for i in range(100000)})),
+            # only the outer list's elements can't be split up
+            (ListOf(ListOf(str)), ListOf(ListOf(str))([[str(i)] * 10 for i in range(40000)])),
+            (Dict(str, ListOf(float)), Dict(str, ListOf(float))({str(i): [i] for i in range(40000)})),
+        ]
+
+        for compressed in [False, True]:
+            sc = SerializationContext(compressionEnabled=compressed)
+            parallelSc = sc.withParallelism(4)
+
+            for T, value in values:
+                data = parallelSc.serialize(value, T)
+
+                self.assertEqual(parallelSc.deserialize(data, T), value)
+
+                # the format doesn't depend on how we wrote it
+                self.assertEqual(sc.deserialize(data, T), value)
+                self.assertEqual(parallelSc.deserialize(sc.serialize(value, T), T), value)
+
+                if not compressed:
+                    self.assertEqual(data, sc.serialize(value, T))
+
+    def test_deserialize_corrupt_data_in_parallel(self):
+        sc = SerializationContext(compressionEnabled=False).withParallelism(4)
+
+        for T, value in [
+            (ListOf(str), ListOf(str)([str(i) for i in range(100000)])),
+            (Dict(int, str), Dict(int, str)({i: str(i) for i in range(100000)})),
+        ]:
+            data = sc.serialize(value, T)
+
+            with self.assertRaises(Exception):
+                sc.deserialize(data[:len(data) // 2], T)
+
+            # a string that claims to be longer than it is
+            ix = data.index(b"50000") - 1
+            self.assertEqual(data[ix], 5)
+
+            with self.assertRaises(Exception):
+                sc.deserialize(data[:ix] + bytes([100]) + data[ix + 1:], T)
+
+            self.assertEqual(sc.deserialize(data, T), value)
+
+    def test_serialize_columnar(self):
+        NT = NamedTuple(a=int, b=OneOf(None, float), c=str, d=float, e=bool, f=TupleOf(int))
+
+        def makeRows(count, distinctStrings):
+            return [
+                NT(a=i, b=None if i % 3 else i, c=str(i % distinctStrings), d=i / 2, e=i % 2 == 0, f=(i,))
+                for i in range(count)
+            ]
+
+        sc = SerializationContext(compressionEnabled=False)
+        columnarSc = sc.withColumnarEncoding()
+
+        for rows in [makeRows(1, 1), makeRows(1000, 10), makeRows(1000, 1000), []]:
+            for T in [ListOf(NT), TupleOf(NT)]:
+                value = T(rows)
+                data = columnarSc.serialize(value, T)
+
+                self.assertEqual(columnarSc.deserialize(data, T), value)
+
+                # any context can read it
+                self.assertEqual(sc.deserialize(data, T), value)
+
+        from typed_python import UInt8, UInt64, Int32
+
+        # integer columns are written as differences, which have to wrap around correctly
+        Ints = NamedTuple(a=int, b=Int32, c=UInt8, d=UInt64)
+        value = ListOf(Ints)([
+            Ints(a=a, b=a, c=a, d=a)
+            for a in [0, -1, 2 ** 63 - 1, -2 ** 63, 5, 2 ** 31 - 1, -2 ** 31, 255, 0]
+        ])
+        self.assertEqual(sc.deserialize(columnarSc.serialize(value, ListOf(Ints)), ListOf(Ints)), value)
+
+        # a list that appears twice is still only written once
+        Pair = NamedTuple(x=ListOf(NT), y=ListOf(NT))
+        aList = ListOf(NT)(makeRows(100, 10))
+
+        pair = columnarSc.deserialize(columnarSc.serialize(Pair(x=aList, y=aList), Pair), Pair)
+
+        self.assertEqual(pair.x, aList)
+        self.assertEqual(refcount(pair.x), 3)
+
+        # lists of NamedTuples with fields that can refer to other parts of the message
+        # are written a row at a time
+        Other = NamedTuple(a=int, b=ListOf(int))
+        others = ListOf(Other)([Other(a=1, b=[1])])
+
+        self.assertEqual(columnarSc.serialize(others, ListOf(Other)), sc.serialize(others, ListOf(Other)))
+
+    def test_deserialize_columnar_subset(self):
+        NT = NamedTuple(a=int, b=str, c=float)
+        Subset = NamedTuple(c=float, a=int, z=str)
+
+        rows = ListOf(NT)([NT(a=i, b=str(i), c=i * 2) for i in range(1000)])
+
+        subset = SerializationContext().withColumnarEncoding().deserialize(
+            SerializationContext().withColumnarEncoding().serialize(rows, ListOf(NT)),
+            ListOf(Subset)
+        )
+
+        self.assertEqual(subset, ListOf(Subset)([Subset(a=i, c=i * 2) for i in range(1000)]))
+
+        with self.assertRaisesRegex(Exception, "column at a time"):
+            SerializationContext().deserialize(
+                SerializationContext().withColumnarEncoding().serialize(rows, ListOf(NT)),
+                ListOf(int)
+            )
+
+    def test_serialize_columnar_is_smaller_and_faster(self):
+        NT = NamedTuple(a=int, b=float, c=str)
+
+        rows = ListOf(NT)([NT(a=i // 10, b=1.0, c=["red", "green", "blue"][i // 1000 % 3]) for i in range(1000000)])
+
+        sc = SerializationContext(compressionEnabled=True)
+        columnarSc = sc.withColumnarEncoding()
+
+        rowData = sc.serialize(rows, ListOf(NT))
+        columnarData = columnarSc.serialize(rows, ListOf(NT))
+
+        self.assertLess(len(columnarData) * 2, len(rowData))
+
+        t0 = time.time()
+        sc.deserialize(rowData, ListOf(NT))
+        rowTime = time.time() - t0
+
+        t0 = time.time()
+        self.assertEqual(columnarSc.deserialize(columnarData, ListOf(NT)), rows)
+        columnarTime = time.time() - t0
+
+        print(f"row format took {rowTime} for {len(rowData)} bytes, columnar took {columnarTime} for {len(columnarData)}")
+
+        self.assertLess(columnarTime, rowTime)
+
+    def test_deserialize_corrupt_columnar_data(self):
+        NT = NamedTuple(a=int, b=str)
+
+        sc = SerializationContext(compressionEnabled=False).withColumnarEncoding()
+        rows = ListOf(NT)([NT(a=i, b=str(i % 10)) for i in range(1000)])
+
+        data = sc.serialize(rows, ListOf(NT))
+
+        for cut in [10, len(data) // 2, len(data) - 3]:
+            with self.assertRaises(Exception):
+                sc.deserialize(data[:cut], ListOf(NT))
+
+        self.assertEqual(sc.deserialize(data, ListOf(NT)), rows)
+
     def test_serialize_large_numpy_arrays(self):
         x = SerializationContext()
 
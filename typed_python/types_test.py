@@ -876,6 +876,233 @@ class TypesTests(unittest.TestCase):
             d["1"] = "1"
             self.assertTrue("1" in d)
 
+    def test_dict_and_set_with_wide_hash_table_slots(self):
+        d = Dict(int, str)()
+        s = Set(str)()
+
+        d[1] = "1"
+        s.add("1")
+
+        # tables this small don't have a hashtable at all
+        self.assertEqual(_types.hashTableSlotBytes(d), 0)
+        self.assertEqual(_types.hashTableSlotBytes(s), 0)
+        self.assertEqual(_types.hashTableHashBytes(d), 4)
+        self.assertEqual(_types.hashTableHashBytes(s), 4)
+
+        _types.setMinimumHashTableSlotBytes(8)
+
+        try:
+            for i in range(2000):
+                d[i] = str(i)
+                s.add(str(i))
+
+            for i in range(0, 2000, 3):
+                del d[i]
+                s.discard(str(i))
+
+            self.assertEqual(_types.hashTableSlotBytes(d), 8)
+            self.assertEqual(_types.hashTableSlotBytes(s), 8)
+
+            # the tables switched to 64 bit hashes when they first needed int64 indices
+            self.assertEqual(_types.hashTableHashBytes(d), 8)
+            self.assertEqual(_types.hashTableHashBytes(s), 8)
+
+            expected = {i: str(i) for i in range(2000) if i % 3}
+
+            self.assertEqual(dict(d), expected)
+            self.assertEqual(set(s), set(expected.values()))
+            self.assertEqual(dict(deserialize(type(d), serialize(type(d), d))), expected)
+            self.assertEqual(dict(_types.deepcopy(d)), expected)
+            self.assertEqual(set(type(s)(s)), set(s))
+        finally:
+            _types.setMinimumHashTableSlotBytes(1)
+
+        # tables that are already wide keep working once the floor is lowered
+        d.clear()
+
+        for i in range(2000):
+            d[i] = str(i)
+
+        self.assertEqual(len(d), 2000)
+        self.assertEqual(d[1999], "1999")
+        self.assertEqual(_types.hashTableHashBytes(d), 8)
+        self.assertEqual(_types.hashTableSlotBytes(Dict(int, str)({i: str(i) for i in range(20)})), 1)
+        self.assertEqual(_types.hashTableHashBytes(Dict(int, str)({i: str(i) for i in range(20)})), 4)
+
+        with self.assertRaises(ValueError):
+            _types.setMinimumHashTableSlotBytes(3)
+
+    def test_dict_and_set_with_wide_hashes(self):
+        _types.setMinimumHashTableSlotBytes(8)
+
+        try:
+            floats = Dict(float, int)({i / 4: i for i in range(1000)})
+            strings = Set(str)(str(i) * 3 for i in range(1000))
+            blobs = Set(bytes)(str(i).encode() * 3 for i in range(1000))
+            oneOfs = Dict(OneOf(int, str, None), int)()
+
+            for i in range(1000):
+                oneOfs[i] = i
+                oneOfs[str(i)] = -i
+
+            oneOfs[None] = 1000
+
+            for table in [floats, strings, blobs, oneOfs]:
+                self.assertEqual(_types.hashTableHashBytes(table), 8)
+
+            # integral floats hash like the equivalent ints
+            self.assertEqual(floats[3], 12)
+            self.assertEqual(floats[0.25], 1)
+            self.assertNotIn(1000, floats)
+
+            self.assertIn("999999", strings)
+            self.assertNotIn("1000", strings)
+            self.assertIn(b"999999", blobs)
+            self.assertNotIn(b"1000", blobs)
+
+            self.assertEqual(oneOfs[999], 999)
+            self.assertEqual(oneOfs["999"], -999)
+            self.assertEqual(oneOfs[None], 1000)
+            self.assertEqual(len(oneOfs), 2001)
+
+            for i in range(1000):
+                del oneOfs[str(i)]
+
+            self.assertEqual(dict(oneOfs), {**{i: i for i in range(1000)}, None: 1000})
+            self.assertEqual(
+                set(deserialize(type(strings), serialize(type(strings), strings))),
+                set(strings)
+            )
+        finally:
+            _types.setMinimumHashTableSlotBytes(1)
+
+    def test_dict_and_set_hash_table_layouts(self):
+        d = Dict(int, str)({i: str(i) for i in range(100)})
+        s = Set(str)(str(i) for i in range(100))
+
+        self.assertEqual(_types.hashTableLayout(d), "probed")
+        self.assertEqual(_types.hashTableLayout(s), "probed")
+        self.assertIsNone(_types.hashTableLayout(Dict(int, str)({1: "1"})))
+
+        _types.setHashTableLayout("swiss")
+
+        try:
+            # existing tables pick up the new layout when they're next rebuilt
+            for i in range(100, 2000):
+                d[i] = str(i)
+                s.add(str(i))
+
+            self.assertEqual(_types.hashTableLayout(d), "swiss")
+            self.assertEqual(_types.hashTableLayout(s), "swiss")
+
+            for i in range(0, 2000, 3):
+                del d[i]
+                s.discard(str(i))
+
+            expected = {i: str(i) for i in range(2000) if i % 3}
+
+            self.assertEqual(dict(d), expected)
+            self.assertEqual(set(s), set(expected.values()))
+            self.assertEqual(dict(deserialize(type(d), serialize(type(d), d))), expected)
+            self.assertEqual(dict(_types.deepcopy(d)), expected)
+            self.assertEqual(set(type(s)(s)), set(s))
+            self.assertEqual(_types.hashTableLayout(type(d)(d)), "swiss")
+        finally:
+            _types.setHashTableLayout("probed")
+
+        # and go back once they outgrow their hashtable
+        for i in range(2000, 20000):
+            d[i] = str(i)
+
+        self.assertEqual(_types.hashTableLayout(d), "probed")
+        self.assertEqual(d[19999], "19999")
+        self.assertEqual(d[1999], "1999")
+        self.assertNotIn(3, d)
+
+        with self.assertRaises(ValueError):
+            _types.setHashTableLayout("linear")
+
+    def test_dict_and_set_hash_table_slot_widths(self):
+        d = Dict(int, int)()
+        s = Set(int)()
+        widths = []
+
+        for i in range(40000):
+            d[i] = i
+            s.add(i)
+
+            if i in (0, 7, 8, 127, 128, 32767, 32768):
+                widths.append((_types.hashTableSlotBytes(d), _types.hashTableSlotBytes(s)))
+
+        self.assertEqual([w[0] for w in widths], [w[1] for w in widths])
+        self.assertEqual([w[0] for w in widths], [0, 0, 1, 1, 2, 2, 4])
+
+        for i in range(40000):
+            if i % 7:
+                del d[i]
+                s.discard(i)
+
+        self.assertEqual(dict(d), {i: i for i in range(0, 40000, 7)})
+        self.assertEqual(set(s), set(range(0, 40000, 7)))
+
+        # emptying the tables out shrinks them back down to the narrowest slots
+        for i in range(0, 40000, 7):
+            del d[i]
+            s.discard(i)
+
+        self.assertEqual(len(d), 0)
+        self.assertLessEqual(_types.hashTableSlotBytes(d), 1)
+        self.assertLessEqual(_types.hashTableSlotBytes(s), 1)
+
+        d[1] = 2
+        s.add(1)
+
+        self.assertEqual(dict(d), {1: 2})
+        self.assertEqual(set(s), {1})
+
+    def test_small_dicts_and_sets_scan_their_items(self):
+        # keys that collide have to be told apart by comparing them
+        class Collides:
+            def __init__(self, x):
+                self.x = x
+
+            def __hash__(self):
+                return 1
+
+            def __eq__(self, other):
+                return self.x == other.x
+
+        d = Dict(object, int)()
+
+        for i in range(8):
+            d[Collides(i)] = i
+
+        self.assertEqual(_types.hashTableSlotBytes(d), 0)
+
+        for i in range(8):
+            self.assertEqual(d[Collides(i)], i)
+
+        self.assertNotIn(Collides(8), d)
+
+        del d[Collides(3)]
+
+        self.assertNotIn(Collides(3), d)
+        self.assertEqual(len(d), 7)
+
+        d2 = deserialize(Dict(str, int), serialize(Dict(str, int), Dict(str, int)({"a": 1, "b": 2})))
+
+        self.assertEqual(_types.hashTableSlotBytes(d2), 0)
+        self.assertEqual(d2["b"], 2)
+
+        self.assertEqual(dict(_types.deepcopy(d2)), {"a": 1, "b": 2})
+        self.assertEqual(Dict(str, int)(d2), d2)
+
+        # a small dict doesn't pay for a hashtable
+        big = Dict(int, int)({i: i for i in range(9)})
+        small = Dict(int, int)({i: i for i in range(8)})
+
+        self.assertGreater(_types.deepBytecount(big) - _types.deepBytecount(small), 64)
+
     def test_deserialize_primitive(self):
         x = deserialize(str, serialize(str, "a"))
         self.assertTrue(isinstance(x, str))
@@ -1065,6 +1292,77 @@ class TypesTests(unittest.TestCase):
         self.assertTrue(d2 not in big)
         self.assertTrue(big[d] == d2)
 
+    def test_const_dict_small_updates_to_big_dicts(self):
+        t = ConstDict(int, str)
+
+        d = t({k: str(k) for k in range(0, 2000, 2)})
+        pyD = dict(d)
+
+        rng = numpy.random.RandomState(42)
+
+        for _ in range(3000):
+            k = int(rng.randint(0, 2000))
+
+            if rng.randint(2) and k in pyD:
+                d = d - (k,)
+                del pyD[k]
+            else:
+                d = d + {k: str(-k)}
+                pyD[k] = str(-k)
+
+        self.assertEqual(len(d), len(pyD))
+        self.assertEqual(list(d), sorted(pyD))
+        self.assertEqual(list(d.values()), [pyD[k] for k in sorted(pyD)])
+        self.assertEqual(dict(d), pyD)
+
+        for k in range(-1, 2001):
+            self.assertEqual(k in d, k in pyD)
+            self.assertEqual(d.get(k), pyD.get(k))
+
+        flat = t(pyD)
+
+        self.assertEqual(d, flat)
+        self.assertEqual(hash(d), hash(flat))
+        self.assertEqual(str(d), str(flat))
+        self.assertFalse(d < flat)
+        self.assertTrue(d < flat + {5000: ""})
+        self.assertEqual(deserialize(t, serialize(t, d)), flat)
+        self.assertEqual(d + flat, flat)
+        self.assertEqual(d - list(pyD), t())
+
+        # removing keys one at a time all the way down still works
+        for k in sorted(pyD):
+            d = d - (k,)
+            del pyD[k]
+            self.assertEqual(len(d), len(pyD))
+
+        self.assertEqual(d, t())
+
+    def test_const_dict_small_updates_share_memory(self):
+        t = ConstDict(int, str)
+
+        baseline = _types.totalBytesAllocatedOnFreeStore()
+
+        d = t({k: str(k) for k in range(100000)}) + {-1: "-1"}
+        bigSize = _types.totalBytesAllocatedOnFreeStore() - baseline
+
+        before = _types.totalBytesAllocatedOnFreeStore()
+        d2 = d + {-2: "-2"}
+        d3 = d2 - (500,)
+
+        self.assertLess(_types.totalBytesAllocatedOnFreeStore() - before, bigSize / 100)
+
+        self.assertEqual(len(d2), 100002)
+        self.assertEqual(len(d3), 100001)
+        self.assertEqual(d2[500], "500")
+        self.assertNotIn(500, d3)
+        self.assertEqual(d[-1], "-1")
+        self.assertNotIn(-2, d)
+
+        d = d2 = d3 = None
+
+        self.assertEqual(_types.totalBytesAllocatedOnFreeStore(), baseline)
+
     @flaky(max_runs=3, min_passes=1)
     def test_dict_hash_perf(self):
         str_dict = ConstDict(str, str)